@@ -0,0 +1,197 @@
+"""
+    Compares fetching a snapshot as one page[size]=<size> response with the
+    paginated, concurrent fetcher in snapshot_fetch.py and with reading the
+    NDJSON stream of /locations/export, against a local stand-in for the
+    API. Reports wall time and the peak RSS of both the client and the
+    stand-in server for each approach.
+
+    Usage:
+    bench_fetch.py [--size=<size>] [--vertices=<vertices>] [--latency=<ms>]
+                   [--hit-cost=<ms>] [--page-size=<size>] [--concurrency=<pages>]
+    bench_fetch.py --serve <size> <vertices> <latency> <hit_cost>
+    bench_fetch.py --client <mode> <url> <page_size> <concurrency>
+
+    Options:
+        --size=<size>          Locations served by the stand-in [default: 10000]
+        --vertices=<vertices>  Polygon vertices per location [default: 100]
+        --latency=<ms>         Simulated Elastic Search latency per request [default: 20]
+        --hit-cost=<ms>        Simulated fetch and mapping cost per returned location [default: 0.3]
+        --page-size=<size>     page[size] used by the paginated fetcher [default: 500]
+        --concurrency=<pages>  Pages fetched in parallel [default: 4]
+"""
+from __future__ import print_function
+
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+from docopt import docopt
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import urlencode
+    from urlparse import parse_qs, urlsplit
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlencode, urlsplit
+
+from bench_stream import peak_rss_mb, synthetic_location
+from snapshot_fetch import EXPORT_PATH, fetch_snapshot
+from snapshot_stream import compact_record
+
+# Locations the API reads from an Elastic Search scroll at a time
+EXPORT_BATCH_SIZE = 500
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def stand_in_handler(locations, latency, hit_cost):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            if parts.path == '/__stats':
+                return self.send_json({"peak_rss_mb": peak_rss_mb()})
+            if parts.path.endswith(EXPORT_PATH):
+                return self.send_export()
+
+            params = parse_qs(parts.query)
+            page_number = int(params.get('page[number]', ['1'])[0])
+            page_size = int(params.get('page[size]', ['10'])[0])
+            start = (page_number - 1) * page_size
+
+            page = locations[start:start + page_size]
+
+            # stand-in for the Elastic Search round trip and LocationMapper
+            time.sleep((latency + hit_cost * len(page)) / 1000.0)
+
+            last_page = max(1, (len(locations) + page_size - 1) // page_size)
+
+            def link(number):
+                return 'http://localhost/locations?' + urlencode(
+                    {'page[number]': number, 'page[size]': page_size})
+
+            self.send_json({
+                "links": {
+                    "self": link(page_number),
+                    "first": link(1),
+                    "last": link(last_page),
+                    "prev": link(page_number - 1) if page_number > 1 else None,
+                    "next": link(page_number + 1)
+                    if page_number < last_page else None,
+                },
+                "data": page,
+            })
+
+        def send_json(self, body):
+            # Like the API, the whole result object is serialized at once
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def send_export(self):
+            # Like the API, each location is written as soon as it is read,
+            # in a stream without a length that ends with the connection
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            for start in range(0, len(locations), EXPORT_BATCH_SIZE):
+                batch = locations[start:start + EXPORT_BATCH_SIZE]
+                time.sleep((latency + hit_cost * len(batch)) / 1000.0)
+                for location in batch:
+                    self.wfile.write(json.dumps(location).encode('utf-8') +
+                                     b'\n')
+
+    return Handler
+
+
+def serve(size, vertices, latency, hit_cost):
+    random.seed(size)
+    locations = [synthetic_location(index, vertices) for index in range(size)]
+    server = StandInServer(('127.0.0.1', 0),
+                           stand_in_handler(locations, latency, hit_cost))
+    print(server.server_address[1])
+    sys.stdout.flush()
+    server.serve_forever()
+
+
+def run_client(mode, url, page_size, concurrency):
+    start = time.time()
+    if mode == 'mega':
+        response = requests.get(url, params={'page[size]': page_size})
+        records = dict((location['id'], compact_record(location))
+                       for location in response.json()['data'])
+    else:
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        records = fetch_snapshot(url, path, page_size=page_size,
+                                 concurrency=concurrency)
+        os.remove(path)
+    print(json.dumps({"records": len(records),
+                      "seconds": time.time() - start,
+                      "peak_rss_mb": peak_rss_mb()}))
+
+
+def run_scenario(mode, args, page_size, concurrency):
+    server = subprocess.Popen(
+        [sys.executable, __file__, '--serve', args['--size'],
+         args['--vertices'], args['--latency'], args['--hit-cost']],
+        stdout=subprocess.PIPE)
+    try:
+        base_url = 'http://127.0.0.1:{}'.format(
+            int(server.stdout.readline()))
+        url = base_url + '/locations'
+        if mode == 'export':
+            url += EXPORT_PATH
+        result = json.loads(subprocess.check_output(
+            [sys.executable, __file__, '--client', mode,
+             url, str(page_size), str(concurrency)]
+        ).decode('utf-8'))
+        server_stats = requests.get(base_url + '/__stats').json()
+    finally:
+        server.terminate()
+        server.wait()
+    return result, server_stats
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+
+    if args['--serve']:
+        serve(int(args['<size>']), int(args['<vertices>']),
+              float(args['<latency>']), float(args['<hit_cost>']))
+    elif args['--client']:
+        run_client(args['<mode>'], args['<url>'], int(args['<page_size>']),
+                   int(args['<concurrency>']))
+    else:
+        print("{:>10} {:>10} {:>18} {:>18}".format(
+            "mode", "seconds", "client RSS MB", "server RSS MB"))
+        scenarios = [
+            ('mega', int(args['--size']), 1),
+            ('paged', int(args['--page-size']), int(args['--concurrency'])),
+            ('export', int(args['--page-size']), 1),
+        ]
+        for mode, page_size, concurrency in scenarios:
+            result, server_stats = run_scenario(mode, args, page_size,
+                                                concurrency)
+            print("{:>10} {:>10.2f} {:>18.1f} {:>18.1f}".format(
+                mode, result['seconds'], result['peak_rss_mb'],
+                server_stats['peak_rss_mb']))
@@ -0,0 +1,118 @@
+"""
+    Compares peak memory of loading a snapshot with json.loads against the
+    streaming reader in snapshot_stream.py, over growing snapshot sizes.
+
+    Usage:
+    bench_stream.py [--sizes=<sizes>] [--vertices=<vertices>]
+    bench_stream.py --child <mode> <snapshot_path>
+
+    Options:
+        --sizes=<sizes>        Comma separated location counts [default: 1000,5000,20000]
+        --vertices=<vertices>  Polygon vertices per location [default: 200]
+"""
+from __future__ import print_function
+
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from docopt import docopt
+
+from snapshot_stream import compact_record, iter_records
+
+
+def synthetic_location(index, vertices):
+    lat, lon = 44.56 + random.random() / 100, -123.28 + random.random() / 100
+    ring = [[lon + random.random() / 1000, lat + random.random() / 1000]
+            for _ in range(vertices - 1)]
+    ring.append(ring[0])
+    open_hours = dict(
+        (str(day), [{"start": "2018-06-0{}T15:00:00Z".format(day),
+                     "end": "2018-06-0{}T23:00:00Z".format(day)}])
+        for day in range(1, 8))
+    return {
+        "id": "{:032x}".format(index),
+        "type": "locations",
+        "attributes": {
+            "name": "Building {}".format(index),
+            "abbreviation": "B{}".format(index),
+            "latitude": str(lat),
+            "longitude": str(lon),
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+            "openHours": open_hours,
+            "campus": "corvallis",
+            "type": "building",
+        },
+        "links": {"self": "https://api.oregonstate.edu/v1/locations/{:032x}"
+                  .format(index)},
+        "relationships": None,
+    }
+
+
+def write_snapshot(path, size, vertices):
+    # json.dumps escapes non-ASCII, so the output is plain ASCII text
+    with open(path, 'w') as snapshot_file:
+        snapshot_file.write('{"links": {}, "data": [')
+        for index in range(size):
+            if index:
+                snapshot_file.write(',')
+            snapshot_file.write(json.dumps(synthetic_location(index, vertices)))
+        snapshot_file.write(']}')
+
+
+def load(mode, path):
+    if mode == 'stream':
+        return dict((record.id, record) for record in iter_records(path))
+    with io.open(path, 'r', encoding='utf-8') as snapshot_file:
+        snapshot = json.loads(snapshot_file.read())
+    return dict((location['id'], compact_record(location))
+                for location in snapshot['data'])
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+
+def run_child(mode, path):
+    start = time.time()
+    records = load(mode, path)
+    print(json.dumps({"records": len(records),
+                      "seconds": time.time() - start,
+                      "peak_rss_mb": peak_rss_mb()}))
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+
+    if args['--child']:
+        run_child(args['<mode>'], args['<snapshot_path>'])
+        sys.exit(0)
+
+    vertices = int(args['--vertices'])
+    work_dir = tempfile.mkdtemp()
+    try:
+        print("{:>8} {:>10} {:>10} {:>14} {:>14}".format(
+            "size", "file MB", "mode", "seconds", "peak RSS MB"))
+        for size in [int(s) for s in args['--sizes'].split(',')]:
+            path = os.path.join(work_dir, 'snapshot-{}.json'.format(size))
+            write_snapshot(path, size, vertices)
+            file_mb = os.path.getsize(path) / (1024.0 * 1024.0)
+            for mode in ['json', 'stream']:
+                result = json.loads(subprocess.check_output(
+                    [sys.executable, __file__, '--child', mode, path]
+                ).decode('utf-8'))
+                print("{:>8} {:>10.1f} {:>10} {:>14.2f} {:>14.1f}".format(
+                    size, file_mb, mode, result['seconds'],
+                    result['peak_rss_mb']))
+            os.remove(path)
+    finally:
+        shutil.rmtree(work_dir)
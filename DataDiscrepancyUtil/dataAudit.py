@@ -0,0 +1,193 @@
+"""
+    Diffs every location and every service between two deployments in one
+    run. Locations and services are each diffed once over the whole index,
+    in parallel on a process pool, and the locations report is then split
+    into one report per type and campus.
+
+    Usage:
+    dataAudit.py [options] <old_source> <new_source>
+
+    Arguments:
+        old_source: Base url of the old API (e.g. https://api.oregonstate.edu/v1), or a directory written by --save-dir
+        new_source: Base url of the new API (e.g. https://localhost:8082/api/v0), or a directory written by --save-dir
+
+    Options:
+        --auth=<header>          Authorization header value sent to both APIs
+        --old-auth=<header>      Authorization header value sent to the old API
+        --new-auth=<header>      Authorization header value sent to the new API
+        --page-size=<size>       page[size] used when fetching urls [default: 500]
+        --concurrency=<pages>    Pages fetched in parallel per endpoint [default: 4]
+        --radius=<meters>        Distance within which a new key can match a gone one [default: 100]
+        --min-score=<score>      Minimum name/proximity score for a rekey match [default: 0.6]
+        --processes=<count>      Endpoints diffed in parallel [default: all cores]
+        --save-dir=<dir>         Keep the fetched new snapshots here, to audit against next time
+        --json=<path>            Also write the merged report to this file as JSON
+"""
+from __future__ import print_function
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import traceback
+
+from docopt import docopt
+
+from dataDiffCheck import compare, has_differences, print_report
+from snapshot_fetch import is_url
+from snapshot_stream import iter_resources
+
+# Endpoints diffed between the two deployments, each over all of its
+# resources
+ENDPOINTS = ['locations', 'services']
+
+# Stands in for the type or campus of locations that have none
+NO_VALUE = 'none'
+
+# Report sections, the id each of their entries is about, and whether the
+# location has that id in the new snapshot (or only in the old one)
+SECTION_IDS = {
+    'gone': (lambda entry: entry[0], False),
+    'rekeyed': (lambda entry: entry['new'], True),
+    'new': (lambda entry: entry[0], True),
+    'changed': (lambda entry: entry['id'], True),
+}
+
+
+def location_group(resource):
+    attributes = resource.get('attributes') or {}
+    return 'locations-{}-{}'.format(attributes.get('type') or NO_VALUE,
+                                    attributes.get('campus') or NO_VALUE)
+
+
+def location_groups(path, ids):
+    """Returns {id: group} for the locations of the snapshot in ids."""
+    if not ids:
+        return {}
+    return dict((resource['id'], location_group(resource))
+                for resource in iter_resources(path)
+                if resource['id'] in ids)
+
+
+def group_report(report, old_path, new_path):
+    """
+    Splits the report of all locations into [(group, report)], one report
+    per type x campus, sorted by group. Locations are grouped by the type
+    and campus they have in the new snapshot, or in the old one when they
+    are gone, so that each is reported once even when its type or campus
+    changed. A report without differences is kept whole, as 'locations'.
+    """
+    if not has_differences(report):
+        return [('locations', report)]
+
+    paths = {False: old_path, True: new_path}
+    ids = {False: set(), True: set()}
+    for section, (entry_id, in_new) in SECTION_IDS.items():
+        ids[in_new].update(entry_id(entry) for entry in report[section])
+    groups = dict((in_new, location_groups(paths[in_new], ids[in_new]))
+                  for in_new in paths)
+
+    reports = {}
+    for section, (entry_id, in_new) in SECTION_IDS.items():
+        for entry in report[section]:
+            group = groups[in_new][entry_id(entry)]
+            if group not in reports:
+                reports[group] = dict((name, []) for name in SECTION_IDS)
+            reports[group][section].append(entry)
+    return sorted(reports.items())
+
+
+def endpoint_source(source, endpoint):
+    if is_url(source):
+        return source.rstrip('/') + '/' + endpoint
+    return os.path.join(source, endpoint + '.json')
+
+
+def snapshot_path(source, directory, name):
+    """Returns the file source is read from, or fetched to when a url."""
+    if is_url(source):
+        return os.path.join(directory, name + '.json')
+    return source
+
+
+def audit_endpoint(task):
+    """
+    Worker: diffs one endpoint. Returns [(name, report, error)], with the
+    locations report split by group, so that one failing endpoint doesn't
+    abort the whole audit.
+    """
+    endpoint, old_source, new_source, args = task
+    old = endpoint_source(old_source, endpoint)
+    new = endpoint_source(new_source, endpoint)
+    for source in (old, new):
+        if not is_url(source) and not os.path.exists(source):
+            return [(endpoint, None, "no snapshot at " + source)]
+
+    # Fetched snapshots are kept until the locations report is grouped
+    temp_dir = tempfile.mkdtemp()
+    old_path = snapshot_path(old, temp_dir, 'old-' + endpoint)
+    new_path = snapshot_path(new, args['--save-dir'] or temp_dir, endpoint)
+    try:
+        report = compare(old, new, args, old_path, new_path)
+        if endpoint != 'locations':
+            return [(endpoint, report, None)]
+        return [(group, grouped, None) for group, grouped
+                in group_report(report, old_path, new_path)]
+    except Exception:
+        return [(endpoint, None, traceback.format_exc())]
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def process_count(args):
+    if args['--processes'] == 'all cores':
+        return multiprocessing.cpu_count()
+    return int(args['--processes'])
+
+
+def audit(old_source, new_source, args):
+    """Returns [(name, report, error), ...] in endpoint order."""
+    if args['--save-dir'] and not os.path.isdir(args['--save-dir']):
+        os.makedirs(args['--save-dir'])
+
+    tasks = [(endpoint, old_source, new_source, args)
+             for endpoint in ENDPOINTS]
+    pool = multiprocessing.Pool(min(process_count(args), len(tasks)))
+    try:
+        results = pool.map(audit_endpoint, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    return [result for endpoint_results in results
+            for result in endpoint_results]
+
+
+def print_summary(results):
+    print("\n{:<36} {:>6} {:>8} {:>6} {:>8}".format(
+        "report", "gone", "rekeyed", "new", "changed"))
+    for name, report, error in results:
+        if error:
+            print("{:<36} {}".format(name, error.strip().splitlines()[-1]))
+        else:
+            print("{:<36} {:>6} {:>8} {:>6} {:>8}".format(
+                name, len(report["gone"]), len(report["rekeyed"]),
+                len(report["new"]), len(report["changed"])))
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+
+    results = audit(args['<old_source>'], args['<new_source>'], args)
+
+    for name, report, error in results:
+        if report and has_differences(report):
+            print("\n==== {} ====".format(name))
+            print_report(report)
+    print_summary(results)
+
+    if args['--json']:
+        with open(args['--json'], 'w') as report_file:
+            json.dump(dict((name, {"report": report, "error": error})
+                           for name, report, error in results),
+                      report_file, indent=4, sort_keys=True)
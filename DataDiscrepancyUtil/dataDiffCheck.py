@@ -1,90 +1,246 @@
 """
     Usage:
-    dataDiffCheck.py <old_data_path> <new_data_path>
+    dataDiffCheck.py [options] <old_data_path> <new_data_path>
+    dataDiffCheck.py [options] --store=<dir> <new_data_path>
 
     Arguments:
-        old_data_path: File path of old building json
-        new_data_path: File path of new building json
+        old_data_path: File path of old building json, or a /locations url to fetch it from
+        new_data_path: File path of new building json, or a /locations url to fetch it from
+
+    With --store, new_data_path is saved to the snapshot store in <dir> and
+    diffed against the latest snapshot already stored there.
+
+    Options:
+        --auth=<header>          Authorization header value sent when fetching urls
+        --page-size=<size>       page[size] used when fetching urls [default: 500]
+        --concurrency=<pages>    Pages fetched in parallel when fetching urls [default: 4]
+        --radius=<meters>        Distance within which a new key can match a gone one [default: 100]
+        --min-score=<score>      Minimum name/proximity score for a rekey match [default: 0.6]
+        --store=<dir>            Snapshot store (see snapshot_store.py) to save and diff against
 """
 # old.json being the data from https://api.oregonstate.edu/v1/locations?page[size]=10000&type=building
 # new.json being the data from https://localhost:8082/api/v0/locations?page[size]=10000&type=building - locations-frontend-api commit b1bec1e013cf29f16a0a01b9dd7c3777e3b4e192
+from __future__ import print_function
+
+import os
 import sys
 import json
+import tempfile
 from docopt import docopt
-print(docopt(__doc__, version='1.0.0rc2'))
 
-args = docopt(__doc__, version='1.0.0rc2')
+from location_diff import field_changes
+from rekey_match import match_rekeyed
+from snapshot_fetch import fetch_snapshot, is_url, iter_remote_resources
+from snapshot_store import SnapshotStore, snapshot_field_changes
+from snapshot_stream import iter_records, iter_resources
 
 
-def create_mappings(buildings_json):
+def create_mappings(records):
     building_data = {}
-    names2ids = {}
-    #map id to building data
-    #map name to id
-    for building in buildings_json['data']:
-        building_data[building['id']] = building
-        names2ids[ building['attributes']['name'] ] = building['id']
-        
-    return (building_data, names2ids)
+    #map id to compact building record
+    for record in records:
+        building_data[record.id] = record
+
+    return building_data
+
+
+def load_snapshot(source, args, auth=None, save_path=None):
+    """
+    Returns (path, records, temporary) for a snapshot file, or for a url
+    fetched page by page into save_path (a temporary file when not given)
+    that is kept for the field-level pass.
+    """
+    if not is_url(source):
+        return source, iter_records(source), False
+
+    path = save_path
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+    records = fetch_snapshot(source, path, auth,
+                             int(args['--page-size']),
+                             int(args['--concurrency']))
+    return path, records.values(), save_path is None
+
+
+def compare(old_source, new_source, args, old_save_path=None,
+            new_save_path=None):
+    """
+    Diffs two snapshots (files or urls) and returns the report as a dict of
+    plain lists and dicts, so it can be printed, dumped to JSON or sent back
+    from a worker process. --old-auth and --new-auth, when args has them,
+    take precedence over --auth for their side.
+    """
+    old_auth = args.get('--old-auth') or args['--auth']
+    new_auth = args.get('--new-auth') or args['--auth']
+    temp_paths = []
+    try:
+        # Snapshots are streamed resource by resource; only the compact
+        # (id, name, digest, lat, lon) records are kept in memory.
+        new_path, new_records, temporary = load_snapshot(
+            new_source, args, new_auth, new_save_path)
+        if temporary:
+            temp_paths.append(new_path)
+        new_building_data_dict = create_mappings(new_records)
+        old_path, old_records, temporary = load_snapshot(
+            old_source, args, old_auth, old_save_path)
+        if temporary:
+            temp_paths.append(old_path)
+        old_building_data_dict = create_mappings(old_records)
+
+        return build_report(
+            old_building_data_dict, new_building_data_dict, args,
+            lambda old, new: field_changes(old_path, new_path, old, new))
+    finally:
+        for temp_path in temp_paths:
+            os.remove(temp_path)
+
+
+def compare_with_store(new_source, args):
+    """
+    Saves new_source as a new snapshot in the --store directory and diffs it
+    against the latest snapshot stored before it. Returns None when the
+    store was empty, i.e. there was nothing to diff against yet.
+    """
+    store = SnapshotStore(args['--store'])
+    old = store.latest()
+    if is_url(new_source):
+        resources = iter_remote_resources(
+            new_source, args.get('--new-auth') or args['--auth'],
+            int(args['--page-size']), int(args['--concurrency']))
+    else:
+        resources = iter_resources(new_source)
+
+    with store.save(resources) as new:
+        if old is None:
+            return None
+        with old:
+            return build_report(
+                old.records(), new.records(), args,
+                lambda old_records, new_records: snapshot_field_changes(
+                    old, new, old_records, new_records))
+
+
+def build_report(old_building_data_dict, new_building_data_dict, args,
+                 changes):
+    """
+    Builds the report from the compact records of both snapshots; changes
+    is called with both record dicts to get the field-level changes.
+    """
+    old_bdict_view = set(old_building_data_dict)
+    new_bdict_view = set(new_building_data_dict)
+
+    # Names aren't unique, so every pair of keys is keyed by the old id:
+    # buildings that kept their id pair with themselves, and the rekeyed
+    # ones are added once the matcher has paired them.
+    bkey_intersections = {}
+    for b in old_bdict_view & new_bdict_view:
+        bkey_intersections[b] = {
+            "name": new_building_data_dict[b].name,
+            "old": b,
+            "new": b
+        }
+
+    gone_old_buildings = sorted(old_bdict_view - new_bdict_view)
+    gone_new_buildings = sorted(new_bdict_view - old_bdict_view)
+    rekeyedBuildings = match_rekeyed(
+        [old_building_data_dict[b] for b in gone_old_buildings],
+        [new_building_data_dict[b] for b in gone_new_buildings],
+        float(args['--radius']), float(args['--min-score']))
+    rekeyedNewIds = set(match.new.id for match in rekeyedBuildings)
+    totallyNewBuildings = [b for b in gone_new_buildings if b not in rekeyedNewIds]
+
+    for match in rekeyedBuildings:
+        bkey_intersections[match.old.id] = {
+            "name": match.old.name,
+            "old": match.old.id,
+            "new": match.new.id
+        }
+
+    changed_buildings = changes(old_building_data_dict, new_building_data_dict)
+
+    return {
+        "gone": [[b, old_building_data_dict[b].name] for b in gone_old_buildings],
+        "rekeyed": [{
+            "old": match.old.id,
+            "oldName": match.old.name,
+            "new": match.new.id,
+            "name": match.new.name,
+            "distance": match.distance
+        } for match in rekeyedBuildings],
+        "new": [[b, new_building_data_dict[b].name] for b in totallyNewBuildings],
+        "changed": [{
+            "id": b,
+            "name": new_building_data_dict[b].name,
+            "changes": changed_buildings[b]
+        } for b in sorted(changed_buildings)],
+        "oldNewKeys": bkey_intersections
+    }
+
+
+def describe_change(path, old_value, new_value):
+    # Geometries and open hour lists are too long to print usefully
+    if isinstance(old_value, (dict, list)) or isinstance(new_value, (dict, list)):
+        return path
+    return "{}: {} -> {}".format(path, json.dumps(old_value), json.dumps(new_value))
+
+
+def has_differences(report):
+    return any(report[section] for section in ["gone", "rekeyed", "new", "changed"])
+
+
+def print_report(report):
+    if report["gone"] or report["rekeyed"] or report["new"]:
+        # There are differences
+        print("\nThese are old ID keys (from the older data) that are no longer present in the new data\n")
+        for gone_b, name in report["gone"]:
+            print(gone_b + "  ---  " + name)
+
+        print("\nThese are new location keys that didn't exist in the old data\n")
+
+        for match in report["rekeyed"]:
+            detail = "was " + match["old"]
+            if match["oldName"] != match["name"]:
+                detail += " " + match["oldName"]
+            if match["distance"] is not None:
+                detail += ", {:.0f}m away".format(match["distance"])
+            print(match["new"] + "  --- REKEYED! ---  " + match["name"] +
+                  "  (" + detail + ")")
+
+        print("\nThese are the totally new buildings\n")
+        for new_b, name in report["new"]:
+            print(new_b + "  ---  " + name)
+
+    if report["changed"]:
+        print("\nThese are locations whose attributes changed\n")
+        for changed_b in report["changed"]:
+            print(changed_b["id"] + "  ---  " + changed_b["name"])
+            for change in changed_b["changes"]:
+                print("    " + describe_change(*change))
+
+    if not has_differences(report):
+        print("There are no differences.")
+
 
 if __name__ == "__main__":
-    
-    if(args['<old_data_path>'] == args['<new_data_path>']):
-        print "These are the same file..."
+    args = docopt(__doc__, version='1.0.0rc2')
+
+    if args['--store']:
+        report = compare_with_store(args['<new_data_path>'], args)
+        if report is None:
+            print("Saved the first snapshot in " + args['--store'] +
+                  "; there is nothing to compare it with yet.")
+            sys.exit(0)
+    elif(args['<old_data_path>'] == args['<new_data_path>']):
+        print("These are the same file...")
         sys.exit(1)
     else:
+        report = compare(args['<old_data_path>'], args['<new_data_path>'], args)
+
+    # TODO Add -o output filename option for (OLD,NEW) keyed building json file
+    print("\n Outputing buildings with new and old keys to buildingsWithOldNewKeys.json\n")
+    with open("buildingsWithOldNewKeys.json", "w") as intersection_file:
+        intersection_file.write(json.dumps(
+            {"buildings": report["oldNewKeys"]},indent=4, sort_keys=True))
 
-        with open(args['<old_data_path>'], "r") as old_json_file, open(args['<new_data_path>'], "r") as new_json_file:
-            new_building_data_dict, new_names2ids = create_mappings(json.loads(new_json_file.read()))
-            old_building_data_dict, old_names2ids = create_mappings(json.loads(old_json_file.read()))
-
-        old_bdict_view = old_building_data_dict.viewkeys()
-        new_bdict_view = new_building_data_dict.viewkeys()
-
-        bkey_intersections = {}
-        for k in old_names2ids.viewkeys() & new_names2ids.viewkeys():
-            bkey_intersections[k] = {
-                "old": old_names2ids[k],
-                "new": new_names2ids[k]
-            }
-
-        # TODO Add -o output filename option for (OLD,NEW) keyed building json file
-        print "\n Outputing buildings with new and old keys to buildingsWithOldNewKeys.json\n"
-        with open("buildingsWithOldNewKeys.json", "w") as intersection_file:
-            intersection_file.write(json.dumps(
-                {"buildings": bkey_intersections},indent=4, sort_keys=True))
-        # Report Processing
-        rekeyCheckDict = {}
-        rekeyedBuildings = []
-        totallyNewBuildings = []
-
-        # Dictionary View symetric diff returns set([]) when theres no difference
-        if (old_bdict_view ^ new_bdict_view) != set([]):
-            # There are differences
-            print "\nThese are old ID keys (from the older data) that are no longer present in the new data\n"
-            gone_old_buildings = list(old_bdict_view - new_bdict_view)
-
-            for gone_b in gone_old_buildings:
-                print gone_b + "  ---  " + old_building_data_dict[gone_b]['attributes']['name']
-                rekeyCheckDict[old_building_data_dict[gone_b]
-                               ['attributes']['name']] = gone_b
-
-            print "\nThese are new location keys that didn't exist in the old data\n"
-
-            gone_new_buildings = list(new_bdict_view - old_bdict_view)
-            for gone_b in gone_new_buildings:
-                bname = new_building_data_dict[gone_b]['attributes']['name']
-                if bname in rekeyCheckDict:
-                    print gone_b + "  --- REKEYED! ---  " + new_building_data_dict[gone_b]['attributes']['name']
-                    rekeyedBuildings.append(gone_b)
-                else:
-                    totallyNewBuildings.append(gone_b)
-
-            print "\nThese are the totally new buildings\n"
-            for gone_b in totallyNewBuildings:
-                print gone_b + "  ---  " + new_building_data_dict[gone_b]['attributes']['name']
-
-        else:
-            print "There are no differences."
-
-# TODO sort output
+    print_report(report)
@@ -0,0 +1,75 @@
+"""
+Field-level change detection between two snapshots.
+
+The diff runs in two passes. The first pass compares the compact records
+built by snapshot_stream: locations whose digests match are unchanged and
+are never looked at again. The second pass streams both snapshots once more,
+keeping the attributes of only the locations whose digests differ, and
+walks those attribute trees to find exactly which fields changed.
+"""
+from __future__ import print_function
+
+from snapshot_stream import iter_resources, normalize_attributes
+
+
+def changed_ids(old_records, new_records):
+    """Returns the ids present in both snapshots whose digests differ."""
+    return set(location_id for location_id in old_records
+               if location_id in new_records and
+               old_records[location_id].digest !=
+               new_records[location_id].digest)
+
+
+def load_attributes(path, ids):
+    """Streams the snapshot at path, keeping the attributes of ids only."""
+    attributes = {}
+    for resource in iter_resources(path):
+        if resource['id'] in ids:
+            attributes[resource['id']] = normalize_attributes(
+                resource.get('attributes'))
+    return attributes
+
+
+def diff_attributes(old, new, prefix=''):
+    """
+    Yields (path, old_value, new_value) for every field that differs.
+
+    Nested objects such as openHours are walked so the path points at the
+    changed member (e.g. "openHours.3"); lists such as geometry coordinates
+    are compared as a whole.
+    """
+    for key in sorted(set(old) | set(new)):
+        path = prefix + key
+        old_value, new_value = old.get(key), new.get(key)
+        if old_value == new_value:
+            continue
+        if isinstance(old_value, dict) and isinstance(new_value, dict):
+            for change in diff_attributes(old_value, new_value, path + '.'):
+                yield change
+        else:
+            yield (path, old_value, new_value)
+
+
+def field_changes(old_path, new_path, old_records, new_records):
+    """
+    Returns {id: [(path, old_value, new_value), ...]} for every location
+    whose content changed between the two snapshots.
+
+    Locations whose digests differ only because one snapshot carries ES
+    hashCodes and the other does not come back without changes and are
+    left out.
+    """
+    ids = changed_ids(old_records, new_records)
+    if not ids:
+        return {}
+
+    old_attributes = load_attributes(old_path, ids)
+    new_attributes = load_attributes(new_path, ids)
+
+    changes = {}
+    for location_id in ids:
+        location_changes = list(diff_attributes(old_attributes[location_id],
+                                                new_attributes[location_id]))
+        if location_changes:
+            changes[location_id] = location_changes
+    return changes
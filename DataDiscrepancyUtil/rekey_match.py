@@ -0,0 +1,144 @@
+"""
+Matches locations that disappeared from the old snapshot with locations that
+appeared in the new one, to find buildings that were rekeyed.
+
+Candidates for each disappeared location are the new locations with the same
+normalized name plus the new locations within `radius` meters, found through
+a uniform grid over lat/lon whose cells are `radius` of latitude on a side,
+so only the neighbouring cells that radius reaches are ever searched. Each
+candidate pair is scored from name similarity and proximity, and pairs are
+accepted greedily from the best score down, one match per location. This
+keeps matching near O(n log n) rather than comparing every pair, and unlike a
+name lookup it neither drops duplicate names nor misses buildings that were
+renamed along with the new key.
+"""
+from __future__ import print_function
+
+import math
+import re
+from collections import defaultdict, namedtuple
+from difflib import SequenceMatcher
+
+DEFAULT_RADIUS_METERS = 100.0
+DEFAULT_MIN_SCORE = 0.6
+
+METERS_PER_DEGREE = 111320.0
+
+RekeyMatch = namedtuple('RekeyMatch',
+                        ['old', 'new', 'score', 'distance'])
+
+_NON_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_name(name):
+    return _NON_ALPHANUMERIC.sub(' ', (name or '').lower()).strip()
+
+
+def has_point(record):
+    return record.lat is not None and record.lon is not None
+
+
+def distance_meters(a, b):
+    """Equirectangular approximation; plenty for distances within a campus."""
+    x = math.radians(b.lon - a.lon) * math.cos(
+        math.radians((a.lat + b.lat) / 2.0))
+    y = math.radians(b.lat - a.lat)
+    return math.hypot(x, y) * 6371000.0
+
+
+class GridIndex(object):
+    """
+    Buckets records into cells cell_meters of latitude high and as many
+    degrees wide. A degree of longitude is shorter than one of latitude, so
+    near() searches as many columns either side as radius spans at the
+    latitude of the record asked about, and keeps the records within radius.
+    Every column is the same width at any latitude, so two records within
+    radius are always in reach of each other.
+    """
+
+    def __init__(self, records, cell_meters):
+        self.cell_meters = cell_meters
+        self.step = cell_meters / METERS_PER_DEGREE
+        self.cells = defaultdict(list)
+        for record in records:
+            if has_point(record):
+                self.cells[self._cell(record.lat, record.lon)].append(record)
+
+    def _cell(self, lat, lon):
+        return (int(math.floor(lat / self.step)),
+                int(math.floor(lon / self.step)))
+
+    def near(self, record):
+        """Yields the records within cell_meters of record."""
+        row, column = self._cell(record.lat, record.lon)
+        columns = int(math.ceil(1.0 / max(
+            math.cos(math.radians(min(abs(record.lat) + self.step, 90.0))),
+            0.01)))
+        for d_row in (-1, 0, 1):
+            for d_column in range(-columns, columns + 1):
+                for candidate in self.cells.get((row + d_row,
+                                                 column + d_column), []):
+                    if distance_meters(record, candidate) <= \
+                            self.cell_meters:
+                        yield candidate
+
+
+def score_pair(old, new, radius):
+    """
+    Returns (score, distance) for a candidate pair. Name similarity and
+    proximity weigh equally, so an identical name far away or a different
+    name on the same spot alone is not enough. Without coordinates on both
+    sides only the name can be compared.
+    """
+    name_score = SequenceMatcher(None, normalize_name(old.name),
+                                 normalize_name(new.name)).ratio()
+    if not (has_point(old) and has_point(new)):
+        return name_score, None
+    distance = distance_meters(old, new)
+    proximity = max(0.0, 1.0 - distance / radius)
+    return (name_score + proximity) / 2.0, distance
+
+
+def match_rekeyed(gone, added, radius=DEFAULT_RADIUS_METERS,
+                  min_score=DEFAULT_MIN_SCORE):
+    """
+    Returns a list of RekeyMatch pairing records from gone (old ids missing
+    from the new data) with records from added (new ids missing from the
+    old data), best matches first.
+    """
+    grid = GridIndex(added, radius)
+    by_name = defaultdict(list)
+    for record in added:
+        by_name[normalize_name(record.name)].append(record)
+    gone_name_counts = defaultdict(int)
+    for record in gone:
+        gone_name_counts[normalize_name(record.name)] += 1
+
+    candidates = []
+    for old in gone:
+        seen = set()
+        name = normalize_name(old.name)
+        same_name = by_name.get(name, [])
+        nearby = grid.near(old) if has_point(old) else []
+        for new in list(same_name) + list(nearby):
+            if new.id in seen:
+                continue
+            seen.add(new.id)
+            score, distance = score_pair(old, new, radius)
+            if name and len(same_name) == 1 and gone_name_counts[name] == 1 \
+                    and normalize_name(new.name) == name:
+                # A name that is unique on both sides is still a match when
+                # the coordinates moved further than radius.
+                score = max(score, min_score)
+            if score >= min_score:
+                candidates.append(RekeyMatch(old, new, score, distance))
+
+    candidates.sort(key=lambda match: match.score, reverse=True)
+    matched_old, matched_new, matches = set(), set(), []
+    for match in candidates:
+        if match.old.id in matched_old or match.new.id in matched_new:
+            continue
+        matched_old.add(match.old.id)
+        matched_new.add(match.new.id)
+        matches.append(match)
+    return matches
@@ -0,0 +1,204 @@
+"""
+Fetches a /locations snapshot page by page instead of as one
+page[size]=10000 response.
+
+The first page is requested on its own to learn the page count from
+links.last; the remaining pages are then requested by a small thread pool
+over one keep-alive session, at most `concurrency` pages ahead of the page
+being consumed. Pages are consumed in order and written straight into a
+snapshot file while their compact records are collected, so neither the
+client nor the API ever holds more than a few pages at once. Resources
+that show up on two pages are only kept once, and a snapshot whose pages
+don't add up to the total fails with IncompleteSnapshotError.
+
+Export urls (/locations/export, /services/export) are read as the NDJSON
+stream the API writes instead, one resource per line as it arrives.
+"""
+from __future__ import print_function
+
+import json
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+try:
+    from urllib.parse import parse_qs, urlsplit, urlunsplit
+except ImportError:
+    from urlparse import parse_qs, urlsplit, urlunsplit
+
+from snapshot_stream import canonical_json, compact_record, \
+                            normalize_attributes, serialize_resource
+
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_CONCURRENCY = 4
+TIMEOUT_SECONDS = 60
+EXPORT_PATH = '/export'
+
+
+def make_session(concurrency=DEFAULT_CONCURRENCY, auth_header=None):
+    """
+    Returns a session whose connection pool fits `concurrency` keep-alive
+    connections and which retries failed GETs with exponential backoff.
+    """
+    retry = Retry(total=5, backoff_factor=0.5,
+                  status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if auth_header:
+        session.headers['Authorization'] = auth_header
+    return session
+
+
+def split_url(url):
+    """Splits url into the bare endpoint and its query parameters."""
+    parts = urlsplit(url)
+    return (urlunsplit((parts.scheme, parts.netloc, parts.path, '', '')),
+            parse_qs(parts.query))
+
+
+def last_page_number(links):
+    """
+    Reads page[number] from links.last. The links are built from the API's
+    configured endpointUri, so only the page number is taken from them and
+    requests keep going to the url we were given.
+    """
+    last = (links or {}).get('last')
+    if not last:
+        return 1
+    return int(parse_qs(urlsplit(last).query).get('page[number]', ['1'])[0])
+
+
+def get_page(session, url, params, page_number, page_size):
+    page_params = dict(params)
+    page_params['page[number]'] = page_number
+    page_params['page[size]'] = page_size
+    response = session.get(url, params=page_params, timeout=TIMEOUT_SECONDS)
+    response.raise_for_status()
+    return response.json()
+
+
+class IncompleteSnapshotError(Exception):
+    """
+    Raised when the pages of a snapshot don't add up to the locations the
+    API reported, because the index changed or the hits were reordered
+    between two page requests.
+    """
+
+
+def iter_pages(session, url, params=None, page_size=DEFAULT_PAGE_SIZE,
+               concurrency=DEFAULT_CONCURRENCY):
+    """
+    Yields the "data" list of every page, in page order, without the
+    resources already yielded by an earlier page.
+
+    Pages are requested independently by page[number], and hits of equal
+    score are not kept in the same order from one request to the next, so a
+    location can show up on two pages and another on none. Duplicates are
+    dropped, and IncompleteSnapshotError is raised once the pages are read
+    if the unique resources don't number (last page - 1) * page_size plus
+    the size of the last page, the total links.last implies.
+    """
+    params = dict(params or {})
+    seen = set()
+
+    def unseen(data):
+        fresh = [resource for resource in data
+                 if resource.get('id') not in seen]
+        seen.update(resource.get('id') for resource in fresh)
+        return fresh
+
+    first_page = get_page(session, url, params, 1, page_size)
+    last_page = last_page_number(first_page.get('links'))
+    yield unseen(first_page['data'])
+    last_page_size = len(first_page['data'])
+
+    if last_page > 1:
+        pool = ThreadPool(concurrency)
+        try:
+            pending = deque()
+            next_page = 2
+            while pending or next_page <= last_page:
+                while next_page <= last_page and len(pending) < concurrency:
+                    pending.append(pool.apply_async(
+                        get_page,
+                        (session, url, params, next_page, page_size)))
+                    next_page += 1
+                data = pending.popleft().get()['data']
+                last_page_size = len(data)
+                yield unseen(data)
+        finally:
+            pool.terminate()
+
+    expected = (last_page - 1) * page_size + last_page_size
+    if len(seen) != expected:
+        raise IncompleteSnapshotError(
+            '{} pages of {} held {} distinct resources instead of {}: its'
+            ' hits changed or were reordered while it was read; use the'
+            ' export url for a consistent snapshot'.format(
+                last_page, url, len(seen), expected))
+
+
+def iter_export(session, url):
+    """
+    Yields every resource of an NDJSON export endpoint as its line is
+    received. The export is a full dump: query parameters do not apply.
+    """
+    response = session.get(url, stream=True, timeout=TIMEOUT_SECONDS)
+    response.raise_for_status()
+    try:
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line.decode('utf-8'))
+    finally:
+        response.close()
+
+
+def iter_remote_resources(url, auth_header=None, page_size=DEFAULT_PAGE_SIZE,
+                          concurrency=DEFAULT_CONCURRENCY):
+    """
+    Yields every resource of url, page by page (query parameters such as
+    type=building are kept), or line by line for an export url.
+    """
+    endpoint, params = split_url(url)
+    session = make_session(concurrency, auth_header)
+    if endpoint.endswith(EXPORT_PATH):
+        for resource in iter_export(session, endpoint):
+            yield resource
+        return
+    for page in iter_pages(session, endpoint, params, page_size, concurrency):
+        for resource in page:
+            yield resource
+
+
+def fetch_snapshot(url, path, auth_header=None, page_size=DEFAULT_PAGE_SIZE,
+                   concurrency=DEFAULT_CONCURRENCY):
+    """
+    Fetches every page of url into a snapshot file at path and returns
+    {id: LocationRecord}.
+    """
+    records = {}
+    # json.dumps escapes non-ASCII, so the snapshot is plain ASCII text
+    with open(path, 'w') as snapshot_file:
+        snapshot_file.write('{"links": {}, "data": [')
+        separator = ''
+        for resource in iter_remote_resources(url, auth_header, page_size,
+                                              concurrency):
+            canonical = canonical_json(
+                normalize_attributes(resource.get('attributes')))
+            snapshot_file.write(separator +
+                                serialize_resource(resource, canonical))
+            separator = ','
+            record = compact_record(resource, canonical)
+            records[record.id] = record
+        snapshot_file.write(']}')
+    return records
+
+
+def is_url(source):
+    return source.startswith('http://') or source.startswith('https://')
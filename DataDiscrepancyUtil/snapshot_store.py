@@ -0,0 +1,292 @@
+"""
+    On-disk store of /locations snapshots, so each pull can be diffed against
+    the previous one without keeping raw multi-megabyte dumps around.
+
+    Every snapshot is a pair of files named after the time it was saved:
+
+    <name>.jsonl  one resource per line, attributes normalized to the API
+                  shape and serialized with canonical_json, sorted by id
+    <name>.idx    one JSON array per line, also sorted by id:
+                  [id, offset, length, name, lat, lon, digest, field digests]
+                  where offset and length locate the resource in the .jsonl
+                  file and field digests maps every top-level attribute to a
+                  short digest of its value
+
+    Both files are memory-mapped when a snapshot is opened. Looking a location
+    up is a binary search over the index lines, so history queries touch a
+    handful of index lines per snapshot, and a diff reads the .jsonl lines of
+    changed locations only, and of those only the attributes whose field
+    digests differ.
+
+    Usage:
+    snapshot_store.py list <store>
+    snapshot_store.py import [--name=<name>] <store> <snapshot>
+    snapshot_store.py history [--field=<attribute>] <store> <location_id>
+
+    Arguments:
+        store: Directory holding the snapshots
+        snapshot: A /locations response or Elastic Search response file to store
+        location_id: Location to show the history of
+
+    Options:
+        --name=<name>          Snapshot name (the current UTC time when not given)
+        --field=<attribute>    Only report changes to this attribute (e.g. geometry)
+"""
+from __future__ import print_function
+
+import binascii
+import datetime
+import hashlib
+import json
+import mmap
+import os
+from collections import namedtuple
+
+from docopt import docopt
+
+from location_diff import diff_attributes
+from snapshot_stream import LocationRecord, canonical_json, content_digest, \
+                            iter_resources, location_point, \
+                            normalize_attributes, serialize_resource
+
+FIELD_DIGEST_LENGTH = 16
+
+IndexEntry = namedtuple('IndexEntry', ['id', 'offset', 'length', 'name',
+                                       'lat', 'lon', 'digest', 'fields'])
+
+
+def field_digests(attributes):
+    """Returns {attribute: short hex digest of its canonical JSON}."""
+    return dict((key, hashlib.sha1(canonical_json(value).encode('utf-8'))
+                 .hexdigest()[:FIELD_DIGEST_LENGTH])
+                for key, value in attributes.items())
+
+
+def _map(path):
+    with open(path, 'rb') as mapped_file:
+        if os.fstat(mapped_file.fileno()).st_size == 0:
+            # mmap refuses empty files
+            return b''
+        return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _parse_entry(line):
+    return IndexEntry(*json.loads(line.decode('utf-8')))
+
+
+class Snapshot(object):
+    """A stored snapshot, with its index and data files memory-mapped."""
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.index = _map(os.path.join(directory, name + '.idx'))
+        self.data = _map(os.path.join(directory, name + '.jsonl'))
+
+    def close(self):
+        for mapped in (self.index, self.data):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def entries(self):
+        """Yields every IndexEntry in id order."""
+        start = 0
+        while start < len(self.index):
+            end = self.index.find(b'\n', start)
+            yield _parse_entry(self.index[start:end])
+            start = end + 1
+
+    def find(self, location_id):
+        """Returns the IndexEntry of location_id, or None."""
+        low, high = 0, len(self.index)
+        while low < high:
+            middle = (low + high) // 2
+            start = self.index.rfind(b'\n', 0, middle) + 1
+            end = self.index.find(b'\n', start)
+            entry = _parse_entry(self.index[start:end])
+            if entry.id == location_id:
+                return entry
+            if entry.id < location_id:
+                low = end + 1
+            else:
+                high = start
+        return None
+
+    def resource(self, entry):
+        line = self.data[entry.offset:entry.offset + entry.length]
+        return json.loads(line.decode('utf-8'))
+
+    def records(self):
+        """Returns {id: LocationRecord}, built from the index alone."""
+        return dict((entry.id, LocationRecord(entry.id, entry.name,
+                                              entry.digest, entry.lat,
+                                              entry.lon))
+                    for entry in self.entries())
+
+
+def snapshot_field_changes(old, new, old_records, new_records):
+    """
+    Returns {id: [(path, old_value, new_value), ...]} like
+    location_diff.field_changes, for two stored snapshots. Only attributes
+    whose field digests differ are read and walked.
+    """
+    changes = {}
+    for location_id in old_records:
+        if location_id not in new_records or \
+                old_records[location_id].digest == \
+                new_records[location_id].digest:
+            continue
+        old_entry, new_entry = old.find(location_id), new.find(location_id)
+        fields = set(key for key in set(old_entry.fields) | set(new_entry.fields)
+                     if old_entry.fields.get(key) != new_entry.fields.get(key))
+        old_attributes = old.resource(old_entry)['attributes']
+        new_attributes = new.resource(new_entry)['attributes']
+        location_changes = list(diff_attributes(
+            dict((key, old_attributes[key]) for key in fields
+                 if key in old_attributes),
+            dict((key, new_attributes[key]) for key in fields
+                 if key in new_attributes)))
+        if location_changes:
+            changes[location_id] = location_changes
+    return changes
+
+
+class SnapshotStore(object):
+    """A directory of snapshots, oldest to newest by name."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, name, extension):
+        return os.path.join(self.directory, name + extension)
+
+    def names(self):
+        # The index is written last, so it marks a complete snapshot
+        return sorted(file_name[:-len('.idx')]
+                      for file_name in os.listdir(self.directory)
+                      if file_name.endswith('.idx'))
+
+    def open(self, name):
+        return Snapshot(self.directory, name)
+
+    def latest(self):
+        """Returns the newest Snapshot, or None for an empty store."""
+        names = self.names()
+        return self.open(names[-1]) if names else None
+
+    def save(self, resources, name=None):
+        """
+        Stores resources as a new snapshot and returns it opened. Resources
+        are written in arrival order first, keeping only their index entries
+        in memory, then copied into id order through a memory map of that
+        file, so a pull is never held in memory as a whole.
+        """
+        name = name or datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S.%fZ')
+        if os.path.exists(self._path(name, '.idx')):
+            raise ValueError("snapshot {} already exists".format(name))
+
+        unsorted_path = self._path(name, '.unsorted')
+        entries = {}
+        offset = 0
+        # json.dumps escapes non-ASCII, so every line is plain ASCII text
+        with open(unsorted_path, 'w') as unsorted_file:
+            for resource in resources:
+                if resource['id'] in entries:
+                    continue
+                attributes = normalize_attributes(resource.get('attributes'))
+                canonical = canonical_json(attributes)
+                line = serialize_resource(resource, canonical)
+                unsorted_file.write(line + '\n')
+                lat, lon = location_point(attributes)
+                entries[resource['id']] = IndexEntry(
+                    resource['id'], offset, len(line), attributes.get('name'),
+                    lat, lon,
+                    binascii.hexlify(content_digest(canonical)).decode('ascii'),
+                    field_digests(attributes))
+                offset += len(line) + 1
+
+        unsorted = _map(unsorted_path)
+        try:
+            with open(self._path(name, '.jsonl'), 'wb') as data_file, \
+                    open(self._path(name, '.idx.tmp'), 'w') as index_file:
+                offset = 0
+                for location_id in sorted(entries):
+                    entry = entries[location_id]
+                    data_file.write(
+                        unsorted[entry.offset:entry.offset + entry.length + 1])
+                    index_file.write(json.dumps(
+                        list(entry._replace(offset=offset))) + '\n')
+                    offset += entry.length + 1
+        finally:
+            if isinstance(unsorted, mmap.mmap):
+                unsorted.close()
+            os.remove(unsorted_path)
+        os.rename(self._path(name, '.idx.tmp'), self._path(name, '.idx'))
+        return self.open(name)
+
+    def history(self, location_id, field=None):
+        """
+        Yields (snapshot name, change) for every snapshot in which
+        location_id appeared, disappeared or changed, oldest first. change
+        is 'added', 'removed' or the sorted list of changed attributes; with
+        field, only changes to that attribute are reported.
+        """
+        previous = None
+        for name in self.names():
+            with self.open(name) as snapshot:
+                entry = snapshot.find(location_id)
+            if entry is None:
+                if previous is not None:
+                    yield name, 'removed'
+            elif previous is None:
+                yield name, 'added'
+            else:
+                changed = sorted(
+                    key for key in set(previous.fields) | set(entry.fields)
+                    if previous.fields.get(key) != entry.fields.get(key) and
+                    field in (None, key))
+                if changed:
+                    yield name, changed
+            previous = entry
+
+    def last_changed(self, location_id, field=None):
+        """
+        Returns the name of the snapshot in which location_id (or its field)
+        last changed or was added, or None if it never was stored.
+        """
+        last = None
+        for name, change in self.history(location_id, field):
+            if change != 'removed':
+                last = name
+        return last
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    store = SnapshotStore(args['<store>'])
+
+    if args['list']:
+        for name in store.names():
+            with store.open(name) as snapshot:
+                print("{}  {} locations".format(
+                    name, sum(1 for _ in snapshot.entries())))
+    elif args['import']:
+        with store.save(iter_resources(args['<snapshot>']),
+                        args['--name']) as snapshot:
+            print(snapshot.name)
+    else:
+        for name, change in store.history(args['<location_id>'],
+                                          args['--field']):
+            if isinstance(change, list):
+                change = "changed " + ", ".join(change)
+            print("{}  {}".format(name, change))
+        last = store.last_changed(args['<location_id>'], args['--field'])
+        print("\n{} last changed in {}".format(
+            args['--field'] or args['<location_id>'], last or "no snapshot"))
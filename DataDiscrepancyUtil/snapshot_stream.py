@@ -0,0 +1,232 @@
+"""
+Incremental reader for /locations snapshot dumps.
+
+A snapshot is either the JSON body returned by the frontend's /locations
+endpoint (a top-level object with "links" and a "data" array of resource
+objects) or a raw Elasticsearch search response, whose hits carry the same
+resource objects in "_source". Instead of handing the whole file to
+json.loads, the reader below decodes the array one resource at a time, so
+only the current resource (and whatever the caller decides to keep of it)
+is held in memory.
+"""
+from __future__ import print_function
+
+import hashlib
+import io
+import json
+from collections import namedtuple
+
+CHUNK_SIZE = 64 * 1024
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+# The compact per-location record kept by the diff instead of the full
+# resource object. digest is derived from the ES hashCode when the snapshot
+# carries one, otherwise it is a SHA-1 of the canonical attributes JSON.
+# lat and lon are None for locations without any coordinates.
+LocationRecord = namedtuple('LocationRecord',
+                            ['id', 'name', 'digest', 'lat', 'lon'])
+
+# Attributes that only exist in the ES documents; LocationMapper drops them
+# before serving a location, so they are not part of the content.
+ES_ONLY_ATTRIBUTES = ['geoLocation', 'parent', 'locationId', 'hashCode']
+
+
+class _Reader(object):
+    """Pull-style JSON tokenizer over a file object, refilled in chunks."""
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # Grow reads geometrically with the pending value so re-decoding a
+        # large resource stays linear in its size.
+        pending = len(self.buf) - self.pos
+        chunk = self.stream.read(max(self.chunk_size, pending))
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and \
+                    self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return ''
+            self._fill()
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError('Expected {!r} but found {!r}'.format(
+                char, found or 'end of file'))
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                # A number or literal that ends exactly at the end of the
+                # buffer may continue in the next chunk.
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            self._fill()
+
+    def array(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
+
+
+def _seek_member(reader, keys):
+    """
+    Advances the reader to the value of the first member whose key is in
+    keys, decoding and discarding the members before it. Returns the key,
+    or None when the object ends first.
+    """
+    reader.expect('{')
+    while reader.peek() != '}':
+        key = reader.value()
+        reader.expect(':')
+        if key in keys:
+            return key
+        reader.value()
+        if reader.peek() == ',':
+            reader.pos += 1
+    reader.expect('}')
+    return None
+
+
+def iter_data(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yields the resource objects of the snapshot one by one.
+
+    For API snapshots these are the items of the top-level "data" array; for
+    Elasticsearch responses they are the "_source" of each hit. Other
+    members (links, meta, took, ...) are decoded and discarded.
+    """
+    reader = _Reader(stream, chunk_size)
+    key = _seek_member(reader, ['data', 'hits'])
+    if key == 'data':
+        for resource in reader.array():
+            yield resource
+    elif key == 'hits' and _seek_member(reader, ['hits']):
+        for hit in reader.array():
+            yield hit['_source']
+
+
+def normalize_attributes(attributes):
+    """
+    Returns attributes in the shape the API serves them, so ES documents and
+    API snapshots can be compared with each other.
+    """
+    attributes = dict(attributes or {})
+    geo_location = attributes.get('geoLocation')
+    if geo_location and 'latitude' not in attributes:
+        attributes['latitude'] = str(geo_location.get('lat'))
+        attributes['longitude'] = str(geo_location.get('lon'))
+    for attribute in ES_ONLY_ATTRIBUTES:
+        attributes.pop(attribute, None)
+    return attributes
+
+
+def location_point(attributes):
+    """
+    Returns (lat, lon) from latitude/longitude, the ES geoLocation, or the
+    mean vertex of the first geometry ring, whichever is present first.
+    """
+    try:
+        if attributes.get('latitude') and attributes.get('longitude'):
+            return (float(attributes['latitude']),
+                    float(attributes['longitude']))
+        geo_location = attributes.get('geoLocation')
+        if geo_location and geo_location.get('lat') is not None:
+            return float(geo_location['lat']), float(geo_location['lon'])
+    except (TypeError, ValueError):
+        pass
+
+    coordinates = (attributes.get('geometry') or {}).get('coordinates')
+    # Polygon rings are lists of [lon, lat]; MultiPolygons nest one deeper
+    while coordinates and isinstance(coordinates[0], list) and \
+            coordinates[0] and isinstance(coordinates[0][0], list):
+        coordinates = coordinates[0]
+    if not coordinates or not isinstance(coordinates[0], list):
+        return None, None
+    return (sum(vertex[1] for vertex in coordinates) / len(coordinates),
+            sum(vertex[0] for vertex in coordinates) / len(coordinates))
+
+
+def canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def content_digest(canonical):
+    """Returns a SHA-1 digest of a canonical_json serialization."""
+    return hashlib.sha1(canonical.encode('utf-8')).digest()
+
+
+def serialize_resource(resource, canonical_attributes):
+    """
+    Serializes resource with the attributes already serialized by
+    canonical_json spliced in, instead of encoding its geometry and open
+    hours a second time.
+    """
+    head = json.dumps(dict((key, value) for key, value in resource.items()
+                           if key != 'attributes'))
+    return head[:-1] + ', "attributes": ' + canonical_attributes + '}'
+
+
+def compact_record(resource, canonical_attributes=None):
+    """
+    Builds the LocationRecord of resource. Callers that already serialized
+    the normalized attributes with canonical_json can pass the result to
+    avoid serializing them twice.
+    """
+    attributes = resource.get('attributes') or {}
+    if attributes.get('hashCode') is not None:
+        # ES already hashed the document when it was indexed
+        digest = 'hashCode:{}'.format(attributes['hashCode'])
+    else:
+        if canonical_attributes is None:
+            canonical_attributes = canonical_json(
+                normalize_attributes(attributes))
+        digest = content_digest(canonical_attributes)
+    lat, lon = location_point(attributes)
+    return LocationRecord(resource['id'], attributes.get('name'), digest,
+                          lat, lon)
+
+
+def iter_resources(path):
+    """Yields every resource object in the snapshot file."""
+    with io.open(path, 'r', encoding='utf-8') as snapshot_file:
+        for resource in iter_data(snapshot_file):
+            yield resource
+
+
+def iter_records(path):
+    """Yields a LocationRecord for every resource in the snapshot file."""
+    for resource in iter_resources(path):
+        yield compact_record(resource)
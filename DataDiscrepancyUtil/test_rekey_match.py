@@ -0,0 +1,68 @@
+"""
+Tests of rekey_match.py:
+
+    python -m unittest test_rekey_match
+"""
+import math
+import random
+import unittest
+
+from rekey_match import METERS_PER_DEGREE, GridIndex, distance_meters, \
+                        match_rekeyed
+from snapshot_stream import LocationRecord
+
+
+def record(id, name, lat, lon):
+    return LocationRecord(id, name, None, lat, lon)
+
+
+def offset(lat, lon, north_meters, east_meters):
+    """Returns the point north_meters north and east_meters east of lat/lon."""
+    return (lat + north_meters / METERS_PER_DEGREE,
+            lon + east_meters / (METERS_PER_DEGREE *
+                                 math.cos(math.radians(lat))))
+
+
+class GridIndexTest(unittest.TestCase):
+    def test_pairs_offset_in_latitude(self):
+        # Pairs 90m apart, mostly north-south, around the Corvallis campus,
+        # where a column of the grid is about 80m wide
+        rng = random.Random(4)
+        old, new = [], []
+        for i in range(2000):
+            lat = 44.5 + rng.uniform(0, 0.1)
+            lon = -123.3 + rng.uniform(0, 0.1)
+            bearing = math.radians(rng.uniform(-30, 30))
+            old.append(record('old%d' % i, 'a', lat, lon))
+            new.append(record('new%d' % i, 'b', *offset(
+                lat, lon, 90 * math.cos(bearing), 90 * math.sin(bearing))))
+
+        grid = GridIndex(new, 100.0)
+        missed = [i for i in range(2000)
+                  if new[i] not in list(grid.near(old[i]))]
+        self.assertEqual(missed, [])
+
+    def test_near_keeps_records_within_radius(self):
+        center = record('old', 'a', 44.56, -123.28)
+        inside = record('inside', 'b', *offset(44.56, -123.28, 0, 99))
+        outside = record('outside', 'c', *offset(44.56, -123.28, 0, 110))
+        grid = GridIndex([inside, outside], 100.0)
+
+        self.assertEqual(list(grid.near(center)), [inside])
+        self.assertLess(distance_meters(center, inside), 100.0)
+
+    def test_match_rekeyed_duplicate_names(self):
+        gone = [record('old1', 'Extension Office', 44.56, -123.28),
+                record('old2', 'Extension Office', 45.52, -122.68)]
+        added = [record('new2', 'Extension Office',
+                        *offset(45.52, -122.68, 30, 0)),
+                 record('new1', 'Extension Office',
+                        *offset(44.56, -123.28, 0, 30))]
+
+        pairs = sorted((match.old.id, match.new.id)
+                       for match in match_rekeyed(gone, added))
+        self.assertEqual(pairs, [('old1', 'new1'), ('old2', 'new2')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 package edu.oregonstate.mist.api
 
+import edu.oregonstate.mist.api.jsonapi.ResultObject
+
 import javax.ws.rs.core.Context
 import javax.ws.rs.core.Response
 import javax.ws.rs.core.Response.ResponseBuilder
@@ -158,6 +160,80 @@ abstract class Resource {
         uriBuilder.build().toString()
     }
 
+    /**
+     * Adds pagination links to a page of search results: self, first, last, prev and next
+     * when paged by page[number], or self and next when paged by a page[after] cursor.
+     *
+     * @param resultObject result object with the list of the hits of the page as data
+     * @param totalHits number of hits of the search
+     * @param urlParams query parameters of the request, with its pageNumber and pageSize
+     * @param resourceEndpoint the endpoint to be appended on the uri
+     * @param pageAfter cursor of the page, or null when paged by page[number]
+     * @param nextPageAfter cursor of the page after this one, or null if there is none
+     */
+    protected void setPaginationLinks(ResultObject resultObject, Integer totalHits,
+                                      Map urlParams, String resourceEndpoint,
+                                      String pageAfter, String nextPageAfter) {
+        // If no results were found, no need to add links
+        if (!totalHits) {
+            return
+        }
+
+        if (pageAfter != null) {
+            setCursorLinks(resultObject, urlParams, resourceEndpoint, pageAfter, nextPageAfter)
+            return
+        }
+
+        Integer pageNumber = (Integer) urlParams.pageNumber
+        Integer pageSize = (Integer) urlParams.pageSize
+        int lastPage = Math.ceil(totalHits / pageSize)
+        resultObject.links["self"] = getPaginationUrl(urlParams, resourceEndpoint)
+        urlParams.pageNumber = 1
+        resultObject.links["first"] = getPaginationUrl(urlParams, resourceEndpoint)
+        urlParams.pageNumber = lastPage
+        resultObject.links["last"] = getPaginationUrl(urlParams, resourceEndpoint)
+
+        if (pageNumber > DEFAULT_PAGE_NUMBER) {
+            urlParams.pageNumber = pageNumber - 1
+            resultObject.links["prev"] = getPaginationUrl(urlParams, resourceEndpoint)
+        } else {
+            resultObject.links["prev"] = null
+        }
+
+        if (totalHits > (pageNumber * pageSize)) {
+            urlParams.pageNumber = pageNumber + 1
+            resultObject.links["next"] = getPaginationUrl(urlParams, resourceEndpoint)
+        } else {
+            resultObject.links["next"] = null
+        }
+    }
+
+    /**
+     * Adds the self link of a page paged by a page[after] cursor, and a link to the next page
+     * when there may be one.
+     *
+     * @param resultObject
+     * @param urlParams
+     * @param resourceEndpoint
+     * @param pageAfter
+     * @param nextPageAfter
+     */
+    private void setCursorLinks(ResultObject resultObject, Map urlParams,
+                                String resourceEndpoint, String pageAfter,
+                                String nextPageAfter) {
+        urlParams.remove("pageNumber")
+        urlParams["page[after]"] = pageAfter
+        resultObject.links["self"] = getPaginationUrl(urlParams, resourceEndpoint)
+
+        // Only a full page can be followed by more hits
+        if (((List) resultObject.data).size() == urlParams.pageSize && nextPageAfter) {
+            urlParams["page[after]"] = nextPageAfter
+            resultObject.links["next"] = getPaginationUrl(urlParams, resourceEndpoint)
+        } else {
+            resultObject.links["next"] = null
+        }
+    }
+
     /**
      *  Returns the page number used by pagination. The value of: page[number] in the url.
      *
@@ -186,6 +262,16 @@ abstract class Resource {
         pageSize.toInteger()
     }
 
+    /**
+     * Returns the cursor used by cursor pagination. The value of: page[after] in the url, which
+     * is empty for the first page, or null without cursor pagination.
+     *
+     * @return
+     */
+    protected String getPageAfter() {
+        uriInfo.getQueryParameters().getFirst('page[after]')
+    }
+
     /**
      * Returns true if page[size] exceeds MAX_PAGE_SIZE
      *
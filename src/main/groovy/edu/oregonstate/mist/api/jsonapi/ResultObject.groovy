@@ -1,5 +1,7 @@
 package edu.oregonstate.mist.api.jsonapi
 
+import com.fasterxml.jackson.annotation.JsonInclude
+
 class ResultObject {
     /**
      * Holds links to the current search and pagination links to allow the
@@ -20,4 +22,14 @@ class ResultObject {
      * @required
      */
     def data
+
+    /**
+     * Holds the ResourceObjects related to data that the request asked to
+     * include, making this a compound document. Left out of the response
+     * unless asked for.
+     *
+     * @optional
+     */
+    @JsonInclude(JsonInclude.Include.NON_NULL)
+    List<ResourceObject> included
 }
@@ -1,14 +1,23 @@
 package edu.oregonstate.mist.locations.frontend
 
+import edu.oregonstate.mist.locations.frontend.db.CachingLocationDAO
+import edu.oregonstate.mist.locations.frontend.db.IndexChangeWatcher
 import edu.oregonstate.mist.locations.frontend.db.LocationDAO
+import edu.oregonstate.mist.locations.frontend.db.LocationStore
+import edu.oregonstate.mist.locations.frontend.db.NearbyLocationDAO
 import edu.oregonstate.mist.locations.frontend.health.ElasticSearchHealthCheck
 import edu.oregonstate.mist.locations.frontend.db.ElasticSearchManager
+import edu.oregonstate.mist.locations.frontend.resources.AsyncResponses
 import edu.oregonstate.mist.locations.frontend.resources.LocationResource
+import edu.oregonstate.mist.locations.frontend.resources.SerializationTimer
 import edu.oregonstate.mist.locations.frontend.resources.ServiceResource
 import edu.oregonstate.mist.api.Application
 import groovy.transform.TypeChecked
 import io.dropwizard.setup.Environment
 
+import java.util.concurrent.ExecutorService
+import java.util.concurrent.TimeUnit
+
 /**
  * Main application class.
  */
@@ -28,17 +37,101 @@ class LocationsFrontEndApplication extends Application<LocationsFrontendConfigur
         def esManager = new ElasticSearchManager(esUrl)
         environment.lifecycle().manage(esManager)
 
-        LocationDAO locationDAO = new LocationDAO(configuration.locationsConfiguration, esManager)
+        LocationDAO esDAO = new LocationDAO(configuration.locationsConfiguration, esManager,
+                responseExecutor(configuration, environment),
+                environment.lifecycle().scheduledExecutorService("es-timeouts-%d").build())
+        esDAO.limiter.registerMetrics(environment.metrics())
+        LocationStore locationDAO = esDAO
+        if (CachingLocationDAO.isEnabled(configuration.locationsConfiguration)) {
+            locationDAO = cacheResponses(locationDAO, configuration, environment, esManager)
+        }
+        if (NearbyLocationDAO.isEnabled(configuration.locationsConfiguration)) {
+            locationDAO = indexNearbyLocations(locationDAO, configuration, environment)
+        }
 
         def endpointUri = configuration.api.endpointUri
-        environment.jersey().register(new LocationResource(locationDAO, endpointUri))
-        environment.jersey().register(new ServiceResource(locationDAO, endpointUri))
+        long timeoutSeconds = CachingLocationDAO.setting(configuration.locationsConfiguration,
+                "requestTimeoutSeconds", AsyncResponses.DEFAULT_TIMEOUT_SECONDS)
+        environment.jersey().register(new LocationResource(locationDAO, endpointUri,
+                timeoutSeconds, environment.metrics()))
+        environment.jersey().register(new ServiceResource(locationDAO, endpointUri,
+                timeoutSeconds, environment.metrics()))
+        environment.jersey().register(new SerializationTimer(environment.metrics()))
 
         ElasticSearchHealthCheck healthCheck =
                 new ElasticSearchHealthCheck(esManager.client, configuration.locationsConfiguration)
         environment.healthChecks().register("elasticSearchCluster", healthCheck)
     }
 
+    /**
+     * Returns the executor the futures of ElasticSearch responses are completed on, so that
+     * results are mapped and serialized off the transport threads, with esResponseThreads
+     * threads (default: one per processor).
+     *
+     * @param configuration
+     * @param environment
+     * @return
+     */
+    private static ExecutorService responseExecutor(LocationsFrontendConfiguration configuration,
+                                                    Environment environment) {
+        int threads = (int) CachingLocationDAO.setting(configuration.locationsConfiguration,
+                "esResponseThreads", Runtime.runtime.availableProcessors())
+        environment.lifecycle().executorService("es-responses-%d")
+                .minThreads(threads).maxThreads(threads).build()
+    }
+
+    /**
+     * Puts a response cache in front of the DAO, with its metrics, and checks the indexes for
+     * changes to clear it.
+     *
+     * @param locationDAO
+     * @param configuration
+     * @param environment
+     * @param esManager
+     * @return
+     */
+    private static CachingLocationDAO cacheResponses(LocationStore locationDAO,
+                                                     LocationsFrontendConfiguration configuration,
+                                                     Environment environment,
+                                                     ElasticSearchManager esManager) {
+        Map<String, String> locationsConfiguration = configuration.locationsConfiguration
+        def cachingDAO = new CachingLocationDAO(locationDAO, locationsConfiguration)
+        cachingDAO.registerMetrics(environment.metrics())
+
+        long checkSeconds = CachingLocationDAO.setting(locationsConfiguration,
+                "cacheIndexCheckSeconds", CachingLocationDAO.DEFAULT_INDEX_CHECK_SECONDS)
+        def watcher = new IndexChangeWatcher(esManager.client, locationsConfiguration, cachingDAO)
+        environment.lifecycle().scheduledExecutorService("index-change-watcher-%d").build()
+                .scheduleWithFixedDelay(watcher, 0, checkSeconds, TimeUnit.SECONDS)
+
+        cachingDAO
+    }
+
+    /**
+     * Answers nearby searches from an index of the locations, with its metrics, and refreshes
+     * the index on a schedule.
+     *
+     * @param locationDAO
+     * @param configuration
+     * @param environment
+     * @return
+     */
+    private static NearbyLocationDAO indexNearbyLocations(
+            LocationStore locationDAO, LocationsFrontendConfiguration configuration,
+            Environment environment) {
+        Map<String, String> locationsConfiguration = configuration.locationsConfiguration
+        def nearbyDAO = new NearbyLocationDAO(locationDAO, locationsConfiguration)
+        nearbyDAO.registerMetrics(environment.metrics())
+
+        long refreshSeconds = CachingLocationDAO.setting(locationsConfiguration,
+                "nearbyIndexRefreshSeconds", NearbyLocationDAO.DEFAULT_REFRESH_SECONDS)
+        environment.lifecycle().scheduledExecutorService("nearby-index-%d").build()
+                .scheduleWithFixedDelay({ nearbyDAO.refresh() } as Runnable, 0, refreshSeconds,
+                        TimeUnit.SECONDS)
+
+        nearbyDAO
+    }
+
     /**
      * Instantiates the application class with command-line arguments.
      *
@@ -0,0 +1,253 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import com.codahale.metrics.Gauge
+import com.codahale.metrics.MetricRegistry
+import com.google.common.cache.Cache
+import com.google.common.cache.CacheBuilder
+import com.google.common.cache.Weigher
+import com.google.common.util.concurrent.UncheckedExecutionException
+import groovy.transform.PackageScope
+import groovy.transform.TypeChecked
+
+import java.util.concurrent.Callable
+import java.util.concurrent.CompletableFuture
+import java.util.concurrent.ExecutionException
+import java.util.concurrent.TimeUnit
+import java.util.concurrent.atomic.AtomicLong
+
+/**
+ * Serves repeated queries from memory instead of ElasticSearch. Responses of a LocationStore
+ * are kept in a least recently used cache bounded by the memory their strings take, keyed by
+ * the normalized parameters the resources pass in, and expire after a time to live. Weighing
+ * responses rather than counting them keeps a few large lists of locations from taking as
+ * much room as thousands of single locations would.
+ *
+ * Responses are cached as futures of the strings ElasticSearch returns, which unlike the
+ * ResourceObjects mapped from them can be shared between requests without being modified.
+ * Requests for a response still being loaded wait on the same future rather than sending the
+ * query again, and failed responses are dropped, so that the next request tries again.
+ *
+ * Queries for open locations are only cached for the window of time they were made in, and
+ * all responses are dropped with invalidate() once IndexChangeWatcher sees the indexes change.
+ *
+ * Settings (in the locations configuration):
+ *  cacheMaxBytes              bytes of responses kept, 0 turns the cache off
+ *                             (default: 67108864, 64 MiB)
+ *  cacheTtlSeconds            seconds a response is served for (default: 300)
+ *  cacheIsOpenWindowSeconds   seconds an isOpen query is served for (default: 60)
+ *  cacheIndexCheckSeconds     seconds between checks for index changes (default: 30)
+ */
+@TypeChecked
+class CachingLocationDAO extends LocationStore {
+    static final long DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+    static final long DEFAULT_TTL_SECONDS = 300
+    static final long DEFAULT_IS_OPEN_WINDOW_SECONDS = 60
+    static final long DEFAULT_INDEX_CHECK_SECONDS = 30
+
+    private final LocationStore dao
+    private final long isOpenWindowMillis
+    private final Cache<List<Object>, CompletableFuture<String>> cache
+
+    // Part of every key and bumped when the indexes change, so that a response still being
+    // loaded from the old indexes while the cache is cleared is never served
+    private final AtomicLong generation = new AtomicLong()
+
+    CachingLocationDAO(LocationStore dao, Map<String, String> locationConfiguration) {
+        this.dao = dao
+        isOpenWindowMillis = 1000 * setting(locationConfiguration, "cacheIsOpenWindowSeconds",
+                DEFAULT_IS_OPEN_WINDOW_SECONDS)
+        cache = (Cache<List<Object>, CompletableFuture<String>>) CacheBuilder.newBuilder()
+                .maximumWeight(setting(locationConfiguration, "cacheMaxBytes",
+                        DEFAULT_MAX_BYTES))
+                .weigher({ List<Object> key, CompletableFuture<String> response ->
+                    weigh(response)
+                } as Weigher<List<Object>, CompletableFuture<String>>)
+                .expireAfterWrite(setting(locationConfiguration, "cacheTtlSeconds",
+                        DEFAULT_TTL_SECONDS), TimeUnit.SECONDS)
+                .recordStats()
+                .build()
+    }
+
+    /**
+     * Returns a numeric setting of the locations configuration, or its default.
+     *
+     * @param locationConfiguration
+     * @param name
+     * @param defaultValue
+     * @return
+     */
+    static long setting(Map<String, String> locationConfiguration, String name,
+                        long defaultValue) {
+        String value = locationConfiguration.get(name)
+        value != null ? Long.parseLong(value) : defaultValue
+    }
+
+    static boolean isEnabled(Map<String, String> locationConfiguration) {
+        setting(locationConfiguration, "cacheMaxBytes", DEFAULT_MAX_BYTES) > 0
+    }
+
+    /**
+     * Returns the bytes the string of a response takes, two per char, or 0 while it is still
+     * being loaded. Entries are weighed when they are written: cached() writes a response
+     * again once it has loaded, so that it is weighed by its string.
+     *
+     * @param response
+     * @return
+     */
+    @PackageScope
+    static int weigh(CompletableFuture<String> response) {
+        if (!response.isDone() || response.isCompletedExceptionally()) {
+            return 0
+        }
+        String result = response.getNow(null)
+        result != null ? 2 * result.length() : 0
+    }
+
+    @Override
+    CompletableFuture<String> search(String q, String campus, List<String> type,
+                                     Double lat, Double lon, String searchDistance,
+                                     Boolean isOpen, Integer weekday, Boolean giRestroom,
+                                     List<String> parkingZoneGroup, Integer adaParkingSpaceCount,
+                                     Integer motorcycleParkingSpaceCount,
+                                     Integer evParkingSpaceCount, String abbreviation,
+                                     Integer pageNumber, Integer pageSize,
+                                     List<Object> searchAfter, List<String> fields) {
+        // search_after pages ignore the page number
+        cached(key("search", q, campus, type, lat, lon, searchDistance,
+                openWindow(isOpen, weekday), giRestroom, parkingZoneGroup,
+                adaParkingSpaceCount, motorcycleParkingSpaceCount, evParkingSpaceCount,
+                abbreviation, searchAfter == null ? pageNumber : null, pageSize, searchAfter,
+                fields), {
+            dao.search(q, campus, type, lat, lon, searchDistance, isOpen, weekday, giRestroom,
+                    parkingZoneGroup, adaParkingSpaceCount, motorcycleParkingSpaceCount,
+                    evParkingSpaceCount, abbreviation, pageNumber, pageSize, searchAfter,
+                    fields)
+        })
+    }
+
+    @Override
+    CompletableFuture<String> searchService(String q, Boolean isOpen, Integer weekday,
+                                            Integer pageNumber, Integer pageSize,
+                                            List<Object> searchAfter) {
+        cached(key("searchService", q, openWindow(isOpen, weekday),
+                searchAfter == null ? pageNumber : null, pageSize, searchAfter), {
+            dao.searchService(q, isOpen, weekday, pageNumber, pageSize, searchAfter)
+        })
+    }
+
+    @Override
+    CompletableFuture<String> getRelatedServices(String locationId, Integer pageNumber,
+                                                 Integer pageSize) {
+        cached(key("getRelatedServices", locationId?.toLowerCase(), pageNumber, pageSize), {
+            dao.getRelatedServices(locationId, pageNumber, pageSize)
+        })
+    }
+
+    @Override
+    CompletableFuture<String> getServicesByLocationIds(List<String> locationIds) {
+        // The same locations in any order or case are the same query
+        List<String> normalized = locationIds.collect { String id -> id.toLowerCase() }.sort()
+        cached(key("getServicesByLocationIds", normalized), {
+            dao.getServicesByLocationIds(locationIds)
+        })
+    }
+
+    @Override
+    CompletableFuture<String> getById(String id, List<String> fields) {
+        cached(key("getById", id?.toLowerCase(), fields), { dao.getById(id, fields) })
+    }
+
+    @Override
+    CompletableFuture<String> getServiceById(String id) {
+        cached(key("getServiceById", id?.toLowerCase()), { dao.getServiceById(id) })
+    }
+
+    // Batches are rarely asked for twice with the same ids, and exports stream every
+    // document: neither is cached
+
+    @Override
+    CompletableFuture<List<String>> getByIds(List<String> ids, List<String> fields) {
+        dao.getByIds(ids, fields)
+    }
+
+    @Override
+    void exportLocations(Integer batchSize, List<String> fields, Closure<?> eachSource) {
+        dao.exportLocations(batchSize, fields, eachSource)
+    }
+
+    @Override
+    void exportServices(Integer batchSize, Closure<?> eachSource) {
+        dao.exportServices(batchSize, eachSource)
+    }
+
+    /**
+     * Drops every cached response, for when the indexes have changed.
+     */
+    void invalidate() {
+        generation.incrementAndGet()
+        cache.invalidateAll()
+    }
+
+    /**
+     * Registers gauges of the cache hits, misses, evictions, size and invalidations.
+     *
+     * @param metrics
+     */
+    void registerMetrics(MetricRegistry metrics) {
+        registerGauge(metrics, "hits") { cache.stats().hitCount() }
+        registerGauge(metrics, "misses") { cache.stats().missCount() }
+        registerGauge(metrics, "hitRatio") { cache.stats().hitRate() }
+        registerGauge(metrics, "evictions") { cache.stats().evictionCount() }
+        registerGauge(metrics, "size") { cache.size() }
+        registerGauge(metrics, "invalidations") { generation.get() }
+    }
+
+    private static void registerGauge(MetricRegistry metrics, String name, Closure<?> value) {
+        metrics.register(MetricRegistry.name(CachingLocationDAO, "cache", name), value as Gauge)
+    }
+
+    private List<Object> key(Object... parameters) {
+        List<Object> key = [(Object) generation.get()]
+        key.addAll(parameters)
+        key
+    }
+
+    /**
+     * Open locations change with time: isOpen queries get the weekday and the current window
+     * of cacheIsOpenWindowSeconds in their key, so they are answered again in the next window.
+     */
+    private List<Object> openWindow(Boolean isOpen, Integer weekday) {
+        isOpen ? [(Object) weekday, System.currentTimeMillis().intdiv(isOpenWindowMillis)] :
+                null
+    }
+
+    private CompletableFuture<String> cached(List<Object> key,
+                                             Closure<CompletableFuture<String>> load) {
+        CompletableFuture<String> response
+        boolean loaded = false
+        try {
+            response = cache.get(key, {
+                loaded = true
+                load()
+            } as Callable<CompletableFuture<String>>)
+        } catch (ExecutionException | UncheckedExecutionException e) {
+            // Surface what the DAO threw, as without the cache
+            throw e.cause
+        }
+        if (!loaded) {
+            return response
+        }
+
+        // Once loaded, the response is removed if it failed, or written again to be weighed,
+        // unless it was replaced since. Hits don't write it again, which would keep a popular
+        // response from expiring.
+        response.whenComplete { String result, Throwable failure ->
+            if (failure != null) {
+                cache.asMap().remove(key, response)
+            } else {
+                cache.asMap().replace(key, response, response)
+            }
+        }
+        response
+    }
+}
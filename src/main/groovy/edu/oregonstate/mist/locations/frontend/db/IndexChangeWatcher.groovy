@@ -0,0 +1,102 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import groovy.transform.PackageScope
+import groovy.transform.TypeChecked
+import org.elasticsearch.action.admin.indices.stats.CommonStats
+import org.elasticsearch.action.admin.indices.stats.IndicesStatsResponse
+import org.elasticsearch.client.Client
+import org.slf4j.Logger
+import org.slf4j.LoggerFactory
+
+/**
+ * Polls the stats of the locations and services indexes and clears the response cache of a
+ * CachingLocationDAO when they change: when an alias is moved to a new index, or documents
+ * are indexed or deleted.
+ *
+ * Documents are counted as indexed before the refresh that makes them searchable, and
+ * responses cached in between still have the old documents. The cache is therefore cleared
+ * once more on the check after a change, by which time the indexes have refreshed as long as
+ * they refresh more often than cacheIndexCheckSeconds.
+ */
+@TypeChecked
+class IndexChangeWatcher implements Runnable {
+    private static final Logger LOGGER = LoggerFactory.getLogger(IndexChangeWatcher.class)
+
+    private final Client esClient
+    private final List<String> indexes
+    private final CachingLocationDAO dao
+
+    private String lastFingerprint
+    private boolean changedAtLastCheck
+
+    IndexChangeWatcher(Client esClient, Map<String, String> locationConfiguration,
+                       CachingLocationDAO dao) {
+        this.esClient = esClient
+        this.indexes = [locationConfiguration.get("esIndex"),
+                        locationConfiguration.get("esIndexService")]
+        this.dao = dao
+    }
+
+    @Override
+    void run() {
+        // An exception would cancel the scheduled checks, so they are logged instead
+        try {
+            check(fingerprint(counts()))
+        } catch (Exception e) {
+            LOGGER.warn("Could not check indexes ${indexes} for changes", e)
+        }
+    }
+
+    /**
+     * Clears the response cache if a fingerprint differs from the last one checked, or if the
+     * last one checked differed from the one before it.
+     *
+     * @param current
+     */
+    @PackageScope
+    void check(String current) {
+        if (lastFingerprint != null && current != lastFingerprint) {
+            LOGGER.info("Indexes ${indexes} changed, clearing the response cache")
+            dao.invalidate()
+            changedAtLastCheck = true
+        } else if (changedAtLastCheck) {
+            // Drops what was cached before the refresh of the documents indexed last time
+            dao.invalidate()
+            changedAtLastCheck = false
+        }
+        lastFingerprint = current
+    }
+
+    /**
+     * Returns the document count, and the indexing and deletion totals, of each concrete index
+     * behind the configured names. Refreshes are left out: indexes refresh every second or so
+     * whether or not anything changed, and only the documents they make visible matter.
+     *
+     * @return
+     */
+    private Map<String, List<Long>> counts() {
+        IndicesStatsResponse stats = esClient.admin().indices()
+                .prepareStats(indexes as String[])
+                .clear().setDocs(true).setIndexing(true)
+                .get()
+
+        stats.indices.keySet().collectEntries { String index ->
+            CommonStats total = stats.getIndex(index).total
+            [(index): [total.docs.count, total.indexing.total.indexCount,
+                       total.indexing.total.deleteCount]]
+        } as Map<String, List<Long>>
+    }
+
+    /**
+     * Summarizes the state of the indexes, the same whatever order their counts are in.
+     *
+     * @param counts counts() of each index
+     * @return
+     */
+    @PackageScope
+    static String fingerprint(Map<String, List<Long>> counts) {
+        counts.keySet().sort().collect { String index ->
+            index + ":" + counts.get(index).join(":")
+        }.join(",")
+    }
+}
@@ -7,38 +7,102 @@ import groovy.transform.TypeChecked
 import org.apache.lucene.search.join.ScoreMode
 
 import org.elasticsearch.action.get.GetResponse
+import org.elasticsearch.action.get.MultiGetRequest
+import org.elasticsearch.action.get.MultiGetItemResponse
+import org.elasticsearch.action.get.MultiGetResponse
 import org.elasticsearch.action.search.SearchRequestBuilder
+import org.elasticsearch.action.search.SearchResponse
 import org.elasticsearch.client.Client
 import org.elasticsearch.common.geo.GeoDistance
 import org.elasticsearch.common.unit.DistanceUnit
+import org.elasticsearch.common.unit.TimeValue
 import org.elasticsearch.index.query.QueryBuilders
+import org.elasticsearch.search.fetch.subphase.FetchSourceContext
+import org.elasticsearch.search.SearchHit
+import org.elasticsearch.search.sort.FieldSortBuilder
 import org.elasticsearch.search.sort.SortBuilders
 import org.elasticsearch.search.sort.SortOrder
 import org.slf4j.Logger
 import org.slf4j.LoggerFactory
 
+import com.google.common.util.concurrent.MoreExecutors
+
+import java.util.concurrent.CompletableFuture
+import java.util.concurrent.CompletionException
+import java.util.concurrent.Executor
+import java.util.concurrent.ScheduledExecutorService
+import java.util.function.Function
+
 /**
  * Handles HTTP requests against ElasticSearch. Operation supported are:
- * search, searchService, getRelatedService, getById, and getServiceById.
+ * search, searchService, getRelatedService, getServicesByLocationIds, getById, getByIds,
+ * and getServiceById.
+ *
+ * Requests are sent through a RequestLimiter: they return futures of the response instead of
+ * blocking the calling thread, and fail with a SaturatedException when esMaxInFlight requests
+ * (default: 64) are waiting for ElasticSearch already, or with a TimeoutException when
+ * ElasticSearch hasn't answered within requestTimeoutSeconds (default: 10). Exports wait for
+ * each batch of their scroll, but send them through the RequestLimiter too. Searches can be
+ * profiled with the ES profile API by a QueryProfiler, for a fraction esProfileSampleRate
+ * (default: 0) of them.
  */
 @TypeChecked
 @InheritConstructors
-class LocationDAO {
+class LocationDAO extends LocationStore {
     private static final Logger LOGGER = LoggerFactory.getLogger(LocationDAO.class)
 
+    // how long ES keeps an export's scroll context between two batches
+    private static final TimeValue SCROLL_KEEP_ALIVE = TimeValue.timeValueMinutes(1)
+
+    // index.max_result_window of ES, the most hits a single search can return
+    static final int MAX_RELATED_SERVICES = 10000
+
     private final String esIndex
     private final String esType
     private final String esIndexService
     private final String esTypeService
 
     private final ElasticSearchManager esManager
+    final RequestLimiter limiter
+    final QueryProfiler profiler
 
+    /**
+     * Completes the futures of requests on the thread that received the response, and doesn't
+     * time requests out.
+     *
+     * @param locationConfiguration
+     * @param esManager
+     */
     LocationDAO(Map<String, String> locationConfiguration, ElasticSearchManager esManager) {
+        this(locationConfiguration, esManager, MoreExecutors.directExecutor(), null)
+    }
+
+    /**
+     * Completes the futures of requests on responseExecutor, and times requests out with
+     * timeoutScheduler.
+     *
+     * @param locationConfiguration
+     * @param esManager
+     * @param responseExecutor
+     * @param timeoutScheduler
+     */
+    LocationDAO(Map<String, String> locationConfiguration, ElasticSearchManager esManager,
+                Executor responseExecutor, ScheduledExecutorService timeoutScheduler) {
         this.esManager = esManager
         esIndex = locationConfiguration.get("esIndex")
         esType = locationConfiguration.get("estype")
         esIndexService = locationConfiguration.get("esIndexService")
         esTypeService = locationConfiguration.get("estypeService")
+
+        String maxInFlight = locationConfiguration.get("esMaxInFlight")
+        long timeoutSeconds = CachingLocationDAO.setting(locationConfiguration,
+                "requestTimeoutSeconds", RequestLimiter.DEFAULT_TIMEOUT_SECONDS)
+        limiter = new RequestLimiter(maxInFlight ? Integer.parseInt(maxInFlight) :
+                RequestLimiter.DEFAULT_MAX_IN_FLIGHT, 1000 * timeoutSeconds, responseExecutor,
+                timeoutScheduler)
+
+        String profileSampleRate = locationConfiguration.get("esProfileSampleRate")
+        profiler = new QueryProfiler(profileSampleRate ? Double.parseDouble(profileSampleRate) : 0d)
     }
 
     private Client getEsClient() {
@@ -46,63 +110,50 @@ class LocationDAO {
     }
 
     /**
-     * Searches ES (elasticsearch) for locations matching "q" full text search within the given
-     * campus and type.
+     * Searches ES (elasticsearch) for locations, see LocationStore.search().
      *
-     * @param q                            query text to use for full text search
-     * @param campus                       campus to use to filter results
-     * @param type                         type of location to filter results
-     * @param lat                          latitude for geo search
-     * @param lon                          longitude for geo search
-     * @param searchDistance               restrict results to be at most this far from (lat,lon)
-     * @param isOpen                       only include dining locations which are open at the time
-     *                                     of the search
-     * @param weekday                      if isOpen is true, weekday gives the current day of the
-     *                                     week (monday=1, sunday=7)
-     * @param giRestroom                   only include building with gender inclusive restrooms
-     * @param parkingZoneGroup             parking zonegroup if type is parking
-     * @param adaParkingSpaceCount         search for locations with ADA parking space greater than
-     *                                     and equal to this amount
-     * @param motorcycleParkingSpaceCount  search for locations with motorcycle parking space
-     *                                     greater than and equal to this amount
-     * @param evParkingSpaceCount          search for locations with electric vehicle parking space
-     *                                     greater than and equal to this amount
-     * @param pageNumber                   page number (1..)
-     * @param pageSize                     page size
-     * @return json                        JSON search results from ES
+     * @return json                        future of the JSON search results from ES
      */
-    String search(String q, String campus, List<String> type,
-                  Double lat, Double lon, String searchDistance,
-                  Boolean isOpen, Integer weekday, Boolean giRestroom,
-                  List<String> parkingZoneGroup, Integer adaParkingSpaceCount,
-                  Integer motorcycleParkingSpaceCount, Integer evParkingSpaceCount,
-                  String abbreviation, Integer pageNumber, Integer pageSize) {
+    @Override
+    CompletableFuture<String> search(String q, String campus, List<String> type,
+                                     Double lat, Double lon, String searchDistance,
+                                     Boolean isOpen, Integer weekday, Boolean giRestroom,
+                                     List<String> parkingZoneGroup, Integer adaParkingSpaceCount,
+                                     Integer motorcycleParkingSpaceCount,
+                                     Integer evParkingSpaceCount, String abbreviation,
+                                     Integer pageNumber, Integer pageSize,
+                                     List<Object> searchAfter, List<String> fields) {
         def esQuery = prepareLocationSearch()
         esQuery = buildSearchRequest(esQuery, q, campus, type, lat, lon, searchDistance,
                                      isOpen, weekday, giRestroom, parkingZoneGroup,
                                      adaParkingSpaceCount, motorcycleParkingSpaceCount,
                                      evParkingSpaceCount, abbreviation, pageNumber, pageSize)
-        LOGGER.debug("elastic search query: " + esQuery.toString())
+        if (searchAfter != null) {
+            esQuery = applySearchAfter(esQuery, searchAfter)
+        }
+        if (fields != null) {
+            esQuery.setFetchSource(sourceIncludes(fields), null)
+        }
 
-        def resp = esQuery.get()
         // TODO: think about error conditions
-
-        //LOGGER.debug("elastic search response: " + resp.toString())
-
-        resp.toString()
+        execute(esQuery)
     }
 
     /**
-     * Performs a search / list against the services index.
+     * Performs a search / list against the services index, paging with search_after when
+     * searchAfter is given (see search()).
      *
      * @param q
      * @param isOpen
      * @param pageNumber
      * @param pageSize
+     * @param searchAfter
      * @return
      */
-    String searchService(String q, Boolean isOpen, Integer weekday,
-                         Integer pageNumber, Integer pageSize) {
+    @Override
+    CompletableFuture<String> searchService(String q, Boolean isOpen, Integer weekday,
+                                            Integer pageNumber, Integer pageSize,
+                                            List<Object> searchAfter) {
 
         // generate ES query to search for locations
         def esQuery = prepareServiceSearch()
@@ -110,12 +161,11 @@ class LocationDAO {
                                      null, null, null,
                                      isOpen, weekday,
                                      null, null, null, null, null, null, pageNumber, pageSize)
+        if (searchAfter != null) {
+            esQuery = applySearchAfter(esQuery, searchAfter)
+        }
 
-        LOGGER.debug("elastic search query: " + esQuery.toString())
-
-        def resp = esQuery.get()
-
-        resp.toString()
+        execute(esQuery)
     }
 
     /**
@@ -126,28 +176,46 @@ class LocationDAO {
      * @param pageSize
      * @return
      */
-    String getRelatedServices(String locationId, Integer pageNumber, Integer pageSize) {
+    @Override
+    CompletableFuture<String> getRelatedServices(String locationId, Integer pageNumber,
+                                                 Integer pageSize) {
 
         // generate ES query to search for locations
         def esQuery = prepareServiceSearch()
         esQuery = buildRelatedServicesRequest(esQuery, locationId, pageNumber, pageSize)
 
-        LOGGER.debug("elastic search query: " + esQuery.toString())
+        execute(esQuery)
+    }
 
-        def resp = esQuery.get()
+    /**
+     * Returns the services related to any of the given locations, with one terms query instead
+     * of a getRelatedServices() search per location.
+     *
+     * @param locationIds
+     * @return
+     */
+    @Override
+    CompletableFuture<String> getServicesByLocationIds(List<String> locationIds) {
+        def esQuery = prepareServiceSearch()
+        esQuery = buildServicesByLocationIdsRequest(esQuery, locationIds)
 
-        resp.toString()
+        execute(esQuery)
     }
 
     /**
-     * Return a single location object with the matching id
+     * Return a single location object with the matching id, with only the given fields.
      *
      * @param id
+     * @param fields attributes and relationships to return, or null for all of them
      * @return
      */
-    String getById(String id) {
-        GetResponse response = esClient.prepareGet(esIndex, esType, id.toLowerCase()).get()
-        response.sourceAsString
+    @Override
+    CompletableFuture<String> getById(String id, List<String> fields) {
+        def esQuery = esClient.prepareGet(esIndex, esType, id.toLowerCase())
+        if (fields != null) {
+            esQuery.setFetchSource(sourceIncludes(fields), null)
+        }
+        sourceOf(limiter.execute(esQuery))
     }
 
     /**
@@ -156,10 +224,124 @@ class LocationDAO {
      * @param id
      * @return
      */
-    String getServiceById(String id) {
-        GetResponse response =
-                esClient.prepareGet(esIndexService, esTypeService, id.toLowerCase()).get()
-        response.sourceAsString
+    @Override
+    CompletableFuture<String> getServiceById(String id) {
+        sourceOf(limiter.execute(
+                esClient.prepareGet(esIndexService, esTypeService, id.toLowerCase())))
+    }
+
+    /**
+     * Returns the sources of the locations with the matching ids, fetched with one multi-get,
+     * with only the given fields. Sources are in the order of the ids, and ids that weren't
+     * found are left out.
+     *
+     * @param ids
+     * @param fields attributes and relationships to return, or null for all of them
+     * @return
+     */
+    @Override
+    CompletableFuture<List<String>> getByIds(List<String> ids, List<String> fields) {
+        FetchSourceContext fetchSource = fields != null ?
+                new FetchSourceContext(true, sourceIncludes(fields), null) : null
+        def esQuery = esClient.prepareMultiGet()
+        ids.each { String id ->
+            esQuery.add(new MultiGetRequest.Item(esIndex, esType, id.toLowerCase())
+                    .fetchSourceContext(fetchSource))
+        }
+
+        limiter.execute(esQuery).thenApply({ MultiGetResponse resp ->
+            List<String> sources = []
+            for (MultiGetItemResponse item : resp.responses) {
+                if (item.failed) {
+                    throw item.failure.failure
+                }
+                if (item.response.exists) {
+                    sources << item.response.sourceAsString
+                }
+            }
+            sources
+        } as Function<MultiGetResponse, List<String>>)
+    }
+
+    /**
+     * Sends a search, profiling it when the profiler samples it.
+     *
+     * @param esQuery
+     * @return future of the JSON search results from ES
+     */
+    private CompletableFuture<String> execute(SearchRequestBuilder esQuery) {
+        LOGGER.debug("elastic search query: " + esQuery.toString())
+
+        if (profiler.sample()) {
+            return profiler.profile(esQuery, limiter)
+        }
+        limiter.execute(esQuery).thenApply({ SearchResponse resp -> resp.toString() }
+                as Function<SearchResponse, String>)
+    }
+
+    private static CompletableFuture<String> sourceOf(CompletableFuture<GetResponse> response) {
+        response.thenApply({ GetResponse resp -> resp.sourceAsString }
+                as Function<GetResponse, String>)
+    }
+
+    /**
+     * Passes the source of every location to eachSource, reading them from a scroll in batches
+     * of batchSize, so that all of them can be streamed without holding more than a batch.
+     *
+     * @param batchSize
+     * @param fields attributes and relationships to export, or null for all of them
+     * @param eachSource called with the JSON source of each location
+     */
+    @Override
+    void exportLocations(Integer batchSize, List<String> fields, Closure<?> eachSource) {
+        def esQuery = prepareLocationSearch()
+        if (fields != null) {
+            esQuery.setFetchSource(sourceIncludes(fields), null)
+        }
+        scroll(esQuery, batchSize, eachSource)
+    }
+
+    /**
+     * Passes the source of every service to eachSource, like exportLocations().
+     *
+     * @param batchSize
+     * @param eachSource called with the JSON source of each service
+     */
+    @Override
+    void exportServices(Integer batchSize, Closure<?> eachSource) {
+        scroll(prepareServiceSearch(), batchSize, eachSource)
+    }
+
+    /**
+     * Reads a search with a scroll. Each batch is sent through the limiter like any other
+     * request, so that exports fail with a SaturatedException rather than add to a saturated
+     * cluster.
+     */
+    private void scroll(SearchRequestBuilder req, Integer batchSize, Closure<?> eachSource) {
+        // _doc order is the cheapest to scroll through
+        SearchResponse resp = await(limiter.execute(req.setScroll(SCROLL_KEEP_ALIVE)
+                .setSize(batchSize)
+                .addSort(SortBuilders.fieldSort(FieldSortBuilder.DOC_FIELD_NAME))))
+
+        try {
+            while (resp.hits.hits.length) {
+                resp.hits.hits.each { SearchHit hit -> eachSource(hit.sourceAsString) }
+                resp = await(limiter.execute(esClient.prepareSearchScroll(resp.scrollId)
+                        .setScroll(SCROLL_KEEP_ALIVE)))
+            }
+        } finally {
+            // Not limited: the scroll context would otherwise be kept until it times out
+            esClient.prepareClearScroll().addScrollId(resp.scrollId).get()
+        }
+    }
+
+    private static SearchResponse await(CompletableFuture<SearchResponse> response) {
+        try {
+            response.join()
+        } catch (CompletionException e) {
+            // Surface what the request failed with, as get() on the request would
+            throw e.cause
+        }
     }
 
     @PackageScope
@@ -299,6 +481,66 @@ class LocationDAO {
         req
     }
 
+    /**
+     * Returns the parts of a location's _source the resources need to map the given fields
+     * of the API: the identity and links of the location, then the attributes and
+     * relationships of those names. latitude and longitude are read from geoLocation, and
+     * distance comes from the sort values rather than the source.
+     *
+     * @param fields
+     * @return
+     */
+    @PackageScope
+    static String[] sourceIncludes(List<String> fields) {
+        Set<String> includes = new LinkedHashSet<String>(["id", "type", "links"])
+        fields.each { String field ->
+            if (field in ["latitude", "longitude"]) {
+                includes << "attributes.geoLocation"
+            } else {
+                includes << "attributes.${field}".toString()
+                includes << "relationships.${field}".toString()
+            }
+        }
+        includes as String[]
+    }
+
+    /**
+     * Turns a search request built by buildSearchRequest into one for the page after the hit
+     * with the given sort values. The hits are also sorted by _id, so that hits with the same
+     * score or distance keep their order between pages.
+     *
+     * @param req
+     * @param searchAfter sort values of the last hit of the previous page, empty for the first
+     * @return
+     * @throws IllegalArgumentException if searchAfter does not have a value for each sort
+     */
+    @PackageScope // for testing
+    static SearchRequestBuilder applySearchAfter(SearchRequestBuilder req,
+                                                 List<Object> searchAfter) {
+        req.setFrom(0)
+        req.addSort(SortBuilders.fieldSort("_id").order(SortOrder.ASC))
+
+        if (searchAfter) {
+            int sorts = req.request().source().sorts().size()
+            if (searchAfter.size() != sorts) {
+                throw new IllegalArgumentException(
+                        "Cursor has ${searchAfter.size()} sort values instead of ${sorts}")
+            }
+            req.searchAfter(searchAfter.toArray())
+        }
+        req
+    }
+
+    @PackageScope
+    static SearchRequestBuilder buildServicesByLocationIdsRequest(
+            SearchRequestBuilder req, List<String> locationIds) {
+        // Every service of the locations, up to the most ES returns from a search
+        req.setSize(MAX_RELATED_SERVICES)
+        req.setQuery(QueryBuilders.termsQuery("attributes.locationId",
+                locationIds.collect { String id -> id.toLowerCase() }))
+        req
+    }
+
     @PackageScope
     static SearchRequestBuilder buildRelatedServicesRequest(
             SearchRequestBuilder req, String locationId,
@@ -0,0 +1,218 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import groovy.transform.TypeChecked
+
+import java.util.concurrent.CompletableFuture
+
+/**
+ * The operations the resources read locations and services with. LocationDAO answers them
+ * from ElasticSearch, and CachingLocationDAO and NearbyLocationDAO wrap another LocationStore
+ * to answer some of them from memory.
+ *
+ * The shorter overloads pass null for the parameters they leave out, so that a store only
+ * implements the longest of each.
+ */
+@TypeChecked
+abstract class LocationStore {
+    /**
+     * Searches for locations matching "q" full text search within the given campus and type.
+     *
+     * @param q                            query text to use for full text search
+     * @param campus                       campus to use to filter results
+     * @param type                         type of location to filter results
+     * @param lat                          latitude for geo search
+     * @param lon                          longitude for geo search
+     * @param searchDistance               restrict results to be at most this far from (lat,lon)
+     * @param isOpen                       only include dining locations which are open at the time
+     *                                     of the search
+     * @param weekday                      if isOpen is true, weekday gives the current day of the
+     *                                     week (monday=1, sunday=7)
+     * @param giRestroom                   only include building with gender inclusive restrooms
+     * @param parkingZoneGroup             parking zonegroup if type is parking
+     * @param adaParkingSpaceCount         search for locations with ADA parking space greater than
+     *                                     and equal to this amount
+     * @param motorcycleParkingSpaceCount  search for locations with motorcycle parking space
+     *                                     greater than and equal to this amount
+     * @param evParkingSpaceCount          search for locations with electric vehicle parking space
+     *                                     greater than and equal to this amount
+     * @param pageNumber                   page number (1..)
+     * @param pageSize                     page size
+     * @return json                        future of the JSON search results from ES
+     */
+    CompletableFuture<String> search(String q, String campus, List<String> type,
+                                     Double lat, Double lon, String searchDistance,
+                                     Boolean isOpen, Integer weekday, Boolean giRestroom,
+                                     List<String> parkingZoneGroup, Integer adaParkingSpaceCount,
+                                     Integer motorcycleParkingSpaceCount,
+                                     Integer evParkingSpaceCount, String abbreviation,
+                                     Integer pageNumber, Integer pageSize) {
+        search(q, campus, type, lat, lon, searchDistance, isOpen, weekday, giRestroom,
+               parkingZoneGroup, adaParkingSpaceCount, motorcycleParkingSpaceCount,
+               evParkingSpaceCount, abbreviation, pageNumber, pageSize, null)
+    }
+
+    /**
+     * Searches for locations like search(), but pages with search_after instead of
+     * from / size when searchAfter is given: pageNumber is then ignored, and the page starts
+     * after the hit with these sort values (the first page when empty).
+     *
+     * @param searchAfter                  sort values of the last hit of the previous page,
+     *                                     or null to page by pageNumber
+     * @return json                        future of the JSON search results from ES
+     */
+    CompletableFuture<String> search(String q, String campus, List<String> type,
+                                     Double lat, Double lon, String searchDistance,
+                                     Boolean isOpen, Integer weekday, Boolean giRestroom,
+                                     List<String> parkingZoneGroup, Integer adaParkingSpaceCount,
+                                     Integer motorcycleParkingSpaceCount,
+                                     Integer evParkingSpaceCount, String abbreviation,
+                                     Integer pageNumber, Integer pageSize,
+                                     List<Object> searchAfter) {
+        search(q, campus, type, lat, lon, searchDistance, isOpen, weekday, giRestroom,
+               parkingZoneGroup, adaParkingSpaceCount, motorcycleParkingSpaceCount,
+               evParkingSpaceCount, abbreviation, pageNumber, pageSize, searchAfter, null)
+    }
+
+    /**
+     * Searches for locations like search(), returning only the given fields of each.
+     *
+     * @param fields                       attributes and relationships to return, or null
+     *                                     for all of them
+     * @return json                        future of the JSON search results from ES
+     */
+    abstract CompletableFuture<String> search(String q, String campus, List<String> type,
+                                              Double lat, Double lon, String searchDistance,
+                                              Boolean isOpen, Integer weekday,
+                                              Boolean giRestroom, List<String> parkingZoneGroup,
+                                              Integer adaParkingSpaceCount,
+                                              Integer motorcycleParkingSpaceCount,
+                                              Integer evParkingSpaceCount, String abbreviation,
+                                              Integer pageNumber, Integer pageSize,
+                                              List<Object> searchAfter, List<String> fields)
+
+    /**
+     * Performs a search / list against the services index.
+     *
+     * @param q
+     * @param isOpen
+     * @param pageNumber
+     * @param pageSize
+     * @return
+     */
+    CompletableFuture<String> searchService(String q, Boolean isOpen, Integer weekday,
+                                            Integer pageNumber, Integer pageSize) {
+        searchService(q, isOpen, weekday, pageNumber, pageSize, null)
+    }
+
+    /**
+     * Performs a search / list against the services index, paging with search_after when
+     * searchAfter is given (see search()).
+     *
+     * @param q
+     * @param isOpen
+     * @param pageNumber
+     * @param pageSize
+     * @param searchAfter
+     * @return
+     */
+    abstract CompletableFuture<String> searchService(String q, Boolean isOpen, Integer weekday,
+                                                     Integer pageNumber, Integer pageSize,
+                                                     List<Object> searchAfter)
+
+    /**
+     * Returns the related services mapped to a building / location
+     *
+     * @param locationId
+     * @param pageNumber
+     * @param pageSize
+     * @return
+     */
+    abstract CompletableFuture<String> getRelatedServices(String locationId, Integer pageNumber,
+                                                          Integer pageSize)
+
+    /**
+     * Returns the services related to any of the given locations, with one query instead of a
+     * getRelatedServices() search per location.
+     *
+     * @param locationIds
+     * @return
+     */
+    abstract CompletableFuture<String> getServicesByLocationIds(List<String> locationIds)
+
+    /**
+     * Return a single location object with the matching id
+     *
+     * @param id
+     * @return
+     */
+    CompletableFuture<String> getById(String id) {
+        getById(id, null)
+    }
+
+    /**
+     * Return a single location object with the matching id, with only the given fields.
+     *
+     * @param id
+     * @param fields attributes and relationships to return, or null for all of them
+     * @return
+     */
+    abstract CompletableFuture<String> getById(String id, List<String> fields)
+
+    /**
+     * Returns a single service
+     *
+     * @param id
+     * @return
+     */
+    abstract CompletableFuture<String> getServiceById(String id)
+
+    /**
+     * Returns the sources of the locations with the matching ids, in the order of the ids.
+     * Ids that weren't found are left out.
+     *
+     * @param ids
+     * @return
+     */
+    CompletableFuture<List<String>> getByIds(List<String> ids) {
+        getByIds(ids, null)
+    }
+
+    /**
+     * Returns the sources of the locations with the matching ids, like getByIds(), with only
+     * the given fields.
+     *
+     * @param ids
+     * @param fields attributes and relationships to return, or null for all of them
+     * @return
+     */
+    abstract CompletableFuture<List<String>> getByIds(List<String> ids, List<String> fields)
+
+    /**
+     * Passes the source of every location to eachSource, in batches of batchSize, so that all
+     * of them can be streamed without holding more than a batch.
+     *
+     * @param batchSize
+     * @param eachSource called with the JSON source of each location
+     */
+    void exportLocations(Integer batchSize, Closure<?> eachSource) {
+        exportLocations(batchSize, null, eachSource)
+    }
+
+    /**
+     * Passes the source of every location to eachSource, like exportLocations(), with only the
+     * given fields.
+     *
+     * @param batchSize
+     * @param fields attributes and relationships to export, or null for all of them
+     * @param eachSource called with the JSON source of each location
+     */
+    abstract void exportLocations(Integer batchSize, List<String> fields, Closure<?> eachSource)
+
+    /**
+     * Passes the source of every service to eachSource, like exportLocations().
+     *
+     * @param batchSize
+     * @param eachSource called with the JSON source of each service
+     */
+    abstract void exportServices(Integer batchSize, Closure<?> eachSource)
+}
@@ -0,0 +1,252 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import com.fasterxml.jackson.databind.ObjectMapper
+import groovy.transform.TypeChecked
+import org.apache.lucene.geo.GeoEncodingUtils
+import org.apache.lucene.geo.Rectangle
+import org.elasticsearch.common.geo.GeoDistance
+import org.elasticsearch.common.unit.DistanceUnit
+
+import java.util.regex.Matcher
+import java.util.regex.Pattern
+
+/**
+ * An immutable grid of the geoLocation points of locations, to find the locations within a
+ * distance of a point, and filter them by campus and type, without asking ElasticSearch.
+ *
+ * Points are matched and measured the way ElasticSearch 6 does it for the queries of
+ * LocationDAO.buildSearchRequest, with the same Lucene and ElasticSearch code:
+ *
+ *  - coordinates are quantized like geo_point doc values, with GeoEncodingUtils
+ *  - geo_distance keeps the points GeoEncodingUtils.createDistancePredicate() accepts, which
+ *    is what LatLonPoint.newDistanceQuery() tests every point with
+ *  - distances are GeoDistance.PLANE in kilometers from the quantized points, like the
+ *    geo distance sort
+ *  - campus and type match when the field has any token of the value, tokens being runs of
+ *    letters and digits in lower case, like the match queries on analyzed fields
+ */
+@TypeChecked
+class NearbyIndex {
+    private static final ObjectMapper MAPPER = new ObjectMapper()
+
+    // Size of the grid cells in degrees, about a kilometer of latitude
+    static final double CELL_DEGREES = 0.01d
+
+    private static final Pattern TOKEN = Pattern.compile(/[0-9a-z]+/)
+
+    /**
+     * A location with a geoLocation: its id and the parts of its source the index searches by.
+     */
+    static class Location {
+        String id
+        int encodedLat
+        int encodedLon
+        double lat
+        double lon
+        Set<String> campus
+        Set<String> type
+        Set<String> tags
+    }
+
+    /**
+     * A location within the distance of a search, and its distance in kilometers.
+     */
+    static class Hit {
+        Location location
+        double distance
+    }
+
+    private final List<Location> locations
+    private final Map<Long, List<Location>> cells = new HashMap<Long, List<Location>>()
+
+    // Milliseconds since the epoch the index was built at
+    final long builtAt = System.currentTimeMillis()
+
+    /**
+     * Builds the index of the locations that have a geoLocation. The others can't be near
+     * anything and are left out.
+     *
+     * @param sources JSON sources of the locations, with at least their id, geoLocation,
+     *                campus, type and tags
+     */
+    NearbyIndex(Collection<String> sources) {
+        List<Location> indexed = []
+        sources.each { String source ->
+            Location location = location(source)
+            if (location != null) {
+                indexed << location
+                long key = cell(location.lat, location.lon)
+                if (!cells.containsKey(key)) {
+                    cells.put(key, new ArrayList<Location>())
+                }
+                cells.get(key) << location
+            }
+        }
+        locations = indexed.asImmutable()
+    }
+
+    int getSize() {
+        locations.size()
+    }
+
+    /**
+     * Returns the locations within meters of a point that match the campus and types, with
+     * their distances, closest first and then by id.
+     *
+     * @param lat
+     * @param lon
+     * @param meters
+     * @param campus campus to match, or null for any
+     * @param types types of which any has to match, or null for any
+     * @return
+     */
+    List<Hit> search(double lat, double lon, double meters, String campus, List<String> types) {
+        GeoEncodingUtils.DistancePredicate withinDistance =
+                GeoEncodingUtils.createDistancePredicate(lat, lon, meters)
+        Set<String> campusTokens = campus ? tokens(campus) : null
+
+        List<Hit> hits = []
+        candidates(Rectangle.fromPointDistance(lat, lon, meters)).each { Location location ->
+            if (withinDistance.test(location.encodedLat, location.encodedLon) &&
+                    matches(location, campusTokens, types)) {
+                hits << new Hit(location: location, distance: GeoDistance.PLANE.calculate(
+                        lat, lon, location.lat, location.lon, DistanceUnit.KILOMETERS))
+            }
+        }
+
+        // Sorted in place and returned on its own: on JDK 8 a closure could also be taken for
+        // the Comparator of List.sort, which returns nothing
+        Collections.sort(hits, { Hit a, Hit b ->
+            a.distance <=> b.distance ?: a.location.id <=> b.location.id
+        } as Comparator<Hit>)
+        hits
+    }
+
+    /**
+     * Returns the locations in the cells a bounding box overlaps, or all of them when that is
+     * fewer to go through or the box crosses the dateline.
+     */
+    private Collection<Location> candidates(Rectangle box) {
+        long minLatCell = cellIndex(box.minLat)
+        long maxLatCell = cellIndex(box.maxLat)
+        long minLonCell = cellIndex(box.minLon)
+        long maxLonCell = cellIndex(box.maxLon)
+        if (box.crossesDateline() ||
+                (maxLatCell - minLatCell + 1) * (maxLonCell - minLonCell + 1) > cells.size()) {
+            return locations
+        }
+
+        List<Location> candidates = []
+        for (long latCell = minLatCell; latCell <= maxLatCell; latCell++) {
+            for (long lonCell = minLonCell; lonCell <= maxLonCell; lonCell++) {
+                List<Location> inCell = cells.get(cellKey(latCell, lonCell))
+                if (inCell != null) {
+                    candidates.addAll(inCell)
+                }
+            }
+        }
+        candidates
+    }
+
+    private static boolean matches(Location location, Set<String> campusTokens,
+                                   List<String> types) {
+        if (campusTokens != null && !location.campus.any { String token ->
+            campusTokens.contains(token)
+        }) {
+            return false
+        }
+
+        // One should clause per type, on tags for cultural centers like buildSearchRequest
+        !types || types.any { String type ->
+            Set<String> field = type == "cultural-center" ? location.tags : location.type
+            tokens(type).any { String token -> field.contains(token) }
+        }
+    }
+
+    /**
+     * Reads the parts of a source the index needs, or returns null when it has no valid
+     * geoLocation.
+     */
+    private static Location location(String source) {
+        Map<String, Object> document = (Map<String, Object>) MAPPER.readValue(source, Map)
+        Map<String, Object> attributes = (Map<String, Object>) document.get("attributes")
+        double[] point = point(attributes?.get("geoLocation"))
+        if (point == null) {
+            return null
+        }
+
+        int encodedLat = GeoEncodingUtils.encodeLatitude(point[0])
+        int encodedLon = GeoEncodingUtils.encodeLongitude(point[1])
+        new Location(id: document.get("id").toString(),
+                encodedLat: encodedLat, encodedLon: encodedLon,
+                lat: GeoEncodingUtils.decodeLatitude(encodedLat),
+                lon: GeoEncodingUtils.decodeLongitude(encodedLon),
+                campus: fieldTokens(attributes.get("campus")),
+                type: fieldTokens(attributes.get("type")),
+                tags: fieldTokens(attributes.get("tags")))
+    }
+
+    /**
+     * Returns [lat, lon] of a geo_point given as an object or a "lat,lon" string, or null.
+     */
+    private static double[] point(Object geoLocation) {
+        Object lat = null
+        Object lon = null
+        if (geoLocation instanceof Map) {
+            lat = ((Map) geoLocation).get("lat")
+            lon = ((Map) geoLocation).get("lon")
+        } else if (geoLocation instanceof String) {
+            List<String> parts = ((String) geoLocation).split(",").toList()
+            if (parts.size() == 2) {
+                lat = parts[0].trim()
+                lon = parts[1].trim()
+            }
+        }
+        if (lat == null || lon == null) {
+            return null
+        }
+
+        try {
+            double latitude = Double.parseDouble(lat.toString())
+            double longitude = Double.parseDouble(lon.toString())
+            if (latitude < -90 || latitude > 90 || longitude < -180 || longitude > 180) {
+                return null
+            }
+            [latitude, longitude] as double[]
+        } catch (NumberFormatException e) {
+            null
+        }
+    }
+
+    private static Set<String> fieldTokens(Object value) {
+        Set<String> found = new HashSet<String>()
+        if (value instanceof Collection) {
+            ((Collection) value).each { Object element -> found.addAll(fieldTokens(element)) }
+        } else if (value != null) {
+            found.addAll(tokens(value.toString()))
+        }
+        found
+    }
+
+    private static Set<String> tokens(String text) {
+        Set<String> found = new LinkedHashSet<String>()
+        Matcher matcher = TOKEN.matcher(text.toLowerCase(Locale.ROOT))
+        while (matcher.find()) {
+            found << matcher.group()
+        }
+        found
+    }
+
+    private static long cellIndex(double degrees) {
+        (long) Math.floor(degrees / CELL_DEGREES)
+    }
+
+    private static long cellKey(long latCell, long lonCell) {
+        // Longitude cells range over 360 / CELL_DEGREES, well under 1 << 20 of them
+        (latCell << 20) + lonCell
+    }
+
+    private static long cell(double lat, double lon) {
+        cellKey(cellIndex(lat), cellIndex(lon))
+    }
+}
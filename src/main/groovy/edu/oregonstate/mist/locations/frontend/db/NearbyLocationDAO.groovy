@@ -0,0 +1,321 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import com.codahale.metrics.Gauge
+import com.codahale.metrics.MetricRegistry
+import com.fasterxml.jackson.core.JsonGenerator
+import com.fasterxml.jackson.databind.ObjectMapper
+import groovy.transform.PackageScope
+import groovy.transform.TypeChecked
+import org.elasticsearch.index.query.QueryBuilders
+import org.slf4j.Logger
+import org.slf4j.LoggerFactory
+
+import java.util.concurrent.CompletableFuture
+import java.util.concurrent.atomic.AtomicLong
+import java.util.function.Function
+
+import static java.util.concurrent.CompletableFuture.completedFuture
+
+/**
+ * Answers "what's near me" searches from a NearbyIndex of the locations instead of an
+ * ElasticSearch search. Searches by lat and lon, with any distance, campus and types, sparse
+ * fields and paging, are matched and sorted by the index, and only the sources of the hits of
+ * the page are fetched, with one getByIds() multi-get, which ElasticSearch answers with the
+ * current sources and filters to the sparse fields. Any other search, and every other
+ * request, goes to the LocationStore it wraps.
+ *
+ * The index holds the id, geoLocation, campus, type and tags of each location, and is rebuilt
+ * from an export of only those fields every nearbyIndexRefreshSeconds by refresh(). Until the
+ * first refresh, and after a failed one, searches go to ElasticSearch or use the last index
+ * built.
+ *
+ * Responses differ from those of ElasticSearch, which is why the index is off by default:
+ *  - hits at the same distance are ordered by id rather than by score, and have a score of
+ *    0.0 in their sort values, as the index scores nothing, so their ETags differ too
+ *  - which locations match lags behind ElasticSearch by up to nearbyIndexRefreshSeconds, as
+ *    IndexChangeWatcher only clears the response cache; a hit deleted since the last refresh
+ *    is left out of its page rather than replaced
+ *
+ * Settings (in the locations configuration):
+ *  nearbyIndexRefreshSeconds  seconds between refreshes, 0 turns the index off (default: 0)
+ */
+@TypeChecked
+class NearbyLocationDAO extends LocationStore {
+    private static final Logger LOGGER = LoggerFactory.getLogger(NearbyLocationDAO.class)
+
+    private static final ObjectMapper MAPPER = new ObjectMapper()
+
+    static final long DEFAULT_REFRESH_SECONDS = 0
+
+    // The fields of the locations the index searches by, all it exports
+    static final List<String> INDEXED_FIELDS = ["geoLocation", "campus", "type", "tags"]
+
+    // Locations read from ElasticSearch per batch of a refresh
+    static final int EXPORT_BATCH_SIZE = 500
+
+    private final LocationStore dao
+    private final String esIndex
+    private final String esType
+
+    private volatile NearbyIndex index
+
+    private final AtomicLong served = new AtomicLong()
+    private final AtomicLong delegated = new AtomicLong()
+
+    NearbyLocationDAO(LocationStore dao, Map<String, String> locationConfiguration) {
+        this.dao = dao
+        esIndex = locationConfiguration.get("esIndex")
+        esType = locationConfiguration.get("estype")
+    }
+
+    static boolean isEnabled(Map<String, String> locationConfiguration) {
+        CachingLocationDAO.setting(locationConfiguration, "nearbyIndexRefreshSeconds",
+                DEFAULT_REFRESH_SECONDS) > 0
+    }
+
+    /**
+     * Rebuilds the index from the locations in ElasticSearch. Failures are logged and the
+     * last index kept, so that it can be run on a schedule.
+     */
+    void refresh() {
+        try {
+            List<String> sources = []
+            dao.exportLocations(EXPORT_BATCH_SIZE, INDEXED_FIELDS) { String source ->
+                sources << source
+            }
+            NearbyIndex refreshed = new NearbyIndex(sources)
+            index = refreshed
+            LOGGER.debug("Indexed ${refreshed.size} of ${sources.size()} locations " +
+                    "for nearby searches")
+        } catch (Exception e) {
+            LOGGER.warn("Could not refresh the nearby locations index", e)
+        }
+    }
+
+    @Override
+    CompletableFuture<String> search(String q, String campus, List<String> type,
+                                     Double lat, Double lon, String searchDistance,
+                                     Boolean isOpen, Integer weekday, Boolean giRestroom,
+                                     List<String> parkingZoneGroup, Integer adaParkingSpaceCount,
+                                     Integer motorcycleParkingSpaceCount,
+                                     Integer evParkingSpaceCount, String abbreviation,
+                                     Integer pageNumber, Integer pageSize,
+                                     List<Object> searchAfter, List<String> fields) {
+        // Only the geo distance, campus and type filters are matched by the index
+        NearbyIndex current = index
+        boolean nearbyOnly = lat && lon && !q && !isOpen && !giRestroom && !parkingZoneGroup &&
+                !adaParkingSpaceCount && !motorcycleParkingSpaceCount && !evParkingSpaceCount &&
+                !abbreviation
+        Double distance = nearbyOnly && current != null ? meters(searchDistance) : null
+        if (distance == null || !pageable(lat, lon, pageNumber, pageSize, searchAfter)) {
+            delegated.incrementAndGet()
+            return dao.search(q, campus, type, lat, lon, searchDistance, isOpen, weekday,
+                    giRestroom, parkingZoneGroup, adaParkingSpaceCount,
+                    motorcycleParkingSpaceCount, evParkingSpaceCount, abbreviation,
+                    pageNumber, pageSize, searchAfter, fields)
+        }
+
+        served.incrementAndGet()
+        List<NearbyIndex.Hit> hits = current.search(lat, lon, distance, campus, type)
+        List<NearbyIndex.Hit> page = page(hits, pageNumber, pageSize, searchAfter)
+        if (!page) {
+            return completedFuture(searchResponse(hits.size(), page, [], searchAfter))
+        }
+        dao.getByIds(page.collect { NearbyIndex.Hit hit -> hit.location.id }, fields)
+                .thenApply({ List<String> sources ->
+                    searchResponse(hits.size(), page, sources, searchAfter)
+                } as Function<List<String>, String>)
+    }
+
+    @Override
+    CompletableFuture<String> searchService(String q, Boolean isOpen, Integer weekday,
+                                            Integer pageNumber, Integer pageSize,
+                                            List<Object> searchAfter) {
+        dao.searchService(q, isOpen, weekday, pageNumber, pageSize, searchAfter)
+    }
+
+    @Override
+    CompletableFuture<String> getRelatedServices(String locationId, Integer pageNumber,
+                                                 Integer pageSize) {
+        dao.getRelatedServices(locationId, pageNumber, pageSize)
+    }
+
+    @Override
+    CompletableFuture<String> getServicesByLocationIds(List<String> locationIds) {
+        dao.getServicesByLocationIds(locationIds)
+    }
+
+    @Override
+    CompletableFuture<String> getById(String id, List<String> fields) {
+        dao.getById(id, fields)
+    }
+
+    @Override
+    CompletableFuture<String> getServiceById(String id) {
+        dao.getServiceById(id)
+    }
+
+    @Override
+    CompletableFuture<List<String>> getByIds(List<String> ids, List<String> fields) {
+        dao.getByIds(ids, fields)
+    }
+
+    @Override
+    void exportLocations(Integer batchSize, List<String> fields, Closure<?> eachSource) {
+        dao.exportLocations(batchSize, fields, eachSource)
+    }
+
+    @Override
+    void exportServices(Integer batchSize, Closure<?> eachSource) {
+        dao.exportServices(batchSize, eachSource)
+    }
+
+    /**
+     * Registers gauges of the locations in the index, the searches it served and passed on,
+     * and the seconds since it was built.
+     *
+     * @param metrics
+     */
+    void registerMetrics(MetricRegistry metrics) {
+        registerGauge(metrics, "size") { index?.size ?: 0 }
+        registerGauge(metrics, "served") { served.get() }
+        registerGauge(metrics, "delegated") { delegated.get() }
+        registerGauge(metrics, "ageSeconds") {
+            NearbyIndex current = index
+            current != null ? (System.currentTimeMillis() - current.builtAt).intdiv(1000) : null
+        }
+    }
+
+    private static void registerGauge(MetricRegistry metrics, String name, Closure<?> value) {
+        metrics.register(MetricRegistry.name(NearbyLocationDAO, "index", name), value as Gauge)
+    }
+
+    /**
+     * Returns the distance of a search in meters, as the geo_distance query reads it, or null
+     * when it doesn't parse, for ElasticSearch to report.
+     */
+    private static Double meters(String searchDistance) {
+        try {
+            QueryBuilders.geoDistanceQuery("attributes.geoLocation")
+                    .distance(searchDistance).distance()
+        } catch (IllegalArgumentException | NullPointerException e) {
+            null
+        }
+    }
+
+    /**
+     * Whether the page of a search is one the index can return, rather than one ElasticSearch
+     * rejects: a valid point, a page within the result window and a cursor of the sort values
+     * of a previous page.
+     */
+    private static boolean pageable(Double lat, Double lon, Integer pageNumber,
+                                    Integer pageSize, List<Object> searchAfter) {
+        // Written so that NaN coordinates fail too
+        boolean validPoint = lat >= -90 && lat <= 90 && lon >= -180 && lon <= 180
+        if (!validPoint || pageNumber == null || pageSize == null || pageNumber < 1 ||
+                pageSize < 0) {
+            return false
+        }
+
+        // MAX_RELATED_SERVICES is the result window of every search
+        if (searchAfter == null) {
+            return (pageNumber - 1) * (long) pageSize + pageSize <=
+                    LocationDAO.MAX_RELATED_SERVICES
+        }
+        pageSize <= LocationDAO.MAX_RELATED_SERVICES && (searchAfter.isEmpty() ||
+                (searchAfter.size() == 3 && searchAfter[0] instanceof Number &&
+                        searchAfter[2] instanceof String))
+    }
+
+    /**
+     * Returns the hits of a page of a search.
+     *
+     * @param hits every hit of the search
+     * @param pageNumber
+     * @param pageSize
+     * @param searchAfter
+     * @return
+     */
+    private static List<NearbyIndex.Hit> page(List<NearbyIndex.Hit> hits, Integer pageNumber,
+                                              Integer pageSize, List<Object> searchAfter) {
+        if (searchAfter == null) {
+            int from = Math.min((pageNumber - 1) * pageSize, hits.size())
+            return hits.subList(from, Math.min(from + pageSize, hits.size()))
+        }
+        List<NearbyIndex.Hit> after = hits.findAll { NearbyIndex.Hit hit ->
+            isAfter(hit, searchAfter)
+        }
+        after.subList(0, Math.min(pageSize, after.size()))
+    }
+
+    /**
+     * Writes a page of hits as the JSON of an ElasticSearch search response, with their
+     * sources. Hits without a source, deleted since the index was built, are left out.
+     *
+     * @param total number of hits of the search
+     * @param page hits of the page
+     * @param sources JSON sources of the locations of the page, in any order
+     * @param searchAfter
+     * @return
+     */
+    @PackageScope
+    String searchResponse(int total, List<NearbyIndex.Hit> page, List<String> sources,
+                          List<Object> searchAfter) {
+        Map<String, String> sourcesById = [:]
+        sources.each { String source ->
+            sourcesById.put(MAPPER.readTree(source).get("id").asText(), source)
+        }
+
+        List<NearbyIndex.Hit> found = page.findAll { NearbyIndex.Hit hit ->
+            sourcesById.containsKey(hit.location.id)
+        }
+
+        StringWriter json = new StringWriter()
+        JsonGenerator generator = MAPPER.factory.createGenerator(json)
+        generator.writeStartObject()
+        generator.writeNumberField("took", 0)
+        generator.writeBooleanField("timed_out", false)
+        generator.writeObjectFieldStart("_shards")
+        generator.writeNumberField("total", 1)
+        generator.writeNumberField("successful", 1)
+        generator.writeNumberField("skipped", 0)
+        generator.writeNumberField("failed", 0)
+        generator.writeEndObject()
+        generator.writeObjectFieldStart("hits")
+        generator.writeNumberField("total", total)
+        generator.writeNullField("max_score")
+        generator.writeArrayFieldStart("hits")
+        found.each { NearbyIndex.Hit hit ->
+            generator.writeStartObject()
+            generator.writeStringField("_index", esIndex)
+            generator.writeStringField("_type", esType)
+            generator.writeStringField("_id", hit.location.id)
+            generator.writeNullField("_score")
+            generator.writeFieldName("_source")
+            generator.writeRawValue(sourcesById.get(hit.location.id))
+            generator.writeArrayFieldStart("sort")
+            generator.writeNumber(hit.distance)
+            generator.writeNumber(0d)
+            if (searchAfter != null) {
+                generator.writeString(hit.location.id)
+            }
+            generator.writeEndArray()
+            generator.writeEndObject()
+        }
+        generator.writeEndArray()
+        generator.writeEndObject()
+        generator.writeEndObject()
+        generator.close()
+
+        json.toString()
+    }
+
+    private static boolean isAfter(NearbyIndex.Hit hit, List<Object> searchAfter) {
+        if (searchAfter.isEmpty()) {
+            return true
+        }
+        double distance = ((Number) searchAfter[0]).doubleValue()
+        hit.distance > distance ||
+                (hit.distance == distance && hit.location.id > (String) searchAfter[2])
+    }
+}
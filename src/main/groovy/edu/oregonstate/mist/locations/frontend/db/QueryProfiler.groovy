@@ -0,0 +1,163 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import com.fasterxml.jackson.databind.JsonNode
+import com.fasterxml.jackson.databind.ObjectMapper
+import com.fasterxml.jackson.databind.node.ArrayNode
+import com.fasterxml.jackson.databind.node.ObjectNode
+import com.fasterxml.jackson.databind.node.TextNode
+import groovy.transform.PackageScope
+import groovy.transform.TypeChecked
+import org.elasticsearch.action.search.SearchRequestBuilder
+import org.elasticsearch.action.search.SearchResponse
+import org.slf4j.Logger
+import org.slf4j.LoggerFactory
+
+import java.util.concurrent.CompletableFuture
+import java.util.concurrent.ThreadLocalRandom
+import java.util.function.Function
+import java.util.regex.Pattern
+
+/**
+ * Opt-in profiling of ElasticSearch searches. A fraction (esProfileSampleRate, default 0) of
+ * the searches are sent with the profile API on, and the profile of each is logged at info
+ * level as one line of JSON after "query profile: ", with the shape of the query:
+ *
+ *  {"fingerprint":"5c1f09a2","index":"locations","tookMillis":12,"shape":{...},"profile":{...}}
+ *
+ * The shape is the query with every value replaced by "?", numbered path segments (the
+ * weekday of openHours.3) by "N" and repeated clauses (one should clause per type) kept
+ * once, so that searches that only differ by their values share a fingerprint. The profile
+ * is left out of the response the DAO returns, so that it is neither cached nor mapped.
+ *
+ * src/test/integration/query_profile.py ranks the shapes and clauses of the logged profiles.
+ */
+@TypeChecked
+class QueryProfiler {
+    private static final Logger LOGGER = LoggerFactory.getLogger(QueryProfiler.class)
+
+    private static final ObjectMapper MAPPER = new ObjectMapper()
+
+    // Numbered segments of field paths, like the weekday of attributes.openHours.3.start
+    private static final Pattern NUMBERED_SEGMENT = Pattern.compile(/\.\d+(?=\.|$)/)
+
+    // The profile is the last field of a search response, so it ends the JSON
+    private static final String PROFILE_FIELD = ',"profile":'
+
+    static final String LOG_PREFIX = "query profile: "
+
+    private final double sampleRate
+
+    /**
+     * @param sampleRate fraction of searches to profile, from 0 (none) to 1 (all of them)
+     */
+    QueryProfiler(double sampleRate) {
+        if (sampleRate < 0 || sampleRate > 1) {
+            throw new IllegalArgumentException(
+                    "esProfileSampleRate must be from 0 to 1, not ${sampleRate}")
+        }
+        this.sampleRate = sampleRate
+    }
+
+    /**
+     * Whether to profile the next search.
+     *
+     * @return
+     */
+    boolean sample() {
+        sampleRate > 0 && ThreadLocalRandom.current().nextDouble() < sampleRate
+    }
+
+    /**
+     * Sends a search with the profile API on, through limiter, and logs its profile.
+     *
+     * @param request
+     * @param limiter
+     * @return future of the JSON of the search response, without the profile
+     */
+    CompletableFuture<String> profile(SearchRequestBuilder request, RequestLimiter limiter) {
+        JsonNode queryShape = shape(request)
+        String fingerprint = fingerprint(queryShape)
+        String index = request.request().indices().join(",")
+        request.setProfile(true)
+
+        limiter.execute(request).thenApply({ SearchResponse response ->
+            List<String> parts = splitProfile(response.toString())
+            ObjectNode entry = MAPPER.createObjectNode()
+            entry.put("fingerprint", fingerprint)
+            entry.put("index", index)
+            entry.put("tookMillis", response.took.millis())
+            entry.set("shape", queryShape)
+            entry.set("profile", parts[1] ? MAPPER.readTree(parts[1]) : null)
+            LOGGER.info(LOG_PREFIX + MAPPER.writeValueAsString(entry))
+
+            parts[0]
+        } as Function<SearchResponse, String>)
+    }
+
+    /**
+     * Returns the shape of a search request: its source with the values taken out.
+     *
+     * @param request
+     * @return
+     */
+    @PackageScope
+    static JsonNode shape(SearchRequestBuilder request) {
+        normalize(MAPPER.readTree(request.request().source().toString()))
+    }
+
+    /**
+     * Returns a short hash of a query shape, to group the profiles of a shape by.
+     *
+     * @param queryShape
+     * @return
+     */
+    @PackageScope
+    static String fingerprint(JsonNode queryShape) {
+        String.format("%08x", queryShape.toString().hashCode())
+    }
+
+    /**
+     * Splits the JSON of a profiled search response into the response without its profile
+     * and the profile, which is null when the response has none.
+     *
+     * @param responseJson
+     * @return [response, profile]
+     */
+    @PackageScope
+    static List<String> splitProfile(String responseJson) {
+        int start = responseJson.lastIndexOf(PROFILE_FIELD)
+        if (start < 0) {
+            return [responseJson, null]
+        }
+
+        [responseJson.substring(0, start) + "}",
+         responseJson.substring(start + PROFILE_FIELD.length(), responseJson.length() - 1)]
+    }
+
+    private static JsonNode normalize(JsonNode node) {
+        if (node.isObject()) {
+            ObjectNode normalized = MAPPER.createObjectNode()
+            Iterator<Map.Entry<String, JsonNode>> fields = node.fields()
+            while (fields.hasNext()) {
+                Map.Entry<String, JsonNode> field = fields.next()
+                if (field.key != "profile") {
+                    normalized.set(NUMBERED_SEGMENT.matcher(field.key).replaceAll(".N"),
+                            normalize(field.value))
+                }
+            }
+            return normalized
+        }
+
+        if (node.isArray()) {
+            Set<JsonNode> elements = new LinkedHashSet<JsonNode>()
+            for (JsonNode element : node) {
+                elements << normalize(element)
+            }
+            ArrayNode normalized = MAPPER.createArrayNode()
+            normalized.addAll(elements)
+            return normalized
+        }
+
+        TextNode.valueOf("?")
+    }
+}
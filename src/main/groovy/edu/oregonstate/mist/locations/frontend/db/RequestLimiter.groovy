@@ -0,0 +1,199 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import com.codahale.metrics.Gauge
+import com.codahale.metrics.MetricRegistry
+import com.google.common.util.concurrent.MoreExecutors
+import groovy.transform.TypeChecked
+import org.elasticsearch.action.ActionListener
+import org.elasticsearch.action.ActionRequestBuilder
+import org.elasticsearch.action.ActionResponse
+import org.elasticsearch.action.search.SearchRequestBuilder
+import org.elasticsearch.action.search.SearchResponse
+import org.elasticsearch.common.unit.TimeValue
+
+import java.util.concurrent.CompletableFuture
+import java.util.concurrent.Executor
+import java.util.concurrent.ScheduledExecutorService
+import java.util.concurrent.ScheduledFuture
+import java.util.concurrent.Semaphore
+import java.util.concurrent.TimeUnit
+import java.util.concurrent.TimeoutException
+import java.util.concurrent.atomic.AtomicBoolean
+import java.util.concurrent.atomic.AtomicLong
+
+/**
+ * Sends ElasticSearch requests without blocking the calling thread, and at most maxInFlight
+ * at a time. A request over the limit fails at once with a SaturatedException rather than
+ * waiting for a slot, so that a slow cluster can't tie up every thread of the server.
+ *
+ * Futures are completed on the completions executor rather than on the transport thread that
+ * received the response, so that what callers chain on them, from mapping the results to
+ * serializing the response, runs there too.
+ *
+ * A request ElasticSearch hasn't answered within the timeout fails with a TimeoutException
+ * and gives its permit back. Searches are sent with the same timeout, so that ElasticSearch
+ * stops working on them too; a search it cut short fails the same way rather than return the
+ * hits found until then.
+ */
+@TypeChecked
+class RequestLimiter {
+    static final int DEFAULT_MAX_IN_FLIGHT = 64
+    static final long DEFAULT_TIMEOUT_SECONDS = 10
+
+    private final int maxInFlight
+    private final Semaphore permits
+    private final long timeoutMillis
+    private final Executor completions
+    private final ScheduledExecutorService timer
+    private final AtomicLong rejected = new AtomicLong()
+    private final AtomicLong timedOut = new AtomicLong()
+
+    /**
+     * Limits requests without timing them out, completing their futures on the thread that
+     * received the response.
+     *
+     * @param maxInFlight
+     */
+    RequestLimiter(int maxInFlight) {
+        this(maxInFlight, 0, MoreExecutors.directExecutor(), null)
+    }
+
+    /**
+     * Limits requests, completing their futures on completions and timing them out with timer
+     * after timeoutMillis.
+     *
+     * @param maxInFlight
+     * @param timeoutMillis
+     * @param completions
+     * @param timer
+     */
+    RequestLimiter(int maxInFlight, long timeoutMillis, Executor completions,
+                   ScheduledExecutorService timer) {
+        this.maxInFlight = maxInFlight
+        permits = new Semaphore(maxInFlight)
+        this.timeoutMillis = timeoutMillis
+        this.completions = completions
+        this.timer = timer
+    }
+
+    /**
+     * Sends a request, returning a future of its response.
+     *
+     * @param request
+     * @return future completed with the response, or failed with the exception of the request,
+     *         a SaturatedException or a TimeoutException
+     */
+    public <R extends ActionResponse> CompletableFuture<R> execute(
+            ActionRequestBuilder<?, R, ?> request) {
+        CompletableFuture<R> future = new CompletableFuture<R>()
+        if (!permits.tryAcquire()) {
+            rejected.incrementAndGet()
+            future.completeExceptionally(new SaturatedException(maxInFlight))
+            return future
+        }
+
+        boolean timed = timer != null && timeoutMillis > 0
+        if (timed && request instanceof SearchRequestBuilder) {
+            ((SearchRequestBuilder) request).setTimeout(TimeValue.timeValueMillis(timeoutMillis))
+        }
+        def listener = new PermitListener<R>(future, permits, completions, timedOut)
+        try {
+            request.execute(listener)
+        } catch (Exception e) {
+            listener.onFailure(e)
+            return future
+        }
+        if (timed) {
+            String message = "No answer from ElasticSearch within ${timeoutMillis} ms"
+            listener.timeout = timer.schedule({ listener.timeOut(message) } as Runnable,
+                    timeoutMillis, TimeUnit.MILLISECONDS)
+        }
+        future
+    }
+
+    int getInFlight() {
+        maxInFlight - permits.availablePermits()
+    }
+
+    long getRejected() {
+        rejected.get()
+    }
+
+    long getTimedOut() {
+        timedOut.get()
+    }
+
+    /**
+     * Registers gauges of the requests in flight, rejected and timed out.
+     *
+     * @param metrics
+     */
+    void registerMetrics(MetricRegistry metrics) {
+        metrics.register(MetricRegistry.name(RequestLimiter, "inFlight"),
+                { -> inFlight } as Gauge<Integer>)
+        metrics.register(MetricRegistry.name(RequestLimiter, "rejected"),
+                { -> rejected.get() } as Gauge<Long>)
+        metrics.register(MetricRegistry.name(RequestLimiter, "timedOut"),
+                { -> timedOut.get() } as Gauge<Long>)
+    }
+
+    /**
+     * Completes the future of a request, and gives its permit back, once ElasticSearch has
+     * answered or the request has timed out, whichever comes first.
+     */
+    private static class PermitListener<R> implements ActionListener<R> {
+        private final CompletableFuture<R> future
+        private final Semaphore permits
+        private final Executor completions
+        private final AtomicLong timedOut
+        private final AtomicBoolean finished = new AtomicBoolean()
+
+        // Set once the request is sent, so it may be answered before it is
+        volatile ScheduledFuture<?> timeout
+
+        PermitListener(CompletableFuture<R> future, Semaphore permits, Executor completions,
+                       AtomicLong timedOut) {
+            this.future = future
+            this.permits = permits
+            this.completions = completions
+            this.timedOut = timedOut
+        }
+
+        @Override
+        void onResponse(R response) {
+            if (response instanceof SearchResponse && ((SearchResponse) response).timedOut) {
+                timeOut("ElasticSearch timed out searching")
+                return
+            }
+            finish { future.complete(response) }
+        }
+
+        @Override
+        void onFailure(Exception e) {
+            finish { future.completeExceptionally(e) }
+        }
+
+        void timeOut(String message) {
+            if (finish { future.completeExceptionally(new TimeoutException(message)) }) {
+                timedOut.incrementAndGet()
+            }
+        }
+
+        /**
+         * Gives the permit back and completes the future on the completions executor, unless
+         * the request has finished already.
+         *
+         * @param complete
+         * @return whether this finished the request
+         */
+        private boolean finish(Closure<?> complete) {
+            if (!finished.compareAndSet(false, true)) {
+                return false
+            }
+            timeout?.cancel(false)
+            permits.release()
+            completions.execute(complete as Runnable)
+            true
+        }
+    }
+}
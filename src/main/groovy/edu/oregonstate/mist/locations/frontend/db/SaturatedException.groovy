@@ -0,0 +1,13 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import groovy.transform.TypeChecked
+
+/**
+ * Thrown instead of sending an ElasticSearch request when too many are in flight already.
+ */
+@TypeChecked
+class SaturatedException extends RuntimeException {
+    SaturatedException(int maxInFlight) {
+        super("${maxInFlight} ElasticSearch requests are in flight already".toString())
+    }
+}
@@ -0,0 +1,195 @@
+package edu.oregonstate.mist.locations.frontend.mapper
+
+import groovy.transform.TypeChecked
+
+/**
+ * Simplifies GeoJSON geometries for clients that draw them at a coarser scale than they were
+ * surveyed at. Lines and rings are reduced with the Douglas-Peucker algorithm, which drops the
+ * positions closer than tolerance (in degrees) to the line between the positions kept around
+ * them, and coordinates are rounded to precision decimal places.
+ *
+ * Rings stay closed, and a line or ring that would be left with fewer positions than GeoJSON
+ * requires of it is kept as it was, only rounded.
+ */
+@TypeChecked
+class GeometrySimplifier {
+    // GeoJSON positions of a linear ring, whose first and last are the same, and of a line
+    static final int MIN_RING_SIZE = 4
+    static final int MIN_LINE_SIZE = 2
+
+    private final double tolerance
+    private final Integer precision
+    private final double scale
+
+    /**
+     * @param tolerance distance in degrees under which positions are dropped, 0 to keep all
+     * @param precision decimal places coordinates are rounded to, null to keep them as is
+     */
+    GeometrySimplifier(double tolerance, Integer precision) {
+        this.tolerance = tolerance
+        this.precision = precision
+        this.scale = precision != null ? Math.pow(10d, precision.doubleValue()) : 1d
+    }
+
+    /**
+     * Simplifies a GeoJSON geometry, as read from ElasticSearch, in place.
+     *
+     * @param geometry map of the type and coordinates (or geometries) of the geometry
+     */
+    void simplify(Map geometry) {
+        if (geometry == null) {
+            return
+        }
+
+        Object coordinates = geometry.get("coordinates")
+        switch (geometry.get("type")) {
+            case "Point":
+                geometry.put("coordinates", round((List<Number>) coordinates))
+                break
+            case "MultiPoint":
+                geometry.put("coordinates", ((List<List<Number>>) coordinates).collect {
+                    List<Number> position -> round(position)
+                })
+                break
+            case "LineString":
+                geometry.put("coordinates", line((List<List<Number>>) coordinates,
+                        MIN_LINE_SIZE))
+                break
+            case "MultiLineString":
+            case "Polygon":
+                int minSize = geometry.get("type") == "Polygon" ? MIN_RING_SIZE : MIN_LINE_SIZE
+                geometry.put("coordinates", ((List<List<List<Number>>>) coordinates).collect {
+                    List<List<Number>> positions -> line(positions, minSize)
+                })
+                break
+            case "MultiPolygon":
+                geometry.put("coordinates",
+                        ((List<List<List<List<Number>>>>) coordinates).collect {
+                            List<List<List<Number>>> rings -> rings.collect {
+                                List<List<Number>> ring -> line(ring, MIN_RING_SIZE)
+                            }
+                        })
+                break
+            case "GeometryCollection":
+                ((List<Map>) geometry.get("geometries")).each { Map member -> simplify(member) }
+                break
+        }
+    }
+
+    /**
+     * Simplifies then rounds the positions of a line or ring. A ring's first and last
+     * positions are the same, and are always kept, so it stays closed.
+     *
+     * @param positions
+     * @param minSize positions the result must have, or the line is only rounded
+     * @return
+     */
+    private List<List<Number>> line(List<List<Number>> positions, int minSize) {
+        List<List<Number>> rounded = dropRepeated(positions.collect {
+            List<Number> position -> round(position)
+        })
+        List<List<Number>> simplified = tolerance > 0 ?
+                dropRepeated(douglasPeucker(positions).collect {
+                    List<Number> position -> round(position)
+                }) : rounded
+
+        if (simplified.size() >= minSize) {
+            return simplified
+        }
+        rounded.size() >= minSize ? rounded : positions
+    }
+
+    /**
+     * Returns the positions the Douglas-Peucker algorithm keeps: the ends, then, recursively,
+     * the position farthest from the segment between two kept ones, while it is farther than
+     * tolerance. Ranges are taken from a stack rather than by recursion, so long lines can't
+     * overflow the call stack.
+     *
+     * @param positions
+     * @return
+     */
+    private List<List<Number>> douglasPeucker(List<List<Number>> positions) {
+        int last = positions.size() - 1
+        if (last < 2) {
+            return positions
+        }
+
+        boolean[] kept = new boolean[positions.size()]
+        kept[0] = true
+        kept[last] = true
+        Deque<int[]> ranges = new ArrayDeque<int[]>()
+        ranges.push([0, last] as int[])
+
+        while (!ranges.isEmpty()) {
+            int[] range = ranges.pop()
+            int start = range[0]
+            int end = range[1]
+            double farthestDistance = 0
+            int farthest = -1
+            for (int i = start + 1; i < end; i++) {
+                double distance = segmentDistance(positions[i], positions[start], positions[end])
+                if (distance > farthestDistance) {
+                    farthestDistance = distance
+                    farthest = i
+                }
+            }
+
+            if (farthest != -1 && farthestDistance > tolerance) {
+                kept[farthest] = true
+                ranges.push([start, farthest] as int[])
+                ranges.push([farthest, end] as int[])
+            }
+        }
+
+        List<List<Number>> simplified = []
+        for (int i = 0; i <= last; i++) {
+            if (kept[i]) {
+                simplified << positions[i]
+            }
+        }
+        simplified
+    }
+
+    /**
+     * Distance in degrees from position p to the segment from a to b, treating longitude and
+     * latitude as plane coordinates, which is close enough over the size of a campus. When a
+     * and b are the same, as the ends of a ring are, it is the distance to that position.
+     */
+    private static double segmentDistance(List<Number> p, List<Number> a, List<Number> b) {
+        double x = p[0].doubleValue()
+        double y = p[1].doubleValue()
+        double ax = a[0].doubleValue()
+        double ay = a[1].doubleValue()
+        double dx = b[0].doubleValue() - ax
+        double dy = b[1].doubleValue() - ay
+
+        double lengthSquared = dx * dx + dy * dy
+        double t = 0
+        if (lengthSquared > 0) {
+            t = Math.max(0d, Math.min(1d, ((x - ax) * dx + (y - ay) * dy) / lengthSquared))
+        }
+        Math.hypot(x - (ax + t * dx), y - (ay + t * dy))
+    }
+
+    private List<Number> round(List<Number> position) {
+        if (precision == null) {
+            return position
+        }
+        position.collect { Number coordinate ->
+            (Number) (Math.round(coordinate.doubleValue() * scale) / scale)
+        }
+    }
+
+    /**
+     * Drops positions equal to the one before them, as rounding can make neighbours.
+     */
+    private static List<List<Number>> dropRepeated(List<List<Number>> positions) {
+        List<List<Number>> result = []
+        for (List<Number> position : positions) {
+            if (result.isEmpty() || result.last() != position) {
+                result << position
+            }
+        }
+        result
+    }
+}
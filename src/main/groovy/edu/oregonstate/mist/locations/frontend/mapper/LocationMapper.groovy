@@ -1,34 +1,255 @@
 package edu.oregonstate.mist.locations.frontend.mapper
 
+import com.fasterxml.jackson.core.JsonParser
+import com.fasterxml.jackson.core.JsonToken
 import com.fasterxml.jackson.databind.JsonNode
 import com.fasterxml.jackson.databind.ObjectMapper
+import com.fasterxml.jackson.databind.ObjectReader
 import edu.oregonstate.mist.api.jsonapi.ResourceObject
+import groovy.transform.PackageScope
 
 class LocationMapper {
+    // ObjectMapper and ObjectReader are thread safe once configured, so all requests share
+    // them instead of building a mapper and its deserializer caches for every hit
+    static final ObjectMapper MAPPER = new ObjectMapper()
+    private static final ObjectReader RESOURCE_READER = MAPPER.readerFor(ResourceObject.class)
+
     public static ResourceObject map(JsonNode hit) {
-        def hitSource = hit.get("_source").toString()
-        buildResourceObject(hitSource, hit)
-    }
+        ResourceObject ro = RESOURCE_READER.readValue(hit.get("_source"))
+        adjustLocationsResource(ro, hit.get('sort'))
 
-    public static map(String hitSource) {
-        buildResourceObject(hitSource)
+        ro
     }
 
-    private static buildResourceObject(String hitSource, JsonNode hit = null) {
-        ResourceObject ro = new ObjectMapper().readValue(hitSource, ResourceObject.class)
-        adjustLocationsResource(ro, hit)
+    public static ResourceObject map(String hitSource) {
+        ResourceObject ro = RESOURCE_READER.readValue(hitSource)
+        adjustLocationsResource(ro, null)
 
         ro
     }
 
+    /**
+     * Maps the hits of an ElasticSearch search response while it is parsed: each _source is
+     * read from the token stream straight into a ResourceObject, without building a tree of
+     * the whole response or serializing any part of it back to a string.
+     *
+     * @param esResponse search response as returned by LocationDAO
+     * @return
+     */
+    public static SearchResults mapSearchResponse(String esResponse) {
+        SearchResults results = new SearchResults()
+        JsonParser parser = MAPPER.factory.createParser(esResponse)
+
+        try {
+            parser.nextToken()
+            while (parser.nextToken() == JsonToken.FIELD_NAME) {
+                String field = parser.currentName
+                parser.nextToken()
+                if (field == "hits") {
+                    readHits(parser, results)
+                } else {
+                    parser.skipChildren()
+                }
+            }
+        } finally {
+            parser.close()
+        }
+
+        results
+    }
+
+    /**
+     * Reads the top level "hits" object: the total and the hits themselves.
+     *
+     * @param parser positioned at the start of the object
+     * @param results
+     */
+    private static void readHits(JsonParser parser, SearchResults results) {
+        while (parser.nextToken() == JsonToken.FIELD_NAME) {
+            String field = parser.currentName
+            parser.nextToken()
+            if (field == "total") {
+                results.total = parser.intValue
+            } else if (field == "hits") {
+                while (parser.nextToken() == JsonToken.START_OBJECT) {
+                    readHit(parser, results)
+                }
+            } else {
+                parser.skipChildren()
+            }
+        }
+    }
+
+    /**
+     * Reads a single hit into a ResourceObject and adds it to the results.
+     *
+     * @param parser positioned at the start of the hit
+     * @param results
+     */
+    private static void readHit(JsonParser parser, SearchResults results) {
+        ResourceObject ro = null
+        JsonNode sort = null
+
+        while (parser.nextToken() == JsonToken.FIELD_NAME) {
+            String field = parser.currentName
+            parser.nextToken()
+            if (field == "_source") {
+                ro = RESOURCE_READER.readValue(parser)
+            } else if (field == "sort") {
+                sort = MAPPER.readTree(parser)
+            } else {
+                parser.skipChildren()
+            }
+        }
+        adjustLocationsResource(ro, sort)
+
+        results.data << ro
+        results.lastSort = sort
+    }
+
+    /**
+     * Returns what the page of hits of a search response is made of, for entity tags: the
+     * total, and the _id, sort values and hashCode of each hit. The hashCode, which the
+     * indexer derives from the document, stands for the whole source; a source without one,
+     * such as one filtered to a sparse fieldset, stands for itself. It is read from the token
+     * stream without mapping the hits.
+     *
+     * @param esResponse search response as returned by LocationDAO
+     * @return
+     */
+    public static String hitsFingerprint(String esResponse) {
+        StringBuilder fingerprint = new StringBuilder()
+        JsonParser parser = MAPPER.factory.createParser(esResponse)
+
+        try {
+            parser.nextToken()
+            while (parser.nextToken() == JsonToken.FIELD_NAME) {
+                String field = parser.currentName
+                parser.nextToken()
+                if (field == "hits") {
+                    fingerprintHits(parser, esResponse, fingerprint)
+                } else {
+                    parser.skipChildren()
+                }
+            }
+        } finally {
+            parser.close()
+        }
+
+        fingerprint.toString()
+    }
+
+    private static void fingerprintHits(JsonParser parser, String esResponse,
+                                        StringBuilder fingerprint) {
+        while (parser.nextToken() == JsonToken.FIELD_NAME) {
+            String field = parser.currentName
+            parser.nextToken()
+            if (field == "total") {
+                fingerprint.append(parser.text).append('\n')
+            } else if (field == "hits") {
+                while (parser.nextToken() == JsonToken.START_OBJECT) {
+                    fingerprintHit(parser, esResponse, fingerprint)
+                }
+            } else {
+                parser.skipChildren()
+            }
+        }
+    }
+
+    private static void fingerprintHit(JsonParser parser, String esResponse,
+                                       StringBuilder fingerprint) {
+        String id = null
+        String sort = null
+        String source = null
+
+        while (parser.nextToken() == JsonToken.FIELD_NAME) {
+            String field = parser.currentName
+            parser.nextToken()
+            if (field == "_id") {
+                id = parser.text
+            } else if (field == "sort") {
+                sort = MAPPER.readTree(parser).toString()
+            } else if (field == "_source") {
+                source = sourceFingerprint(parser, esResponse)
+            } else {
+                parser.skipChildren()
+            }
+        }
+
+        fingerprint.append(id).append(' ').append(sort).append(' ').append(source).append('\n')
+    }
+
+    /**
+     * Returns the hashCode attribute of a hit's source, or the source itself when it has none.
+     *
+     * @param parser positioned at the start of the source
+     * @param esResponse the response being parsed, which the source is cut from
+     * @return
+     */
+    private static String sourceFingerprint(JsonParser parser, String esResponse) {
+        int start = (int) parser.tokenLocation.charOffset
+        String hashCode = null
+
+        while (parser.nextToken() == JsonToken.FIELD_NAME) {
+            String field = parser.currentName
+            parser.nextToken()
+            if (field == "attributes" && parser.currentToken == JsonToken.START_OBJECT) {
+                while (parser.nextToken() == JsonToken.FIELD_NAME) {
+                    String attribute = parser.currentName
+                    parser.nextToken()
+                    if (attribute == "hashCode") {
+                        hashCode = parser.text
+                    } else {
+                        parser.skipChildren()
+                    }
+                }
+            } else {
+                parser.skipChildren()
+            }
+        }
+
+        if (hashCode != null) {
+            return "hashCode:" + hashCode
+        }
+        esResponse.substring(start, (int) parser.currentLocation.charOffset)
+    }
+
+    /**
+     * Writes the source of a hit, mapped like map(String), as a line of newline delimited JSON.
+     *
+     * @param hitSource
+     * @param writer
+     */
+    public static void writeNdjson(String hitSource, Writer writer) {
+        writer.write(MAPPER.writeValueAsString(map(hitSource)))
+        writer.write("\n")
+    }
+
+    /**
+     * Keeps only the given attributes and relationships of a resource object, for sparse
+     * fieldsets: the ones adjustLocationsResource adds are there whether asked for or not.
+     *
+     * @param ro
+     * @param fields
+     */
+    public static void retainFields(ResourceObject ro, Collection<String> fields) {
+        if (ro?.attributes instanceof Map) {
+            ((Map) ro.attributes).keySet().retainAll(fields)
+        }
+        if (ro?.relationships instanceof Map) {
+            ((Map) ro.relationships).keySet().retainAll(fields)
+        }
+    }
+
     /**
      * Modify the json object from ElasticSearch to the API specification.
      *
-     * @param attr
-     * @param sort
+     * @param ro
+     * @param sort sort values of the hit, if any
      * @return
      */
-    private static void adjustLocationsResource(ResourceObject ro, JsonNode hit) {
+    @PackageScope // for benchmarking
+    static void adjustLocationsResource(ResourceObject ro, JsonNode sort) {
         // setup the individual latitude, longitude and remove ES geoLocation object
         if (ro?.type != "services") { // services don't have lat / lon
             ro?.attributes?.latitude = ro?.attributes?.geoLocation?.lat?.toString()
@@ -39,8 +260,8 @@ class LocationMapper {
         }
 
         // add the sort ES metadata to attributes
-        if (hit?.get('sort')?.get(0)) {
-            ro?.attributes?.distance = hit?.get('sort')?.get(0)?.asDouble()
+        if (sort?.get(0)) {
+            ro?.attributes?.distance = sort?.get(0)?.asDouble()
         }
 
         // remove attributes not part of the api spec
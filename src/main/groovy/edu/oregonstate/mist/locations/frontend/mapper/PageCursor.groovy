@@ -0,0 +1,62 @@
+package edu.oregonstate.mist.locations.frontend.mapper
+
+import com.fasterxml.jackson.databind.JsonNode
+
+/**
+ * Opaque page[after] cursors of search_after pagination: the sort values of the last hit of a
+ * page, as URL safe base64 of their JSON.
+ */
+class PageCursor {
+    /**
+     * Returns the cursor of the page after the hit with these sort values.
+     *
+     * @param sort
+     * @return
+     */
+    public static String encode(JsonNode sort) {
+        Base64.urlEncoder.withoutPadding().encodeToString(
+                LocationMapper.MAPPER.writeValueAsBytes(sort))
+    }
+
+    /**
+     * Returns the cursor of the page after a page of search results, or null when they have
+     * no sort values to start after.
+     *
+     * @param searchResults
+     * @return
+     */
+    public static String after(SearchResults searchResults) {
+        searchResults.lastSort ? encode(searchResults.lastSort) : null
+    }
+
+    /**
+     * Returns the sort values of a cursor: null without a cursor, and none for an empty one,
+     * which asks for the first page.
+     *
+     * @param cursor
+     * @return
+     * @throws IllegalArgumentException if the cursor was not made by encode()
+     */
+    public static List<Object> decode(String cursor) {
+        if (cursor == null) {
+            return null
+        }
+        if (!cursor) {
+            return []
+        }
+
+        def sort
+        try {
+            sort = LocationMapper.MAPPER.readValue(Base64.urlDecoder.decode(cursor), Object)
+        } catch (IOException | IllegalArgumentException e) {
+            throw new IllegalArgumentException("Invalid page[after] cursor.", e)
+        }
+        boolean sortValues = sort instanceof List && sort && sort.every {
+            it instanceof Number || it instanceof String
+        }
+        if (!sortValues) {
+            throw new IllegalArgumentException("Invalid page[after] cursor.")
+        }
+        (List<Object>) sort
+    }
+}
@@ -0,0 +1,15 @@
+package edu.oregonstate.mist.locations.frontend.mapper
+
+import com.fasterxml.jackson.databind.JsonNode
+import edu.oregonstate.mist.api.jsonapi.ResourceObject
+
+/**
+ * The hits of an ElasticSearch search response mapped to ResourceObjects, along with the
+ * total number of hits used for pagination and the sort values of the last hit, which the
+ * next page of a search_after search starts after.
+ */
+class SearchResults {
+    Integer total = 0
+    List<ResourceObject> data = []
+    JsonNode lastSort
+}
@@ -0,0 +1,97 @@
+package edu.oregonstate.mist.locations.frontend.resources
+
+import edu.oregonstate.mist.api.Error
+import edu.oregonstate.mist.locations.frontend.db.RequestLimiter
+import edu.oregonstate.mist.locations.frontend.db.SaturatedException
+import org.slf4j.Logger
+
+import javax.ws.rs.container.AsyncResponse
+import javax.ws.rs.container.TimeoutHandler
+import javax.ws.rs.core.Response
+import java.util.concurrent.CompletableFuture
+import java.util.concurrent.CompletionException
+import java.util.concurrent.TimeUnit
+import java.util.concurrent.TimeoutException
+
+/**
+ * Completes suspended requests with the futures of responses built from LocationStore results,
+ * so that no server thread waits for ElasticSearch. The futures of ElasticSearch requests are
+ * completed on the response executor of the RequestLimiter, so the responses are built and
+ * requests resumed there rather than on a transport thread.
+ *
+ * Requests that take longer than the timeout, or that are turned away because too many
+ * ElasticSearch requests are in flight, get a 503 at once. Other failures are logged and
+ * answered with a 500, as the resources did before.
+ */
+class AsyncResponses {
+    /**
+     * Seconds a request may wait for ElasticSearch, the same as the RequestLimiter waits.
+     */
+    public static final long DEFAULT_TIMEOUT_SECONDS = RequestLimiter.DEFAULT_TIMEOUT_SECONDS
+
+    public static final String BUG_MESSAGE = "Woot you found a bug for us to fix!"
+
+    public static final String TIMEOUT_MESSAGE = "Timed out waiting for ElasticSearch."
+
+    /**
+     * Resumes asyncResponse with the response the closure returns a future of.
+     *
+     * @param asyncResponse
+     * @param timeoutSeconds
+     * @param logger logs unexpected failures
+     * @param failureMessage message logged with them
+     * @param respond closure returning a CompletableFuture<Response>
+     */
+    static void resume(AsyncResponse asyncResponse, long timeoutSeconds, Logger logger,
+                       String failureMessage, Closure<CompletableFuture<Response>> respond) {
+        asyncResponse.setTimeoutHandler({ AsyncResponse timedOut ->
+            timedOut.resume(unavailable(TIMEOUT_MESSAGE))
+        } as TimeoutHandler)
+        asyncResponse.setTimeout(timeoutSeconds, TimeUnit.SECONDS)
+
+        CompletableFuture<Response> response
+        try {
+            response = respond()
+        } catch (Exception e) {
+            response = new CompletableFuture<Response>()
+            response.completeExceptionally(e)
+        }
+
+        response.whenComplete { Response result, Throwable failure ->
+            // Once timed out the request is answered already, and resume() returns false
+            asyncResponse.resume(failure == null ? result :
+                    failureResponse(failure, logger, failureMessage))
+        }
+    }
+
+    /**
+     * Returns the error response for a failed request.
+     *
+     * @param failure
+     * @param logger
+     * @param failureMessage
+     * @return
+     */
+    static Response failureResponse(Throwable failure, Logger logger, String failureMessage) {
+        Throwable cause = failure instanceof CompletionException && failure.cause ?
+                failure.cause : failure
+        if (cause instanceof SaturatedException) {
+            return unavailable(cause.message)
+        }
+        if (cause instanceof TimeoutException) {
+            // The request timed out in the RequestLimiter before it did here
+            return unavailable(TIMEOUT_MESSAGE)
+        }
+
+        logger.error(failureMessage, cause)
+        Response.status(Response.Status.INTERNAL_SERVER_ERROR)
+                .entity(Error.internalServerError(BUG_MESSAGE))
+                .build()
+    }
+
+    private static Response unavailable(String message) {
+        Response.status(Response.Status.SERVICE_UNAVAILABLE)
+                .entity(Error.serviceUnavailable(message))
+                .build()
+    }
+}
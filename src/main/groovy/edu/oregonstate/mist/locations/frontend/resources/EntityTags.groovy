@@ -0,0 +1,91 @@
+package edu.oregonstate.mist.locations.frontend.resources
+
+import javax.ws.rs.core.EntityTag
+import javax.ws.rs.core.HttpHeaders
+import javax.ws.rs.core.Response
+import java.nio.charset.StandardCharsets
+import java.security.MessageDigest
+
+/**
+ * Strong entity tags of responses built from ElasticSearch documents, so that clients and
+ * caches holding a response can revalidate it with If-None-Match and get a 304 without a body.
+ *
+ * A tag is a digest of the request URI, which decides the form of the response (its page,
+ * fields, geojson, ...), and of what ElasticSearch returned for it: the source of a single
+ * document, or for searches LocationMapper.hitsFingerprint(), which is read without mapping
+ * the hits. Requests that match are answered before anything is mapped or serialized.
+ */
+class EntityTags {
+    // Bytes of the SHA-256 digest kept in tags
+    private static final int TAG_BYTES = 16
+
+    /**
+     * Returns the tag of a response.
+     *
+     * @param requestUri
+     * @param contents what ElasticSearch returned for the request
+     * @return
+     */
+    static EntityTag of(URI requestUri, String... contents) {
+        MessageDigest digest = MessageDigest.getInstance("SHA-256")
+        digest.update(requestUri.toString().getBytes(StandardCharsets.UTF_8))
+        contents.each { String content ->
+            // Separates the contents, so that they can't run into each other
+            digest.update((byte) 0)
+            digest.update(content.getBytes(StandardCharsets.UTF_8))
+        }
+
+        byte[] tag = Arrays.copyOf(digest.digest(), TAG_BYTES)
+        new EntityTag(Base64.urlEncoder.withoutPadding().encodeToString(tag))
+    }
+
+    /**
+     * Returns the If-None-Match header of a request. It has to be read while the request is
+     * handled by the thread it came in on, like uriInfo.
+     *
+     * @param httpHeaders
+     * @return
+     */
+    static String ifNoneMatch(HttpHeaders httpHeaders) {
+        httpHeaders?.getHeaderString(HttpHeaders.IF_NONE_MATCH)
+    }
+
+    /**
+     * Whether an If-None-Match header matches a tag: it is * or lists the tag. Tags are
+     * compared weakly, as If-None-Match calls for, so W/ prefixes are ignored.
+     *
+     * @param ifNoneMatch
+     * @param tag null when the response isn't tagged
+     * @return
+     */
+    static boolean matches(String ifNoneMatch, EntityTag tag) {
+        if (!ifNoneMatch || tag == null) {
+            return false
+        }
+
+        String quoted = "\"${tag.value}\"".toString()
+        ifNoneMatch.split(',').any { String candidate ->
+            String trimmed = candidate.trim()
+            trimmed == "*" || trimmed == quoted || trimmed == "W/" + quoted
+        }
+    }
+
+    static Response notModified(EntityTag tag) {
+        Response.notModified(tag).build()
+    }
+
+    /**
+     * Returns a 200 response with an entity and its tag.
+     *
+     * @param entity
+     * @param tag null to leave the response untagged
+     * @return
+     */
+    static Response ok(Object entity, EntityTag tag) {
+        Response.ResponseBuilder builder = Response.ok(entity)
+        if (tag != null) {
+            builder.tag(tag)
+        }
+        builder.build()
+    }
+}
@@ -1,17 +1,20 @@
 package edu.oregonstate.mist.locations.frontend.resources
 
+import com.codahale.metrics.MetricRegistry
 import com.codahale.metrics.annotation.Timed
-import com.fasterxml.jackson.databind.JsonNode
-import com.fasterxml.jackson.databind.ObjectMapper
 import edu.oregonstate.mist.api.Resource
 import edu.oregonstate.mist.api.geojson.GeoCooridinate
 import edu.oregonstate.mist.api.geojson.GeoFeature
 import edu.oregonstate.mist.api.geojson.GeoFeatureCollection
 import edu.oregonstate.mist.api.geojson.Geometries
 import edu.oregonstate.mist.api.jsonapi.ResourceObject
-import edu.oregonstate.mist.locations.frontend.db.LocationDAO
+import edu.oregonstate.mist.locations.frontend.db.LocationStore
 import edu.oregonstate.mist.api.jsonapi.ResultObject
+import edu.oregonstate.mist.locations.frontend.mapper.GeometrySimplifier
 import edu.oregonstate.mist.locations.frontend.mapper.LocationMapper
+import edu.oregonstate.mist.locations.frontend.mapper.PageCursor
+import edu.oregonstate.mist.locations.frontend.mapper.SearchResults
+import groovy.transform.PackageScope
 import org.joda.time.DateTime
 import org.slf4j.Logger
 import org.slf4j.LoggerFactory
@@ -22,8 +25,15 @@ import javax.ws.rs.Path
 import javax.ws.rs.PathParam
 import javax.ws.rs.Produces
 import javax.ws.rs.QueryParam
+import javax.ws.rs.container.AsyncResponse
+import javax.ws.rs.container.Suspended
+import javax.ws.rs.core.Context
+import javax.ws.rs.core.EntityTag
+import javax.ws.rs.core.HttpHeaders
 import javax.ws.rs.core.MediaType
 import javax.ws.rs.core.Response
+import javax.ws.rs.core.Response.ResponseBuilder
+import java.util.concurrent.CompletableFuture
 import java.util.regex.Pattern
 
 @Path("locations")
@@ -48,7 +58,24 @@ class LocationResource extends Resource {
                                                            "mm", "millimeters",
                                                            "NM", "nmi", "nauticalmiles"]
 
-    private final LocationDAO locationDAO
+    // Related resources that can be included in responses
+    public static final ArrayList<String> ALLOWED_INCLUDES = ["services"]
+
+    // Most ids a batch request can ask for
+    public static final Integer MAX_BATCH_SIZE = 100
+
+    private static final Pattern ID_PATTERN = Pattern.compile('[0-9a-zA-Z]+')
+
+    // Names of the attributes and relationships a sparse fieldset can ask for
+    private static final Pattern FIELD_PATTERN = Pattern.compile('[0-9a-zA-Z_]+')
+
+    // Attributes GeoJSON features take their geometry from, fetched whatever the fieldset
+    public static final List<String> GEOMETRY_FIELDS = ["geometry", "latitude", "longitude"]
+
+    // Most decimal places coordinates can be rounded to
+    public static final Integer MAX_PRECISION = 15
+
+    private final LocationStore locationDAO
 
     private static final Pattern illegalCharacterPattern = Pattern.compile(
             '''(?x)       # this extended regex defines
@@ -64,92 +91,339 @@ class LocationResource extends Resource {
                .          # to be an illegal character.
             ''')
 
-    LocationResource(LocationDAO locationDAO, URI endpointUri) {
+    private final long timeoutSeconds
+
+    private final MetricRegistry metrics
+
+    @Context
+    HttpHeaders httpHeaders
+
+    LocationResource(LocationStore locationDAO, URI endpointUri) {
+        this(locationDAO, endpointUri, AsyncResponses.DEFAULT_TIMEOUT_SECONDS,
+                new MetricRegistry())
+    }
+
+    LocationResource(LocationStore locationDAO, URI endpointUri, long timeoutSeconds,
+                     MetricRegistry metrics) {
         this.locationDAO = locationDAO
         this.endpointUri = endpointUri
+        this.timeoutSeconds = timeoutSeconds
+        this.metrics = metrics
     }
 
     @GET
     @Timed
-    Response list(@QueryParam('q') String q,
-                  @QueryParam('campus') String campus,
-                  @QueryParam('type') List<String> type,
-                  @QueryParam('lat') Double lat,
-                  @QueryParam('lon') Double lon,
-                  @QueryParam('distance') Double distance,
-                  @QueryParam('distanceUnit') String distanceUnit,
-                  @QueryParam('isOpen') Boolean isOpen,
-                  @QueryParam('giRestroom') Boolean giRestroom,
-                  @QueryParam('parkingZoneGroup') List<String> parkingZoneGroup,
-                  @QueryParam('adaParkingSpaceCount') Integer adaParkingSpaceCount,
-                  @QueryParam('motorcycleParkingSpaceCount') Integer motorcycleParkingSpaceCount,
-                  @QueryParam('evParkingSpaceCount') Integer evParkingSpaceCount,
-                  @QueryParam('geojson') Boolean geojson,
-                  @QueryParam('abbreviation') String abbreviation) {
+    void list(@QueryParam('q') String q,
+              @QueryParam('campus') String campus,
+              @QueryParam('type') List<String> type,
+              @QueryParam('lat') Double lat,
+              @QueryParam('lon') Double lon,
+              @QueryParam('distance') Double distance,
+              @QueryParam('distanceUnit') String distanceUnit,
+              @QueryParam('isOpen') Boolean isOpen,
+              @QueryParam('giRestroom') Boolean giRestroom,
+              @QueryParam('parkingZoneGroup') List<String> parkingZoneGroup,
+              @QueryParam('adaParkingSpaceCount') Integer adaParkingSpaceCount,
+              @QueryParam('motorcycleParkingSpaceCount') Integer motorcycleParkingSpaceCount,
+              @QueryParam('evParkingSpaceCount') Integer evParkingSpaceCount,
+              @QueryParam('geojson') Boolean geojson,
+              @QueryParam('abbreviation') String abbreviation,
+              @QueryParam('include') String include,
+              @QueryParam('fields[locations]') String fields,
+              @QueryParam('simplify') Double simplify,
+              @QueryParam('precision') Integer precision,
+              @Suspended AsyncResponse asyncResponse) {
+        AsyncResponses.resume(asyncResponse, timeoutSeconds, LOGGER,
+                "Exception while getting locations.") {
+            list(q, campus, type, lat, lon, distance, distanceUnit, isOpen, giRestroom,
+                    parkingZoneGroup, adaParkingSpaceCount, motorcycleParkingSpaceCount,
+                    evParkingSpaceCount, geojson, abbreviation, include, fields, simplify,
+                    precision)
+        }
+    }
 
-        try {
-            if (maxPageSizeExceeded()) {
-                return pageSizeExceededError().build()
-            }
+    /**
+     * Returns a future of the response to a search for locations. Parameters are validated,
+     * and the query parameters of the request read, before ElasticSearch is called: uriInfo
+     * can't be used once the request is no longer handled by the thread it came in on.
+     *
+     * @return
+     */
+    CompletableFuture<Response> list(String q, String campus, List<String> type,
+                                     Double lat, Double lon, Double distance,
+                                     String distanceUnit, Boolean isOpen, Boolean giRestroom,
+                                     List<String> parkingZoneGroup,
+                                     Integer adaParkingSpaceCount,
+                                     Integer motorcycleParkingSpaceCount,
+                                     Integer evParkingSpaceCount, Boolean geojson,
+                                     String abbreviation, String include, String fields,
+                                     Double simplify, Integer precision) {
+        if (maxPageSizeExceeded()) {
+            return CompletableFuture.completedFuture(pageSizeExceededError().build())
+        }
 
-            def trimmedQ = sanitize(q?.trim())
-            def trimmedCampus = sanitize(campus?.trim()?.toLowerCase())
-            def trimmedType = type.collect { sanitize(it.trim().toLowerCase()) }
-            isOpen = isOpen == null ? false : isOpen
-            giRestroom = giRestroom == null ? false : giRestroom
-
-            String searchDistance = null
-            if (lat && lon) {
-                distance = getDistance(distance)
-                distanceUnit = getDistanceUnit(distanceUnit)
-                searchDistance = buildSearchDistance(distance, distanceUnit)
-            }
+        def trimmedQ = sanitize(q?.trim())
+        def trimmedCampus = sanitize(campus?.trim()?.toLowerCase())
+        def trimmedType = type.collect { sanitize(it.trim().toLowerCase()) }
+        isOpen = isOpen == null ? false : isOpen
+        giRestroom = giRestroom == null ? false : giRestroom
+
+        String searchDistance = null
+        if (lat && lon) {
+            distance = getDistance(distance)
+            distanceUnit = getDistanceUnit(distanceUnit)
+            searchDistance = buildSearchDistance(distance, distanceUnit)
+        }
 
-            // validate filtering parameters
-            if (validateParameters(trimmedCampus, trimmedType, lat, lon, distanceUnit)) {
-                return notFound().build()
-            }
+        // validate filtering parameters
+        if (validateParameters(trimmedCampus, trimmedType, lat, lon, distanceUnit)) {
+            return CompletableFuture.completedFuture(notFound().build())
+        }
 
-            // validate ranges of lat and lon
-            if (lat && lon && !(lat >= -90 && lat <= 90 && lon >= -180 && lon <= 180)) {
-                return badRequest("Invalid latitude/longitude").build()
-            }
+        // validate ranges of lat and lon
+        if (lat && lon && !(lat >= -90 && lat <= 90 && lon >= -180 && lon <= 180)) {
+            return CompletableFuture.completedFuture(
+                    badRequest("Invalid latitude/longitude").build())
+        }
+
+        List<String> includes = parseIncludes(include)
+        if (!ALLOWED_INCLUDES.containsAll(includes)) {
+            return CompletableFuture.completedFuture(includeError(includes).build())
+        }
+
+        List<String> fieldList = parseFields(fields)
+        ResponseBuilder invalid = representationError(fieldList, simplify, precision)
+        if (invalid) {
+            return CompletableFuture.completedFuture(invalid.build())
+        }
+        List<String> fetchedFields = fieldsToFetch(fieldList, geojson)
+        GeometrySimplifier simplifier = geometrySimplifier(simplify, precision)
 
-            Integer weekday = DateTime.now().getDayOfWeek()
-            String result = locationDAO.search(
+        String pageAfter = getPageAfter()
+        List<Object> searchAfter
+        try {
+            searchAfter = PageCursor.decode(pageAfter)
+        } catch (IllegalArgumentException e) {
+            return CompletableFuture.completedFuture(badRequest(e.message).build())
+        }
+
+        String baseResource = uriInfo.getMatchedURIs().get(uriInfo.getMatchedURIs().size() - 1)
+        URI requestUri = uriInfo.requestUri
+        String ifNoneMatch = EntityTags.ifNoneMatch(httpHeaders)
+        Integer pageNumber = getPageNumber()
+        Integer pageSize = getPageSize()
+        def urlParams = [
+                "q"                          : q,
+                "type"                       : type,
+                "campus"                     : campus,
+                "lat"                        : lat,
+                "lon"                        : lon,
+                "distance"                   : distance,
+                "distanceUnit"               : distanceUnit,
+                "isOpen"                     : isOpen,
+                "giRestroom"                 : giRestroom,
+                "parkingZoneGroup"           : parkingZoneGroup,
+                "adaParkingSpaceCount"       : adaParkingSpaceCount,
+                "motorcycleParkingSpaceCount": motorcycleParkingSpaceCount,
+                "evParkingSpaceCount"        : evParkingSpaceCount,
+                "abbreviation"               : abbreviation,
+                "include"                    : include,
+                "fields[locations]"          : fields,
+                "simplify"                   : simplify,
+                "precision"                  : precision,
+                "pageSize"                   : pageSize,
+                "pageNumber"                 : pageNumber
+        ]
+
+        Integer weekday = DateTime.now().getDayOfWeek()
+        PhaseTimings timings = new PhaseTimings(metrics, LocationResource, "list",
+                uriInfo.queryParameters)
+        CompletableFuture<String> search
+        try {
+            search = locationDAO.search(
                 trimmedQ, trimmedCampus, trimmedType, lat, lon,
                 searchDistance, isOpen, weekday, giRestroom,
                 parkingZoneGroup, adaParkingSpaceCount, motorcycleParkingSpaceCount,
-                evParkingSpaceCount, abbreviation, pageNumber, pageSize)
+                evParkingSpaceCount, abbreviation, pageNumber, pageSize, searchAfter,
+                fetchedFields
+            )
+        } catch (IllegalArgumentException e) {
+            // A cursor of another search, without a value for each sort of this one
+            return CompletableFuture.completedFuture(badRequest(e.message).build())
+        }
+        timings.end("query")
+
+        search.thenCompose { String result ->
+            timings.end("es")
+            EntityTag tag = includes ? null :
+                    EntityTags.of(requestUri, LocationMapper.hitsFingerprint(result))
+            timings.end("etag")
+            if (EntityTags.matches(ifNoneMatch, tag)) {
+                return CompletableFuture.completedFuture(
+                        timings.finish(EntityTags.notModified(tag)))
+            }
 
+            SearchResults searchResults = LocationMapper.mapSearchResponse(result)
+            shape(searchResults.data, fetchedFields, simplifier)
             ResultObject resultObject = new ResultObject()
-            resultObject.data = []
+            resultObject.data = searchResults.data
 
-            // parse ES into JSON Node
-            ObjectMapper mapper = new ObjectMapper() // can reuse, share globally
-            JsonNode actualObj = mapper.readTree(result)
+            setPaginationLinks(resultObject, searchResults.total, urlParams, baseResource,
+                    pageAfter, PageCursor.after(searchResults))
+            timings.end("map")
 
-            def topLevelHits = actualObj.get("hits")
-            topLevelHits.get("hits").asList().each {
-                resultObject.data += LocationMapper.map(it)
+            includeRelated(includes, resultObject, searchResults.data).thenApply {
+                ResultObject related -> okResult(related, geojson, tag, timings)
             }
+        }
+    }
 
-            setPaginationLinks(topLevelHits, q, type, campus,
-                lat, lon, distance, distanceUnit, isOpen, giRestroom,
-                parkingZoneGroup, adaParkingSpaceCount, motorcycleParkingSpaceCount,
-                evParkingSpaceCount, abbreviation, resultObject)
+    /**
+     * Splits the comma separated names of the include parameter.
+     *
+     * @param include
+     * @return
+     */
+    private static List<String> parseIncludes(String include) {
+        include ? include.split(',').collect { it.trim() } : []
+    }
+
+    private static ResponseBuilder includeError(List<String> includes) {
+        String message = "Unsupported include: ${(includes - ALLOWED_INCLUDES).join(', ')}. " +
+                "Allowed: ${ALLOWED_INCLUDES.join(', ')}"
+        badRequest(message)
+    }
+
+    /**
+     * Splits the comma separated names of the fields[locations] parameter. Returns null when
+     * the parameter isn't given, for all the fields, and an empty list when it is empty, for
+     * none of them.
+     *
+     * @param fields
+     * @return
+     */
+    private static List<String> parseFields(String fields) {
+        fields == null ? null : fields.split(',').collect { it.trim() }.findAll { it }
+    }
+
+    /**
+     * Validates the sparse fieldset and geometry simplification parameters.
+     *
+     * @param fields
+     * @param simplify
+     * @param precision
+     * @return bad request response, or null when the parameters are valid
+     */
+    private static ResponseBuilder representationError(List<String> fields, Double simplify,
+                                                       Integer precision) {
+        if (fields?.any { !FIELD_PATTERN.matcher(it).matches() }) {
+            return badRequest("Invalid fields[locations]")
+        }
+        if (simplify != null && !(simplify > 0)) {
+            return badRequest("simplify must be greater than 0")
+        }
+        if (precision != null && !(precision >= 0 && precision <= MAX_PRECISION)) {
+            return badRequest("precision must be between 0 and ${MAX_PRECISION}".toString())
+        }
+        null
+    }
+
+    /**
+     * Returns the fields to fetch from ElasticSearch: the fieldset, and for GeoJSON the
+     * attributes of the feature geometry, which aren't properties.
+     *
+     * @param fields
+     * @param geojson
+     * @return null for all the fields
+     */
+    private static List<String> fieldsToFetch(List<String> fields, Boolean geojson) {
+        if (fields == null || !geojson) {
+            return fields
+        }
+        (fields + GEOMETRY_FIELDS).unique()
+    }
+
+    private static GeometrySimplifier geometrySimplifier(Double simplify, Integer precision) {
+        if (simplify == null && precision == null) {
+            return null
+        }
+        new GeometrySimplifier(simplify ?: 0d, precision)
+    }
 
-            if (geojson) {
-                def geojsonResultObject = toGeoJson(resultObject)
-                return ok(geojsonResultObject).build()
+    /**
+     * Trims locations to the fields asked for and simplifies their geometry, when asked to.
+     *
+     * @param locations
+     * @param fields null for all the fields
+     * @param simplifier null to keep geometries as they are
+     */
+    @PackageScope // for benchmarking
+    static void shape(List<ResourceObject> locations, List<String> fields,
+                      GeometrySimplifier simplifier) {
+        locations.each { ResourceObject location ->
+            if (fields != null) {
+                LocationMapper.retainFields(location, fields)
             }
+            if (simplifier && location?.attributes instanceof Map) {
+                simplifier.simplify((Map) location.attributes.geometry)
+            }
+        }
+    }
 
-            ok(resultObject).build()
-        } catch (Exception e) {
-            LOGGER.error("Exception while getting locations.", e)
-            internalServerError("Woot you found a bug for us to fix!").build()
+    /**
+     * Adds the services related to locations to resultObject as included resources, when the
+     * request asked for them. The services of all the locations are fetched with a single
+     * query, rather than one per location.
+     *
+     * @param includes
+     * @param resultObject
+     * @param locations
+     * @return future of resultObject
+     */
+    private CompletableFuture<ResultObject> includeRelated(List<String> includes,
+                                                           ResultObject resultObject,
+                                                           List<ResourceObject> locations) {
+        if (!includes.contains("services")) {
+            return CompletableFuture.completedFuture(resultObject)
         }
 
+        resultObject.included = []
+        if (!locations) {
+            return CompletableFuture.completedFuture(resultObject)
+        }
+
+        locationDAO.getServicesByLocationIds(locations.collect { it.id }).thenApply {
+            String result ->
+                resultObject.included = LocationMapper.mapSearchResponse(result).data
+                resultObject
+        }
+    }
+
+    /**
+     * Returns a 200 response with resultObject, or its GeoJSON form when asked for, with the
+     * timings of the request.
+     *
+     * Responses that include related services aren't tagged: the services can change while
+     * the locations they are tagged by don't.
+     *
+     * @param resultObject
+     * @param geojson
+     * @param tag entity tag of the response, or null
+     * @param timings
+     * @return
+     */
+    private static Response okResult(ResultObject resultObject, Boolean geojson,
+                                     EntityTag tag, PhaseTimings timings) {
+        if (resultObject.included != null) {
+            timings.end("include")
+        }
+        if (geojson) {
+            def geojsonResultObject = toGeoJson(resultObject)
+            timings.end("geojson")
+            return timings.finish(EntityTags.ok(geojsonResultObject, tag))
+        }
+
+        timings.finish(EntityTags.ok(resultObject, tag))
     }
 
     private static Double getDistance(Double distance) {
@@ -187,129 +461,207 @@ class LocationResource extends Resource {
         invalidCampus || invalidType || invalidLocation || invalidUnit
     }
 
-    /**
-     * Add pagination links to the data search results.
-     *
-     * @param topLevelHits First "hits" node in the json document
-     * @param q
-     * @param type
-     * @param campus
-     * @param resultObject
-     */
-    private void setPaginationLinks(
-        JsonNode topLevelHits, String q, List<String> type, String campus,
-        Double lat, Double lon, Double distance, String distanceUnit,
-        Boolean isOpen, Boolean giRestroom, List<String> parkingZoneGroup,
-        Integer adaParkingSpaceCount, Integer motorcycleParkingSpaceCount,
-        Integer evParkingSpaceCount, String abbreviation, ResultObject resultObject) {
-
-        def totalHits = topLevelHits.get("total").asInt()
-        // If no results were found, no need to add links
-        if (!totalHits) {
-            return
+    @GET
+    @Timed
+    @Path('export')
+    @Produces(NdjsonExport.MEDIA_TYPE)
+    Response export() {
+        NdjsonExport.response("locations") { Integer batchSize, Closure<?> eachSource ->
+            locationDAO.exportLocations(batchSize, eachSource)
         }
+    }
 
-        String baseResource = uriInfo.getMatchedURIs().get(uriInfo.getMatchedURIs().size() - 1)
-        Integer pageNumber = getPageNumber()
-        Integer pageSize = getPageSize()
-        def urlParams = [
-                "q"                          : q,
-                "type"                       : type,
-                "campus"                     : campus,
-                "lat"                        : lat,
-                "lon"                        : lon,
-                "distance"                   : distance,
-                "distanceUnit"               : distanceUnit,
-                "isOpen"                     : isOpen,
-                "giRestroom"                 : giRestroom,
-                "parkingZoneGroup"           : parkingZoneGroup,
-                "adaParkingSpaceCount"       : adaParkingSpaceCount,
-                "motorcycleParkingSpaceCount": motorcycleParkingSpaceCount,
-                "evParkingSpaceCount"        : evParkingSpaceCount,
-                "abbreviation"               : abbreviation,
-                "pageSize"                   : pageSize,
-                "pageNumber"                 : pageNumber
-        ]
+    @GET
+    @Timed
+    @Path('{id: [0-9a-zA-Z]+}')
+    void getById(@PathParam('id') String id,
+                 @QueryParam('geojson') Boolean geojson,
+                 @QueryParam('include') String include,
+                 @QueryParam('fields[locations]') String fields,
+                 @QueryParam('simplify') Double simplify,
+                 @QueryParam('precision') Integer precision,
+                 @Suspended AsyncResponse asyncResponse) {
+        AsyncResponses.resume(asyncResponse, timeoutSeconds, LOGGER,
+                "Exception while getting location by ID") {
+            getById(id, geojson, include, fields, simplify, precision)
+        }
+    }
 
-        int lastPage = Math.ceil(totalHits / pageSize)
-        resultObject.links["self"] = getPaginationUrl(urlParams, baseResource)
-        urlParams.pageNumber = 1
-        resultObject.links["first"] = getPaginationUrl(urlParams, baseResource)
-        urlParams.pageNumber = lastPage
-        resultObject.links["last"] = getPaginationUrl(urlParams, baseResource)
+    CompletableFuture<Response> getById(String id, Boolean geojson, String include,
+                                        String fields, Double simplify, Integer precision) {
+        List<String> includes = parseIncludes(include)
+        if (!ALLOWED_INCLUDES.containsAll(includes)) {
+            return CompletableFuture.completedFuture(includeError(includes).build())
+        }
 
-        if (pageNumber > DEFAULT_PAGE_NUMBER) {
-            urlParams.pageNumber = pageNumber - 1
-            resultObject.links["prev"] = getPaginationUrl(urlParams, baseResource)
-        } else {
-            resultObject.links["prev"] = null
+        List<String> fieldList = parseFields(fields)
+        ResponseBuilder invalid = representationError(fieldList, simplify, precision)
+        if (invalid) {
+            return CompletableFuture.completedFuture(invalid.build())
         }
+        List<String> fetchedFields = fieldsToFetch(fieldList, geojson)
+        GeometrySimplifier simplifier = geometrySimplifier(simplify, precision)
+        URI requestUri = uriInfo.requestUri
+        String ifNoneMatch = EntityTags.ifNoneMatch(httpHeaders)
+
+        PhaseTimings timings = new PhaseTimings(metrics, LocationResource, "getById",
+                uriInfo.queryParameters)
+        CompletableFuture<String> document = locationDAO.getById(id, fetchedFields)
+        timings.end("query")
+
+        document.thenCompose { String esResponse ->
+            timings.end("es")
+            if (!esResponse) {
+                return CompletableFuture.completedFuture(timings.finish(notFound().build()))
+            }
 
-        if (totalHits > (pageNumber * pageSize)) {
-            urlParams.pageNumber = pageNumber + 1
-            resultObject.links["next"] = getPaginationUrl(urlParams, baseResource)
-        } else {
-            resultObject.links["next"] = null
+            EntityTag tag = includes ? null : EntityTags.of(requestUri, esResponse)
+            timings.end("etag")
+            if (EntityTags.matches(ifNoneMatch, tag)) {
+                return CompletableFuture.completedFuture(
+                        timings.finish(EntityTags.notModified(tag)))
+            }
+
+            ResultObject resultObject = new ResultObject()
+            ResourceObject location = LocationMapper.map(esResponse)
+            shape([location], fetchedFields, simplifier)
+            resultObject.data = location
+            timings.end("map")
+
+            includeRelated(includes, resultObject, [location]).thenApply {
+                ResultObject result -> okResult(result, geojson, tag, timings)
+            }
         }
     }
 
     @GET
     @Timed
-    @Path('{id: [0-9a-zA-Z]+}')
-    Response getById(@PathParam('id') String id,
-                     @QueryParam('geojson') Boolean geojson) {
-        try {
-            String esResponse = locationDAO.getById(id)
-            if (!esResponse) {
-                return notFound().build()
+    @Path('batch')
+    void getByIds(@QueryParam('id') List<String> ids,
+                  @QueryParam('geojson') Boolean geojson,
+                  @QueryParam('include') String include,
+                  @QueryParam('fields[locations]') String fields,
+                  @QueryParam('simplify') Double simplify,
+                  @QueryParam('precision') Integer precision,
+                  @Suspended AsyncResponse asyncResponse) {
+        AsyncResponses.resume(asyncResponse, timeoutSeconds, LOGGER,
+                "Exception while getting locations by ID") {
+            getByIds(ids, geojson, include, fields, simplify, precision)
+        }
+    }
+
+    /**
+     * Returns a future of the response with the locations of many ids, fetched together rather
+     * than with a request for each. Locations are in the order of the ids, and ids that aren't
+     * found are left out.
+     *
+     * @param ids
+     * @param geojson
+     * @param include
+     * @param fields
+     * @param simplify
+     * @param precision
+     * @return
+     */
+    CompletableFuture<Response> getByIds(List<String> ids, Boolean geojson, String include,
+                                         String fields, Double simplify, Integer precision) {
+        if (!ids) {
+            return CompletableFuture.completedFuture(badRequest("No id given").build())
+        }
+        if (ids.size() > MAX_BATCH_SIZE) {
+            return CompletableFuture.completedFuture(
+                    badRequest("At most ${MAX_BATCH_SIZE} ids can be given".toString()).build())
+        }
+        if (ids.any { !ID_PATTERN.matcher(it).matches() }) {
+            return CompletableFuture.completedFuture(badRequest("Invalid id").build())
+        }
+
+        List<String> includes = parseIncludes(include)
+        if (!ALLOWED_INCLUDES.containsAll(includes)) {
+            return CompletableFuture.completedFuture(includeError(includes).build())
+        }
+
+        List<String> fieldList = parseFields(fields)
+        ResponseBuilder invalid = representationError(fieldList, simplify, precision)
+        if (invalid) {
+            return CompletableFuture.completedFuture(invalid.build())
+        }
+        List<String> fetchedFields = fieldsToFetch(fieldList, geojson)
+        GeometrySimplifier simplifier = geometrySimplifier(simplify, precision)
+
+        URI requestUri = uriInfo.requestUri
+        String ifNoneMatch = EntityTags.ifNoneMatch(httpHeaders)
+
+        List<String> uniqueIds = ids.unique(false) { it.toLowerCase() }
+        PhaseTimings timings = new PhaseTimings(metrics, LocationResource, "getByIds",
+                uriInfo.queryParameters)
+        CompletableFuture<List<String>> documents = locationDAO.getByIds(uniqueIds,
+                fetchedFields)
+        timings.end("query")
+
+        documents.thenCompose { List<String> sources ->
+            timings.end("es")
+            EntityTag tag = includes ? null : EntityTags.of(requestUri, sources as String[])
+            timings.end("etag")
+            if (EntityTags.matches(ifNoneMatch, tag)) {
+                return CompletableFuture.completedFuture(
+                        timings.finish(EntityTags.notModified(tag)))
             }
 
             ResultObject resultObject = new ResultObject()
-            resultObject.data = LocationMapper.map(esResponse)
+            List<ResourceObject> locations = sources.collect { LocationMapper.map(it) }
+            shape(locations, fetchedFields, simplifier)
+            resultObject.data = locations
+            timings.end("map")
 
-            if (geojson) {
-                def geojsonResultObject = toGeoJson(resultObject)
-                return ok(geojsonResultObject).build()
+            includeRelated(includes, resultObject, locations).thenApply {
+                ResultObject related -> okResult(related, geojson, tag, timings)
             }
-
-            ok(resultObject).build()
-        } catch (Exception e) {
-            LOGGER.error("Exception while getting location by ID", e)
-            internalServerError("Woot you found a bug for us to fix!").build()
         }
-
     }
 
     @GET
     @Timed
     @Path('{id: [0-9a-zA-Z]+}/services')
-    Response getRelatedServices(@PathParam('id') String id) {
-        try {
-            String result = locationDAO.getRelatedServices(id, pageNumber, pageSize)
-            if (!result) {
-                return notFound().build()
-            }
+    void getRelatedServices(@PathParam('id') String id,
+                            @Suspended AsyncResponse asyncResponse) {
+        AsyncResponses.resume(asyncResponse, timeoutSeconds, LOGGER,
+                "Exception while getting location by ID") {
+            getRelatedServices(id)
+        }
+    }
 
-            ResultObject resultObject = new ResultObject()
-            resultObject.data = []
+    CompletableFuture<Response> getRelatedServices(String id) {
+        URI requestUri = uriInfo.requestUri
+        String ifNoneMatch = EntityTags.ifNoneMatch(httpHeaders)
 
-            // parse ES into JSON Node
-            ObjectMapper mapper = new ObjectMapper() // can reuse, share globally
-            JsonNode actualObj = mapper.readTree(result)
+        PhaseTimings timings = new PhaseTimings(metrics, LocationResource, "getRelatedServices",
+                uriInfo.queryParameters)
+        CompletableFuture<String> services = locationDAO.getRelatedServices(id, pageNumber,
+                pageSize)
+        timings.end("query")
 
-            def topLevelHits = actualObj.get("hits")
-            topLevelHits.get("hits").asList().each {
-                resultObject.data += LocationMapper.map(it)
+        services.thenApply { String result ->
+            timings.end("es")
+            if (!result) {
+                return timings.finish(notFound().build())
+            }
+
+            EntityTag tag = EntityTags.of(requestUri, LocationMapper.hitsFingerprint(result))
+            timings.end("etag")
+            if (EntityTags.matches(ifNoneMatch, tag)) {
+                return timings.finish(EntityTags.notModified(tag))
             }
 
+            SearchResults searchResults = LocationMapper.mapSearchResponse(result)
+            ResultObject resultObject = new ResultObject()
+            resultObject.data = searchResults.data
+            timings.end("map")
+
             //@todo: in the future we may add pagination. For now, let's keep it simple
 
-            ok(resultObject).build()
-        } catch (Exception e) {
-            LOGGER.error("Exception while getting location by ID", e)
-            internalServerError("Woot you found a bug for us to fix!").build()
+            timings.finish(EntityTags.ok(resultObject, tag))
         }
-
     }
 
     /**
@@ -318,7 +670,8 @@ class LocationResource extends Resource {
      * @param resultObject
      * @return
      */
-    private static toGeoJson(ResultObject resultObject) {
+    @PackageScope // for benchmarking
+    static toGeoJson(ResultObject resultObject) {
         def geojsonResultObject
         def ro = resultObject?.data
 
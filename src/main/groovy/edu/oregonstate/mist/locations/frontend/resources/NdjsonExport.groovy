@@ -0,0 +1,50 @@
+package edu.oregonstate.mist.locations.frontend.resources
+
+import edu.oregonstate.mist.locations.frontend.mapper.LocationMapper
+import org.slf4j.Logger
+import org.slf4j.LoggerFactory
+
+import javax.ws.rs.core.Response
+import javax.ws.rs.core.StreamingOutput
+import java.nio.charset.StandardCharsets
+
+/**
+ * Streams every location or service as newline delimited JSON, writing each document as soon
+ * as it is read from ElasticSearch, so that a full export holds no more than one batch of the
+ * scroll in memory whatever the size of the index.
+ */
+class NdjsonExport {
+    private static final Logger LOGGER = LoggerFactory.getLogger(NdjsonExport.class)
+
+    public static final String MEDIA_TYPE = "application/x-ndjson"
+
+    /**
+     * Documents read from ElasticSearch at a time.
+     */
+    public static final Integer BATCH_SIZE = 500
+
+    /**
+     * Returns a response streaming the documents of an export.
+     *
+     * @param kind what is exported, for logging
+     * @param export closure taking a batch size and a closure to call with each document
+     *               source, like LocationDAO.exportLocations
+     * @return
+     */
+    static Response response(String kind, Closure<?> export) {
+        StreamingOutput stream = { OutputStream output ->
+            Writer writer = new BufferedWriter(
+                    new OutputStreamWriter(output, StandardCharsets.UTF_8))
+            try {
+                export(BATCH_SIZE) { String source -> LocationMapper.writeNdjson(source, writer) }
+                writer.flush()
+            } catch (Exception e) {
+                // Once the first documents are sent, the client only sees a truncated export
+                LOGGER.error("Exception while exporting ${kind}.", e)
+                throw e
+            }
+        } as StreamingOutput
+
+        Response.ok(stream, MEDIA_TYPE).build()
+    }
+}
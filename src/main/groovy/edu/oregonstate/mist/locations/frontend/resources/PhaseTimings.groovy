@@ -0,0 +1,136 @@
+package edu.oregonstate.mist.locations.frontend.resources
+
+import com.codahale.metrics.MetricRegistry
+import groovy.transform.TypeChecked
+
+import javax.ws.rs.core.MultivaluedMap
+import javax.ws.rs.core.Response
+import java.util.concurrent.TimeUnit
+
+/**
+ * Times the phases of handling a request, which can run on different threads one after the
+ * other, and reports them in a Server-Timing header and in timers of the metrics registry.
+ *
+ * A phase starts when the one before it ends, so the phases of a request add up to the time
+ * it took to build its response. They are:
+ *
+ *  query      building the ElasticSearch request and handing it to the client
+ *  es         waiting for ElasticSearch (or the response cache) to answer
+ *  etag       working out the entity tag of the response
+ *  map        mapping hits to resource objects, with sparse fieldsets and simplification
+ *  include    fetching related resources asked for with include
+ *  geojson    turning resource objects into GeoJSON
+ *  total      all of the above
+ *
+ * Timers are named after the resource class, the method, the shape of the query and the
+ * phase, like edu...LocationResource.list.geo+isOpen.es. Serializing the entity happens once
+ * the headers are sent, so it is only timed into the metrics, by SerializationTimer.
+ */
+@TypeChecked
+class PhaseTimings {
+    public static final String HEADER = "Server-Timing"
+
+    // Query parameters that filter locations by their attributes
+    static final List<String> FILTERS = ["campus", "type", "giRestroom", "parkingZoneGroup",
+                                         "adaParkingSpaceCount", "motorcycleParkingSpaceCount",
+                                         "evParkingSpaceCount", "abbreviation"]
+
+    private final MetricRegistry metrics
+    private final String prefix
+    private final long started
+    private long phaseStarted
+    private final Map<String, Long> phases = new LinkedHashMap<String, Long>()
+
+    /**
+     * Starts timing a request.
+     *
+     * @param metrics
+     * @param resource resource class handling the request
+     * @param method resource method handling it
+     * @param queryParameters query parameters of the request, for its shape
+     */
+    PhaseTimings(MetricRegistry metrics, Class<?> resource, String method,
+                 MultivaluedMap<String, String> queryParameters) {
+        this.metrics = metrics
+        this.prefix = timerPrefix(resource, method, queryParameters)
+        this.started = System.nanoTime()
+        this.phaseStarted = started
+    }
+
+    /**
+     * Returns the start of the names of the timers of a request.
+     *
+     * @param resource
+     * @param method
+     * @param queryParameters
+     * @return
+     */
+    static String timerPrefix(Class<?> resource, String method,
+                              MultivaluedMap<String, String> queryParameters) {
+        MetricRegistry.name(resource, method, shape(queryParameters))
+    }
+
+    /**
+     * Returns the shape of a query: which of a geo distance filter, isOpen, a full text query
+     * and attribute filters it has, joined by +, or "plain" when it has none of them.
+     *
+     * @param queryParameters
+     * @return
+     */
+    static String shape(MultivaluedMap<String, String> queryParameters) {
+        List<String> parts = []
+        if (queryParameters.getFirst("lat") && queryParameters.getFirst("lon")) {
+            parts << "geo"
+        }
+        if (queryParameters.getFirst("isOpen")?.equalsIgnoreCase("true")) {
+            parts << "isOpen"
+        }
+        if (queryParameters.getFirst("q")) {
+            parts << "q"
+        }
+        if (FILTERS.any { String filter -> queryParameters.getFirst(filter) }) {
+            parts << "filters"
+        }
+        parts ? parts.join("+") : "plain"
+    }
+
+    /**
+     * Ends a phase, which started when the one before it ended. The times of a phase ended
+     * more than once add up.
+     *
+     * @param phase
+     */
+    void end(String phase) {
+        long now = System.nanoTime()
+        Long before = phases.get(phase)
+        phases.put(phase, (before ?: 0L) + now - phaseStarted)
+        phaseStarted = now
+    }
+
+    /**
+     * Records the phases of the request in their timers and returns its response with a
+     * Server-Timing header.
+     *
+     * @param response
+     * @return
+     */
+    Response finish(Response response) {
+        phases.put("total", System.nanoTime() - started)
+        phases.each { String phase, Long nanos ->
+            metrics.timer(MetricRegistry.name(prefix, phase)).update(nanos, TimeUnit.NANOSECONDS)
+        }
+
+        Response.fromResponse(response).header(HEADER, header()).build()
+    }
+
+    /**
+     * Returns the phases as a Server-Timing header value, in milliseconds.
+     *
+     * @return
+     */
+    String header() {
+        phases.collect { String phase, Long nanos ->
+            String.format(Locale.ROOT, "%s;dur=%.3f", phase, nanos / 1e6d)
+        }.join(", ")
+    }
+}
@@ -0,0 +1,48 @@
+package edu.oregonstate.mist.locations.frontend.resources
+
+import com.codahale.metrics.MetricRegistry
+
+import javax.ws.rs.WebApplicationException
+import javax.ws.rs.container.ResourceInfo
+import javax.ws.rs.core.Context
+import javax.ws.rs.core.UriInfo
+import javax.ws.rs.ext.WriterInterceptor
+import javax.ws.rs.ext.WriterInterceptorContext
+import java.lang.reflect.Method
+import java.util.concurrent.TimeUnit
+
+/**
+ * Times writing response entities, Jackson serialization included, into the "serialize"
+ * timers next to the ones of PhaseTimings. The entity is written after the headers are sent,
+ * so its time can't be part of the Server-Timing header.
+ */
+class SerializationTimer implements WriterInterceptor {
+    private final MetricRegistry metrics
+
+    @Context
+    ResourceInfo resourceInfo
+
+    @Context
+    UriInfo uriInfo
+
+    SerializationTimer(MetricRegistry metrics) {
+        this.metrics = metrics
+    }
+
+    @Override
+    void aroundWriteTo(WriterInterceptorContext context)
+            throws IOException, WebApplicationException {
+        long started = System.nanoTime()
+        try {
+            context.proceed()
+        } finally {
+            Method method = resourceInfo?.resourceMethod
+            if (method != null) {
+                String prefix = PhaseTimings.timerPrefix(resourceInfo.resourceClass, method.name,
+                        uriInfo.queryParameters)
+                metrics.timer(MetricRegistry.name(prefix, "serialize"))
+                        .update(System.nanoTime() - started, TimeUnit.NANOSECONDS)
+            }
+        }
+    }
+}
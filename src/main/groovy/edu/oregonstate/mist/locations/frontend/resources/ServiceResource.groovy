@@ -1,19 +1,23 @@
 package edu.oregonstate.mist.locations.frontend.resources
 
+import com.codahale.metrics.MetricRegistry
 import com.codahale.metrics.annotation.Timed
-import com.fasterxml.jackson.databind.JsonNode
-import com.fasterxml.jackson.databind.ObjectMapper
 import edu.oregonstate.mist.api.Resource
 import edu.oregonstate.mist.api.jsonapi.ResultObject
-import edu.oregonstate.mist.locations.frontend.db.LocationDAO
+import edu.oregonstate.mist.locations.frontend.db.LocationStore
 import edu.oregonstate.mist.locations.frontend.mapper.LocationMapper
+import edu.oregonstate.mist.locations.frontend.mapper.PageCursor
+import edu.oregonstate.mist.locations.frontend.mapper.SearchResults
 import org.joda.time.DateTime
 import org.slf4j.Logger
 import org.slf4j.LoggerFactory
 
 import javax.annotation.security.PermitAll
 import javax.ws.rs.*
+import javax.ws.rs.container.AsyncResponse
+import javax.ws.rs.container.Suspended
 import javax.ws.rs.core.*
+import java.util.concurrent.CompletableFuture
 import java.util.regex.Pattern
 
 @Path("services")
@@ -22,7 +26,7 @@ import java.util.regex.Pattern
 class ServiceResource extends Resource {
     private static final Logger LOGGER = LoggerFactory.getLogger(ServiceResource.class)
 
-    private final LocationDAO locationDAO
+    private final LocationStore locationDAO
 
     private static final Pattern illegalCharacterPattern = Pattern.compile(
             '''(?x)       # this extended regex defines
@@ -38,118 +42,155 @@ class ServiceResource extends Resource {
                .          # to be an illegal character.
             ''')
 
-    ServiceResource(LocationDAO locationDAO, URI endpointUri) {
+    private final long timeoutSeconds
+
+    private final MetricRegistry metrics
+
+    ServiceResource(LocationStore locationDAO, URI endpointUri) {
+        this(locationDAO, endpointUri, AsyncResponses.DEFAULT_TIMEOUT_SECONDS,
+                new MetricRegistry())
+    }
+
+    ServiceResource(LocationStore locationDAO, URI endpointUri, long timeoutSeconds,
+                    MetricRegistry metrics) {
         this.locationDAO = locationDAO
         this.endpointUri = endpointUri
+        this.timeoutSeconds = timeoutSeconds
+        this.metrics = metrics
     }
 
     @Context
     UriInfo uriInfo
 
+    @Context
+    HttpHeaders httpHeaders
+
     @GET
     @Timed
-    Response list(@QueryParam('q') String q,
-                  @QueryParam('isOpen') Boolean isOpen) {
-
-        try {
-            def trimmedQ = sanitize(q?.trim())
-            isOpen = isOpen == null ? false : isOpen
-
-            Integer weekday = DateTime.now().getDayOfWeek()
-            String result =
-                    locationDAO.searchService(trimmedQ, isOpen, weekday, pageNumber, pageSize)
-
-            ResultObject resultObject = new ResultObject()
-            resultObject.data = []
-
-            // parse ES into JSON Node
-            ObjectMapper mapper = new ObjectMapper() // can reuse, share globally
-            JsonNode actualObj = mapper.readTree(result)
-
-            def topLevelHits = actualObj.get("hits")
-            topLevelHits.get("hits").asList().each {
-                resultObject.data += LocationMapper.map(it)
-            }
-
-            setPaginationLinks(topLevelHits, q, null, resultObject)
-
-            ok(resultObject).build()
-        } catch (Exception e) {
-            LOGGER.error("Exception while getting locations.", e)
-            internalServerError("Woot you found a bug for us to fix!").build()
+    void list(@QueryParam('q') String q,
+              @QueryParam('isOpen') Boolean isOpen,
+              @Suspended AsyncResponse asyncResponse) {
+        AsyncResponses.resume(asyncResponse, timeoutSeconds, LOGGER,
+                "Exception while getting locations.") {
+            list(q, isOpen)
         }
-
     }
 
     /**
-     * Add pagination links to the data search results.
+     * Returns a future of the response to a search for services. The query parameters of the
+     * request are read before ElasticSearch is called, while uriInfo can still be used.
      *
-     * @param topLevelHits First "hits" node in the json document
      * @param q
-     * @param type
-     * @param resultObject
+     * @param isOpen
+     * @return
      */
-    //@todo: reuse
-    private void setPaginationLinks(JsonNode topLevelHits, String q, String type,
-                                    ResultObject resultObject) {
-        def totalHits = topLevelHits.get("total").asInt()
-        // If no results were found, no need to add links
-        if (!totalHits) {
-            return
+    CompletableFuture<Response> list(String q, Boolean isOpen) {
+        def trimmedQ = sanitize(q?.trim())
+        isOpen = isOpen == null ? false : isOpen
+
+        String pageAfter = getPageAfter()
+        List<Object> searchAfter
+        try {
+            searchAfter = PageCursor.decode(pageAfter)
+        } catch (IllegalArgumentException e) {
+            return CompletableFuture.completedFuture(badRequest(e.message).build())
         }
 
         String baseResource = uriInfo.getMatchedURIs().get(uriInfo.getMatchedURIs().size() - 1)
+        URI requestUri = uriInfo.requestUri
+        String ifNoneMatch = EntityTags.ifNoneMatch(httpHeaders)
         Integer pageNumber = getPageNumber()
         Integer pageSize = getPageSize()
         def urlParams = [
                 "q"         : q,
-                "type"      : type,
+                "type"      : null,
                 "pageSize"  : pageSize,
                 "pageNumber": pageNumber
         ]
 
-        int lastPage = Math.ceil(totalHits / pageSize)
-        resultObject.links["self"] = getPaginationUrl(urlParams, baseResource)
-        urlParams.pageNumber = 1
-        resultObject.links["first"] = getPaginationUrl(urlParams, baseResource)
-        urlParams.pageNumber = lastPage
-        resultObject.links["last"] = getPaginationUrl(urlParams, baseResource)
-
-        if (pageNumber > DEFAULT_PAGE_NUMBER) {
-            urlParams.pageNumber = pageNumber - 1
-            resultObject.links["prev"] = getPaginationUrl(urlParams, baseResource)
-        } else {
-            resultObject.links["prev"] = null
+        Integer weekday = DateTime.now().getDayOfWeek()
+        PhaseTimings timings = new PhaseTimings(metrics, ServiceResource, "list",
+                uriInfo.queryParameters)
+        CompletableFuture<String> search
+        try {
+            search = locationDAO.searchService(
+                    trimmedQ, isOpen, weekday, pageNumber, pageSize, searchAfter
+            )
+        } catch (IllegalArgumentException e) {
+            // A cursor of another search, without a value for each sort of this one
+            return CompletableFuture.completedFuture(badRequest(e.message).build())
         }
+        timings.end("query")
+
+        search.thenApply { String result ->
+            timings.end("es")
+            EntityTag tag = EntityTags.of(requestUri, LocationMapper.hitsFingerprint(result))
+            timings.end("etag")
+            if (EntityTags.matches(ifNoneMatch, tag)) {
+                return timings.finish(EntityTags.notModified(tag))
+            }
+
+            SearchResults searchResults = LocationMapper.mapSearchResponse(result)
+            ResultObject resultObject = new ResultObject()
+            resultObject.data = searchResults.data
+
+            setPaginationLinks(resultObject, searchResults.total, urlParams, baseResource,
+                    pageAfter, PageCursor.after(searchResults))
+            timings.end("map")
+
+            timings.finish(EntityTags.ok(resultObject, tag))
+        }
+    }
 
-        if (totalHits > (pageNumber * pageSize)) {
-            urlParams.pageNumber = pageNumber + 1
-            resultObject.links["next"] = getPaginationUrl(urlParams, baseResource)
-        } else {
-            resultObject.links["next"] = null
+    @GET
+    @Timed
+    @Path('export')
+    @Produces(NdjsonExport.MEDIA_TYPE)
+    Response export() {
+        NdjsonExport.response("services") { Integer batchSize, Closure<?> eachSource ->
+            locationDAO.exportServices(batchSize, eachSource)
         }
     }
 
     @GET
     @Timed
     @Path('{id: [0-9a-zA-Z]+}')
-    Response getById(@PathParam('id') String id) {
+    void getById(@PathParam('id') String id, @Suspended AsyncResponse asyncResponse) {
+        AsyncResponses.resume(asyncResponse, timeoutSeconds, LOGGER,
+                "Exception while getting location by ID") {
+            getById(id)
+        }
+    }
+
+    CompletableFuture<Response> getById(String id) {
+        URI requestUri = uriInfo.requestUri
+        String ifNoneMatch = EntityTags.ifNoneMatch(httpHeaders)
+
+        PhaseTimings timings = new PhaseTimings(metrics, ServiceResource, "getById",
+                uriInfo.queryParameters)
+
         //@todo: very similar logic???
-        try {
-            String esResponse = locationDAO.getServiceById(id)
+        CompletableFuture<String> document = locationDAO.getServiceById(id)
+        timings.end("query")
+
+        document.thenApply { String esResponse ->
+            timings.end("es")
             if (!esResponse) {
-                return notFound().build()
+                return timings.finish(notFound().build())
+            }
+
+            EntityTag tag = EntityTags.of(requestUri, esResponse)
+            timings.end("etag")
+            if (EntityTags.matches(ifNoneMatch, tag)) {
+                return timings.finish(EntityTags.notModified(tag))
             }
 
             ResultObject resultObject = new ResultObject()
             resultObject.data = LocationMapper.map(esResponse)
+            timings.end("map")
 
-            ok(resultObject).build()
-        } catch (Exception e) {
-            LOGGER.error("Exception while getting location by ID", e)
-            internalServerError("Woot you found a bug for us to fix!").build()
+            timings.finish(EntityTags.ok(resultObject, tag))
         }
-
     }
 
     /**
@@ -3,12 +3,23 @@ package edu.oregonstate.mist.locations.frontend
 import com.fasterxml.jackson.databind.JsonNode
 import edu.oregonstate.mist.api.jsonapi.ResultObject
 import edu.oregonstate.mist.locations.frontend.db.LocationDAO
+import edu.oregonstate.mist.locations.frontend.db.SaturatedException
+import edu.oregonstate.mist.locations.frontend.mapper.LocationMapper
+import edu.oregonstate.mist.locations.frontend.mapper.PageCursor
 import edu.oregonstate.mist.locations.frontend.resources.LocationResource
 import groovy.mock.interceptor.MockFor
 import org.junit.Test
 
+import javax.ws.rs.container.AsyncResponse
+import javax.ws.rs.container.TimeoutHandler
+import javax.ws.rs.core.EntityTag
+import javax.ws.rs.core.HttpHeaders
 import javax.ws.rs.core.Response
 import javax.ws.rs.core.UriBuilder
+import java.util.concurrent.CompletableFuture
+import java.util.concurrent.TimeUnit
+
+import static java.util.concurrent.CompletableFuture.completedFuture
 
 class LocationResourceTest {
     static URI endpointUri = UriBuilder.fromPath('https://api.unit.test.edu/v1/').build()
@@ -22,8 +33,8 @@ class LocationResourceTest {
             Double lon, String searchDistance, Boolean isOpen, Integer weekday,
             Boolean giRestroom, String parkingZoneGroup, Integer adaParkingSpaceCount,
             Integer motorcycleParkingSpaceCount, Integer evParkingSpaceCount, String abbreviation,
-            Integer pageNumber, Integer pageSize ->
-                '{"hits": {"total": 0, "hits": []}}'
+            Integer pageNumber, Integer pageSize, List<Object> searchAfter, List<String> fields ->
+                completedFuture('{"hits": {"total": 0, "hits": []}}')
         }
         def dao = mock.proxyInstance()
         def resource = new LocationResource(dao, endpointUri)
@@ -31,14 +42,16 @@ class LocationResourceTest {
 
         // Test: no result
         def noResultRsp = resource.list('dixon', null,
-            null, null, null, null, null, null, false, null, null, null, null, null, null)
+            null, null, null, null, null, null, false, null, null, null, null, null, null,
+            null, null, null, null).get()
         assert noResultRsp.status == 200
         assert noResultRsp.entity.links == [:]
         assert noResultRsp.entity.data == []
 
         // Test: invalid campus
         def invalidCampRes = resource.list('dixon', 'invalid',
-            null, null, null, null, null, null, null, null, null, null,null, null, null)
+            null, null, null, null, null, null, null, null, null, null,null, null, null, null,
+            null, null, null).get()
         assert invalidCampRes.status == 404
         assert invalidCampRes.entity.developerMessage.contains("Not Found")
         assert invalidCampRes.entity.userMessage.contains("Not Found")
@@ -46,14 +59,16 @@ class LocationResourceTest {
 
         // Test: geoJson
         def geoJsonRes = resource.list(null, null,
-            null, null, null, null, null, null, null, null, null, null, null, true, null)
+            null, null, null, null, null, null, null, null, null, null, null, true, null,
+            null, null, null, null).get()
         assert geoJsonRes.status == 200
         assert geoJsonRes.entity.type == 'FeatureCollection'
         assert geoJsonRes.entity.hasProperty('features')
 
         // Test: out of range lat/lon
         def outOfRange = resource.list(null, null,
-            null, -100, 200, null, null, null, null, null, null, null, null, null, null)
+            null, -100, 200, null, null, null, null, null, null, null, null, null, null, null,
+            null, null, null).get()
         assert outOfRange.status == 400
         assert outOfRange.entity.userMessage.contains("Bad Request")
         assert outOfRange.entity.developerMessage.contains("Invalid latitude/longitude")
@@ -61,30 +76,64 @@ class LocationResourceTest {
 
         // Test: in range lat/lon
         def inRange = resource.list(null, null,
-                null, -40, 120, null, null, null, null, null, null, null, null, null, null)
+                null, -40, 120, null, null, null, null, null, null, null, null, null, null,
+                null, null, null, null).get()
         assert inRange.status == 200
 
         mock.verify(dao)
     }
 
+    // Test: LocationResource.list(): a cursor without a value for each sort of the search
+    // answers with a 400
+    @Test
+    public void testListWrongCursor() {
+        def mock = new MockFor(LocationDAO)
+        mock.demand.search() {
+            String q, String campus, List<String> type, Double lat,
+            Double lon, String searchDistance, Boolean isOpen, Integer weekday,
+            Boolean giRestroom, List<String> parkingZoneGroup, Integer adaParkingSpaceCount,
+            Integer motorcycleParkingSpaceCount, Integer evParkingSpaceCount, String abbreviation,
+            Integer pageNumber, Integer pageSize, List<Object> searchAfter, List<String> fields ->
+                assert searchAfter == ["abc"]
+                throw new IllegalArgumentException("Cursor has 1 sort values instead of 2")
+        }
+        def dao = mock.proxyInstance()
+        def resource = new LocationResource(dao, endpointUri)
+        resource.uriInfo = new MockUriInfo()
+        resource.uriInfo.queryParameters.putSingle('page[after]',
+                PageCursor.encode(LocationMapper.MAPPER.readTree('["abc"]')))
+
+        def wrongCursor = resource.list('dixon', null,
+            null, null, null, null, null, null, null, null, null, null, null, null, null,
+            null, null, null, null).get()
+        assert wrongCursor.status == 400
+        assert wrongCursor.entity.developerMessage.contains("sort values")
+        assert wrongCursor.entity.code == 1400
+
+        mock.verify(dao)
+    }
+
     // Test: LocationResource.getById(): valid ID
     @Test
     public void testValidId() {
         def mock = new MockFor(LocationDAO)
         mock.demand.getById( 0..2 ) {
-            String id -> '{"id":"","type":"locations","attributes":{}}'
+            String id, List<String> fields ->
+            completedFuture('{"id":"","type":"locations","attributes":{}}')
         }
         def dao = mock.proxyInstance()
         def resource = new LocationResource(dao, endpointUri)
         resource.uriInfo = new MockUriInfo()
 
-        def validIdRes = resource.getById('valid-id', null)
+        def validIdRes = resource.getById('valid-id', null, null, null, null, null).get()
         assert validIdRes.status == 200
+        assert validIdRes.getHeaderString("Server-Timing").split(", ")*.split(";")*.getAt(0) ==
+                ["query", "es", "etag", "map", "total"]
         validIdRes.entity.links == [:]
         validIdRes.entity.data == '{"id":"","type":"locations","attributes":{}}'
 
         // Test: geoJson
-        def geoJsonRes = resource.getById('valid-id', true)
+        def geoJsonRes = resource.getById('valid-id', true, null, null, null, null).get()
         assert geoJsonRes.status == 200
         assert geoJsonRes.entity.type == "Feature"
         assert geoJsonRes.entity.hasProperty("geometry")
@@ -97,13 +146,13 @@ class LocationResourceTest {
     public void testInvalidId() {
         def mock = new MockFor(LocationDAO)
         mock.demand.getById() {
-            String id -> null
+            String id, List<String> fields -> completedFuture(null)
         }
         def dao = mock.proxyInstance()
         def resource = new LocationResource(dao, endpointUri)
         resource.uriInfo = new MockUriInfo()
 
-        def invalidIdRes = resource.getById(null, null)
+        def invalidIdRes = resource.getById(null, null, null, null, null, null).get()
         assert invalidIdRes.status == 404
         assert invalidIdRes.entity.developerMessage.contains("Not Found")
         assert invalidIdRes.entity.userMessage.contains("Not Found")
@@ -112,6 +161,156 @@ class LocationResourceTest {
         mock.verify(dao)
     }
 
+    // Test: LocationResource.getById(): saturated ElasticSearch answers with a 503
+    @Test
+    public void testSaturated() {
+        def mock = new MockFor(LocationDAO)
+        mock.demand.getById() { String id, List<String> fields ->
+            def esResponse = new CompletableFuture<String>()
+            esResponse.completeExceptionally(new SaturatedException(64))
+            esResponse
+        }
+        def dao = mock.proxyInstance()
+        def resource = new LocationResource(dao, endpointUri)
+        resource.uriInfo = new MockUriInfo()
+
+        Response resumed
+        def asyncResponse = [
+            setTimeoutHandler: { TimeoutHandler handler -> },
+            setTimeout: { long time, TimeUnit unit -> true },
+            resume: { Object response -> resumed = (Response) response; true }
+        ] as AsyncResponse
+        resource.getById('valid-id', null, null, null, null, null, asyncResponse)
+
+        assert resumed.status == 503
+        assert resumed.entity.developerMessage.contains("in flight")
+        assert resumed.entity.code == 1503
+
+        mock.verify(dao)
+    }
+
+    // Test: LocationResource.getByIds()
+    @Test
+    public void testGetByIds() {
+        def mock = new MockFor(LocationDAO)
+        mock.demand.getByIds() { List<String> ids, List<String> fields ->
+            assert ids == ['abc', 'def']
+            completedFuture(['{"id":"abc","type":"locations","attributes":{}}'])
+        }
+        def dao = mock.proxyInstance()
+        def resource = new LocationResource(dao, endpointUri)
+        resource.uriInfo = new MockUriInfo()
+
+        def batchRes = resource.getByIds(['abc', 'def', 'ABC'], null, null, null, null, null).get()
+        assert batchRes.status == 200
+        assert batchRes.entity.data*.id == ['abc']
+        assert batchRes.entity.included == null
+
+        // Test: no ids, too many ids, invalid ids and unsupported includes
+        assert resource.getByIds([], null, null, null, null, null).get().status == 400
+        def tooMany = (0..LocationResource.MAX_BATCH_SIZE).collect { "id${it}".toString() }
+        assert resource.getByIds(tooMany, null, null, null, null, null).get().status == 400
+        assert resource.getByIds(['abc', 'd.f'], null, null, null, null, null).get().status == 400
+        assert resource.getByIds(['abc'], null, 'parking', null, null, null).get().status == 400
+
+        mock.verify(dao)
+    }
+
+    // Test: LocationResource.getById(): related services are included with one query
+    @Test
+    public void testIncludeServices() {
+        def mock = new MockFor(LocationDAO)
+        mock.demand.getById() { String id, List<String> fields ->
+            completedFuture('{"id":"abc","type":"locations","attributes":{}}')
+        }
+        mock.demand.getServicesByLocationIds() { List<String> locationIds ->
+            assert locationIds == ['abc']
+            completedFuture('{"hits": {"total": 1, "hits": [{"_source": ' +
+                    '{"id":"cafe","type":"services","attributes":{"name":"Cafe"}}}]}}')
+        }
+        def dao = mock.proxyInstance()
+        def resource = new LocationResource(dao, endpointUri)
+        resource.uriInfo = new MockUriInfo()
+
+        def includeRes = resource.getById('abc', null, 'services', null, null, null).get()
+        assert includeRes.status == 200
+        assert includeRes.entity.data.id == 'abc'
+        assert includeRes.entity.included*.id == ['cafe']
+        assert includeRes.entity.included[0].attributes.name == 'Cafe'
+
+        mock.verify(dao)
+    }
+
+    // Test: LocationResource.getById(): sparse fieldsets and simplified GeoJSON geometry
+    @Test
+    public void testFieldsAndSimplify() {
+        def mock = new MockFor(LocationDAO)
+        mock.demand.getById() { String id, List<String> fields ->
+            assert fields == ['name', 'geometry', 'latitude', 'longitude']
+            completedFuture('{"id":"abc","type":"locations","attributes":{"name":"Dixon",' +
+                    '"abbreviation":"DXN","geoLocation":{"lat":44.56,"lon":-123.28},' +
+                    '"geometry":{"type":"Polygon","coordinates":[[[-123.2801,44.5601],' +
+                    '[-123.2800,44.5605],[-123.2799,44.5609],[-123.2790,44.5609],' +
+                    '[-123.2801,44.5601]]]}}}')
+        }
+        def dao = mock.proxyInstance()
+        def resource = new LocationResource(dao, endpointUri)
+        resource.uriInfo = new MockUriInfo()
+
+        def res = resource.getById('abc', true, null, 'name', 0.0001d, 3).get()
+        assert res.status == 200
+        assert res.entity.properties.attributes == [name: 'Dixon']
+        assert res.entity.geometry.type == 'GeometryCollection'
+        def ring = res.entity.geometry.geometries[0].coordinates[0]
+        assert ring == [[-123.28d, 44.56d], [-123.28d, 44.561d], [-123.279d, 44.561d],
+                        [-123.28d, 44.56d]]
+
+        // Test: invalid fields, simplify and precision
+        assert resource.getById('abc', null, null, 'na-me', null, null).get().status == 400
+        assert resource.getById('abc', null, null, null, 0d, null).get().status == 400
+        assert resource.getById('abc', null, null, null, null, 16).get().status == 400
+
+        mock.verify(dao)
+    }
+
+    // Test: LocationResource.list(): tagged responses, and 304s to requests with their tag
+    @Test
+    public void testEntityTags() {
+        def mock = new MockFor(LocationDAO)
+        mock.demand.search(2) {
+            String q, String campus, List<String> type, Double lat,
+            Double lon, String searchDistance, Boolean isOpen, Integer weekday,
+            Boolean giRestroom, List<String> parkingZoneGroup, Integer adaParkingSpaceCount,
+            Integer motorcycleParkingSpaceCount, Integer evParkingSpaceCount, String abbreviation,
+            Integer pageNumber, Integer pageSize, List<Object> searchAfter, List<String> fields ->
+                completedFuture('{"hits": {"total": 1, "hits": [{"_id": "abc", "_source": ' +
+                        '{"id":"abc","type":"locations","attributes":{"hashCode":7}}}]}}')
+        }
+        def dao = mock.proxyInstance()
+        def resource = new LocationResource(dao, endpointUri)
+        resource.uriInfo = new MockUriInfo()
+        def request = {
+            resource.list(null, null, null, null, null, null, null, null, null, null, null, null,
+                    null, null, null, null, null, null, null).get()
+        }
+
+        Response tagged = request()
+        assert tagged.status == 200
+        EntityTag tag = tagged.entityTag
+        assert tag && !tag.weak
+
+        resource.httpHeaders = [getHeaderString: { String name ->
+            assert name == HttpHeaders.IF_NONE_MATCH
+            "\"other\", W/\"${tag.value}\"".toString()
+        }] as HttpHeaders
+        Response notModified = request()
+        assert notModified.status == 304
+        assert !notModified.hasEntity()
+        assert notModified.entityTag == tag
+
+        mock.verify(dao)
+    }
+
     // Test: LocationResource.sanitize()
     @Test
     public void testSanitize() {
@@ -143,7 +342,8 @@ class LocationResourceTest {
             Double lon, String searchDistance, Boolean isOpen, Integer weekday,
             Boolean giRestroom, List<String> parkingZoneGroup, Integer adaParkingSpaceCount,
             Integer motorcycleParkingSpaceCount, Integer evParkingSpaceCount, String abbreviation,
-            Integer pageNumber, Integer pageSize -> esStubData
+            Integer pageNumber, Integer pageSize, List<Object> searchAfter, List<String> fields ->
+                completedFuture(esStubData)
         }
         def dao = mock.proxyInstance()
         def resource = new LocationResource(dao, endpointUri)
@@ -182,7 +382,7 @@ class LocationResourceTest {
             (Integer) expectedParams['motorcycleParkingSpaceCount'],
             (Integer) expectedParams['evParkingSpaceCount'],
             (Boolean) expectedParams['geojson'],
-            (String) expectedParams['abbreviation'])
+            (String) expectedParams['abbreviation'], null, null, null, null).get()
         ResultObject resObj = res.entity
         String selfLinks = resObj.links["self"]
 
@@ -60,7 +60,7 @@ class MockUriInfo implements UriInfo {
 
     @Override
     URI getRequestUri() {
-        throw new UnsupportedOperationException('not implemented')
+        UriBuilder.fromUri('https://api.unit.test.edu/v1/locations').build()
     }
 
     @Override
@@ -0,0 +1,158 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import com.codahale.metrics.Gauge
+import com.codahale.metrics.MetricRegistry
+import groovy.mock.interceptor.MockFor
+import org.junit.Test
+
+import java.util.concurrent.CompletableFuture
+
+import static groovy.test.GroovyAssert.shouldFail
+import static java.util.concurrent.CompletableFuture.completedFuture
+
+class CachingLocationDAOTest {
+    static Map<String, String> configuration = [
+            cacheMaxBytes           : "100000",
+            cacheIsOpenWindowSeconds: "3600",
+    ]
+
+    // Test: CachingLocationDAO.getById() is answered from the cache until invalidated
+    @Test
+    public void testGetById() {
+        def mock = new MockFor(LocationDAO)
+        mock.demand.getById(1) { String id, List<String> fields ->
+            completedFuture('{"_id": "abc"}')
+        }
+        mock.demand.getById(1) { String id, List<String> fields -> completedFuture(null) }
+        mock.demand.getById(1) { String id, List<String> fields ->
+            completedFuture('{"_id": "abc", "found": true}')
+        }
+        def locationDAO = mock.proxyInstance()
+        def dao = new CachingLocationDAO(locationDAO, configuration)
+        def metrics = new MetricRegistry()
+        dao.registerMetrics(metrics)
+
+        assert dao.getById("abc").get() == '{"_id": "abc"}'
+        assert dao.getById("ABC").get() == '{"_id": "abc"}'
+        assert dao.getById("missing").get() == null
+        assert dao.getById("missing").get() == null
+
+        Map<String, Gauge> gauges = metrics.gauges
+        String prefix = "${CachingLocationDAO.name}.cache."
+        assert gauges[prefix + "hits"].value == 2
+        assert gauges[prefix + "misses"].value == 2
+        assert gauges[prefix + "size"].value == 2
+
+        dao.invalidate()
+        assert gauges[prefix + "size"].value == 0
+        assert gauges[prefix + "invalidations"].value == 1
+        assert dao.getById("abc").get() == '{"_id": "abc", "found": true}'
+
+        mock.verify(locationDAO)
+    }
+
+    // Test: CachingLocationDAO.search() only keys isOpen queries by weekday
+    @Test
+    public void testSearch() {
+        def mock = new MockFor(LocationDAO)
+        ["all", "open"].each { String response ->
+            mock.demand.search(1) {
+                String q, String campus, List<String> type, Double lat,
+                Double lon, String searchDistance, Boolean isOpen, Integer weekday,
+                Boolean giRestroom, List<String> parkingZoneGroup, Integer adaParkingSpaceCount,
+                Integer motorcycleParkingSpaceCount, Integer evParkingSpaceCount,
+                String abbreviation, Integer pageNumber, Integer pageSize,
+                List<Object> searchAfter, List<String> fields ->
+                    completedFuture(response)
+            }
+        }
+        def locationDAO = mock.proxyInstance()
+        def dao = new CachingLocationDAO(locationDAO, configuration)
+        def search = { Boolean isOpen, Integer weekday ->
+            dao.search("dixon", null, ["building"], null, null, null, isOpen, weekday,
+                    null, null, null, null, null, null, 1, 10).get()
+        }
+
+        assert search(false, 1) == "all"
+        assert search(false, 2) == "all"
+        assert search(true, 2) == "open"
+        assert search(true, 2) == "open"
+
+        mock.verify(locationDAO)
+    }
+
+    // Test: CachingLocationDAO passes on exceptions and failed responses of the DAO and does
+    // not cache them
+    @Test
+    public void testException() {
+        def failed = new CompletableFuture<String>()
+        failed.completeExceptionally(new SaturatedException(1))
+
+        def mock = new MockFor(LocationDAO)
+        mock.demand.getServiceById(1) { String id -> throw new IOException("unavailable") }
+        mock.demand.getServiceById(1) { String id -> failed }
+        mock.demand.getServiceById(1) { String id -> completedFuture('{"_id": "abc"}') }
+        def locationDAO = mock.proxyInstance()
+        def dao = new CachingLocationDAO(locationDAO, configuration)
+
+        shouldFail(IOException) {
+            dao.getServiceById("abc")
+        }
+        assert dao.getServiceById("abc").isCompletedExceptionally()
+        assert dao.getServiceById("abc").get() == '{"_id": "abc"}'
+
+        mock.verify(locationDAO)
+    }
+
+    // Test: CachingLocationDAO weighs responses by their size once loaded, and evicts those
+    // over its budget
+    @Test
+    public void testMaxBytes() {
+        String large = "x" * 1000
+        def pending = new CompletableFuture<String>()
+
+        def mock = new MockFor(LocationDAO)
+        mock.demand.getServiceById(2) { String id -> completedFuture(large) }
+        mock.demand.getServiceById(1) { String id -> pending }
+        def locationDAO = mock.proxyInstance()
+        def dao = new CachingLocationDAO(locationDAO, [cacheMaxBytes: "1000"])
+        def metrics = new MetricRegistry()
+        dao.registerMetrics(metrics)
+
+        assert dao.getServiceById("large").get() == large
+        assert dao.getServiceById("large").get() == large
+
+        Map<String, Gauge> gauges = metrics.gauges
+        String prefix = "${CachingLocationDAO.name}.cache."
+        assert gauges[prefix + "evictions"].value == 2
+
+        // A response is weighed again when it completes
+        assert dao.getServiceById("pending").is(pending)
+        assert dao.getServiceById("pending").is(pending)
+        assert gauges[prefix + "size"].value == 1
+        pending.complete(large)
+        assert gauges[prefix + "evictions"].value == 3
+        assert gauges[prefix + "size"].value == 0
+
+        mock.verify(locationDAO)
+    }
+
+    // Test: CachingLocationDAO.weigh()
+    @Test
+    public void testWeigh() {
+        def failed = new CompletableFuture<String>()
+        failed.completeExceptionally(new SaturatedException(1))
+
+        assert CachingLocationDAO.weigh(completedFuture("abc")) == 6
+        assert CachingLocationDAO.weigh(completedFuture(null)) == 0
+        assert CachingLocationDAO.weigh(new CompletableFuture<String>()) == 0
+        assert CachingLocationDAO.weigh(failed) == 0
+    }
+
+    // Test: CachingLocationDAO.isEnabled()
+    @Test
+    public void testIsEnabled() {
+        assert CachingLocationDAO.isEnabled([:])
+        assert !CachingLocationDAO.isEnabled([cacheMaxBytes: "0"])
+    }
+}
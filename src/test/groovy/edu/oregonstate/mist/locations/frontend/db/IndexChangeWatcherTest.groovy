@@ -0,0 +1,76 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import com.codahale.metrics.Gauge
+import com.codahale.metrics.MetricRegistry
+import groovy.mock.interceptor.MockFor
+import org.junit.Test
+
+class IndexChangeWatcherTest {
+    static Map<String, String> configuration = [
+            esIndex       : "locations",
+            esIndexService: "services",
+    ]
+
+    static Map<String, List<Long>> counts = [
+            "locations-2": [100L, 120L, 20L],
+            "services-1" : [50L, 50L, 0L],
+    ]
+
+    // Test: IndexChangeWatcher.check() only clears the cache when the indexes changed
+    @Test
+    public void testCheck() {
+        def dao = new CachingLocationDAO(new MockFor(LocationDAO).proxyInstance(), [:])
+        def metrics = new MetricRegistry()
+        dao.registerMetrics(metrics)
+        Gauge invalidations = metrics.gauges["${CachingLocationDAO.name}.cache.invalidations"]
+        def watcher = new IndexChangeWatcher(null, configuration, dao)
+
+        watcher.check(IndexChangeWatcher.fingerprint(counts))
+        watcher.check(IndexChangeWatcher.fingerprint(counts))
+        assert invalidations.value == 0
+
+        watcher.check(IndexChangeWatcher.fingerprint(counts + ["services-1": [51L, 51L, 0L]]))
+        assert invalidations.value == 1
+        watcher.check(IndexChangeWatcher.fingerprint(["locations-3": [100L, 100L, 0L],
+                                                      "services-1" : [51L, 51L, 0L]]))
+        assert invalidations.value == 2
+    }
+
+    // Test: IndexChangeWatcher.check() clears the cache again on the check after a document
+    // was indexed, for when the refresh making it searchable comes after the first check
+    @Test
+    public void testCheckAfterRefresh() {
+        def dao = new CachingLocationDAO(new MockFor(LocationDAO).proxyInstance(), [:])
+        def metrics = new MetricRegistry()
+        dao.registerMetrics(metrics)
+        Gauge invalidations = metrics.gauges["${CachingLocationDAO.name}.cache.invalidations"]
+        def watcher = new IndexChangeWatcher(null, configuration, dao)
+
+        // An update is indexed: the document count stays the same
+        Map<String, List<Long>> updated = counts + ["locations-2": [100L, 121L, 20L]]
+
+        watcher.check(IndexChangeWatcher.fingerprint(counts))
+        watcher.check(IndexChangeWatcher.fingerprint(updated))
+        assert invalidations.value == 1
+
+        // The index refreshes between the checks, without changing the counts
+        watcher.check(IndexChangeWatcher.fingerprint(updated))
+        assert invalidations.value == 2
+
+        watcher.check(IndexChangeWatcher.fingerprint(updated))
+        assert invalidations.value == 2
+    }
+
+    // Test: IndexChangeWatcher.fingerprint() doesn't depend on the order of the indexes
+    @Test
+    public void testFingerprint() {
+        Map<String, List<Long>> reversed = [
+                "services-1" : [50L, 50L, 0L],
+                "locations-2": [100L, 120L, 20L],
+        ]
+
+        assert IndexChangeWatcher.fingerprint(counts) ==
+                "locations-2:100:120:20,services-1:50:50:0"
+        assert IndexChangeWatcher.fingerprint(reversed) == IndexChangeWatcher.fingerprint(counts)
+    }
+}
@@ -634,6 +634,90 @@ public class LocationDAOTest {
         assertEquals(COMPARE_STRING, request.toString())
     }
 
+    @Test
+    void testSearchAfter() {
+        request = dao.buildSearchRequest(request, "hello", null, null,
+                null, null, null,
+                null, null, null, null, null, null, null, null, 3, 10)
+        request = dao.applySearchAfter(request, [1.5d, "abc"] as List<Object>)
+        final String COMPARE_STRING = stripSpace("""{
+          "from": 0,
+          "size": 10,
+          "query": {
+            "bool": {
+              "must": [
+                {
+                  "multi_match": {
+                    "query": "hello",
+                    "fields": [
+                      "attributes.abbreviation^1.0",
+                      "attributes.name^1.0",
+                      "attributes.synonyms^1.0"
+                    ],
+                    "type": "best_fields",
+                    "operator": "OR",
+                    "slop": 0,
+                    "prefix_length": 0,
+                    "max_expansions": 50,
+                    "zero_terms_query": "NONE",
+                    "auto_generate_synonyms_phrase_query": true,
+                    "fuzzy_transpositions": true,
+                    "boost": 1.0
+                  }
+                }
+              ],
+              "adjust_pure_negative": true,
+              "boost": 1.0
+            }
+          },
+          "sort": [
+            {
+              "_score": {
+                "order": "desc"
+              }
+            },
+            {
+              "_id": {
+                "order": "asc"
+              }
+            }
+          ],
+          "search_after": [1.5, "abc"]
+        }""")
+        assertEquals(COMPARE_STRING, request.toString())
+    }
+
+    @Test(expected = IllegalArgumentException)
+    void testSearchAfterSortValues() {
+        request = dao.buildSearchRequest(request, "hello", null, null,
+                null, null, null,
+                null, null, null, null, null, null, null, null, 1, 10)
+        dao.applySearchAfter(request, ["abc"] as List<Object>)
+    }
+
+    @Test
+    void testServicesByLocationIdsQuery() {
+        request = dao.buildServicesByLocationIdsRequest(request, ["abc", "DEF"])
+        final String COMPARE_STRING = stripSpace("""{
+          "size": 10000,
+          "query": {
+            "terms": {
+              "attributes.locationId": ["abc", "def"],
+              "boost": 1.0
+            }
+          }
+        }""")
+        assertEquals(COMPARE_STRING, request.toString())
+    }
+
+    @Test
+    void testSourceIncludes() {
+        assertArrayEquals(["id", "type", "links", "attributes.name", "relationships.name",
+                           "attributes.geoLocation"] as String[],
+                LocationDAO.sourceIncludes(["name", "latitude", "longitude"]))
+        assertArrayEquals(["id", "type", "links"] as String[], LocationDAO.sourceIncludes([]))
+    }
+
     private static String stripSpace(String str) {
         str.replaceAll("\\s", "")
     }
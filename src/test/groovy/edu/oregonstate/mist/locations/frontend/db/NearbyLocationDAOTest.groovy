@@ -0,0 +1,198 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import com.codahale.metrics.Gauge
+import com.codahale.metrics.MetricRegistry
+import com.fasterxml.jackson.databind.JsonNode
+import edu.oregonstate.mist.locations.frontend.mapper.LocationMapper
+import groovy.mock.interceptor.MockFor
+import org.apache.lucene.geo.GeoEncodingUtils
+import org.elasticsearch.common.geo.GeoDistance
+import org.elasticsearch.common.unit.DistanceUnit
+import org.junit.Test
+
+import static java.util.concurrent.CompletableFuture.completedFuture
+
+class NearbyLocationDAOTest {
+    static Map<String, String> configuration = [esIndex: "locations", estype: "locations"]
+
+    static List<String> sources = LocationMapper.MAPPER.readTree(new File(
+            "src/test/groovy/edu/oregonstate/mist/locations/frontend/esMockData.json"))
+            .get("hits").get("hits").collect { JsonNode hit -> hit.get("_source").toString() }
+
+    // The first location of esMockData.json, which has four others within 300m
+    static final double LAT = 44.5505d
+    static final double LON = -123.2818d
+    static final List<String> NEARBY_IDS = [
+            "c9290ee9b3cd17934d583da40cc13b89", "47c88592a5dfdcace3b002c3a291b3a1",
+            "be93c7f4a14b91a18b1be885b6963cf9", "f83281f3b54c27c45630c5818ac9034e",
+            "d2ab96b301b13d46af8c8ef121d62b4e",
+    ]
+
+    static Map<String, String> sourcesById = sources.collectEntries { String source ->
+        [(LocationMapper.MAPPER.readTree(source).get("id").asText()): source]
+    }
+
+    static void demandExport(MockFor mock) {
+        mock.demand.exportLocations(1) { Integer batchSize, List<String> fields,
+                                         Closure eachSource ->
+            assert fields == NearbyLocationDAO.INDEXED_FIELDS
+            sources.each { String source -> eachSource(source) }
+        }
+    }
+
+    // Answers multi-gets with the sources of the ids, whatever the fields
+    static void demandGetByIds(MockFor mock, Range times) {
+        mock.demand.getByIds(times) { List<String> ids, List<String> fields ->
+            completedFuture(ids.collect { String id -> sourcesById[id] })
+        }
+    }
+
+    static NearbyLocationDAO refreshedDAO(MockFor mock) {
+        demandExport(mock)
+        demandGetByIds(mock, 0..10)
+        def dao = new NearbyLocationDAO(mock.proxyInstance(), configuration)
+        dao.refresh()
+        dao
+    }
+
+    static JsonNode search(NearbyLocationDAO dao, String campus, List<String> type,
+                           Integer pageNumber, Integer pageSize, List<Object> searchAfter,
+                           List<String> fields) {
+        LocationMapper.MAPPER.readTree(dao.search(null, campus, type, LAT, LON, "300m", null,
+                null, null, null, null, null, null, null, pageNumber, pageSize, searchAfter,
+                fields).get())
+    }
+
+    static List<String> ids(JsonNode response) {
+        response.get("hits").get("hits").collect { JsonNode hit -> hit.get("_id").asText() }
+    }
+
+    // Test: NearbyLocationDAO.search() returns the locations within the distance, closest
+    // first, with the distances of the ElasticSearch plane sort
+    @Test
+    public void testSearch() {
+        def dao = refreshedDAO(new MockFor(LocationDAO))
+        JsonNode response = search(dao, "Corvallis", ["building"], 1, 10, null, null)
+
+        assert response.get("hits").get("total").asInt() == 5
+        assert ids(response) == NEARBY_IDS
+        response.get("hits").get("hits").each { JsonNode hit ->
+            JsonNode point = hit.get("_source").get("attributes").get("geoLocation")
+            double lat = GeoEncodingUtils.decodeLatitude(
+                    GeoEncodingUtils.encodeLatitude(point.get("lat").asDouble()))
+            double lon = GeoEncodingUtils.decodeLongitude(
+                    GeoEncodingUtils.encodeLongitude(point.get("lon").asDouble()))
+            assert hit.get("sort").get(0).asDouble() ==
+                    GeoDistance.PLANE.calculate(LAT, LON, lat, lon, DistanceUnit.KILOMETERS)
+            assert hit.get("sort").size() == 2
+        }
+
+        def results = LocationMapper.mapSearchResponse(dao.search(null, null, null, LAT, LON,
+                "300m", null, null, null, null, null, null, null, null, 1, 10).get())
+        assert results.total == 5
+        assert results.data[0].attributes.distance < 0.001d
+
+        assert ids(search(dao, null, null, 2, 2, null, null)) == NEARBY_IDS[2..3]
+        assert ids(search(dao, null, ["dining", "building"], 1, 10, null, null)) == NEARBY_IDS
+        assert search(dao, "cascades", null, 1, 10, null, null).get("hits").get("total")
+                .asInt() == 0
+        assert search(dao, null, ["dining"], 1, 10, null, null).get("hits").get("total")
+                .asInt() == 0
+    }
+
+    // Test: NearbyLocationDAO.search() pages after the sort values of the previous page
+    @Test
+    public void testSearchAfter() {
+        def dao = refreshedDAO(new MockFor(LocationDAO))
+
+        JsonNode first = search(dao, null, null, 1, 2, [], null)
+        assert ids(first) == NEARBY_IDS[0..1]
+        JsonNode last = first.get("hits").get("hits").get(1).get("sort")
+        assert last.size() == 3
+        assert last.get(2).asText() == NEARBY_IDS[1]
+
+        List<Object> searchAfter = [last.get(0).asDouble(), last.get(1).asDouble(),
+                                    last.get(2).asText()]
+        assert ids(search(dao, null, null, 1, 2, searchAfter, null)) == NEARBY_IDS[2..3]
+    }
+
+    // Test: NearbyLocationDAO.search() gets the sources of a page by id, with the sparse
+    // fields, and leaves out the hits without one
+    @Test
+    public void testFields() {
+        def mock = new MockFor(LocationDAO)
+        demandExport(mock)
+        mock.demand.getByIds(1) { List<String> ids, List<String> fields ->
+            assert ids == NEARBY_IDS[0..2]
+            assert fields == ["name", "latitude"]
+            completedFuture([sourcesById[NEARBY_IDS[2]], sourcesById[NEARBY_IDS[0]]])
+        }
+        def locationDAO = mock.proxyInstance()
+        def dao = new NearbyLocationDAO(locationDAO, configuration)
+        dao.refresh()
+
+        JsonNode response = search(dao, null, null, 1, 3, null, ["name", "latitude"])
+        assert response.get("hits").get("total").asInt() == 5
+        assert ids(response) == [NEARBY_IDS[0], NEARBY_IDS[2]]
+        assert response.get("hits").get("hits").get(1).get("_source").toString() ==
+                LocationMapper.MAPPER.readTree(sourcesById[NEARBY_IDS[2]]).toString()
+
+        assert ids(search(dao, "cascades", null, 1, 3, null, ["name"])) == []
+
+        mock.verify(locationDAO)
+    }
+
+    // Test: NearbyLocationDAO passes on searches the index can't answer, and every search
+    // before the index is built
+    @Test
+    public void testDelegates() {
+        def mock = new MockFor(LocationDAO)
+        ["dixon", null].each { String q ->
+            mock.demand.search(1) {
+                String query, String campus, List<String> type, Double lat,
+                Double lon, String searchDistance, Boolean isOpen, Integer weekday,
+                Boolean giRestroom, List<String> parkingZoneGroup, Integer adaParkingSpaceCount,
+                Integer motorcycleParkingSpaceCount, Integer evParkingSpaceCount,
+                String abbreviation, Integer pageNumber, Integer pageSize,
+                List<Object> searchAfter, List<String> fields ->
+                    assert query == q
+                    completedFuture("es")
+            }
+        }
+        demandExport(mock)
+        mock.demand.search(1) {
+            String query, String campus, List<String> type, Double lat,
+            Double lon, String searchDistance, Boolean isOpen, Integer weekday,
+            Boolean giRestroom, List<String> parkingZoneGroup, Integer adaParkingSpaceCount,
+            Integer motorcycleParkingSpaceCount, Integer evParkingSpaceCount,
+            String abbreviation, Integer pageNumber, Integer pageSize,
+            List<Object> searchAfter, List<String> fields ->
+                assert isOpen
+                completedFuture("es")
+        }
+        demandGetByIds(mock, 1..1)
+        def locationDAO = mock.proxyInstance()
+        def dao = new NearbyLocationDAO(locationDAO, configuration)
+        def metrics = new MetricRegistry()
+        dao.registerMetrics(metrics)
+
+        assert dao.search("dixon", null, null, LAT, LON, "300m", null, null, null, null, null,
+                null, null, null, 1, 10).get() == "es"
+        assert dao.search(null, null, null, LAT, LON, "300m", null, null, null, null, null,
+                null, null, null, 1, 10).get() == "es"
+
+        dao.refresh()
+        assert dao.search(null, null, null, LAT, LON, "300m", true, 3, null, null, null,
+                null, null, null, 1, 10).get() == "es"
+        assert dao.search(null, null, null, LAT, LON, "300m", null, null, null, null, null,
+                null, null, null, 1, 10).get() != "es"
+
+        Map<String, Gauge> gauges = metrics.gauges
+        String prefix = "${NearbyLocationDAO.name}.index."
+        assert gauges[prefix + "size"].value == 10
+        assert gauges[prefix + "served"].value == 1
+        assert gauges[prefix + "delegated"].value == 3
+
+        mock.verify(locationDAO)
+    }
+}
@@ -0,0 +1,55 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import org.elasticsearch.action.search.SearchAction
+import org.elasticsearch.action.search.SearchRequestBuilder
+import org.junit.Test
+
+import static groovy.test.GroovyAssert.shouldFail
+
+class QueryProfilerTest {
+    static SearchRequestBuilder search(String q, List<String> type, Double lat, Double lon,
+                                       Boolean isOpen, Integer weekday, Integer pageNumber) {
+        LocationDAO.buildSearchRequest(new SearchRequestBuilder(null, SearchAction.INSTANCE),
+                q, null, type, lat, lon, "1km", isOpen, weekday,
+                null, null, null, null, null, null, pageNumber, 10)
+    }
+
+    // Test: QueryProfiler.shape() takes the values out of a query but keeps its clauses
+    @Test
+    public void testShape() {
+        def openDining = QueryProfiler.shape(search(null, ["dining"], null, null, true, 1, 1))
+        def openBuildings = QueryProfiler.shape(
+                search(null, ["building", "dining"], null, null, true, 7, 3))
+        assert openBuildings.toString() == openDining.toString()
+        assert QueryProfiler.fingerprint(openBuildings) == QueryProfiler.fingerprint(openDining)
+        assert openDining.toString().contains('"attributes.openHours.N.start"')
+        assert !openDining.toString().contains("dining")
+
+        def nearby = QueryProfiler.shape(search(null, ["dining"], 44.56d, -123.28d, true, 1, 1))
+        def hello = QueryProfiler.shape(search("hello", ["dining"], null, null, true, 1, 1))
+        assert QueryProfiler.fingerprint(nearby) != QueryProfiler.fingerprint(openDining)
+        assert QueryProfiler.fingerprint(hello) != QueryProfiler.fingerprint(openDining)
+        assert nearby.get("sort").size() == 2
+    }
+
+    // Test: QueryProfiler.splitProfile() takes the profile off the end of a search response
+    @Test
+    public void testSplitProfile() {
+        String hits = '{"took":3,"hits":{"total":1,"hits":[{"_id":"a","_source":{}}]}'
+        String profile = '{"shards":[{"id":"[n][locations][0]","searches":[]}]}'
+
+        assert QueryProfiler.splitProfile(hits + ',"profile":' + profile + '}') ==
+                [hits + '}', profile]
+        assert QueryProfiler.splitProfile(hits + '}') == [hits + '}', null]
+    }
+
+    // Test: QueryProfiler profiles no searches by default, every one at 1 and rejects others
+    @Test
+    public void testSampleRate() {
+        assert !new QueryProfiler(0).sample()
+        assert new QueryProfiler(1).sample()
+        shouldFail(IllegalArgumentException) {
+            new QueryProfiler(1.5d)
+        }
+    }
+}
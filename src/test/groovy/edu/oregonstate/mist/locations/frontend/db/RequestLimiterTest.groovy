@@ -0,0 +1,109 @@
+package edu.oregonstate.mist.locations.frontend.db
+
+import com.google.common.util.concurrent.MoreExecutors
+import org.elasticsearch.action.ActionListener
+import org.elasticsearch.action.ActionRequestBuilder
+import org.elasticsearch.action.get.GetRequest
+import org.elasticsearch.action.get.GetResponse
+import org.junit.Test
+
+import java.util.concurrent.CompletableFuture
+import java.util.concurrent.ExecutionException
+import java.util.concurrent.Executor
+import java.util.concurrent.Executors
+import java.util.concurrent.TimeUnit
+import java.util.concurrent.TimeoutException
+
+import static groovy.test.GroovyAssert.shouldFail
+
+class RequestLimiterTest {
+    // Keeps the listener of the request instead of sending it to ElasticSearch
+    static class PendingRequest
+            extends ActionRequestBuilder<GetRequest, GetResponse, PendingRequest> {
+        ActionListener<GetResponse> listener
+
+        PendingRequest() {
+            super(null, null, null)
+        }
+
+        @Override
+        void execute(ActionListener<GetResponse> listener) {
+            this.listener = listener
+        }
+    }
+
+    // Test: RequestLimiter.execute() rejects requests over the limit until one is answered
+    @Test
+    public void testExecute() {
+        def limiter = new RequestLimiter(1)
+
+        def first = new PendingRequest()
+        CompletableFuture<GetResponse> firstResponse = limiter.execute(first)
+        assert !firstResponse.done
+        assert limiter.inFlight == 1
+
+        CompletableFuture<GetResponse> rejected = limiter.execute(new PendingRequest())
+        def e = shouldFail(ExecutionException) {
+            rejected.get()
+        }
+        assert e.cause instanceof SaturatedException
+        assert limiter.rejected == 1
+
+        first.listener.onFailure(new IOException("unavailable"))
+        assert firstResponse.completedExceptionally
+        assert limiter.inFlight == 0
+
+        def second = new PendingRequest()
+        CompletableFuture<GetResponse> secondResponse = limiter.execute(second)
+        assert limiter.inFlight == 1
+        second.listener.onResponse(null)
+        assert secondResponse.get() == null
+        assert limiter.inFlight == 0
+        assert limiter.rejected == 1
+    }
+
+    // Test: RequestLimiter.execute() completes futures on the completions executor, not on the
+    // thread that received the response
+    @Test
+    public void testCompletions() {
+        List<Runnable> completions = []
+        def limiter = new RequestLimiter(1, 0, { Runnable task -> completions << task } as Executor,
+                null)
+
+        def request = new PendingRequest()
+        CompletableFuture<GetResponse> response = limiter.execute(request)
+        request.listener.onResponse(null)
+        assert !response.done
+        assert limiter.inFlight == 0
+
+        completions.each { Runnable task -> task.run() }
+        assert response.done
+    }
+
+    // Test: RequestLimiter.execute() fails requests ElasticSearch doesn't answer in time, and
+    // gives their permit back
+    @Test
+    public void testTimeout() {
+        def timer = Executors.newSingleThreadScheduledExecutor()
+        try {
+            def limiter = new RequestLimiter(1, 10, MoreExecutors.directExecutor(), timer)
+
+            def request = new PendingRequest()
+            CompletableFuture<GetResponse> response = limiter.execute(request)
+            def e = shouldFail(ExecutionException) {
+                response.get(5, TimeUnit.SECONDS)
+            }
+            assert e.cause instanceof TimeoutException
+            assert limiter.inFlight == 0
+            assert limiter.timedOut == 1
+
+            // A late answer doesn't give the permit back twice
+            request.listener.onResponse(null)
+            assert limiter.inFlight == 0
+            assert limiter.execute(new PendingRequest()) != null
+            assert limiter.inFlight == 1
+        } finally {
+            timer.shutdownNow()
+        }
+    }
+}
@@ -0,0 +1,44 @@
+package edu.oregonstate.mist.locations.frontend.mapper
+
+import org.junit.Test
+
+class GeometrySimplifierTest {
+    // Test: GeometrySimplifier.simplify() drops positions close to a line and rounds the rest
+    @Test
+    public void testLineString() {
+        def geometry = [type: "LineString", coordinates: [
+                [0.0d, 0.0d], [1.0d, 0.01d], [2.0d, -0.01d], [3.0d, 5.0d], [4.0d, 6.0d]]]
+        new GeometrySimplifier(0.1d, 1).simplify(geometry)
+
+        assert geometry.coordinates == [[0.0d, 0.0d], [2.0d, 0.0d], [3.0d, 5.0d], [4.0d, 6.0d]]
+    }
+
+    // Test: GeometrySimplifier.simplify() keeps polygon rings closed and valid
+    @Test
+    public void testPolygon() {
+        def square = [[0.0d, 0.0d], [0.5d, 0.001d], [1.0d, 0.0d], [1.0d, 1.0d], [0.0d, 1.0d],
+                      [0.0d, 0.0d]]
+        def geometry = [type: "Polygon", coordinates: [square]]
+        new GeometrySimplifier(0.01d, null).simplify(geometry)
+
+        assert geometry.coordinates == [[[0.0d, 0.0d], [1.0d, 0.0d], [1.0d, 1.0d],
+                                         [0.0d, 1.0d], [0.0d, 0.0d]]]
+
+        // A ring that would be left with fewer than 4 positions is only rounded
+        def triangle = [[0.0d, 0.0d], [0.001d, 0.001d], [0.002d, 0.0d], [0.0d, 0.0d]]
+        geometry = [type: "Polygon", coordinates: [triangle]]
+        new GeometrySimplifier(1d, 3).simplify(geometry)
+
+        assert geometry.coordinates == [triangle]
+    }
+
+    // Test: GeometrySimplifier.simplify() rounds points and goes through collections
+    @Test
+    public void testGeometryCollection() {
+        def point = [type: "Point", coordinates: [-123.28123d, 44.56789d]]
+        def geometry = [type: "GeometryCollection", geometries: [point]]
+        new GeometrySimplifier(0d, 2).simplify(geometry)
+
+        assert point.coordinates == [-123.28d, 44.57d]
+    }
+}
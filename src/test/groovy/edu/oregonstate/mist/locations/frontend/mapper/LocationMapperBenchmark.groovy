@@ -0,0 +1,118 @@
+package edu.oregonstate.mist.locations.frontend.mapper
+
+import com.fasterxml.jackson.databind.JsonNode
+import com.fasterxml.jackson.databind.ObjectMapper
+import com.fasterxml.jackson.databind.node.ArrayNode
+import com.fasterxml.jackson.databind.node.ObjectNode
+import edu.oregonstate.mist.api.jsonapi.ResourceObject
+
+import java.lang.management.ManagementFactory
+
+/**
+ * Microbenchmark of mapping search responses of growing page sizes to ResourceObjects:
+ *
+ * - perHitMapper: what the resources used to do, a new ObjectMapper to read the whole
+ *   response into a tree, then a new ObjectMapper for every hit reading its _source back from
+ *   a string
+ * - sharedTree: the shared reader over a tree of the whole response (LocationMapper.map)
+ * - stream: LocationMapper.mapSearchResponse, reading hits from the token stream
+ *
+ * Reports the mean time and bytes allocated to map one page. Run it with
+ * gradle mapperBenchmark, optionally with -PpageSizes=10,100,1000.
+ */
+class LocationMapperBenchmark {
+    static final List<Integer> DEFAULT_PAGE_SIZES = [10, 100, 1000, 5000]
+    static final long TARGET_NANOS = 2_000_000_000L
+
+    static void main(String[] args) {
+        List<Integer> pageSizes = args ? args[0].split(",").collect { it.toInteger() } :
+                DEFAULT_PAGE_SIZES
+        def mockHits = LocationMapper.MAPPER.readTree(new File(
+                "src/test/groovy/edu/oregonstate/mist/locations/frontend/esMockData.json"))
+                .get("hits").get("hits")
+
+        def approaches = [
+                perHitMapper: { String response -> mapPerHitMapper(response) },
+                sharedTree  : { String response -> mapSharedTree(response) },
+                stream      : { String response -> LocationMapper.mapSearchResponse(response) }
+        ]
+
+        println String.format("%-10s %-13s %12s %12s %14s %12s",
+                "page size", "approach", "pages", "ms/page", "KB/page", "ns/hit")
+        pageSizes.each { Integer pageSize ->
+            String response = searchResponse(mockHits, pageSize)
+            approaches.each { String name, Closure<?> approach ->
+                def result = measure(approach, response)
+                println String.format("%-10d %-13s %12d %12.3f %14.1f %12.0f",
+                        pageSize, name, result.pages, result.nanosPerPage / 1e6,
+                        result.bytesPerPage / 1024, result.nanosPerPage / pageSize)
+            }
+        }
+    }
+
+    /**
+     * Builds a search response with pageSize hits, cycling through the mock hits.
+     */
+    static String searchResponse(JsonNode mockHits, Integer pageSize) {
+        ObjectMapper mapper = LocationMapper.MAPPER
+        ObjectNode response = mapper.createObjectNode()
+        response.put("took", 3)
+        response.put("timed_out", false)
+        ObjectNode topLevelHits = response.putObject("hits")
+        topLevelHits.put("total", pageSize * 10)
+        ArrayNode hits = topLevelHits.putArray("hits")
+        pageSize.times { Integer i ->
+            ObjectNode hit = mockHits.get(i % mockHits.size()).deepCopy()
+            ObjectNode source = (ObjectNode) hit.get("_source")
+            source.put("id", "${source.get('id').asText()}-${i}".toString())
+            hit.put("_id", source.get("id").asText())
+            hits.add(hit)
+        }
+        mapper.writeValueAsString(response)
+    }
+
+    static List<ResourceObject> mapPerHitMapper(String response) {
+        List<ResourceObject> data = []
+        JsonNode actualObj = new ObjectMapper().readTree(response)
+        actualObj.get("hits").get("hits").each { JsonNode hit ->
+            ResourceObject ro = new ObjectMapper().readValue(
+                    hit.get("_source").toString(), ResourceObject.class)
+            LocationMapper.adjustLocationsResource(ro, hit.get("sort"))
+            data << ro
+        }
+        data
+    }
+
+    static List<ResourceObject> mapSharedTree(String response) {
+        List<ResourceObject> data = []
+        LocationMapper.MAPPER.readTree(response).get("hits").get("hits").each { JsonNode hit ->
+            data << LocationMapper.map(hit)
+        }
+        data
+    }
+
+    /**
+     * Warms the approach up, then maps the response repeatedly for about TARGET_NANOS.
+     */
+    static Map measure(Closure<?> approach, String response) {
+        def threads = (com.sun.management.ThreadMXBean) ManagementFactory.threadMXBean
+        long threadId = Thread.currentThread().id
+        long deadline = System.nanoTime() + TARGET_NANOS.intdiv(2)
+        while (System.nanoTime() < deadline) {
+            approach(response)
+        }
+
+        long pages = 0
+        long allocatedBefore = threads.getThreadAllocatedBytes(threadId)
+        long started = System.nanoTime()
+        deadline = started + TARGET_NANOS
+        while (System.nanoTime() < deadline) {
+            approach(response)
+            pages++
+        }
+        long elapsed = System.nanoTime() - started
+        long allocated = threads.getThreadAllocatedBytes(threadId) - allocatedBefore
+
+        [pages: pages, nanosPerPage: elapsed / pages, bytesPerPage: allocated / pages]
+    }
+}
@@ -0,0 +1,102 @@
+package edu.oregonstate.mist.locations.frontend.mapper
+
+import com.fasterxml.jackson.databind.JsonNode
+import edu.oregonstate.mist.api.jsonapi.ResourceObject
+import org.junit.Test
+
+class LocationMapperTest {
+    static String esStubData = new File(
+            "src/test/groovy/edu/oregonstate/mist/locations/frontend/esMockData.json").text
+
+    // Test: LocationMapper.mapSearchResponse() maps hits like LocationMapper.map(JsonNode)
+    @Test
+    public void testMapSearchResponse() {
+        JsonNode topLevelHits = LocationMapper.MAPPER.readTree(esStubData).get("hits")
+        List<ResourceObject> expected = topLevelHits.get("hits").collect {
+            LocationMapper.map(it)
+        }
+
+        SearchResults results = LocationMapper.mapSearchResponse(esStubData)
+        assert results.total == topLevelHits.get("total").asInt()
+        assert results.data.size() == expected.size()
+        [results.data, expected].transpose().each { ResourceObject actual,
+                                                    ResourceObject mapped ->
+            assert actual.id == mapped.id
+            assert actual.type == mapped.type
+            assert actual.attributes == mapped.attributes
+            assert actual.links == mapped.links
+            assert actual.relationships == mapped.relationships
+        }
+
+        assert results.lastSort == topLevelHits.get("hits").get(expected.size() - 1).get("sort")
+
+        def first = results.data[0]
+        assert first.attributes.distance ==
+                topLevelHits.get("hits").get(0).get("sort").get(0).asDouble()
+        assert first.attributes.latitude == "44.5505"
+        assert first.attributes.longitude == "-123.2818"
+        ["geoLocation", "parent", "locationId", "hashCode"].each {
+            assert !first.attributes.containsKey(it)
+        }
+    }
+
+    // Test: LocationMapper.mapSearchResponse(): no hits, services and unknown fields
+    @Test
+    public void testMapSearchResponseServices() {
+        def noHits = LocationMapper.mapSearchResponse('{"hits": {"total": 0, "hits": []}}')
+        assert noHits.total == 0
+        assert noHits.data == []
+
+        def services = LocationMapper.mapSearchResponse('''{
+            "took": 1, "_shards": {"total": 5, "failed": 0},
+            "hits": {"total": 12, "max_score": 1.0, "hits": [{
+                "_index": "services", "_id": "abc", "_score": 1.0,
+                "_source": {"id": "abc", "type": "services",
+                            "attributes": {"name": "Cafe", "type": "services",
+                                           "locationId": "xyz", "hashCode": 1}}
+            }]}
+        }''')
+        assert services.total == 12
+        assert services.data.size() == 1
+        assert services.data[0].id == "abc"
+        assert services.data[0].attributes == [name: "Cafe"]
+    }
+
+    // Test: LocationMapper.hitsFingerprint() reads ids, sort values and hashCodes, or sources
+    @Test
+    public void testHitsFingerprint() {
+        String hits = '''"hits": {"total": 2, "hits": [
+                {"_id": "a", "sort": [1.5], "_source": {"id": "a",
+                    "attributes": {"name": "A", "hashCode": 42}}},
+                {"_id": "b", "_source": {"id": "b", "attributes": {"name": "B"}}}]}'''
+
+        String fingerprint = LocationMapper.hitsFingerprint('{"took": 3, ' + hits + '}')
+        assert fingerprint == '2\na [1.5] hashCode:42\n' +
+                'b null {"id": "b", "attributes": {"name": "B"}}\n'
+        assert LocationMapper.hitsFingerprint('{"took": 9, ' + hits + '}') == fingerprint
+    }
+
+    // Test: LocationMapper.writeNdjson() writes each mapped source on its own line
+    @Test
+    public void testWriteNdjson() {
+        def writer = new StringWriter()
+        LocationMapper.writeNdjson('{"id":"a","type":"locations","attributes":{"parent":"b"}}',
+                writer)
+        LocationMapper.writeNdjson('{"id":"c","type":"services","attributes":{}}', writer)
+
+        List<String> lines = writer.toString().split("\n")
+        assert writer.toString().endsWith("\n")
+        assert lines.size() == 2
+        assert lines.collect { LocationMapper.map(it).id } == ["a", "c"]
+        assert !lines[0].contains("parent")
+    }
+
+    // Test: LocationMapper.map(String)
+    @Test
+    public void testMapSource() {
+        def ro = LocationMapper.map(
+                '{"id":"a","type":"locations","attributes":{"geoLocation":{"lat":1,"lon":2}}}')
+        assert ro.id == "a"
+        assert ro.attributes == [latitude: "1", longitude: "2"]
+    }
+}
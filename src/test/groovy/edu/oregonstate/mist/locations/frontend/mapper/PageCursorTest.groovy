@@ -0,0 +1,31 @@
+package edu.oregonstate.mist.locations.frontend.mapper
+
+import org.junit.Test
+
+import static groovy.test.GroovyAssert.shouldFail
+
+class PageCursorTest {
+    // Test: PageCursor.encode() and decode() round trip the sort values of a hit
+    @Test
+    public void testRoundTrip() {
+        def sort = LocationMapper.MAPPER.readTree('[0.25, 1.0, "3ab0b1e5"]')
+        String cursor = PageCursor.encode(sort)
+
+        assert cursor ==~ /[A-Za-z0-9_-]+/
+        assert PageCursor.decode(cursor) == [0.25, 1.0, "3ab0b1e5"]
+    }
+
+    // Test: PageCursor.decode() without a cursor, with an empty one and with invalid ones
+    @Test
+    public void testDecode() {
+        assert PageCursor.decode(null) == null
+        assert PageCursor.decode("") == []
+
+        ["not base64!", Base64.urlEncoder.encodeToString('{"a": 1}'.bytes),
+         Base64.urlEncoder.encodeToString('[[1]]'.bytes)].each { String cursor ->
+            shouldFail(IllegalArgumentException) {
+                PageCursor.decode(cursor)
+            }
+        }
+    }
+}
@@ -0,0 +1,103 @@
+package edu.oregonstate.mist.locations.frontend.resources
+
+import edu.oregonstate.mist.api.jsonapi.ResourceObject
+import edu.oregonstate.mist.api.jsonapi.ResultObject
+import edu.oregonstate.mist.locations.frontend.mapper.GeometrySimplifier
+import edu.oregonstate.mist.locations.frontend.mapper.LocationMapper
+import edu.oregonstate.mist.locations.frontend.mapper.LocationMapperBenchmark
+
+/**
+ * Benchmark of the size and serialization time of a page of locations in each of the forms
+ * the locations endpoints can return it in:
+ *
+ * - full: every attribute, as without fields[locations]
+ * - sparse: fields[locations]=name,abbreviation,latitude,longitude
+ * - simplified: every attribute, with simplify=0.00001 (about a meter) and precision=6
+ * - geojson, geojson-simplified and geojson-sparse-simplified: the same with geojson=true
+ *
+ * Reports the bytes of a serialized page and the mean time to serialize it. Run it with
+ * gradle payloadBenchmark, optionally with -PpageSizes=10,100,1000.
+ */
+class PayloadBenchmark {
+    static final List<Integer> DEFAULT_PAGE_SIZES = [10, 100, 1000]
+    static final List<String> SPARSE_FIELDS = ["name", "abbreviation", "latitude", "longitude"]
+    static final double TOLERANCE = 0.00001d
+    static final Integer PRECISION = 6
+    static final long TARGET_NANOS = 2_000_000_000L
+
+    static void main(String[] args) {
+        List<Integer> pageSizes = args ? args[0].split(",").collect { it.toInteger() } :
+                DEFAULT_PAGE_SIZES
+        def mockHits = LocationMapper.MAPPER.readTree(new File(
+                "src/test/groovy/edu/oregonstate/mist/locations/frontend/esMockData.json"))
+                .get("hits").get("hits")
+
+        def simplifier = new GeometrySimplifier(TOLERANCE, PRECISION)
+        // GeoJSON responses fetch the attributes of the feature geometry too
+        def geojsonFields = SPARSE_FIELDS + LocationResource.GEOMETRY_FIELDS
+        def modes = [
+                "full"                     : { List<ResourceObject> data -> result(data) },
+                "sparse"                   : { List<ResourceObject> data ->
+                    LocationResource.shape(data, SPARSE_FIELDS, null)
+                    result(data)
+                },
+                "simplified"               : { List<ResourceObject> data ->
+                    LocationResource.shape(data, null, simplifier)
+                    result(data)
+                },
+                "geojson"                  : { List<ResourceObject> data ->
+                    LocationResource.toGeoJson(result(data))
+                },
+                "geojson-simplified"       : { List<ResourceObject> data ->
+                    LocationResource.shape(data, null, simplifier)
+                    LocationResource.toGeoJson(result(data))
+                },
+                "geojson-sparse-simplified": { List<ResourceObject> data ->
+                    LocationResource.shape(data, geojsonFields, simplifier)
+                    LocationResource.toGeoJson(result(data))
+                }
+        ]
+
+        println String.format("%-10s %-26s %12s %12s %12s",
+                "page size", "mode", "KB/page", "bytes/hit", "ms/page")
+        pageSizes.each { Integer pageSize ->
+            String response = LocationMapperBenchmark.searchResponse(mockHits, pageSize)
+            modes.each { String name, Closure<?> mode ->
+                // Shaping changes the locations, so each mode maps the response again
+                def entity = mode(LocationMapper.mapSearchResponse(response).data)
+                byte[] payload = LocationMapper.MAPPER.writeValueAsBytes(entity)
+                double nanosPerPage = measure { LocationMapper.MAPPER.writeValueAsBytes(entity) }
+                println String.format("%-10d %-26s %12.1f %12.0f %12.3f",
+                        pageSize, name, payload.length / 1024, payload.length / pageSize,
+                        nanosPerPage / 1e6)
+            }
+        }
+    }
+
+    static ResultObject result(List<ResourceObject> data) {
+        ResultObject resultObject = new ResultObject()
+        resultObject.data = data
+        resultObject
+    }
+
+    /**
+     * Warms serialization up, then serializes repeatedly for about TARGET_NANOS.
+     *
+     * @return mean nanoseconds per serialization
+     */
+    static double measure(Closure<?> serialize) {
+        long deadline = System.nanoTime() + TARGET_NANOS.intdiv(2)
+        while (System.nanoTime() < deadline) {
+            serialize()
+        }
+
+        long pages = 0
+        long started = System.nanoTime()
+        deadline = started + TARGET_NANOS
+        while (System.nanoTime() < deadline) {
+            serialize()
+            pages++
+        }
+        (System.nanoTime() - started) / pages
+    }
+}
@@ -0,0 +1,53 @@
+package edu.oregonstate.mist.locations.frontend.resources
+
+import com.codahale.metrics.MetricRegistry
+import org.junit.Test
+
+import javax.ws.rs.core.MultivaluedHashMap
+import javax.ws.rs.core.MultivaluedMap
+import javax.ws.rs.core.Response
+
+class PhaseTimingsTest {
+    static MultivaluedMap<String, String> query(Map<String, String> parameters) {
+        MultivaluedMap<String, String> queryParameters = new MultivaluedHashMap<>()
+        parameters.each { String name, String value -> queryParameters.putSingle(name, value) }
+        queryParameters
+    }
+
+    // Test: PhaseTimings.shape() names what a query filters by
+    @Test
+    public void testShape() {
+        assert PhaseTimings.shape(query([:])) == "plain"
+        assert PhaseTimings.shape(query([pageSize: "10"])) == "plain"
+        assert PhaseTimings.shape(query([lat: "44.5", lon: "-123.2"])) == "geo"
+        assert PhaseTimings.shape(query([lat: "44.5"])) == "plain"
+        assert PhaseTimings.shape(query([isOpen: "false", q: "hall"])) == "q"
+        assert PhaseTimings.shape(query([lat: "44.5", lon: "-123.2", isOpen: "true", q: "cafe",
+                                         campus: "corvallis"])) == "geo+isOpen+q+filters"
+    }
+
+    // Test: PhaseTimings.finish() adds a Server-Timing header and updates the phase timers
+    @Test
+    public void testFinish() {
+        def metrics = new MetricRegistry()
+        def timings = new PhaseTimings(metrics, LocationResource, "list",
+                query([type: "building"]))
+        timings.end("query")
+        timings.end("es")
+        timings.end("map")
+        timings.end("es")
+
+        def response = timings.finish(Response.ok("entity").build())
+        assert response.status == 200
+        assert response.entity == "entity"
+
+        String header = response.getHeaderString(PhaseTimings.HEADER)
+        assert header ==~ /query;dur=\d+\.\d{3}, es;dur=\d+\.\d{3}, map;dur=\d+\.\d{3}, / +
+                /total;dur=\d+\.\d{3}/
+
+        String prefix = LocationResource.name + ".list.filters."
+        ["query", "es", "map", "total"].each { String phase ->
+            assert metrics.timers[prefix + phase].count == 1
+        }
+    }
+}
@@ -0,0 +1,188 @@
+import json
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from urlparse import parse_qs, urlsplit
+except ImportError:
+    from urllib.parse import parse_qs, urlsplit
+
+from response_store import ReplayMiss
+
+# Connections kept alive per host
+POOL_SIZE = 10
+# Refresh tokens this many seconds before the gateway expires them
+TOKEN_EXPIRY_MARGIN = 60
+DEFAULT_PAGE_SIZE = 500
+
+
+class TokenCache(object):
+    """
+    Fetches an OAuth2 client credentials token once and reuses it until it
+    is about to expire, instead of requesting a new token per run or call.
+    """
+    def __init__(self, token_url, client_id, client_secret, session=None):
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.session = session or requests.Session()
+        self.lock = threading.Lock()
+        self.access_token = None
+        self.expires_at = 0
+
+    def _fetch(self):
+        post_data = {
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'grant_type': 'client_credentials'
+        }
+        response = self.session.post(self.token_url, data=post_data).json()
+        self.access_token = 'Bearer ' + response["access_token"]
+        # Apigee returns expires_in as a string of seconds
+        expires_in = response.get("expires_in")
+        self.expires_at = (time.time() + float(expires_in)
+                           if expires_in else float('inf'))
+
+    def get(self):
+        """Returns the "Bearer ..." header value, refreshing it if needed."""
+        with self.lock:
+            if (self.access_token is None or
+                    time.time() >= self.expires_at - TOKEN_EXPIRY_MARGIN):
+                self._fetch()
+            return self.access_token
+
+    def invalidate(self):
+        with self.lock:
+            self.access_token = None
+
+
+def authorization(access_token):
+    """Returns the Authorization header value for a token or TokenCache."""
+    if isinstance(access_token, TokenCache):
+        return access_token.get()
+    return access_token
+
+
+class ApiClient(object):
+    """
+    Sends every request of the suite over one keep-alive session, so each
+    call reuses a pooled connection instead of paying a new TCP and TLS
+    handshake.
+    """
+    def __init__(self, gzip=True, pool_size=POOL_SIZE):
+        self.session = requests.Session()
+        self.store = None
+        self.mode = None
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not gzip:
+            # requests asks for gzip by default
+            self.session.headers['Accept-Encoding'] = 'identity'
+
+    def use_store(self, store, mode):
+        """
+        Records every response into a ResponseStore (mode 'record'), or
+        serves them from it without touching the network (mode 'replay').
+        """
+        if mode not in ('record', 'replay'):
+            raise ValueError('mode must be record or replay, not ' + mode)
+        self.store = store
+        self.mode = mode
+
+    def remember(self, key, compute):
+        """
+        Returns compute(), recording the result under key, or the recorded
+        result in replay mode. For checks made outside the session.
+        """
+        if self.mode == 'replay':
+            recorded = self.store.get(key)
+            if recorded is None:
+                raise ReplayMiss('no recorded result for ' + key)
+            return recorded['value']
+        result = compute()
+        if self.mode == 'record':
+            self.store.put(key, result)
+        return result
+
+    def request(self, verb, url, access_token=None, params=None, **kwargs):
+        """
+        Sends a request, authorized with access_token (a header value or a
+        TokenCache) when given. A 401 with a TokenCache is retried once
+        with a fresh token, in case the cached one was revoked early.
+        """
+        if self.store is not None:
+            key = self.store.key(verb, url, params, access_token is not None)
+            if self.mode == 'replay':
+                return self.store.replay_response(key, url)
+        response = self._send(verb, url, access_token, params, **kwargs)
+        if self.mode == 'record':
+            self.store.record_response(key, response)
+        return response
+
+    def _send(self, verb, url, access_token, params, **kwargs):
+        headers = dict(kwargs.pop('headers', None) or {})
+        if access_token is not None:
+            headers['Authorization'] = authorization(access_token)
+        response = self.session.request(verb, url, params=params,
+                                        headers=headers, **kwargs)
+        if response.status_code == 401 and \
+                isinstance(access_token, TokenCache):
+            access_token.invalidate()
+            headers['Authorization'] = access_token.get()
+            response = self.session.request(verb, url, params=params,
+                                            headers=headers, **kwargs)
+        return response
+
+    def get(self, url, access_token=None, params=None, **kwargs):
+        return self.request('get', url, access_token, params, **kwargs)
+
+    def iter_resources(self, url, access_token, params=None,
+                       page_size=DEFAULT_PAGE_SIZE, cursor=False):
+        """
+        Lazily yields every resource of a paginated endpoint, requesting
+        the next page only once the previous one has been consumed. With
+        cursor, pages are requested by the page[after] cursor of the next
+        link rather than by page[number].
+        """
+        params = dict(params or {})
+        params['page[size]'] = page_size
+        if cursor:
+            params['page[after]'] = ''
+        page_number = 1
+        while True:
+            if not cursor:
+                params['page[number]'] = page_number
+            response = self.get(url, access_token, params)
+            response.raise_for_status()
+            page = response.json()
+            for resource in page['data']:
+                yield resource
+            # Links are built from the API's own endpointUri, so only
+            # whether there is a next page, and its cursor, are taken
+            # from them
+            next_link = page.get('links', {}).get('next')
+            if not next_link:
+                return
+            if cursor:
+                params['page[after]'] = parse_qs(
+                    urlsplit(next_link).query)['page[after]'][0]
+            page_number += 1
+
+    def iter_export(self, url, access_token):
+        """
+        Lazily yields every resource of an NDJSON export endpoint, parsing
+        each line as it arrives instead of loading the whole dump.
+        """
+        response = self.get(url, access_token, stream=True)
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line.decode('utf-8'))
+
+
+client = ApiClient()
@@ -1,58 +1,64 @@
 import ssl
 import urllib2
 
-import requests
-
-
-def get_buildings_with_services(url, access_token):
-    query_params = {'page[size]': 1000}
-    services = query_request(url, access_token, "get", query_params).json()
-    building_ids = []
-    for service in services['data']:
-        building_id = service['relationships']['locations']['data'][0]['id']
-        if building_id not in building_ids:
-            building_ids.append(building_id)
-
-    return building_ids
+from api_client import DEFAULT_PAGE_SIZE, authorization, client
 
 
 def id_request(url, access_token, id, query_params=None):
     url += '/{}'.format(id)
-    headers = {'Authorization': access_token}
-    request = requests.get(url, params=query_params, headers=headers)
+    request = client.get(url, access_token, query_params)
     return request.json()
 
 
 def query_request(url, access_token, verb, query_params):
-    headers = {'Authorization': access_token}
-    request = requests.request(verb, url, params=query_params, headers=headers)
+    request = client.request(verb, url, access_token, query_params)
     return request
 
 
+def all_results(url, access_token, query_params=None,
+                page_size=DEFAULT_PAGE_SIZE, cursor=False):
+    """
+    Lazily yields every result of a query, page by page, following
+    page[after] cursors when cursor is true.
+    """
+    return client.iter_resources(url, access_token, query_params, page_size,
+                                 cursor)
+
+
+def batch_request(url, access_token, ids, include=None):
+    """Gets the locations of many ids, with their include, in one request."""
+    query_params = {'id': list(ids)}
+    if include:
+        query_params['include'] = include
+    return client.get(url + '/batch', access_token, query_params).json()
+
+
+def export_results(url, access_token):
+    """Lazily yields every resource of url's NDJSON export."""
+    return client.iter_export(url + '/export', access_token)
+
+
 def results_with_links(url, access_token):
     query_params = {'campus': 'Corvallis'}
-    headers = {'Authorization': access_token}
-    request = requests.get(url, params=query_params, headers=headers)
+    request = client.get(url, access_token, query_params)
     response = request.json()
     return response["links"]
 
 
 def unauth_request(url):
     query_params = {'q': 'Oxford'}
-    request = requests.get(url, params=query_params)
+    request = client.get(url, params=query_params)
     return request.status_code
 
 
 def not_found_request(url, access_token, query_params):
-    headers = {'Authorization': access_token}
-    request = requests.get(url, params=query_params, headers=headers)
+    request = client.get(url, access_token, query_params)
     return request
 
 
 def blank_result(url, access_token):
     query_params = {'q': 'nosuchbuilding'}
-    headers = {'Authorization': access_token}
-    request = requests.get(url, params=query_params, headers=headers)
+    request = client.get(url, access_token, query_params)
     response = request.json()
 
     if response["data"] == []:
@@ -63,8 +69,7 @@ def blank_result(url, access_token):
 
 def response_time(url, access_token):
     query_params = {'q': 'Oxford'}
-    headers = {'Authorization': access_token}
-    request = requests.get(url, params=query_params, headers=headers)
+    request = client.get(url, access_token, query_params)
     response_time = request.elapsed.total_seconds()
 
     print "API response time: ", response_time, " seconds"
@@ -72,10 +77,19 @@ def response_time(url, access_token):
 
 
 def check_ssl(protocol, url, access_token):
+    # urllib2 bypasses the client's session, so only the outcome is recorded
+    key = client.store.key('SSL {}'.format(protocol), url, {'q': 'Oxford'}) \
+        if client.store is not None else None
+    return client.remember(key, lambda: _check_ssl(protocol, url,
+                                                   access_token))
+
+
+def _check_ssl(protocol, url, access_token):
     try:
         context = ssl.SSLContext(protocol)
         request = urllib2.Request(
-            url + "?q=Oxford", headers={"Authorization": access_token})
+            url + "?q=Oxford",
+            headers={"Authorization": authorization(access_token)})
         urllib2.urlopen(request, context=context)
     except (urllib2.URLError):
         return False
@@ -84,4 +98,4 @@ def check_ssl(protocol, url, access_token):
 
 
 def get_weekly_menu(url):
-    return requests.get(url, allow_redirects=False)
+    return client.get(url, allow_redirects=False)
@@ -0,0 +1,425 @@
+"""
+Load and latency benchmark for the locations and services endpoints.
+
+Drives a weighted mix of the query shapes the integration tests use, either
+with a fixed number of concurrent clients (closed loop) or at a target
+request rate (open loop), and reports throughput and p50/p95/p99 latency per
+shape. Results can be saved as a JSON baseline and later runs compared
+against it, to catch regressions in how queries are built and served.
+
+    python benchmark.py -i configuration.json --concurrency 8 --duration 60
+    python benchmark.py -i configuration.json --rate 20 --save baseline.json
+    python benchmark.py -i configuration.json --rate 20 --compare baseline.json
+
+With --revalidate, requests repeating an earlier one send the ETag of its
+response in If-None-Match, as a caching client would, and the 304s and the
+body bytes on the wire per request show what conditional requests save.
+
+The Server-Timing headers of the responses are collected too, and the mean
+and p95 of every phase of the API (Elasticsearch, mapping, GeoJSON, ...) are
+printed per shape after the latencies; see server_timing.py.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
+from api_client import ApiClient
+from configuration_load import get_single_resource_id, \
+                               get_token_cache, \
+                               get_url
+from server_timing import parse as parse_server_timing, print_breakdown
+
+SEARCH_TERMS = ['Oxford', 'Dixon', 'library', 'engineering', 'Milam Hall',
+                'basketball', 'College of Business Austin']
+DISTANCE_UNITS = ['ft', 'yd', 'm', 'km', 'mi']
+# Around the Valley Library, which the geo tests also query
+CAMPUS_LAT = 44.565066
+CAMPUS_LON = -123.276147
+
+
+def near_campus(rng):
+    return {
+        'lat': round(CAMPUS_LAT + rng.uniform(-0.005, 0.005), 6),
+        'lon': round(CAMPUS_LON + rng.uniform(-0.005, 0.005), 6)
+    }
+
+
+def full_text(urls, rng):
+    return urls['locations'], {'q': rng.choice(SEARCH_TERMS)}
+
+
+def geo(urls, rng):
+    params = near_campus(rng)
+    params['distance'] = rng.randint(1, 500)
+    params['distanceUnit'] = rng.choice(DISTANCE_UNITS)
+    return urls['locations'], params
+
+
+def multi_type(urls, rng):
+    params = near_campus(rng)
+    params.update({'type': ['building', 'dining'], 'distance': 300,
+                   'distanceUnit': 'ft'})
+    return urls['locations'], params
+
+
+def is_open(urls, rng):
+    return urls['locations'], {'isOpen': 'true', 'page[size]': 100}
+
+
+def parking_spaces(urls, rng):
+    return urls['locations'], {
+        'type': 'parking',
+        'adaParkingSpaceCount': rng.randint(0, 5),
+        'motorcycleParkingSpaceCount': rng.randint(0, 5),
+        'evParkingSpaceCount': rng.randint(0, 5)
+    }
+
+
+def geojson(urls, rng):
+    return urls['locations'], {'q': rng.choice(SEARCH_TERMS),
+                               'geojson': 'true'}
+
+
+def get_by_id(urls, rng):
+    return urls['locations'] + '/' + urls['single_resource_id'], None
+
+
+def services(urls, rng):
+    return urls['services'], {'page[size]': 100}
+
+
+# Query shapes by name, each returning the (url, params) of one request
+SHAPES = {
+    'q': full_text,
+    'geo': geo,
+    'multi_type': multi_type,
+    'isOpen': is_open,
+    'parking_spaces': parking_spaces,
+    'geojson': geojson,
+    'getById': get_by_id,
+    'services': services
+}
+
+
+def parse_mix(mix):
+    """Parses "q=3,geo=1" into [(shape, weight)]; "" weighs all equally."""
+    if not mix:
+        return [(shape, 1.0) for shape in sorted(SHAPES)]
+    weights = []
+    for part in mix.split(','):
+        shape, _, weight = part.partition('=')
+        if shape not in SHAPES:
+            raise ValueError('unknown query shape {}, expected one of {}'
+                             .format(shape, ', '.join(sorted(SHAPES))))
+        weights.append((shape, float(weight or 1)))
+    return weights
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    # Rounded first so that 0.07 * 100 = 7.000000000000001 is rank 7, not 8
+    rank = max(1, int(math.ceil(round(fraction * len(sorted_values), 9))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder(object):
+    """
+    Collects latencies, errors and body bytes per shape from the worker
+    threads. 503s, which the API answers with at once when Elasticsearch is
+    saturated or too slow, are counted apart from the other errors as well,
+    and so are 304s. The phases of the Server-Timing headers are kept in
+    milliseconds per shape and phase.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.unavailable = defaultdict(int)
+        self.not_modified = defaultdict(int)
+        self.wire_bytes = defaultdict(int)
+        self.phases = defaultdict(lambda: defaultdict(list))
+
+    def record(self, shape, latency, status, wire_bytes=0, phases=None):
+        """
+        status is the HTTP status, or None when the request failed,
+        wire_bytes the size of the body as sent, compressed or not, and
+        phases the parsed Server-Timing header of the response.
+        """
+        with self.lock:
+            self.latencies[shape].append(latency)
+            self.wire_bytes[shape] += wire_bytes
+            for phase, duration in (phases or {}).items():
+                self.phases[shape][phase].append(duration)
+            if status is None or status >= 400:
+                self.errors[shape] += 1
+            if status == 503:
+                self.unavailable[shape] += 1
+            if status == 304:
+                self.not_modified[shape] += 1
+
+    def summary(self, elapsed):
+        shapes = {}
+        for shape in sorted(self.latencies):
+            latencies = sorted(self.latencies[shape])
+            shapes[shape] = {
+                'requests': len(latencies),
+                'errors': self.errors[shape],
+                'unavailable': self.unavailable[shape],
+                'not_modified': self.not_modified[shape],
+                'wire_bytes': self.wire_bytes[shape] / len(latencies),
+                'throughput': len(latencies) / elapsed,
+                'mean': sum(latencies) / len(latencies),
+                'p50': percentile(latencies, 0.50),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99),
+                'max': latencies[-1],
+                'phases': self.phase_summary(shape)
+            }
+        return shapes
+
+    def phase_summary(self, shape):
+        phases = {}
+        for phase, durations in self.phases[shape].items():
+            durations = sorted(durations)
+            phases[phase] = {
+                'count': len(durations),
+                'mean': sum(durations) / len(durations),
+                'p95': percentile(durations, 0.95)
+            }
+        return phases
+
+
+class Benchmark(object):
+    def __init__(self, client, access_token, urls, mix, seed=None,
+                 revalidate=False):
+        self.client = client
+        self.access_token = access_token
+        self.urls = urls
+        self.shapes = [shape for shape, _ in mix]
+        self.cumulative_weights = []
+        total = 0.0
+        for _, weight in mix:
+            total += weight
+            self.cumulative_weights.append(total)
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.recorder = Recorder()
+        self.revalidate = revalidate
+        # ETag of the last response to each request, by url and params
+        self.etags = {}
+
+    def next_request(self):
+        """Picks a shape by weight and builds its request."""
+        with self.rng_lock:
+            pick = self.rng.random() * self.cumulative_weights[-1]
+            index = next(i for i, total in enumerate(self.cumulative_weights)
+                         if pick < total)
+            shape = self.shapes[index]
+            url, params = SHAPES[shape](self.urls, self.rng)
+        return shape, url, params
+
+    def send(self, shape, url, params, started):
+        """
+        Sends one request and records its latency from started, which for
+        the target-rate mode is when the request was scheduled, so time
+        spent queued behind slow requests counts too.
+        """
+        key = url + '?' + json.dumps(params, sort_keys=True)
+        headers = {}
+        if self.revalidate and key in self.etags:
+            headers['If-None-Match'] = self.etags[key]
+        wire_bytes = 0
+        phases = None
+        try:
+            response = self.client.get(url, self.access_token, params,
+                                       headers=headers)
+            # Read the whole body, as a client would
+            response.content
+            status = response.status_code
+            # Bytes read from the connection, before gzip is decoded
+            wire_bytes = response.raw.tell()
+            if response.headers.get('ETag'):
+                self.etags[key] = response.headers['ETag']
+            phases = parse_server_timing(
+                response.headers.get('Server-Timing'))
+        except Exception:
+            status = None
+        self.recorder.record(shape, time.time() - started, status, wire_bytes,
+                             phases)
+
+    def run_concurrency(self, concurrency, duration):
+        """Closed loop: concurrency clients send requests back to back."""
+        deadline = time.time() + duration
+
+        def worker():
+            while time.time() < deadline:
+                shape, url, params = self.next_request()
+                self.send(shape, url, params, time.time())
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_rate(self, rate, duration, workers):
+        """Open loop: requests are started at a fixed rate per second."""
+        pool = ThreadPool(workers)
+        start = time.time()
+        try:
+            for index in range(int(rate * duration)):
+                scheduled = start + index / float(rate)
+                delay = scheduled - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                shape, url, params = self.next_request()
+                pool.apply_async(self.send, (shape, url, params, scheduled))
+        finally:
+            pool.close()
+            pool.join()
+
+
+def name_width(shapes):
+    """Width of the first column of the tables: the longest shape name."""
+    return max([16] + [len(shape) for shape in shapes])
+
+
+def print_results(shapes):
+    width = name_width(shapes)
+    print('{:<{width}} {:>8} {:>7} {:>6} {:>6} {:>9} {:>9} {:>9} {:>9} {:>9}'
+          .format('shape', 'requests', 'errors', '503s', '304s', 'req/s',
+                  'KB/req', 'p50 ms', 'p95 ms', 'p99 ms', width=width))
+    for shape in sorted(shapes):
+        result = shapes[shape]
+        print('{:<{width}} {:>8} {:>7} {:>6} {:>6} {:>9.2f} {:>9.1f} '
+              '{:>9.1f} {:>9.1f} {:>9.1f}'
+              .format(shape, result['requests'], result['errors'],
+                      result.get('unavailable', 0),
+                      result.get('not_modified', 0), result['throughput'],
+                      result.get('wire_bytes', 0) / 1024.0,
+                      result['p50'] * 1000, result['p95'] * 1000,
+                      result['p99'] * 1000, width=width))
+
+
+def compare_to_baseline(shapes, baseline, tolerance):
+    """
+    Prints the p95 change of every shape against the baseline and returns
+    the shapes whose p95 grew by more than tolerance (a fraction).
+    """
+    regressions = []
+    width = name_width(shapes)
+    print('\n{:<{width}} {:>12} {:>12} {:>8}'.format(
+        'shape', 'baseline p95', 'p95', 'change', width=width))
+    for shape in sorted(shapes):
+        if shape not in baseline['shapes']:
+            continue
+        before = baseline['shapes'][shape]['p95']
+        after = shapes[shape]['p95']
+        change = (after - before) / before
+        print('{:<{width}} {:>12.1f} {:>12.1f} {:>+7.0%}'.format(
+            shape, before * 1000, after * 1000, change, width=width))
+        if change > tolerance:
+            regressions.append(shape)
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Load and latency benchmark for the locations API')
+    parser.add_argument('-i', dest='config_path', required=True,
+                        help='configuration.json of the integration tests')
+    parser.add_argument('--mix', default='',
+                        help='weighted query shapes, e.g. q=3,geo=2,getById=1'
+                             ' (default: every shape equally); shapes: ' +
+                             ', '.join(sorted(SHAPES)))
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--concurrency', type=int, default=4,
+                      help='concurrent clients sending back to back'
+                           ' (default: 4)')
+    mode.add_argument('--rate', type=float,
+                      help='target requests per second instead')
+    parser.add_argument('--workers', type=int, default=64,
+                        help='threads available to --rate (default: 64)')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='seconds to run (default: 30)')
+    parser.add_argument('--seed', type=int, help='seed for the query mix')
+    parser.add_argument('--revalidate', action='store_true',
+                        help='send the ETag of the last response to the same'
+                             ' request in If-None-Match')
+    parser.add_argument('--save', help='save the results as a JSON baseline')
+    parser.add_argument('--compare',
+                        help='JSON baseline to compare p95 latencies with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='p95 growth over the baseline that fails the'
+                             ' comparison (default: 0.2)')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    url = get_url(args.config_path)
+    urls = {
+        'locations': url + '/locations',
+        'services': url + '/services',
+        'single_resource_id': get_single_resource_id(args.config_path)
+    }
+    access_token = get_token_cache(args.config_path)
+    # Fetch the token before timing starts
+    access_token.get()
+
+    pool_size = args.workers if args.rate else args.concurrency
+    benchmark = Benchmark(ApiClient(pool_size=pool_size), access_token, urls,
+                          mix, args.seed, args.revalidate)
+    start = time.time()
+    if args.rate:
+        benchmark.run_rate(args.rate, args.duration, args.workers)
+    else:
+        benchmark.run_concurrency(args.concurrency, args.duration)
+    elapsed = time.time() - start
+
+    shapes = benchmark.recorder.summary(elapsed)
+    print_results(shapes)
+    if any(result['phases'] for result in shapes.values()):
+        print_breakdown(shapes)
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump({
+                'url': url,
+                'mode': {'rate': args.rate} if args.rate else
+                        {'concurrency': args.concurrency},
+                'duration': elapsed,
+                'mix': args.mix,
+                'revalidate': args.revalidate,
+                'shapes': shapes
+            }, baseline_file, indent=4, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_to_baseline(shapes, baseline, args.tolerance)
+        if regressions:
+            print('\np95 regressed by more than {:.0%}: {}'.format(
+                args.tolerance, ', '.join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
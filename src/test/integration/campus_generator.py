@@ -0,0 +1,471 @@
+"""
+Generates a synthetic campus of location and service documents for scale
+testing, in the Elasticsearch _source shape of esMockData.json.
+
+Locations get Polygon or MultiPolygon geometries with closed,
+counterclockwise rings around a geoLocation, weekday openHours intervals for
+the current week, parking zone groups and space counts, synonyms and tags.
+Services link to a building or dining location through locationId and
+relationships, and those locations link back to them. Every document is
+derived from the seed and its index alone, so the same seed always produces
+the same campus and documents are written as they are generated, whatever
+the scale.
+
+    python campus_generator.py --locations 30000 --bulk campus.ndjson
+    python campus_generator.py --locations 3000 --seed 7 \\
+        --mix building=6,dining=1,parking=2 \\
+        --api-locations locations.json --api-services services.json
+
+The bulk NDJSON can be loaded into a cluster with the _bulk API or served by
+query_shape_fixture.py; the API-shaped JSON matches what /locations and
+/services return, for dataDiffCheck and the integration checks.
+"""
+from __future__ import print_function
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import sys
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+API_URL = 'https://api.oregonstate.edu/v1'
+
+DEFAULT_TYPE_MIX = 'building=6,dining=1,parking=2,cultural-center=0.3,other=0.7'
+DEFAULT_CAMPUS_MIX = 'corvallis=8,extension=1,cascades=1,hmsc=0.5,other=0.2'
+
+# (latitude, longitude, spread in degrees) of each campus
+CAMPUS_CENTERS = {
+    'corvallis': (44.5646, -123.2789, 0.012),
+    'cascades': (44.0455, -121.3326, 0.004),
+    'hmsc': (44.6232, -124.0448, 0.003),
+    'other': (44.9429, -123.0351, 0.3),
+    # Extension offices are spread across the state
+    'extension': (44.0, -120.5, 2.0)
+}
+
+SURNAMES = ['Kidder', 'Milam', 'Weniger', 'Gilkey', 'Bexell', 'Dearborn',
+            'Kearney', 'Strand', 'Gilbert', 'Furman', 'Batcheller', 'Covell',
+            'Graf', 'Johnson', 'Linus', 'Moreland', 'Nash', 'Owen', 'Pearl',
+            'Rogers', 'Snell', 'Waldo', 'Withycombe', 'Wiegand', 'Hovland']
+SUBJECTS = ['Engineering', 'Forestry', 'Agriculture', 'Oceanography',
+            'Chemistry', 'Physics', 'Business', 'Music', 'Pharmacy', 'Art',
+            'Nursing', 'Veterinary', 'Education', 'Mathematics', 'Geology']
+BUILDING_KINDS = ['Hall', 'Building', 'Lab', 'Center', 'Annex', 'Library',
+                  'Pavilion', 'Greenhouse']
+DINING_KINDS = ['Cafe', 'Grill', 'Deli', 'Bistro', 'Market', 'Coffee',
+                'Kitchen']
+SYNONYMS = {
+    'Engineering': ['engineering', 'computer science', 'robotics'],
+    'Music': ['concert', 'recital'],
+    'Business': ['college of business', 'mba'],
+    'Library': ['books', 'study'],
+    'Pavilion': ['basketball', 'arena'],
+    'Coffee': ['espresso', 'latte']
+}
+PARKING_ZONE_GROUPS = ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C', 'D', 'R']
+SERVICE_KINDS = ['Printing', 'Advising', 'Tutoring', 'Help Desk',
+                 'Mail Center', 'Lactation Room', 'Food Pantry', 'ATM']
+COUNTIES = ['Benton', 'Lane', 'Linn', 'Marion', 'Deschutes', 'Jackson',
+            'Klamath', 'Umatilla', 'Coos', 'Clatsop', 'Malheur', 'Wasco']
+
+METERS_PER_DEGREE = 111320.0
+# Pacific time is 7 or 8 hours behind UTC
+UTC_OFFSET_HOURS = 7
+
+
+def parse_mix(mix):
+    """Parses "building=6,dining=1" into [(name, weight)]."""
+    weights = []
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights.append((name.strip(), float(weight or 1)))
+    return weights
+
+
+def weighted_choice(rng, weights):
+    pick = rng.random() * sum(weight for _, weight in weights)
+    for name, weight in weights:
+        pick -= weight
+        if pick < 0:
+            return name
+    return weights[-1][0]
+
+
+def document_id(seed, kind, index):
+    """A 32 hex digit id like the ones the locations ETL assigns."""
+    return hashlib.md5('{}-{}-{}'.format(seed, kind, index)
+                       .encode('utf-8')).hexdigest()
+
+
+def java_hash_code(attributes):
+    """A signed 32-bit content hash, standing in for the ETL's hashCode."""
+    checksum = zlib.crc32(json.dumps(attributes, sort_keys=True)
+                          .encode('utf-8')) & 0xffffffff
+    return checksum - (1 << 32) if checksum >= 1 << 31 else checksum
+
+
+def polygon_ring(rng, lat, lon, radius_meters, vertices):
+    """
+    A closed, counterclockwise ring of vertices [lon, lat] around (lat, lon),
+    as GeoJSON expects for exterior rings.
+    """
+    # One vertex per equal slice of the circle keeps the ring simple and
+    # its area well away from zero
+    step = 2 * math.pi / vertices
+    angles = [step * vertex + rng.uniform(0, step * 0.8)
+              for vertex in range(vertices)]
+    lon_scale = METERS_PER_DEGREE * math.cos(math.radians(lat))
+    ring = []
+    for angle in angles:
+        distance = radius_meters * rng.uniform(0.6, 1.0)
+        ring.append([round(lon + distance * math.cos(angle) / lon_scale, 6),
+                     round(lat + distance * math.sin(angle) /
+                           METERS_PER_DEGREE, 6)])
+    ring.append(list(ring[0]))
+    return ring
+
+
+def geometry(rng, lat, lon, location_type, args):
+    radius = rng.uniform(15, 40) if location_type != 'parking' \
+        else rng.uniform(30, 90)
+    vertices = lambda: rng.randint(args.min_vertices, args.max_vertices)
+    if rng.random() >= args.multipolygon_fraction:
+        return {'type': 'Polygon',
+                'coordinates': [polygon_ring(rng, lat, lon, radius,
+                                             vertices())]}
+    polygons = []
+    for part in range(rng.randint(2, 5)):
+        # Wings of a building, a few building widths apart
+        offset = 2.5 * radius * part
+        part_lon = lon + offset / (METERS_PER_DEGREE *
+                                   math.cos(math.radians(lat)))
+        polygons.append([polygon_ring(rng, lat, part_lon, radius / 2,
+                                      vertices())])
+    return {'type': 'MultiPolygon', 'coordinates': polygons}
+
+
+def open_hours(rng, week_start, always_some):
+    """
+    openHours keyed by ISO weekday ("1" is Monday) with UTC intervals on the
+    dates of the week starting at week_start, as the locations ETL writes
+    them for the current week.
+    """
+    hours = {}
+    opens = rng.choice([6, 7, 8, 10])
+    closes = rng.choice([14, 17, 19, 22])
+    for day in range(1, 8):
+        date = week_start + timedelta(days=day - 1)
+        if day >= 6 and not always_some and rng.random() < 0.6:
+            hours[str(day)] = []
+            continue
+        slots = [(opens, closes)]
+        if rng.random() < 0.15:
+            # Closed over lunch
+            slots = [(opens, 11), (13, closes)]
+        hours[str(day)] = [{
+            'start': (date + timedelta(hours=start + UTC_OFFSET_HOURS))
+            .strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'end': (date + timedelta(hours=end + UTC_OFFSET_HOURS))
+            .strftime('%Y-%m-%dT%H:%M:%SZ')
+        } for start, end in slots]
+    return hours
+
+
+def location_name(rng, index, location_type):
+    if location_type == 'dining':
+        return '{} {}'.format(rng.choice(SURNAMES + SUBJECTS),
+                              rng.choice(DINING_KINDS)), 'dining'
+    if location_type == 'parking':
+        return 'Parking Lot {}'.format(index), 'parking'
+    kind = rng.choice(BUILDING_KINDS)
+    if rng.random() < 0.5:
+        return '{} {}'.format(rng.choice(SURNAMES), kind), kind
+    return '{} {} {}'.format(rng.choice(SUBJECTS), kind, index % 97), kind
+
+
+def location_source(seed, index, location_type, campus, service_ids, args):
+    """The ES _source document of location index."""
+    rng = random.Random(seed * 1000003 + index)
+    center_lat, center_lon, spread = CAMPUS_CENTERS.get(
+        campus, CAMPUS_CENTERS['other'])
+    lat = round(center_lat + rng.uniform(-spread, spread), 6)
+    lon = round(center_lon + rng.uniform(-spread, spread) * 1.4, 6)
+    name, kind = location_name(rng, index, location_type)
+    location_id = document_id(seed, 'locations', index)
+
+    synonyms = []
+    for word in name.split() + [kind]:
+        synonyms.extend(SYNONYMS.get(word, []))
+    has_hours = location_type == 'dining' or rng.random() < 0.3
+
+    attributes = {
+        'name': name,
+        'abbreviation': ''.join(word[0] for word in name.split()).upper() +
+                        str(index),
+        'tags': ['cultural-center'] if location_type == 'cultural-center'
+                else [],
+        'openHours': open_hours(rng, args.week_start,
+                                location_type == 'dining')
+                     if has_hours else {},
+        # Cultural centers are searched by tag and indexed as buildings
+        'type': 'building' if location_type == 'cultural-center'
+                else location_type,
+        'parent': None,
+        'locationId': None,
+        'geoLocation': {'lat': lat, 'lon': lon},
+        'geometry': geometry(rng, lat, lon, location_type, args),
+        'summary': 'Synthetic {} {}'.format(location_type, index),
+        'description': None,
+        'address': '{} SW Campus Way'.format(100 + index % 9000),
+        'city': 'Corvallis' if campus == 'corvallis' else None,
+        'state': 'OR',
+        'zip': '97331' if campus == 'corvallis' else None,
+        'county': None,
+        'telephone': None,
+        'fax': None,
+        'thumbnails': [],
+        'images': [],
+        'departments': [],
+        'website': None,
+        'sqft': rng.randint(500, 200000)
+                if location_type in ('building', 'cultural-center') else None,
+        'calendar': None,
+        'campus': campus,
+        'giRestroomCount': rng.choice([0, 0, 0, 1, 2, 3]),
+        'giRestroomLimit': rng.random() < 0.2,
+        'giRestroomLocations': None,
+        'synonyms': synonyms
+    }
+    if attributes['giRestroomCount']:
+        attributes['giRestroomLocations'] = ', '.join(
+            str(rng.randint(100, 450))
+            for _ in range(attributes['giRestroomCount']))
+    if campus == 'extension':
+        # The integration tests expect complete extension office contacts
+        county = rng.choice(COUNTIES)
+        attributes.update({
+            'name': '{} County Extension Office {}'.format(county, index),
+            'type': 'building',
+            'county': county,
+            'city': county + ' City',
+            'zip': '97{:03d}'.format(rng.randint(0, 999)),
+            'telephone': '541-{:03d}-{:04d}'.format(rng.randint(200, 999),
+                                                    rng.randint(0, 9999)),
+            'fax': '541-{:03d}-{:04d}'.format(rng.randint(200, 999),
+                                              rng.randint(0, 9999)),
+            'website': 'https://extension.oregonstate.edu/{}'.format(
+                county.lower())
+        })
+    if location_type == 'dining':
+        attributes['weeklyMenu'] = \
+            'https://food.oregonstate.edu/menu/{}'.format(location_id)
+    if location_type == 'parking':
+        attributes.update({
+            'parkingZoneGroup': rng.choice(PARKING_ZONE_GROUPS),
+            'adaParkingSpaceCount': rng.randint(0, 8),
+            'evParkingSpaceCount': rng.randint(0, 6),
+            'motorcycleParkingSpaceCount': rng.randint(0, 10)
+        })
+    attributes['hashCode'] = java_hash_code(attributes)
+
+    return {
+        'id': location_id,
+        'type': 'locations',
+        'attributes': attributes,
+        'links': {'self': '{}/locations/{}'.format(API_URL, location_id)},
+        'relationships': {
+            'services': {'data': [{'id': service_id, 'type': 'services'}
+                                  for service_id in service_ids]}
+        } if service_ids else None
+    }
+
+
+def service_source(seed, index, location_id, args):
+    """The ES _source document of service index, offered at location_id."""
+    rng = random.Random(seed * 1000003 + index + (1 << 40))
+    service_id = document_id(seed, 'services', index)
+    attributes = {
+        'name': '{} {}'.format(rng.choice(SERVICE_KINDS), index),
+        'tags': [],
+        'openHours': open_hours(rng, args.week_start, True),
+        'type': 'services',
+        'parent': None,
+        'locationId': location_id
+    }
+    attributes['hashCode'] = java_hash_code(attributes)
+    return {
+        'id': service_id,
+        'type': 'services',
+        'attributes': attributes,
+        'links': {'self': '{}/services/{}'.format(API_URL, service_id)},
+        'relationships': {
+            'locations': {'data': [{'id': location_id,
+                                    'type': 'locations'}]}
+        }
+    }
+
+
+def to_api(source):
+    """Maps a _source document to the API response shape, as LocationMapper
+    does."""
+    resource = dict(source)
+    attributes = dict(source['attributes'])
+    if source['type'] == 'services':
+        attributes.pop('type', None)
+    else:
+        geo_location = attributes.get('geoLocation') or {}
+        attributes['latitude'] = str(geo_location.get('lat'))
+        attributes['longitude'] = str(geo_location.get('lon'))
+    for attribute in ('geoLocation', 'parent', 'locationId', 'hashCode'):
+        attributes.pop(attribute, None)
+    resource['attributes'] = attributes
+    return resource
+
+
+class JsonArrayWriter(object):
+    """Writes an API result object one resource at a time."""
+    def __init__(self, path):
+        self.file = open(path, 'w') if path else None
+        self.separator = ''
+        if self.file:
+            self.file.write('{"links": {}, "data": [')
+
+    def write(self, resource):
+        if self.file:
+            self.file.write(self.separator + json.dumps(resource))
+            self.separator = ',\n'
+
+    def close(self):
+        if self.file:
+            self.file.write(']}\n')
+            self.file.close()
+
+
+def plan(args):
+    """
+    Picks every location's type and campus and every service's location up
+    front, as small tuples, so relationships are known before any document
+    is written.
+    """
+    rng = random.Random(args.seed)
+    type_mix = parse_mix(args.mix)
+    campus_mix = parse_mix(args.campus_mix)
+    locations = []
+    for _ in range(args.locations):
+        location_type = weighted_choice(rng, type_mix)
+        # Extension offices are all buildings
+        campus = weighted_choice(rng, campus_mix) \
+            if location_type in ('building', 'cultural-center') \
+            else weighted_choice(rng, [(name, weight)
+                                       for name, weight in campus_mix
+                                       if name != 'extension'])
+        locations.append((location_type, campus))
+
+    hosts = [index for index, (location_type, _) in enumerate(locations)
+             if location_type in ('building', 'dining')]
+    services = defaultdict(list)
+    service_locations = []
+    for index in range(args.services if hosts else 0):
+        host = rng.choice(hosts)
+        services[host].append(document_id(args.seed, 'services', index))
+        service_locations.append(host)
+    return locations, services, service_locations
+
+
+def generate(args):
+    locations, services, service_locations = plan(args)
+    bulk = open(args.bulk, 'w') if args.bulk else None
+    api_locations = JsonArrayWriter(args.api_locations)
+    api_services = JsonArrayWriter(args.api_services)
+    try:
+        for index, (location_type, campus) in enumerate(locations):
+            source = location_source(args.seed, index, location_type, campus,
+                                     services.get(index), args)
+            if bulk:
+                bulk.write(json.dumps({'index': {
+                    '_index': args.locations_index,
+                    '_type': args.locations_type, '_id': source['id']}}) +
+                    '\n' + json.dumps(source) + '\n')
+            api_locations.write(to_api(source))
+
+        for index, host in enumerate(service_locations):
+            source = service_source(args.seed, index,
+                                    document_id(args.seed, 'locations', host),
+                                    args)
+            if bulk:
+                bulk.write(json.dumps({'index': {
+                    '_index': args.services_index,
+                    '_type': args.services_type, '_id': source['id']}}) +
+                    '\n' + json.dumps(source) + '\n')
+            api_services.write(to_api(source))
+    finally:
+        if bulk:
+            bulk.close()
+        api_locations.close()
+        api_services.close()
+    return len(locations), len(service_locations)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic campus for scale testing')
+    parser.add_argument('--locations', type=int, default=3000,
+                        help='number of locations (default: 3000)')
+    parser.add_argument('--services', type=int,
+                        help='number of services (default: a tenth of the'
+                             ' locations)')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='seed; the same seed gives the same campus')
+    parser.add_argument('--mix', default=DEFAULT_TYPE_MIX,
+                        help='weighted location types (default: {})'
+                             .format(DEFAULT_TYPE_MIX))
+    parser.add_argument('--campus-mix', default=DEFAULT_CAMPUS_MIX,
+                        help='weighted campuses (default: {})'
+                             .format(DEFAULT_CAMPUS_MIX))
+    parser.add_argument('--multipolygon-fraction', type=float, default=0.1,
+                        help='share of MultiPolygon geometries'
+                             ' (default: 0.1)')
+    parser.add_argument('--min-vertices', type=int, default=4,
+                        help='fewest vertices per ring (default: 4)')
+    parser.add_argument('--max-vertices', type=int, default=40,
+                        help='most vertices per ring (default: 40)')
+    parser.add_argument('--week-start',
+                        help='Monday of the openHours week, YYYY-MM-DD'
+                             ' (default: this week)')
+    parser.add_argument('--bulk', help='write ES bulk NDJSON here')
+    parser.add_argument('--api-locations',
+                        help='write a /locations shaped response here')
+    parser.add_argument('--api-services',
+                        help='write a /services shaped response here')
+    parser.add_argument('--locations-index', default='locations')
+    parser.add_argument('--locations-type', default='locations')
+    parser.add_argument('--services-index', default='services')
+    parser.add_argument('--services-type', default='services')
+    args = parser.parse_args(argv)
+
+    if args.services is None:
+        args.services = args.locations // 10
+    if args.min_vertices < 3 or args.max_vertices < args.min_vertices:
+        parser.error('rings need at least 3 vertices and'
+                     ' --max-vertices >= --min-vertices')
+    if args.week_start:
+        args.week_start = datetime.strptime(args.week_start, '%Y-%m-%d')
+    else:
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0,
+                                          microsecond=0)
+        args.week_start = today - timedelta(days=today.weekday())
+    if not (args.bulk or args.api_locations or args.api_services):
+        parser.error('nothing to write; give --bulk, --api-locations or'
+                     ' --api-services')
+    return args
+
+
+if __name__ == '__main__':
+    arguments = parse_args(sys.argv[1:])
+    location_count, service_count = generate(arguments)
+    print('{} locations and {} services'.format(location_count,
+                                                service_count))
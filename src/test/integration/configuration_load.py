@@ -1,11 +1,17 @@
 import json
 
-import requests
+from api_client import TokenCache, client
+
+# Parsed configuration files and token caches, by config_path
+config_data_cache = {}
+token_caches = {}
 
 
 def get_config_data(config_path):
-    config_data_file = open(config_path)
-    return json.load(config_data_file)
+    if config_path not in config_data_cache:
+        with open(config_path) as config_data_file:
+            config_data_cache[config_path] = json.load(config_data_file)
+    return config_data_cache[config_path]
 
 
 def get_url(config_path):
@@ -13,19 +19,22 @@ def get_url(config_path):
     return config_data["hostname"] + config_data["version"]
 
 
+def get_token_cache(config_path):
+    """
+    Returns the TokenCache for config_path. The api_request helpers accept
+    it in place of an access token and refresh the token when it expires.
+    """
+    if config_path not in token_caches:
+        config_data = get_config_data(config_path)
+        token_caches[config_path] = TokenCache(config_data["token_api"],
+                                               config_data["client_id"],
+                                               config_data["client_secret"],
+                                               client.session)
+    return token_caches[config_path]
+
+
 def get_access_token(config_path):
-    config_data = get_config_data(config_path)
-    access_token_url = config_data["token_api"]
-    client_id = config_data["client_id"]
-    client_secret = config_data["client_secret"]
-    post_data = {
-        'client_id': client_id,
-        'client_secret': client_secret,
-        'grant_type': 'client_credentials'
-    }
-    request = requests.post(access_token_url, data=post_data)
-    response = request.json()
-    return 'Bearer ' + response["access_token"]
+    return get_token_cache(config_path).get()
 
 
 def get_single_resource_id(config_path):
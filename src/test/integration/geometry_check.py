@@ -0,0 +1,288 @@
+"""
+Validates the geometry of every location at once.
+
+All rings are packed into one flat array of coordinates with offset tables,
+so that closure, vertex counts, winding order, coordinate ranges, degenerate
+areas and whether a location's latitude/longitude lies within its
+geometry's bounding box are each checked in one vectorized pass, however
+many locations there are.
+
+    python geometry_check.py -i configuration.json
+    python geometry_check.py locations.json
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+import time
+from itertools import chain
+
+import numpy as np
+
+# A closed ring needs three distinct positions and the repeated first one
+MIN_RING_VERTICES = 4
+# Rings enclosing less than this (in square degrees, roughly a square metre
+# at campus latitudes) are degenerate
+MIN_RING_AREA = 1e-10
+
+
+class PackedRings(object):
+    """
+    Every ring of a list of locations:
+
+    - coordinates: (vertices, 2) array of [lon, lat], all rings back to back
+    - ring_offsets: ring r is coordinates[ring_offsets[r]:ring_offsets[r+1]]
+    - ring_location: index of the location each ring belongs to
+    - ring_is_hole: whether a ring is an interior ring of its polygon
+    - location_ids, latitudes, longitudes: per location, NaN when missing
+
+    Rings whose positions aren't [lon, lat] pairs of numbers can't be
+    packed; the ids of their locations are listed in malformed instead.
+    """
+    def __init__(self, locations):
+        try:
+            self._pack(locations, check_rings=False)
+        except (TypeError, ValueError):
+            # Checking every ring is slower, so it's only done once packing
+            # them all at once has failed
+            self._pack(locations, check_rings=True)
+
+    def _pack(self, locations, check_rings):
+        self.location_ids = []
+        self.malformed = []
+        latitudes = []
+        longitudes = []
+        pairs = []
+        counts = []
+        ring_location = []
+        ring_is_hole = []
+
+        for index, location in enumerate(locations):
+            attributes = location.get('attributes') or {}
+            self.location_ids.append(str(location.get('id')))
+            latitudes.append(to_float(attributes.get('latitude')))
+            longitudes.append(to_float(attributes.get('longitude')))
+            for ring, is_hole in iter_rings(attributes.get('geometry')):
+                if check_rings and not is_ring_of_pairs(ring):
+                    self.malformed.append(self.location_ids[-1])
+                    continue
+                pairs.extend(ring)
+                counts.append(len(ring))
+                ring_location.append(index)
+                ring_is_hole.append(is_hole)
+
+        if set(map(len, pairs)) - {2}:
+            raise ValueError('positions are not [lon, lat] pairs')
+        # Twice as fast as np.array on the nested lists
+        self.coordinates = np.fromiter(chain.from_iterable(pairs), float,
+                                       2 * len(pairs)).reshape(-1, 2)
+        self.ring_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.ring_offsets[1:])
+        self.ring_location = np.array(ring_location, dtype=np.int64)
+        self.ring_is_hole = np.array(ring_is_hole, dtype=bool)
+        self.latitudes = np.array(latitudes, dtype=float)
+        self.longitudes = np.array(longitudes, dtype=float)
+
+    @property
+    def ring_counts(self):
+        return np.diff(self.ring_offsets)
+
+    @property
+    def vertex_ring(self):
+        """The ring of every vertex."""
+        return np.repeat(np.arange(len(self.ring_counts)), self.ring_counts)
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def iter_rings(geometry):
+    """Yields (ring, is_hole) for the rings of a Polygon or MultiPolygon."""
+    if not geometry:
+        return
+    if geometry.get('type') == 'Polygon':
+        polygons = [geometry.get('coordinates') or []]
+    elif geometry.get('type') == 'MultiPolygon':
+        polygons = geometry.get('coordinates') or []
+    else:
+        return
+    for polygon in polygons:
+        for index, ring in enumerate(polygon or []):
+            yield ring, index > 0
+
+
+def is_ring_of_pairs(ring):
+    if not isinstance(ring, list):
+        return False
+    try:
+        positions = np.array(ring, dtype=float)
+    except (TypeError, ValueError):
+        return False
+    return not ring or (positions.ndim == 2 and positions.shape[1] == 2)
+
+
+def ring_signed_areas(rings):
+    """
+    Twice the signed (shoelace) area of every ring: positive when
+    counterclockwise.
+    """
+    lon = rings.coordinates[:, 0]
+    lat = rings.coordinates[:, 1]
+    following = np.arange(1, len(lon) + 1)
+    starts = rings.ring_offsets[:-1]
+    ends = rings.ring_offsets[1:]
+    nonempty = ends > starts
+    # The last vertex of a ring wraps around to its first one
+    following[ends[nonempty] - 1] = starts[nonempty]
+    cross = lon * lat[following] - lon[following] * lat
+    return np.bincount(rings.vertex_ring, weights=cross,
+                       minlength=len(starts))
+
+
+def geometry_problems(locations, min_area=MIN_RING_AREA, bbox_margin=0.0):
+    """
+    Checks the geometry of every location and returns a description of each
+    problem found:
+
+    - a ring isn't closed, has fewer than MIN_RING_VERTICES positions or
+      encloses less than min_area
+    - an exterior ring isn't counterclockwise or a hole isn't clockwise
+      (https://tools.ietf.org/html/rfc7946#section-3.1.6)
+    - a position is outside [-180, 180] longitude or [-90, 90] latitude
+    - the location's latitude/longitude lies outside the bounding box of
+      its geometry, grown by bbox_margin degrees
+    """
+    rings = PackedRings(locations)
+    problems = []
+    for location_id in sorted(set(rings.malformed)):
+        problems.append('location {} has a ring that is not a list of'
+                        ' [lon, lat] numbers'.format(location_id))
+
+    ids = rings.location_ids
+    counts = rings.ring_counts
+    starts = rings.ring_offsets[:-1]
+    ends = rings.ring_offsets[1:]
+    coordinates = rings.coordinates
+    nonempty = counts > 0
+
+    # Index of every ring within its own location, for the messages
+    first_ring = np.zeros(len(counts), dtype=np.int64)
+    if len(counts):
+        new_location = np.ones(len(counts), dtype=bool)
+        new_location[1:] = rings.ring_location[1:] != rings.ring_location[:-1]
+        first_ring = np.maximum.accumulate(
+            np.where(new_location, np.arange(len(counts)), 0))
+
+    def report(ring_mask, message):
+        for ring in np.flatnonzero(ring_mask):
+            problems.append('location {} ring {}: {}'.format(
+                ids[rings.ring_location[ring]], ring - first_ring[ring],
+                message))
+
+    report(counts < MIN_RING_VERTICES,
+           'fewer than {} positions'.format(MIN_RING_VERTICES))
+
+    firsts = coordinates[starts[nonempty]]
+    lasts = coordinates[ends[nonempty] - 1]
+    unclosed = np.zeros(len(counts), dtype=bool)
+    unclosed[nonempty] = np.any(firsts != lasts, axis=1)
+    report(unclosed, 'first and last positions differ')
+
+    out_of_range = (np.abs(coordinates[:, 0]) > 180) | \
+        (np.abs(coordinates[:, 1]) > 90)
+    report(np.bincount(rings.vertex_ring, weights=out_of_range,
+                       minlength=len(counts)) > 0,
+           'positions out of the longitude/latitude range')
+
+    areas = ring_signed_areas(rings) / 2
+    valid = (counts >= MIN_RING_VERTICES) & ~unclosed
+    report(valid & (np.abs(areas) < min_area), 'degenerate area')
+    sized = valid & (np.abs(areas) >= min_area)
+    report(sized & ~rings.ring_is_hole & (areas < 0),
+           'exterior ring is clockwise')
+    report(sized & rings.ring_is_hole & (areas > 0),
+           'hole is counterclockwise')
+
+    problems.extend(bbox_problems(rings, bbox_margin))
+    return problems
+
+
+def bbox_problems(rings, margin):
+    """Locations whose latitude/longitude is outside their geometry's
+    bounding box."""
+    counts = rings.ring_counts
+    if not counts.sum():
+        return []
+    # The vertices of a location's rings are contiguous, so its bounding box
+    # is a reduction over one slice per location
+    vertex_location = np.repeat(rings.ring_location, counts)
+    located, location_starts = np.unique(vertex_location, return_index=True)
+    lon = rings.coordinates[:, 0]
+    lat = rings.coordinates[:, 1]
+    min_lon = np.minimum.reduceat(lon, location_starts) - margin
+    max_lon = np.maximum.reduceat(lon, location_starts) + margin
+    min_lat = np.minimum.reduceat(lat, location_starts) - margin
+    max_lat = np.maximum.reduceat(lat, location_starts) + margin
+    point_lon = rings.longitudes[located]
+    point_lat = rings.latitudes[located]
+    with np.errstate(invalid='ignore'):
+        outside = (point_lon < min_lon) | (point_lon > max_lon) | \
+            (point_lat < min_lat) | (point_lat > max_lat)
+    return ['location {}: latitude/longitude {}, {} outside the geometry'
+            ' bounding box'.format(rings.location_ids[location],
+                                   rings.latitudes[location],
+                                   rings.longitudes[location])
+            for location in located[outside]]
+
+
+def load_locations(path):
+    """Reads the locations of a /locations response saved to a file."""
+    with open(path) as locations_file:
+        return json.load(locations_file)['data']
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Check the geometry of every location')
+    parser.add_argument('-i', dest='config_path',
+                        help='configuration.json of the integration tests, to'
+                             ' check the locations the API serves')
+    parser.add_argument('files', nargs='*',
+                        help='/locations responses saved to files')
+    parser.add_argument('--min-area', type=float, default=MIN_RING_AREA,
+                        help='ring area in square degrees below which a ring'
+                             ' is degenerate (default: %(default)s)')
+    parser.add_argument('--bbox-margin', type=float, default=0.0,
+                        help='degrees latitude/longitude may lie outside the'
+                             ' geometry bounding box (default: 0)')
+    args = parser.parse_args(argv)
+    if not args.config_path and not args.files:
+        parser.error('give -i or files to check')
+
+    locations = []
+    for path in args.files:
+        locations.extend(load_locations(path))
+    if args.config_path:
+        from api_request import all_results
+        from configuration_load import get_token_cache, get_url
+        locations.extend(all_results(get_url(args.config_path) + '/locations',
+                                     get_token_cache(args.config_path),
+                                     page_size=2000))
+
+    start = time.time()
+    problems = geometry_problems(locations, args.min_area, args.bbox_margin)
+    elapsed = time.time() - start
+    for problem in problems:
+        print(problem)
+    print('{} problems in {} locations, checked in {:.3f}s'.format(
+        len(problems), len(locations), elapsed), file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
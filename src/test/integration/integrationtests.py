@@ -3,13 +3,16 @@ import ssl
 import sys
 import unittest
 from datetime import datetime
-from random import randint
+from random import randint, seed
 
 import geojson
 
-from api_request import blank_result, \
+from api_client import client
+from api_request import all_results, \
+                        batch_request, \
+                        blank_result, \
                         check_ssl, \
-                        get_buildings_with_services, \
+                        export_results, \
                         id_request, \
                         not_found_request, \
                         query_request, \
@@ -17,37 +20,52 @@ from api_request import blank_result, \
                         results_with_links, \
                         unauth_request, \
                         get_weekly_menu
-from configuration_load import get_access_token, \
-                               get_single_resource_id, \
+from configuration_load import get_single_resource_id, \
+                               get_token_cache, \
                                get_url
+from geometry_check import geometry_problems
+from integrity_check import location_service_problems, \
+                            services_by_location
+from open_hours_check import build_index, check_api
+from response_store import ResponseStore
+
+RECORDING_SEED = 20180613
 
 
 class gateway_tests(unittest.TestCase):
     def test_services(self):
-        buildings = get_buildings_with_services(services_url, access_token)
-        query_params = {'page[size]': 500}
-
-        for building_id in buildings:
-            # Test that a building's service links back to the same building
-            building_object = id_request(locations_url, access_token,
-                                         building_id)
-            for service in building_object['data']['relationships'][
-                    'services']['data']:
-                service_object = id_request(services_url, access_token,
-                                            service['id'])
-                parent_id = service_object['data']['relationships'][
-                    'locations']['data'][0]['id']
-
-                self.assertEqual(building_id, str(parent_id))
-
-            # Test that the relationships object and the services endpoint
-            # have the same number of services
+        # Pull every location and service in a few bulk pages and check the
+        # relationships between them in memory
+        locations = list(all_results(locations_url, access_token, {},
+                                     bulk_page_size))
+        services = list(all_results(services_url, access_token, {},
+                                    bulk_page_size))
+        self.assertEqual(location_service_problems(locations, services), [])
+
+        # Every location with services, fetched in batches with its services
+        # included, and the /services sub-resource of the first of them,
+        # agree with the services linking back to them
+        grouped = services_by_location(services)
+        building_ids = sorted(grouped)
+        for start in range(0, len(building_ids), max_batch_size):
+            batch_ids = building_ids[start:start + max_batch_size]
+            batch = batch_request(locations_url, access_token, batch_ids,
+                                  include='services')
+            self.assertEqual([str(building['id'])
+                              for building in batch['data']], batch_ids)
+            included = services_by_location(batch['included'])
+            for building_id in batch_ids:
+                self.assertEqual(included[building_id],
+                                 grouped[building_id])
+
+        for building_id in building_ids[:1]:
             request_url = locations_url + "/" + building_id + "/services"
             building_services = query_request(request_url, access_token, "get",
-                                              query_params).json()
+                                              {'page[size]': 500}).json()
             self.assertEqual(
-                len(building_object['data']['relationships']['services'][
-                    'data']), len(building_services['data']))
+                set(str(service['id'])
+                    for service in building_services['data']),
+                grouped[building_id])
 
     # Tests a single resource ID in different case styles
     def test_id(self):
@@ -264,15 +282,22 @@ class gateway_tests(unittest.TestCase):
         self.assertEqual(mu_geometry['coordinates'][0][0],
                          mu_geometry['coordinates'][0][-1])
 
+    # Checks the rings of every location for closure, vertex counts, winding
+    # order, coordinate ranges and degenerate areas, and that each location's
+    # latitude/longitude lies within its geometry's bounding box
+    def test_all_geometries(self):
+        locations = all_results(locations_url, access_token, {},
+                                bulk_page_size)
+        self.assertEqual(geometry_problems(locations), [])
+
     # Tests results of a query that should return only locations with gender
     # inclusive restrooms
     def test_gender_inclusive_rr(self):
-        gi_rr = query_request(locations_url, access_token, "get", {
-            'giRestroom': 'true',
-            'page[size]': 5000
-        }).json()
+        gi_rr = all_results(locations_url, access_token, {
+            'giRestroom': 'true'
+        })
 
-        for location in gi_rr['data']:
+        for location in gi_rr:
             attributes = location['attributes']
             self.assertGreater(attributes['giRestroomCount'], 0)
             self.assertIsNotNone(attributes['giRestroomLimit'])
@@ -281,12 +306,11 @@ class gateway_tests(unittest.TestCase):
     def test_parking(self):
         # Test that only parking locations are returned when they should be
         # and each parking location has a related parkingZoneGroup
-        all_parking = query_request(locations_url, access_token, "get", {
-            'type': 'parking',
-            'page[size]': max_page_size
-        }).json()
+        all_parking = all_results(locations_url, access_token, {
+            'type': 'parking'
+        })
 
-        for parking_location in all_parking['data']:
+        for parking_location in all_parking:
             attributes = parking_location['attributes']
             self.assertIsNotNone(attributes['parkingZoneGroup'])
             self.assertEqual(attributes['type'], 'parking')
@@ -294,16 +318,15 @@ class gateway_tests(unittest.TestCase):
         # Test that a multi-query-parameter request for parkingZoneGroup
         # only returns parking locations that match one of the specified zones
         parking_zones = set(['A1', 'C', 'B2'])
-        multi_zone_query = query_request(
-            locations_url, access_token, "get", {
+        multi_zone_query = all_results(
+            locations_url, access_token, {
                 'parkingZoneGroup': parking_zones,
-                'campus': 'corvallis',
-                'page[size]': max_page_size
-            }).json()
+                'campus': 'corvallis'
+            })
 
         result_parking_zones = set([
             parking_location['attributes']['parkingZoneGroup']
-            for parking_location in multi_zone_query['data']
+            for parking_location in multi_zone_query
         ])
 
         self.assertEqual(parking_zones, result_parking_zones)
@@ -312,16 +335,14 @@ class gateway_tests(unittest.TestCase):
     # openHours say
     def test_isopen(self):
         def test_resource(resource_url):
-            all_open_resources = query_request(resource_url, access_token,
-                                               'get', {
-                                                   'page[size]': max_page_size,
-                                                   'isOpen': 'true'
-                                               }).json()
+            all_open_resources = all_results(resource_url, access_token, {
+                'isOpen': 'true'
+            })
 
             now = datetime.utcnow().replace(microsecond=0).isoformat()
             weekday = str(datetime.today().weekday() + 1)
 
-            for open_resource in all_open_resources['data']:
+            for open_resource in all_open_resources:
                 # Test that only open resources are returned when they should
                 # be and each open resource has a related open hours
                 open_hours = open_resource['attributes']['openHours']
@@ -333,6 +354,14 @@ class gateway_tests(unittest.TestCase):
         test_resource(locations_url)
         test_resource(services_url)
 
+    # Checks that isOpen=true returns exactly the resources whose openHours
+    # say they are open, not only that the returned ones are
+    def test_isopen_matches_open_hours(self):
+        for resource_url in (locations_url, services_url):
+            index = build_index(all_results(resource_url, access_token, {},
+                                            bulk_page_size))
+            self.assertIsNone(check_api(resource_url, access_token, index))
+
     # test the query parameters of adaParkingSpaceCount,
     # motorcycleParkingSpaceCount, evParkingSpaceCount
     def test_parking_spaces_filters(self):
@@ -497,16 +526,31 @@ class gateway_tests(unittest.TestCase):
             query_request(locations_url, access_token, "get",
                           query_params).status_code, 200)
 
+    # Tests that cursor pages and the NDJSON export hold the same resources
+    # as numbered pages
+    def test_cursor_and_export(self):
+        for resource_url in [locations_url, services_url]:
+            paged = [resource['id'] for resource in
+                     all_results(resource_url, access_token, {},
+                                 bulk_page_size)]
+            cursor = [resource['id'] for resource in
+                      all_results(resource_url, access_token, {},
+                                  bulk_page_size, cursor=True)]
+            exported = [resource['id'] for resource in
+                        export_results(resource_url, access_token)]
+            for ids in [cursor, exported]:
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertEqual(set(ids), set(paged))
+
     # Test that all extension locations are valid
     def test_extension(self):
-        query_params = {'campus': 'extension', 'page[size]': max_page_size}
-        offices = query_request(locations_url, access_token, "get",
-                                query_params).json()
+        query_params = {'campus': 'extension'}
+        offices = list(all_results(locations_url, access_token, query_params))
 
         # check that we have extension locations
-        self.assertGreater(len(offices["data"]), 10)
+        self.assertGreater(len(offices), 10)
 
-        for office in offices["data"]:
+        for office in offices:
             self.assertIsNotNone(office["id"])
             self.assertEqual(office["type"], "locations")
             self.assertIsNotNone(office["attributes"]["name"])
@@ -621,11 +665,13 @@ class gateway_tests(unittest.TestCase):
 
 
 if __name__ == '__main__':
-    options_tpl = ('-i', 'config_path')
+    options_tpl = ('-i', '--record', '--replay')
+    options = {}
     del_list = []
 
-    for i, config_path in enumerate(sys.argv):
-        if config_path in options_tpl:
+    for i, option in enumerate(sys.argv):
+        if option in options_tpl:
+            options[option] = sys.argv[i + 1]
             del_list.append(i)
             del_list.append(i + 1)
 
@@ -634,11 +680,21 @@ if __name__ == '__main__':
     for i in del_list:
         del sys.argv[i]
 
+    config_path = options['-i']
     url = get_url(config_path)
-    access_token = get_access_token(config_path)
+
+    for mode in ('record', 'replay'):
+        if '--' + mode in options:
+            client.use_store(ResponseStore(options['--' + mode], url), mode)
+            # Tests with random parameters must send the recorded requests
+            seed(RECORDING_SEED)
+    access_token = get_token_cache(config_path)
     single_resourse_id = get_single_resource_id(config_path)
 
     max_page_size = 10000
+    bulk_page_size = 2000
+    # LocationResource.MAX_BATCH_SIZE
+    max_batch_size = 100
 
     locations_url = url + "/locations"
     services_url = url + "/services"
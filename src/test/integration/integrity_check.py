@@ -0,0 +1,59 @@
+from collections import defaultdict
+
+
+def related_ids(resource, relationship):
+    """Returns the ids in a resource's relationship, [] when it has none."""
+    relationships = resource.get('relationships') or {}
+    related = (relationships.get(relationship) or {}).get('data') or []
+    return [str(identifier['id']) for identifier in related]
+
+
+def services_by_location(services):
+    """Groups service ids by the location each service links back to."""
+    grouped = defaultdict(set)
+    for service in services:
+        for location_id in related_ids(service, 'locations'):
+            grouped[location_id].add(str(service['id']))
+    return grouped
+
+
+def location_service_problems(locations, services):
+    """
+    Checks the location <-> service relationships of complete location and
+    service lists in memory and returns a description of every broken one:
+
+    - a location lists a service that doesn't exist, or whose own
+      relationship points at another location
+    - a service links to a location that doesn't exist, or that doesn't
+      list the service (which would make the location's relationship count
+      differ from its /locations/{id}/services results)
+    """
+    location_ids = set(str(location['id']) for location in locations)
+    service_parents = dict((str(service['id']),
+                            related_ids(service, 'locations'))
+                           for service in services)
+    grouped = services_by_location(services)
+    problems = []
+
+    for location in locations:
+        location_id = str(location['id'])
+        listed = set(related_ids(location, 'services'))
+        for service_id in sorted(listed):
+            if service_id not in service_parents:
+                problems.append('location {} lists missing service {}'.format(
+                    location_id, service_id))
+            elif location_id not in service_parents[service_id]:
+                problems.append(
+                    'location {} lists service {} which links to {}'.format(
+                        location_id, service_id,
+                        service_parents[service_id]))
+        for service_id in sorted(grouped.get(location_id, set()) - listed):
+            problems.append(
+                'service {} links to location {} which does not list it'
+                .format(service_id, location_id))
+
+    for location_id in sorted(set(grouped) - location_ids):
+        problems.append('services {} link to missing location {}'.format(
+            sorted(grouped[location_id]), location_id))
+
+    return problems
@@ -0,0 +1,390 @@
+"""
+Replays the traffic recorded in the API's Dropwizard request logs, so a
+node can be tried with production's mix and timing of requests rather than
+the synthetic mix of benchmark.py.
+
+parse reads request logs, in the NCSA common or combined format the
+requestLog appenders write, gzipped or not, into a normalized stream: one
+line of JSON per GET of /locations, /locations/{id},
+/locations/{id}/services or /services, with its time from the first
+request, its endpoint, its path below the API root, its query parameters,
+and the status and milliseconds it was logged with. Other requests are
+skipped and counted.
+
+    python log_replay.py parse logs/requests-*.log.gz > week1.ndjson
+
+replay sends a stream to the API of a configuration.json at the original
+timing, --speedup times faster, or with --max as fast as --workers clients
+can send it, and reports throughput, errors and latency per endpoint like
+benchmark.py, next to the logged latency. Runs can be saved and compared
+the same way.
+
+    python log_replay.py replay -i configuration.json week1.ndjson
+    python log_replay.py replay -i configuration.json --speedup 3 \\
+        --max-gap 5 week1.ndjson --compare baseline.json
+"""
+from __future__ import print_function
+
+import argparse
+import itertools
+import json
+import re
+import sys
+import threading
+import time
+from calendar import timegm
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
+try:
+    from urlparse import parse_qsl, urlsplit
+except ImportError:
+    from urllib.parse import parse_qsl, urlsplit
+
+from api_client import ApiClient
+from benchmark import Recorder, compare_to_baseline, name_width, \
+                      percentile, print_results
+from configuration_load import get_token_cache, get_url
+from logs import open_log
+from server_timing import parse as parse_server_timing, print_breakdown
+
+# host ident user [time] "request" status bytes, then optional referer and
+# user agent, then optionally the milliseconds the request took
+REQUEST_LINE = re.compile(
+    r'^\S+ \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) (?P<target>\S+)'
+    r'(?: [^"]*)?" (?P<status>\d{3}) \S+'
+    r'(?: "[^"]*" "[^"]*")?(?: (?P<ms>\d+))?\s*$')
+MONTHS = {month: number for number, month in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct',
+     'Nov', 'Dec'], 1)}
+# Sub-resources of /locations that aren't ids
+NOT_IDS = ('batch', 'export')
+
+
+def parse_time(value):
+    """Parses 18/Oct/2026:10:00:00 +0000 into seconds since the epoch."""
+    stamp, _, zone = value.partition(' ')
+    day, month, rest = stamp.split('/', 2)
+    year, hour, minute, second = rest.split(':')
+    seconds = timegm((int(year), MONTHS[month], int(day), int(hour),
+                      int(minute), int(second)))
+    if zone:
+        sign = -1 if zone[0] == '-' else 1
+        seconds -= sign * (int(zone[1:3]) * 3600 + int(zone[3:5]) * 60)
+    return seconds
+
+
+def endpoint_of(path):
+    """
+    Returns (endpoint, path below the API root) of a request path, or None
+    for requests to other endpoints. The root (/api/v0, /v1, ...) is
+    whatever comes before the first locations or services segment.
+    """
+    segments = [segment for segment in path.split('/') if segment]
+    for index, resource in enumerate(segments):
+        if resource not in ('locations', 'services'):
+            continue
+        rest = segments[index + 1:]
+        if not rest:
+            endpoint = resource
+        elif resource == 'services' or rest[0] in NOT_IDS:
+            return None
+        elif len(rest) == 1:
+            endpoint = 'locations/{id}'
+        elif rest[1:] == ['services']:
+            endpoint = 'locations/{id}/services'
+        else:
+            return None
+        return endpoint, '/'.join(segments[index:])
+    return None
+
+
+def parse_line(line):
+    """Returns the normalized request of a log line, or None."""
+    match = REQUEST_LINE.match(line)
+    if not match or match.group('method') != 'GET':
+        return None
+    target = urlsplit(match.group('target'))
+    endpoint = endpoint_of(target.path)
+    if endpoint is None:
+        return None
+    return {
+        'time': parse_time(match.group('time')),
+        'endpoint': endpoint[0],
+        'path': endpoint[1],
+        'params': parse_qsl(target.query, keep_blank_values=True),
+        'status': int(match.group('status')),
+        'ms': int(match.group('ms')) if match.group('ms') else None
+    }
+
+
+def spread(requests):
+    """
+    Turns the times of requests, sorted by time, into offsets from the
+    first one. Logged times are whole seconds, so the requests of a second
+    are spread evenly over it instead of all being sent at its start.
+    """
+    first = None
+    for second, group in itertools.groupby(requests,
+                                           key=lambda item: item['time']):
+        group = list(group)
+        if first is None:
+            first = second
+        for index, request in enumerate(group):
+            request['offset'] = round(
+                second - first + index / float(len(group)), 3)
+            del request['time']
+            yield request
+
+
+def parse(paths, output):
+    """
+    Writes the normalized stream of the requests in the logs at paths to
+    output, in the order of their times. Returns the requests kept and the
+    lines skipped.
+    """
+    requests = []
+    skipped = 0
+    for path in paths:
+        with open_log(path) as log:
+            for line in log:
+                request = parse_line(line)
+                if request is None:
+                    skipped += 1
+                else:
+                    requests.append(request)
+
+    # Log files may be given in any order; sorting is stable within them
+    requests.sort(key=lambda request: request['time'])
+    for request in spread(requests):
+        output.write(json.dumps(request, sort_keys=True) + '\n')
+    return len(requests), skipped
+
+
+def read_stream(path, limit=None, max_gap=None):
+    """
+    Reads a stream written by parse, shortening pauses between requests to
+    max_gap seconds, when given, so quiet hours don't have to be waited
+    out.
+    """
+    requests = []
+    with open_log(path) as stream:
+        for line in stream:
+            if limit is not None and len(requests) >= limit:
+                break
+            if line.strip():
+                requests.append(json.loads(line))
+    if max_gap is not None:
+        shift = 0
+        previous = None
+        for request in requests:
+            if previous is not None:
+                shift += max(request['offset'] - previous - max_gap, 0)
+            previous = request['offset']
+            request['offset'] -= shift
+    return requests
+
+
+class Replay(object):
+    def __init__(self, client, access_token, url, requests):
+        self.client = client
+        self.access_token = access_token
+        self.url = url
+        self.requests = requests
+        self.recorder = Recorder()
+        self.lock = threading.Lock()
+        # How far sending fell behind the schedule, in seconds
+        self.max_lag = 0.0
+
+    def send(self, request, started):
+        """
+        Sends one request, recording its latency from started: when it was
+        due in the timed modes, so time queued behind slow requests counts.
+        """
+        with self.lock:
+            self.max_lag = max(self.max_lag, time.time() - started)
+        wire_bytes = 0
+        phases = None
+        try:
+            response = self.client.get(self.url + '/' + request['path'],
+                                       self.access_token, request['params'])
+            response.content
+            status = response.status_code
+            wire_bytes = response.raw.tell()
+            phases = parse_server_timing(
+                response.headers.get('Server-Timing'))
+        except Exception:
+            status = None
+        self.recorder.record(request['endpoint'], time.time() - started,
+                             status, wire_bytes, phases)
+
+    def run_timed(self, speedup, workers):
+        """Sends every request at its offset divided by speedup."""
+        pool = ThreadPool(workers)
+        start = time.time()
+        try:
+            for request in self.requests:
+                scheduled = start + request['offset'] / speedup
+                delay = scheduled - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.apply_async(self.send, (request, scheduled))
+        finally:
+            pool.close()
+            pool.join()
+
+    def run_max(self, workers):
+        """workers clients send the requests in order, back to back."""
+        pending = iter(self.requests)
+        pending_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with pending_lock:
+                    request = next(pending, None)
+                if request is None:
+                    return
+                self.send(request, time.time())
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def print_logged(requests):
+    """Prints the errors and latency the requests were logged with."""
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    for request in requests:
+        if request.get('ms') is not None:
+            latencies[request['endpoint']].append(request['ms'])
+        if request['status'] >= 400:
+            errors[request['endpoint']] += 1
+    counts = defaultdict(int)
+    for request in requests:
+        counts[request['endpoint']] += 1
+    width = name_width(counts)
+    print('\nas logged:')
+    print('{:<{width}} {:>8} {:>7} {:>9} {:>9} {:>9}'.format(
+        'endpoint', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms',
+        width=width))
+    for endpoint in sorted(counts):
+        logged = sorted(latencies[endpoint])
+        print('{:<{width}} {:>8} {:>7} {:>9} {:>9} {:>9}'.format(
+            endpoint, counts[endpoint], errors[endpoint],
+            *[percentile(logged, fraction) if logged else '-'
+              for fraction in (0.50, 0.95, 0.99)], width=width))
+
+
+def replay(args):
+    requests = read_stream(args.stream, args.limit, args.max_gap)
+    if not requests:
+        print('{} has no requests'.format(args.stream), file=sys.stderr)
+        return 2
+    url = get_url(args.config_path)
+    access_token = get_token_cache(args.config_path)
+    # Fetch the token before timing starts
+    access_token.get()
+
+    run = Replay(ApiClient(pool_size=args.workers), access_token, url,
+                 requests)
+    start = time.time()
+    if args.max:
+        run.run_max(args.workers)
+    else:
+        run.run_timed(args.speedup, args.workers)
+    elapsed = time.time() - start
+
+    endpoints = run.recorder.summary(elapsed)
+    print_results(endpoints)
+    print_logged(requests)
+    if any(result['phases'] for result in endpoints.values()):
+        print_breakdown(endpoints)
+    if not args.max:
+        print('\nsent up to {:.1f}s behind schedule{}'.format(
+            run.max_lag, '; raise --workers if that grows'
+            if run.max_lag > 1 else ''))
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump({
+                'url': url,
+                'stream': args.stream,
+                'mode': {'max': args.workers} if args.max else
+                        {'speedup': args.speedup, 'max_gap': args.max_gap},
+                'duration': elapsed,
+                'shapes': endpoints
+            }, baseline_file, indent=4, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_to_baseline(endpoints, baseline,
+                                          args.tolerance)
+        if regressions:
+            print('\np95 regressed by more than {:.0%}: {}'.format(
+                args.tolerance, ', '.join(regressions)))
+            return 1
+    return 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Replays the requests of the API\'s request logs')
+    commands = parser.add_subparsers(dest='command')
+
+    parse_command = commands.add_parser(
+        'parse', help='turn request logs into a request stream on stdout')
+    parse_command.add_argument('logs', nargs='*', default=['-'],
+                               help='request logs, gzipped or not'
+                                    ' (default: stdin)')
+
+    replay_command = commands.add_parser(
+        'replay', help='send a request stream to the API')
+    replay_command.add_argument('stream', help='stream written by parse')
+    replay_command.add_argument('-i', dest='config_path', required=True,
+                                help='configuration.json of the'
+                                     ' integration tests')
+    mode = replay_command.add_mutually_exclusive_group()
+    mode.add_argument('--speedup', type=float, default=1.0,
+                      help='send the stream this many times faster than'
+                           ' it was logged (default: 1)')
+    mode.add_argument('--max', action='store_true',
+                      help='send the requests back to back instead')
+    replay_command.add_argument('--workers', type=int, default=64,
+                                help='concurrent requests (default: 64)')
+    replay_command.add_argument('--max-gap', type=float,
+                                help='shorten pauses between requests to'
+                                     ' this many seconds')
+    replay_command.add_argument('--limit', type=int,
+                                help='replay only the first requests')
+    replay_command.add_argument('--save',
+                                help='save the results as a JSON baseline')
+    replay_command.add_argument('--compare',
+                                help='JSON baseline to compare p95'
+                                     ' latencies with')
+    replay_command.add_argument('--tolerance', type=float, default=0.2,
+                                help='p95 growth over the baseline that'
+                                     ' fails the comparison (default: 0.2)')
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error('expected parse or replay')
+    if args.command == 'replay' and args.speedup <= 0:
+        parser.error('--speedup must be above 0')
+    return args
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.command == 'parse':
+        kept, skipped = parse(args.logs, sys.stdout)
+        print('{} requests, {} other lines skipped'.format(kept, skipped),
+              file=sys.stderr)
+        return 0 if kept else 1
+    return replay(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,29 @@
+"""
+Opens the logs the API writes, for log_replay.py, query_profile.py and
+open_hours_check.py: plain or gzipped files as rotated by the logging
+appenders, or stdin.
+"""
+import gzip
+import sys
+from contextlib import contextmanager
+
+
+@contextmanager
+def open_log(path):
+    """
+    Yields the lines of the log at path, read as text whether it is gzipped
+    or not, or of stdin when path is '-'. Closes the file afterwards, but
+    not stdin.
+    """
+    if path == '-':
+        yield sys.stdin
+        return
+    if path.endswith('.gz'):
+        log = gzip.open(path, 'rt') if sys.version_info[0] > 2 \
+            else gzip.open(path)
+    else:
+        log = open(path)
+    try:
+        yield log
+    finally:
+        log.close()
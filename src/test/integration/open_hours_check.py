@@ -0,0 +1,362 @@
+"""
+Verifies isOpen=true results at many times across a week.
+
+Builds an interval index from the openHours of every location and service,
+pulled once (or read from --locations and --services), and compares what
+isOpen=true returns with what the index says is open at the same time:
+
+- against the API, at the time of each check, as many times as --checks
+- against query_shape_fixture.py, at every --step minutes of the week (and
+  at every opening and closing time with --boundaries), sending the isOpen
+  query LocationDAO logged with the fixture's clock set to the simulated
+  time and the weekday the API would pick then
+
+The API evaluates isOpen against the clock of the Elasticsearch cluster, so
+it can only be checked at the current time. The fixture runs the query
+LocationDAO.buildSearchRequest built, taken from the API's debug log
+("elastic search query: ...", logged for GET /locations?isOpen=true or
+/services?isOpen=true, which build the same query), at any time; load it
+with the same --locations and --services files.
+
+The API picks the openHours weekday from the server's local time, so run
+this in the server's time zone, e.g. TZ=America/Los_Angeles.
+
+    python open_hours_check.py -i configuration.json --checks 12 --every 300
+    python open_hours_check.py --locations locations.json \\
+        --services services.json --fixture http://127.0.0.1:9200 \\
+        --query api.log
+"""
+from __future__ import print_function
+
+import argparse
+import calendar
+import json
+import re
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import requests
+
+from logs import open_log
+
+# Intervals are indexed by the buckets of this many seconds they overlap, so
+# a lookup only compares the intervals of one bucket
+BUCKET_SECONDS = 900
+WEEK_SECONDS = 7 * 24 * 3600
+DATE_FORMATS = ('%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.%fZ')
+
+# LocationDAO logs every search body after this, at debug level
+QUERY_LOG_PREFIX = 'elastic search query: '
+# The weekday key of the openHours paths in an isOpen query
+WEEKDAY_PATH = re.compile(r'(attributes\.openHours\.)\d')
+
+_epochs = {}
+
+
+def to_epoch(value):
+    """Seconds since the epoch of an openHours UTC time, or None."""
+    # Opening times repeat across resources, and strptime is slow
+    try:
+        return _epochs[value]
+    except KeyError:
+        pass
+    except TypeError:
+        return None
+    epoch = None
+    for date_format in DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(value, date_format)
+        except (TypeError, ValueError):
+            continue
+        epoch = calendar.timegm(parsed.timetuple()) + \
+            parsed.microsecond / 1e6
+        break
+    _epochs[value] = epoch
+    return epoch
+
+
+def to_iso(timestamp):
+    return datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def server_weekday(timestamp):
+    """ISO weekday (1 is Monday) in local time, as the API determines it."""
+    return time.localtime(timestamp).tm_wday + 1
+
+
+class OpenHoursIndex(object):
+    """
+    The openHours intervals of many resources, bucketed by weekday key and
+    time, answering which resources are open at a time without looking at
+    the intervals of any other bucket.
+    """
+    def __init__(self, bucket_seconds=BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.buckets = defaultdict(list)
+        self.boundaries = set()
+        self.ids = set()
+
+    def add(self, resource_id, open_hours):
+        self.ids.add(resource_id)
+        for weekday, intervals in (open_hours or {}).items():
+            for interval in intervals or []:
+                start = to_epoch(interval.get('start'))
+                end = to_epoch(interval.get('end'))
+                if start is None or end is None or end <= start:
+                    continue
+                self.boundaries.update((start, end))
+                for bucket in range(int(start // self.bucket_seconds),
+                                    int(end // self.bucket_seconds) + 1):
+                    self.buckets[(str(weekday), bucket)].append(
+                        (start, end, resource_id))
+
+    def open_at(self, timestamp, weekday=None):
+        """
+        Ids of the resources with an interval under the weekday key (by
+        default the server's weekday at timestamp) that has started and not
+        yet ended, like the query start <= now < end.
+        """
+        if weekday is None:
+            weekday = server_weekday(timestamp)
+        bucket = self.buckets.get(
+            (str(weekday), int(timestamp // self.bucket_seconds)), ())
+        return set(resource_id for start, end, resource_id in bucket
+                   if start <= timestamp < end)
+
+
+def mismatch(label, open_ids, expected, ambiguous=()):
+    """Describes how open_ids differs from expected, or returns None."""
+    unexpected = open_ids - expected - set(ambiguous)
+    missing = expected - open_ids - set(ambiguous)
+    if not unexpected and not missing:
+        return None
+    return '{}: open but closed in openHours {}, closed but open in' \
+           ' openHours {}'.format(label, sorted(unexpected), sorted(missing))
+
+
+def read_logged_query(lines):
+    """
+    Returns the first isOpen search body in the lines of an API log, as
+    LocationDAO logged it, or None. The body is logged over several lines,
+    which are joined until they decode.
+    """
+    text = None
+    for line in lines:
+        if text is None:
+            start = line.find(QUERY_LOG_PREFIX)
+            if start < 0:
+                continue
+            text = line[start + len(QUERY_LOG_PREFIX):]
+        else:
+            text += line
+        try:
+            query = json.loads(text)
+        except ValueError:
+            continue
+        if WEEKDAY_PATH.search(text):
+            return query
+        text = None
+    return None
+
+
+def load_logged_query(path):
+    with open_log(path) as log:
+        return read_logged_query(log)
+
+
+def at_weekday(query, weekday, size):
+    """
+    The logged query with its openHours paths under the weekday key, asking
+    for every hit on one page whatever page it was logged for.
+    """
+    query = json.loads(WEEKDAY_PATH.sub(r'\g<1>{}'.format(weekday),
+                                        json.dumps(query)))
+    query['from'] = 0
+    query['size'] = size
+    query.pop('search_after', None)
+    return query
+
+
+def week_timestamps(week_start, step_minutes, index=None):
+    """
+    Every step_minutes of the week starting at local midnight of
+    week_start, plus every opening and closing time within it when given
+    an index.
+    """
+    start = time.mktime(week_start.timetuple())
+    timestamps = set(start + offset
+                     for offset in range(0, WEEK_SECONDS,
+                                         int(step_minutes * 60)))
+    if index is not None:
+        timestamps.update(boundary for boundary in index.boundaries
+                          if start <= boundary < start + WEEK_SECONDS)
+    return sorted(timestamps)
+
+
+def check_fixture(fixture_url, index_name, query, index, timestamps):
+    """
+    Sends the logged isOpen query to the query shape fixture at each of
+    timestamps, and compares the hits with the index.
+    """
+    session = requests.Session()
+    problems = []
+    for timestamp in timestamps:
+        weekday = server_weekday(timestamp)
+        response = session.post(
+            '{}/{}/_search'.format(fixture_url.rstrip('/'), index_name),
+            data=json.dumps(at_weekday(query, weekday, len(index.ids) + 1)),
+            headers={'Content-Type': 'application/json',
+                     'X-Fixture-Now': to_iso(timestamp)})
+        response.raise_for_status()
+        open_ids = set(str(hit['_source'].get('id', hit['_id']))
+                       for hit in response.json()['hits']['hits'])
+        problem = mismatch('{} {} (weekday {})'.format(index_name,
+                                                       to_iso(timestamp),
+                                                       weekday),
+                           open_ids, index.open_at(timestamp, weekday))
+        if problem:
+            problems.append(problem)
+    return problems
+
+
+def check_api(url, access_token, index, label=''):
+    """
+    Compares isOpen=true results with the index at the time of the request.
+    Resources that opened or closed while the results were being paged
+    through could go either way and are not compared.
+    """
+    from api_request import all_results
+
+    before = time.time()
+    open_ids = set(str(resource['id']) for resource in
+                   all_results(url, access_token, {'isOpen': 'true'}))
+    after = time.time()
+    open_before = index.open_at(before)
+    open_after = index.open_at(after)
+    return mismatch('{}{}'.format(label, to_iso(before)), open_ids,
+                    open_before & open_after, open_before ^ open_after)
+
+
+def build_index(resources, index=None):
+    index = index or OpenHoursIndex()
+    for resource in resources:
+        index.add(str(resource['id']),
+                  (resource.get('attributes') or {}).get('openHours'))
+    return index
+
+
+def load_resources(path):
+    with open(path) as resources_file:
+        return json.load(resources_file)['data']
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Check isOpen=true results against openHours')
+    parser.add_argument('-i', dest='config_path',
+                        help='configuration.json of the integration tests, to'
+                             ' pull openHours from and check the API')
+    parser.add_argument('--locations',
+                        help='/locations response to read openHours from')
+    parser.add_argument('--services',
+                        help='/services response to read openHours from')
+    parser.add_argument('--fixture', metavar='URL',
+                        help='check query_shape_fixture.py at simulated times'
+                             ' instead of the API')
+    parser.add_argument('--query', metavar='LOG',
+                        help='API log with the isOpen query LocationDAO'
+                             ' logged, to send to the fixture')
+    parser.add_argument('--locations-index', default='locations',
+                        help='fixture index of the locations (default:'
+                             ' locations)')
+    parser.add_argument('--services-index', default='services',
+                        help='fixture index of the services (default:'
+                             ' services)')
+    parser.add_argument('--week-start', metavar='YYYY-MM-DD',
+                        help='Monday of the week to check (default: this'
+                             ' week)')
+    parser.add_argument('--step', type=float, default=15,
+                        help='minutes between simulated times (default: 15)')
+    parser.add_argument('--boundaries', action='store_true',
+                        help='also check at every opening and closing time')
+    parser.add_argument('--checks', type=int, default=1,
+                        help='times to check the API (default: 1)')
+    parser.add_argument('--every', type=float, default=60,
+                        help='seconds between API checks (default: 60)')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if not args.config_path and not (args.locations or args.services):
+        print('give -i or --locations/--services', file=sys.stderr)
+        return 2
+    if not args.fixture and not args.config_path:
+        print('checking the API needs -i', file=sys.stderr)
+        return 2
+    query = None
+    if args.fixture:
+        query = load_logged_query(args.query) if args.query else None
+        if query is None:
+            print('checking the fixture needs --query with a logged isOpen'
+                  ' query', file=sys.stderr)
+            return 2
+
+    if args.config_path:
+        # api_request is Python 2 only, like the tests
+        from api_request import all_results
+        from configuration_load import get_token_cache, get_url
+        access_token = get_token_cache(args.config_path)
+        url = get_url(args.config_path)
+
+    kinds = []
+    for kind, path, index_name in (
+            ('locations', args.locations, args.locations_index),
+            ('services', args.services, args.services_index)):
+        if path:
+            resources = load_resources(path)
+        elif args.config_path:
+            resources = all_results(url + '/' + kind, access_token,
+                                    page_size=2000)
+        else:
+            continue
+        kinds.append((kind, index_name, build_index(resources)))
+
+    problems = []
+    checks = 0
+    if args.fixture:
+        if args.week_start:
+            week_start = datetime.strptime(args.week_start, '%Y-%m-%d')
+        else:
+            today = datetime.now().replace(hour=0, minute=0, second=0,
+                                           microsecond=0)
+            week_start = today - timedelta(days=today.weekday())
+        for kind, index_name, index in kinds:
+            timestamps = week_timestamps(week_start, args.step,
+                                         index if args.boundaries else None)
+            checks += len(timestamps)
+            problems.extend(check_fixture(args.fixture, index_name, query,
+                                          index, timestamps))
+    else:
+        for check in range(args.checks):
+            if check:
+                time.sleep(args.every)
+            for kind, _, index in kinds:
+                checks += 1
+                problem = check_api(url + '/' + kind, access_token, index,
+                                    kind + ' ')
+                if problem:
+                    problems.append(problem)
+
+    for problem in problems:
+        print(problem)
+    print('{} of {} checks disagree with openHours'.format(len(problems),
+                                                           checks),
+          file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
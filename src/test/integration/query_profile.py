@@ -0,0 +1,193 @@
+"""
+Ranks the query shapes and clauses of the Elasticsearch profiles the API
+logs when esProfileSampleRate is set, to find which filters are worth
+restructuring or caching.
+
+Every profiled search is logged as one line of JSON after "query profile: ",
+with the fingerprint of its shape (the query with its values taken out) and
+the profile Elasticsearch returned. This reads those lines from log files,
+gzipped or not, or from stdin, and prints:
+
+- the shapes by total time spent in Elasticsearch, with the number of
+  searches, their mean and max took and the clause taking the most time
+- the clauses by total self time, that is the time of a clause less that of
+  the clauses inside it, summed over every shard of every search
+
+    python query_profile.py logs/locations-frontend.log
+    python query_profile.py --top 5 --show-shapes logs/*.log.gz
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import re
+import sys
+from collections import defaultdict
+
+from logs import open_log
+
+LOG_PREFIX = 'query profile: '
+
+# Values in Lucene query descriptions: ranges, quoted phrases and terms
+VALUE = re.compile(r':(\[[^\]]*\]|\{[^}]*\}|"[^"]*"|[^\s()]+)')
+# Numbered segments of field paths, like the weekday of openHours.3.start
+NUMBERED_SEGMENT = re.compile(r'\.\d+(?=[.:\s)]|$)')
+NUMBER = re.compile(r'-?\d+(\.\d+)?')
+
+
+def read_profiles(lines):
+    """Yields the logged profiles found in lines, skipping other lines."""
+    for line in lines:
+        start = line.find(LOG_PREFIX)
+        if start < 0:
+            continue
+        try:
+            yield json.loads(line[start + len(LOG_PREFIX):])
+        except ValueError:
+            # A line cut short by log rotation
+            continue
+
+
+def clause_name(query):
+    """
+    Names a clause of a profile by its Lucene query type and description,
+    with the values taken out, so the same clause of different searches
+    adds up.
+    """
+    description = NUMBERED_SEGMENT.sub('.N', query.get('description', ''))
+    description = VALUE.sub(':?', description)
+    description = NUMBER.sub('N', description)
+    return '{} {}'.format(query.get('type', '?'), description)
+
+
+def walk_clauses(query):
+    """Yields (name, self nanos, total nanos) of a clause and its children."""
+    children = query.get('children') or []
+    total = query.get('time_in_nanos', 0)
+    self_time = total - sum(child.get('time_in_nanos', 0)
+                            for child in children)
+    yield clause_name(query), max(self_time, 0), total
+    for child in children:
+        for clause in walk_clauses(child):
+            yield clause
+
+
+def searches(profile):
+    """Yields the searches of every shard of a profile."""
+    for shard in (profile or {}).get('shards', []):
+        for search in shard.get('searches', []):
+            yield search
+
+
+class Report(object):
+    def __init__(self):
+        self.shapes = {}
+        self.clauses = defaultdict(lambda: {'count': 0, 'self': 0,
+                                            'total': 0,
+                                            'shapes': set()})
+        self.query_nanos = 0
+
+    def add(self, entry):
+        fingerprint = entry.get('fingerprint', '?')
+        shape = self.shapes.setdefault(fingerprint, {
+            'index': entry.get('index'),
+            'shape': entry.get('shape'),
+            'count': 0,
+            'took': [],
+            'nanos': 0,
+            'clauses': defaultdict(int)
+        })
+        shape['count'] += 1
+        shape['took'].append(entry.get('tookMillis', 0))
+        for search in searches(entry.get('profile')):
+            # Rewriting and collecting hits are timed apart from the query
+            nanos = search.get('rewrite_time', 0) + sum(
+                collector.get('time_in_nanos', 0)
+                for collector in search.get('collector', []))
+            for query in search.get('query', []):
+                nanos += query.get('time_in_nanos', 0)
+                for name, self_time, total in walk_clauses(query):
+                    clause = self.clauses[name]
+                    clause['count'] += 1
+                    clause['self'] += self_time
+                    clause['total'] += total
+                    clause['shapes'].add(fingerprint)
+                    shape['clauses'][name] += self_time
+            shape['nanos'] += nanos
+            self.query_nanos += nanos
+
+    def ranked_shapes(self):
+        return sorted(self.shapes.items(),
+                      key=lambda item: item[1]['nanos'], reverse=True)
+
+    def ranked_clauses(self):
+        return sorted(self.clauses.items(),
+                      key=lambda item: item[1]['self'], reverse=True)
+
+
+def shorten(text, width):
+    return text if len(text) <= width else text[:width - 3] + '...'
+
+
+def print_report(report, top, show_shapes):
+    print('{:<10} {:<12} {:>8} {:>10} {:>10} {:>10}  {}'.format(
+        'shape', 'index', 'searches', 'mean took', 'max took', 'es ms',
+        'slowest clause'))
+    for fingerprint, shape in report.ranked_shapes()[:top]:
+        slowest = max(list(shape['clauses'].items()) or [('', 0)],
+                      key=lambda item: item[1])
+        print('{:<10} {:<12} {:>8} {:>10.1f} {:>10} {:>10.1f}  {}'.format(
+            fingerprint, shorten(shape['index'] or '?', 12), shape['count'],
+            sum(shape['took']) / float(len(shape['took'])),
+            max(shape['took']), shape['nanos'] / 1e6,
+            shorten(slowest[0], 60)))
+
+    print('\n{:>10} {:>8} {:>10} {:>10} {:>6} {:>7}  {}'.format(
+        'self ms', 'count', 'mean self', 'mean total', 'shapes', 'share',
+        'clause'))
+    for name, clause in report.ranked_clauses()[:top]:
+        share = clause['self'] / float(report.query_nanos) \
+            if report.query_nanos else 0
+        print('{:>10.1f} {:>8} {:>10.3f} {:>10.3f} {:>6} {:>7.0%}  {}'.format(
+            clause['self'] / 1e6, clause['count'],
+            clause['self'] / 1e6 / clause['count'],
+            clause['total'] / 1e6 / clause['count'], len(clause['shapes']),
+            share, shorten(name, 100)))
+
+    if show_shapes:
+        for fingerprint, shape in report.ranked_shapes()[:top]:
+            print('\n{} ({}):'.format(fingerprint, shape['index']))
+            print(json.dumps(shape['shape'], indent=2, sort_keys=True))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Ranks the slowest query shapes and clauses of the'
+                    ' Elasticsearch profiles the API logs')
+    parser.add_argument('logs', nargs='*', default=['-'],
+                        help='log files, gzipped or not (default: stdin)')
+    parser.add_argument('--top', type=int, default=10,
+                        help='shapes and clauses to print (default: 10)')
+    parser.add_argument('--show-shapes', action='store_true',
+                        help='print the normalized query of the top shapes')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    report = Report()
+    for path in args.logs:
+        with open_log(path) as log:
+            for entry in read_profiles(log):
+                report.add(entry)
+
+    if not report.shapes:
+        print('no query profiles found; is esProfileSampleRate set?',
+              file=sys.stderr)
+        return 1
+    print_report(report, args.top, args.show_shapes)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,726 @@
+"""
+Fixture for query-shape tests: evaluates the search and get bodies the
+locations frontend builds against small fixture indexes, over the
+Elasticsearch 6 REST API (search, get, _mget and _bulk), to check what a
+query matches and how it sorts without a cluster loaded with production data.
+
+It is not a backend for the frontend. The frontend connects with the
+transport client, which speaks the binary transport protocol on port 9300,
+so the API can't run against this fixture: queries have to be sent to it
+directly, as LocationDAO logs them at debug level or as written by hand.
+
+Search bodies are evaluated for the subset of the query DSL that
+LocationDAO.buildSearchRequest and buildRelatedServicesRequest build, in
+either the verbose form SearchRequestBuilder.toString() logs or the short
+form people write by hand:
+
+    bool (must, should, filter, must_not), match, multi_match, range (numbers
+    and dates, including "now"), nested (openHours), geo_distance, exists,
+    term, terms, ids, match_all; geo distance, score and field sorts;
+    from and size
+
+Full text queries are scored with BM25 over the tokens of each field, which
+orders results close to, but not exactly like, a real cluster's analyzers.
+
+    python query_shape_fixture.py --port 9200
+    python query_shape_fixture.py --index locations=locations.json \\
+                                  --index services=services.json \\
+                                  --latency 15
+    python query_shape_fixture.py --bulk campus.ndjson
+
+A request may set the time "now" stands for with an X-Fixture-Now header
+(2018-06-13T19:30:00Z), to run the isOpen queries at any time of the week.
+
+Index files may be a search response (hits.hits[]._source, like
+esMockData.json), a /locations or /services API response, a JSON list of
+documents, or bulk NDJSON.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from functools import cmp_to_key
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+DEFAULT_FIXTURE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'groovy', 'edu',
+    'oregonstate', 'mist', 'locations', 'frontend', 'esMockData.json')
+
+# Mean earth radius, as used by Elasticsearch
+EARTH_RADIUS_METERS = 6371008.7714
+
+DISTANCE_UNITS = {
+    'mi': 1609.344, 'miles': 1609.344, 'mile': 1609.344,
+    'yd': 0.9144, 'yards': 0.9144, 'yard': 0.9144,
+    'ft': 0.3048, 'feet': 0.3048, 'foot': 0.3048,
+    'in': 0.0254, 'inch': 0.0254,
+    'km': 1000.0, 'kilometers': 1000.0, 'kilometer': 1000.0,
+    'm': 1.0, 'meters': 1.0, 'meter': 1.0,
+    'cm': 0.01, 'centimeters': 0.01,
+    'mm': 0.001, 'millimeters': 0.001,
+    'nmi': 1852.0, 'nm': 1852.0, 'nauticalmiles': 1852.0
+}
+
+# A request can set the time "now" stands for in date ranges with this
+# header (an ISO 8601 UTC time), to evaluate openHours at another time
+NOW_HEADER = 'X-Fixture-Now'
+
+# BM25 parameters, Elasticsearch's defaults
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r'[0-9a-z]+')
+_DISTANCE = re.compile(r'^\s*([0-9.eE+-]+)\s*([a-zA-Z]*)\s*$')
+
+
+# The time set by the request being handled on this thread, if any
+_clock = threading.local()
+
+
+class QueryError(Exception):
+    """A query the fixture doesn't understand; answered with a 400."""
+
+
+def tokenize(value):
+    return _TOKEN.findall(value.lower())
+
+
+def field_values(source, field):
+    """Returns the leaf values at a dotted field path, flattening lists."""
+    values = [source]
+    for key in field.split('.'):
+        found = []
+        for value in values:
+            if isinstance(value, dict) and value.get(key) is not None:
+                found.append(value[key])
+        values = []
+        for value in found:
+            values.extend(value if isinstance(value, list) else [value])
+    return values
+
+
+def field_tokens(source, field):
+    tokens = []
+    for value in field_values(source, field):
+        if not isinstance(value, (dict, list)):
+            tokens.extend(tokenize(value if isinstance(value, string_types)
+                                   else json.dumps(value)))
+    return tokens
+
+
+def with_path(source, path, value):
+    """Returns a copy of source with only path replaced by value."""
+    key, _, rest = path.partition('.')
+    copy = dict(source)
+    copy[key] = with_path(source.get(key) or {}, rest, value) if rest \
+        else value
+    return copy
+
+
+def parse_point(point):
+    """Reads {lat, lon}, [lon, lat] or "lat,lon" as (lat, lon)."""
+    if isinstance(point, dict):
+        return float(point['lat']), float(point['lon'])
+    if isinstance(point, list):
+        if point and isinstance(point[0], (dict, list, string_types)):
+            return parse_point(point[0])
+        return float(point[1]), float(point[0])
+    if isinstance(point, string_types) and ',' in point:
+        lat, lon = point.split(',', 1)
+        return float(lat), float(lon)
+    raise QueryError('unsupported geo point {!r}'.format(point))
+
+
+def parse_distance(distance, default_unit='m'):
+    """Returns a distance ("2.0miles", "100ft" or a number) in meters."""
+    if isinstance(distance, (int, float)):
+        return float(distance) * DISTANCE_UNITS[default_unit]
+    match = _DISTANCE.match(distance)
+    if not match or match.group(2).lower() not in DISTANCE_UNITS and \
+            match.group(2):
+        raise QueryError('unsupported distance {!r}'.format(distance))
+    unit = match.group(2).lower() or default_unit
+    return float(match.group(1)) * DISTANCE_UNITS[unit]
+
+
+def distance_meters(origin, point, distance_type='arc'):
+    lat1, lon1 = map(math.radians, origin)
+    lat2, lon2 = map(math.radians, point)
+    if distance_type == 'plane':
+        x = (lon2 - lon1) * math.cos((lat1 + lat2) / 2)
+        return math.hypot(x, lat2 - lat1) * EARTH_RADIUS_METERS
+    h = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(h)))
+
+
+def parse_date(value):
+    if value == 'now':
+        return getattr(_clock, 'now', None) or datetime.utcnow()
+    for date_format in ('%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.%fZ',
+                        '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    return None
+
+
+def comparable(value, bound):
+    """
+    Brings a field value and a range bound to comparable types: numbers,
+    dates when either side is a date string or "now", or else strings.
+    """
+    if isinstance(bound, string_types) or isinstance(value, string_types):
+        value_date = parse_date(value) if isinstance(value, string_types) \
+            else None
+        bound_date = parse_date(bound) if isinstance(bound, string_types) \
+            else None
+        if value_date is not None and bound_date is not None:
+            return value_date, bound_date
+        try:
+            return float(value), float(bound)
+        except (TypeError, ValueError):
+            return str(value), str(bound)
+    return value, bound
+
+
+def range_bounds(spec):
+    """Returns [(operator, bound)] from gt/gte/lt/lte or from/to form."""
+    bounds = []
+    for operator in ('gt', 'gte', 'lt', 'lte'):
+        if spec.get(operator) is not None:
+            bounds.append((operator, spec[operator]))
+    if spec.get('from') is not None:
+        bounds.append(('gte' if spec.get('include_lower', True) else 'gt',
+                       spec['from']))
+    if spec.get('to') is not None:
+        bounds.append(('lte' if spec.get('include_upper', True) else 'lt',
+                       spec['to']))
+    return bounds
+
+
+def in_range(value, bounds):
+    for operator, bound in bounds:
+        left, right = comparable(value, bound)
+        if operator == 'gt' and not left > right or \
+                operator == 'gte' and not left >= right or \
+                operator == 'lt' and not left < right or \
+                operator == 'lte' and not left <= right:
+            return False
+    return True
+
+
+def single_field(spec, options=()):
+    """Splits {field: value, option: ...} into (field, value)."""
+    fields = [key for key in spec if key not in options]
+    if len(fields) != 1:
+        raise QueryError('expected one field in {!r}'.format(spec))
+    return fields[0], spec[fields[0]]
+
+
+def compare_sort_values(a, b, descending):
+    """Compares two hits' sort values; missing values sort last."""
+    for value_a, value_b, clause_descending in zip(a, b, descending):
+        if value_a == value_b:
+            continue
+        if value_a is None:
+            return 1
+        if value_b is None:
+            return -1
+        result = -1 if value_a < value_b else 1
+        return -result if clause_descending else result
+    return 0
+
+
+class Index(object):
+    """Documents of one index, with the field statistics BM25 needs."""
+    def __init__(self, name):
+        self.name = name
+        self.documents = {}
+        self.order = []
+        self.lock = threading.Lock()
+        self.field_stats = {}
+
+    def put(self, doc_type, doc_id, source):
+        with self.lock:
+            if doc_id not in self.documents:
+                self.order.append(doc_id)
+            self.documents[doc_id] = (doc_type, source)
+            self.field_stats = {}
+
+    def stats(self, field):
+        """Returns (document frequency per token, average field length)."""
+        with self.lock:
+            if field not in self.field_stats:
+                frequencies = defaultdict(int)
+                total_length = 0
+                for _, source in self.documents.values():
+                    tokens = field_tokens(source, field)
+                    total_length += len(tokens)
+                    for token in set(tokens):
+                        frequencies[token] += 1
+                self.field_stats[field] = (
+                    frequencies,
+                    total_length / float(max(1, len(self.documents))))
+            return self.field_stats[field]
+
+    def text_score(self, source, field, query, operator='or', boost=1.0):
+        """BM25 score of query against field, or None if it doesn't match."""
+        query_tokens = tokenize(query if isinstance(query, string_types)
+                                else json.dumps(query))
+        tokens = field_tokens(source, field)
+        matched = [token for token in set(query_tokens) if token in tokens]
+        if not matched or operator == 'and' and \
+                len(matched) < len(set(query_tokens)):
+            return None
+        frequencies, average_length = self.stats(field)
+        count = float(len(self.documents))
+        score = 0.0
+        for token in matched:
+            idf = math.log(1 + (count - frequencies[token] + 0.5) /
+                           (frequencies[token] + 0.5))
+            frequency = tokens.count(token)
+            score += idf * frequency * (BM25_K1 + 1) / (
+                frequency + BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) /
+                                       max(average_length, 1.0)))
+        return score * boost
+
+    def evaluate(self, query, source):
+        """Returns the score of source for query, or None if not matched."""
+        if not query:
+            return 1.0
+        (kind, spec), = query.items()
+        evaluator = getattr(self, '_' + kind, None)
+        if evaluator is None:
+            raise QueryError('unsupported query {}'.format(kind))
+        return evaluator(spec, source)
+
+    def _match_all(self, spec, source):
+        return float(spec.get('boost', 1.0))
+
+    def _bool(self, spec, source):
+        def clauses(occur):
+            clause = spec.get(occur) or []
+            return clause if isinstance(clause, list) else [clause]
+
+        score = 0.0
+        for clause in clauses('must'):
+            clause_score = self.evaluate(clause, source)
+            if clause_score is None:
+                return None
+            score += clause_score
+        for clause in clauses('filter'):
+            if self.evaluate(clause, source) is None:
+                return None
+        for clause in clauses('must_not'):
+            if self.evaluate(clause, source) is not None:
+                return None
+        should_scores = [clause_score for clause_score in
+                         (self.evaluate(clause, source)
+                          for clause in clauses('should'))
+                         if clause_score is not None]
+        required = spec.get('minimum_should_match')
+        if required is None:
+            required = 0 if clauses('must') or clauses('filter') or \
+                not clauses('should') else 1
+        if len(should_scores) < int(required):
+            return None
+        return (score + sum(should_scores)) * float(spec.get('boost', 1.0))
+
+    def _match(self, spec, source):
+        field, value = single_field(spec)
+        if isinstance(value, dict):
+            return self.text_score(source, field, value['query'],
+                                   value.get('operator', 'or').lower(),
+                                   float(value.get('boost', 1.0)))
+        return self.text_score(source, field, value)
+
+    def _multi_match(self, spec, source):
+        scores = []
+        for field in spec['fields']:
+            field, _, boost = field.partition('^')
+            score = self.text_score(source, field, spec['query'],
+                                    spec.get('operator', 'or').lower(),
+                                    float(boost or 1.0))
+            if score is not None:
+                scores.append(score)
+        if not scores:
+            return None
+        # best_fields: the best field counts, the others by tie_breaker
+        best = max(scores)
+        tie_breaker = float(spec.get('tie_breaker') or 0.0)
+        return (best + tie_breaker * (sum(scores) - best)) * \
+            float(spec.get('boost', 1.0))
+
+    def _term(self, spec, source):
+        field, value = single_field(spec)
+        if isinstance(value, dict):
+            value = value['value']
+        return 1.0 if value in field_values(source, field) else None
+
+    def _terms(self, spec, source):
+        field, values = single_field(spec, ('boost',))
+        found = field_values(source, field)
+        return 1.0 if any(value in found for value in values) else None
+
+    def _ids(self, spec, source):
+        return 1.0 if source.get('id') in spec['values'] else None
+
+    def _exists(self, spec, source):
+        return 1.0 if field_values(source, spec['field']) else None
+
+    def _range(self, spec, source):
+        field, bounds = single_field(spec)
+        bounds = range_bounds(bounds)
+        if any(in_range(value, bounds)
+               for value in field_values(source, field)):
+            return 1.0
+        return None
+
+    def _nested(self, spec, source):
+        path = spec['path']
+        scores = [self.evaluate(spec['query'], with_path(source, path, item))
+                  for item in field_values(source, path)]
+        scores = [score for score in scores if score is not None]
+        if not scores:
+            return None
+        return sum(scores) / len(scores)
+
+    def _geo_distance(self, spec, source):
+        field, origin = single_field(spec, (
+            'distance', 'distance_type', 'validation_method',
+            'ignore_unmapped', 'boost', '_name', 'unit'))
+        origin = parse_point(origin)
+        limit = parse_distance(spec['distance'], spec.get('unit', 'm'))
+        distance_type = spec.get('distance_type', 'arc')
+        for point in field_values(source, field) or []:
+            if distance_meters(origin, parse_point(point),
+                               distance_type) <= limit:
+                return 1.0
+        return None
+
+    def sort_value(self, clause, source, score):
+        """Returns (sort value, descending) of one sort clause for a hit."""
+        if isinstance(clause, string_types):
+            clause = {clause: {}}
+        (field, options), = clause.items()
+        if not isinstance(options, dict):
+            options = {'order': options}
+        if field == '_score':
+            return score, options.get('order', 'desc') == 'desc'
+        descending = options.get('order', 'asc') == 'desc'
+        if field == '_geo_distance':
+            point_field, origin = single_field(options, (
+                'unit', 'distance_type', 'order', 'validation_method',
+                'ignore_unmapped', 'mode'))
+            origin = parse_point(origin)
+            unit = DISTANCE_UNITS[options.get('unit', 'm').lower()]
+            distances = [distance_meters(origin, parse_point(point),
+                                         options.get('distance_type', 'arc'))
+                         for point in field_values(source, point_field)]
+            # Documents without a point sort last, like in Elasticsearch
+            return (min(distances) / unit if distances else float('inf'),
+                    descending)
+        values = field_values(source, field)
+        return (min(values) if values else None), descending
+
+    def search(self, body):
+        query = body.get('query')
+        hits = []
+        for doc_id in self.order:
+            doc_type, source = self.documents[doc_id]
+            score = self.evaluate(query, source)
+            if score is not None:
+                hits.append({'_index': self.name, '_type': doc_type,
+                             '_id': doc_id, '_score': score,
+                             '_source': source})
+
+        sort = body.get('sort')
+        if sort:
+            sort = sort if isinstance(sort, list) else [sort]
+            descending = []
+            for hit in hits:
+                hit['sort'] = []
+                descending = []
+                for clause in sort:
+                    value, clause_descending = self.sort_value(
+                        clause, hit['_source'], hit['_score'])
+                    hit['sort'].append(value)
+                    descending.append(clause_descending)
+            hits.sort(key=cmp_to_key(
+                lambda a, b: compare_sort_values(a['sort'], b['sort'],
+                                                 descending)))
+            tracks_score = any(
+                clause == '_score' or isinstance(clause, dict) and
+                '_score' in clause for clause in sort)
+            for hit in hits:
+                hit['sort'] = [None if value == float('inf') else value
+                               for value in hit['sort']]
+                if not tracks_score:
+                    hit['_score'] = None
+        else:
+            hits.sort(key=lambda hit: -hit['_score'])
+
+        start = int(body.get('from', 0))
+        size = int(body.get('size', 10))
+        scores = [hit['_score'] for hit in hits if hit['_score'] is not None]
+        return {
+            'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'skipped': 0,
+                        'failed': 0},
+            'hits': {
+                'total': len(hits),
+                'max_score': max(scores) if scores else None,
+                'hits': hits[start:start + size]
+            }
+        }
+
+
+class Cluster(object):
+    def __init__(self):
+        self.indexes = {}
+
+    def index(self, name):
+        if name not in self.indexes:
+            self.indexes[name] = Index(name)
+        return self.indexes[name]
+
+    def load_bulk(self, lines, default_index=None):
+        """Applies the index/create actions of bulk NDJSON lines."""
+        items = []
+        lines = iter(line for line in lines if line.strip())
+        for line in lines:
+            (action, metadata), = json.loads(line).items()
+            if action == 'delete':
+                continue
+            source = json.loads(next(lines))
+            if action not in ('index', 'create'):
+                raise QueryError('unsupported bulk action ' + action)
+            index = metadata.get('_index', default_index)
+            doc_id = metadata.get('_id') or source.get('id')
+            self.index(index).put(metadata.get('_type', '_doc'), doc_id,
+                                  source)
+            items.append({action: {'_index': index, '_id': doc_id,
+                                   'status': 201}})
+        return items
+
+    def mget(self, body, default_index=None, default_type='_doc'):
+        """Gets the documents of a multi-get, by docs or by ids."""
+        docs = body.get('docs') or [{'_id': doc_id}
+                                    for doc_id in body.get('ids', [])]
+        responses = []
+        for doc in docs:
+            index_name = doc.get('_index', default_index)
+            doc_type = doc.get('_type', default_type)
+            index = self.indexes.get(index_name)
+            found = index.documents.get(doc['_id']) if index else None
+            response = {'_index': index_name, '_type': doc_type,
+                        '_id': doc['_id'], 'found': found is not None}
+            if found is not None:
+                response['_version'] = 1
+                response['_source'] = found[1]
+            responses.append(response)
+        return {'docs': responses}
+
+    def load_file(self, index_name, path):
+        with open(path) as fixture:
+            text = fixture.read()
+        try:
+            content = json.loads(text)
+        except ValueError:
+            # Bulk NDJSON
+            return len(self.load_bulk(text.splitlines(), index_name))
+
+        index = self.index(index_name)
+        if isinstance(content, dict) and 'hits' in content:
+            for hit in content['hits']['hits']:
+                index.put(hit.get('_type', index_name),
+                          hit.get('_id') or hit['_source']['id'],
+                          hit['_source'])
+            return len(content['hits']['hits'])
+
+        documents = content['data'] if isinstance(content, dict) else content
+        for document in documents:
+            index.put(index_name, document['id'], api_to_source(document))
+        return len(documents)
+
+
+def api_to_source(document):
+    """Turns an API resource back into the document LocationMapper reads."""
+    attributes = dict(document.get('attributes') or {})
+    if attributes.get('latitude') and attributes.get('longitude'):
+        attributes['geoLocation'] = {
+            'lat': float(attributes.pop('latitude')),
+            'lon': float(attributes.pop('longitude'))
+        }
+    attributes.pop('distance', None)
+    source = dict(document)
+    source['attributes'] = attributes
+    return source
+
+
+class FixtureServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def fixture_handler(cluster, latency, jitter):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length).decode('utf-8') if length else ''
+
+        def send_json(self, body, status=200):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type',
+                             'application/json; charset=UTF-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def error(self, status, reason):
+            self.send_json({'error': {'type': 'fixture_exception',
+                                      'reason': reason},
+                            'status': status}, status)
+
+        def handle_request(self):
+            started = time.time()
+            parts = [part for part in urlsplit(self.path).path.split('/')
+                     if part]
+            body = self.read_body()
+            _clock.now = None
+            if self.headers.get(NOW_HEADER):
+                _clock.now = parse_date(self.headers.get(NOW_HEADER))
+                if _clock.now is None:
+                    return self.error(400, 'unparsable {} header {}'.format(
+                        NOW_HEADER, self.headers.get(NOW_HEADER)))
+            if latency or jitter:
+                time.sleep(max(0.0, latency + random.uniform(-jitter, jitter))
+                           / 1000.0)
+            try:
+                if not parts:
+                    return self.send_json({
+                        'name': 'query-shape-fixture',
+                        'cluster_name': 'fixture',
+                        'version': {'number': '6.2.4'},
+                        'tagline': 'You Know, for Search'})
+                if parts == ['_cluster', 'health']:
+                    return self.send_json({'cluster_name': 'fixture',
+                                           'status': 'green'})
+                if parts[-1] == '_bulk':
+                    items = cluster.load_bulk(
+                        body.splitlines(), parts[0] if len(parts) > 1
+                        else None)
+                    return self.send_json({'took': 0, 'errors': False,
+                                           'items': items})
+                if parts[-1] == '_mget':
+                    return self.send_json(cluster.mget(
+                        json.loads(body) if body else {},
+                        parts[0] if len(parts) > 1 else None,
+                        parts[1] if len(parts) > 2 else '_doc'))
+                if parts[0] not in cluster.indexes:
+                    return self.error(404, 'no such index [{}]'.format(
+                        parts[0]))
+                index = cluster.indexes[parts[0]]
+                if parts[-1] == '_search':
+                    response = index.search(json.loads(body) if body else {})
+                    response['took'] = int((time.time() - started) * 1000)
+                    return self.send_json(response)
+                if len(parts) == 3:
+                    return self.get_document(index, parts[1], parts[2])
+                return self.error(400, 'unsupported path ' + self.path)
+            except (QueryError, KeyError, ValueError) as error:
+                return self.error(400, '{}: {}'.format(
+                    type(error).__name__, error))
+
+        def get_document(self, index, doc_type, doc_id):
+            found = index.documents.get(doc_id)
+            response = {'_index': index.name, '_type': doc_type,
+                        '_id': doc_id, 'found': found is not None}
+            if found is None:
+                return self.send_json(response, 404)
+            response['_version'] = 1
+            response['_source'] = found[1]
+            return self.send_json(response)
+
+        do_GET = handle_request
+        do_POST = handle_request
+        do_PUT = handle_request
+
+    return Handler
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Evaluates the Elasticsearch queries of the locations'
+                    ' API against fixture indexes')
+    parser.add_argument('--port', type=int, default=9200,
+                        help='port to listen on, 0 for any (default: 9200)')
+    parser.add_argument('--index', action='append', default=[],
+                        metavar='NAME=PATH',
+                        help='seed index NAME from the fixture at PATH;'
+                             ' may be repeated (default: locations from'
+                             ' esMockData.json)')
+    parser.add_argument('--bulk', action='append', default=[],
+                        metavar='PATH',
+                        help='seed from bulk NDJSON naming its own indexes')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='milliseconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='up to this many milliseconds more or less')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    cluster = Cluster()
+    indexes = args.index
+    if not indexes and not args.bulk:
+        indexes = ['locations=' + DEFAULT_FIXTURE]
+    for spec in indexes:
+        name, _, path = spec.partition('=')
+        count = cluster.load_file(name, path)
+        print('{}: {} documents from {}'.format(name, count, path))
+    for path in args.bulk:
+        with open(path) as bulk_file:
+            count = len(cluster.load_bulk(bulk_file))
+        print('{} documents from {}'.format(count, path))
+
+    server = FixtureServer(('127.0.0.1', args.port),
+                           fixture_handler(cluster, args.latency,
+                                            args.jitter))
+    print('listening on http://127.0.0.1:{}'.format(server.server_address[1]))
+    sys.stdout.flush()
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
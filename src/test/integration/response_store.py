@@ -0,0 +1,162 @@
+"""
+Record/replay store for the responses the integration suite receives, and a
+diff between two recordings.
+
+Responses are keyed by method, URL and normalized query parameters, plus
+whether the request carried an Authorization header. URLs under the API's
+base URL are stored relative to it, so recordings made against different
+deployments share keys and can be compared:
+
+    python response_store.py diff recordings/production recordings/dev
+"""
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import sys
+from datetime import timedelta
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+BASE_URL_PLACEHOLDER = '{base}'
+# Response headers worth keeping; the rest vary per request
+KEPT_HEADERS = ['Content-Type', 'Content-Encoding', 'Location', 'Allow',
+                'WWW-Authenticate']
+
+
+class ReplayMiss(KeyError):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+def normalize_params(params):
+    """
+    Returns params as a sorted list of [name, [values]], with values as
+    strings and repeated parameters (type=building&type=dining) sorted, so
+    equivalent queries get the same key.
+    """
+    if not params:
+        return []
+    items = params.items() if isinstance(params, dict) else params
+    normalized = {}
+    for name, value in items:
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        normalized.setdefault(str(name), []).extend(
+            str(item).lower() if isinstance(item, bool) else str(item)
+            for item in values)
+    return [[name, sorted(normalized[name])] for name in sorted(normalized)]
+
+
+class ResponseStore(object):
+    """A directory of recorded responses, one JSON file per key."""
+    def __init__(self, directory, base_url=None):
+        self.directory = directory
+        self.base_url = base_url.rstrip('/') if base_url else None
+
+    def key(self, method, url, params=None, authorized=True):
+        if self.base_url and url.startswith(self.base_url):
+            url = BASE_URL_PLACEHOLDER + url[len(self.base_url):]
+        return json.dumps([method.upper(), url.rstrip('/'),
+                           normalize_params(params), bool(authorized)])
+
+    def path(self, key):
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest() +
+                            '.json')
+
+    def get(self, key):
+        """Returns the entry recorded under key, or None."""
+        try:
+            with open(self.path(key)) as entry_file:
+                return json.load(entry_file)
+        except IOError:
+            return None
+
+    def put(self, key, value):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with open(self.path(key), 'w') as entry_file:
+            json.dump({'key': key, 'value': value}, entry_file, indent=1,
+                      sort_keys=True)
+
+    def entries(self):
+        """Yields (key, value) for every recorded entry."""
+        for file_name in sorted(os.listdir(self.directory)):
+            if file_name.endswith('.json'):
+                with open(os.path.join(self.directory, file_name)) as entry:
+                    recorded = json.load(entry)
+                yield recorded['key'], recorded['value']
+
+    def record_response(self, key, response):
+        self.put(key, {
+            'status': response.status_code,
+            'headers': dict((name, response.headers[name])
+                            for name in KEPT_HEADERS
+                            if name in response.headers),
+            'body': response.text,
+            'elapsed': response.elapsed.total_seconds()
+        })
+
+    def replay_response(self, key, url):
+        """Rebuilds the requests.Response recorded under key."""
+        recorded = self.get(key)
+        if recorded is None:
+            raise ReplayMiss('no recorded response for ' + key)
+        value = recorded['value']
+        response = requests.Response()
+        response.status_code = value['status']
+        response.headers = CaseInsensitiveDict(value['headers'])
+        response._content = value['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = url
+        response.elapsed = timedelta(seconds=value['elapsed'])
+        return response
+
+
+def comparable_body(value):
+    """Parses JSON bodies, dropping links, which embed each host's URLs."""
+    try:
+        body = json.loads(value['body'])
+    except (TypeError, ValueError):
+        return value['body']
+    if isinstance(body, dict):
+        body.pop('links', None)
+    return body
+
+
+def diff(old_directory, new_directory):
+    """
+    Prints the keys recorded in only one of two recordings and the keys
+    whose status or body differ. Returns the number of differences.
+    """
+    old = dict(ResponseStore(old_directory).entries())
+    new = dict(ResponseStore(new_directory).entries())
+    differences = 0
+    for key in sorted(set(old) | set(new)):
+        if key not in new:
+            print('only in {}: {}'.format(old_directory, key))
+        elif key not in old:
+            print('only in {}: {}'.format(new_directory, key))
+        elif not isinstance(old[key], dict) or 'status' not in old[key]:
+            if old[key] == new[key]:
+                continue
+            print('{}: {} -> {}'.format(key, old[key], new[key]))
+        elif old[key]['status'] != new[key]['status']:
+            print('{}: status {} -> {}'.format(key, old[key]['status'],
+                                               new[key]['status']))
+        elif comparable_body(old[key]) != comparable_body(new[key]):
+            print('{}: body differs'.format(key))
+        else:
+            continue
+        differences += 1
+    print('{} differences'.format(differences))
+    return differences
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'diff':
+        print('usage: python response_store.py diff <old recording>'
+              ' <new recording>', file=sys.stderr)
+        sys.exit(2)
+    sys.exit(1 if diff(sys.argv[2], sys.argv[3]) else 0)
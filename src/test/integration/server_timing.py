@@ -0,0 +1,84 @@
+"""
+Reads the Server-Timing headers of the locations API, which break the time
+it took to build a response down into phases: query (building the
+Elasticsearch request), es (waiting for Elasticsearch or the response
+cache), etag, map (mapping hits to resources), include, geojson and total.
+Serializing the body is not in the header, as it happens once the headers
+are sent; see the serialize timers of the admin metrics for it.
+
+benchmark.py collects the header of every response with parse(). A saved
+benchmark run can be broken down again with:
+
+    python server_timing.py baseline.json
+"""
+from __future__ import print_function
+
+import json
+import sys
+from collections import OrderedDict
+
+# Phases in the order the API times them
+PHASES = ['query', 'es', 'etag', 'map', 'include', 'geojson', 'total']
+
+
+def parse(header):
+    """
+    Parses "es;dur=12.345, map;dur=0.5" into an ordered {phase: ms}, skipping
+    metrics without a duration.
+    """
+    phases = OrderedDict()
+    for metric in (header or '').split(','):
+        name, _, params = metric.strip().partition(';')
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if name and key == 'dur':
+                try:
+                    phases[name] = float(value.strip('"'))
+                except ValueError:
+                    pass
+    return phases
+
+
+def ordered_phases(names):
+    """Known phases in the API's order, then any others by name."""
+    known = [phase for phase in PHASES if phase in names]
+    return known + sorted(set(names) - set(PHASES))
+
+
+def print_breakdown(shapes):
+    """
+    Prints the mean and p95 of every phase of every shape, and the share of
+    the mean total each phase takes, from the 'phases' of summarized shapes.
+    """
+    width = max([16] + [len(shape) for shape in shapes])
+    print('\n{:<{width}} {:<8} {:>8} {:>9} {:>9} {:>7}'.format(
+        'shape', 'phase', 'timed', 'mean ms', 'p95 ms', 'share', width=width))
+    for shape in sorted(shapes):
+        phases = shapes[shape].get('phases') or {}
+        total = phases.get('total', {}).get('mean')
+        for phase in ordered_phases(phases):
+            result = phases[phase]
+            share = '{:>7.0%}'.format(result['mean'] / total) \
+                if total else '{:>7}'.format('')
+            print('{:<{width}} {:<8} {:>8} {:>9.2f} {:>9.2f} {}'.format(
+                shape, phase, result['count'], result['mean'],
+                result['p95'], share, width=width))
+
+
+def main(argv):
+    if len(argv) != 1:
+        print('usage: python server_timing.py <saved benchmark.json>',
+              file=sys.stderr)
+        return 2
+    with open(argv[0]) as run_file:
+        shapes = json.load(run_file)['shapes']
+    if not any(result.get('phases') for result in shapes.values()):
+        print('{} has no Server-Timing phases'.format(argv[0]),
+              file=sys.stderr)
+        return 1
+    print_breakdown(shapes)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))